@@ -0,0 +1,48 @@
+"""
+Helpers shared by the benchmark scripts.
+
+Every script imports `open_llm_vtuber` from the `src` directory given with
+`--src` (this tree by default), so the same script can time an older commit:
+
+    git worktree add ../before <commit>~1
+    python benchmarks/bench_xxx.py --src ../before/src
+    python benchmarks/bench_xxx.py
+"""
+
+import os
+import sys
+import time
+import argparse
+from typing import Callable
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_args(
+    description: str, parser: argparse.ArgumentParser | None = None
+) -> argparse.Namespace:
+    """Parse the command line and make `--src` importable"""
+    parser = parser or argparse.ArgumentParser(description=description)
+    parser.add_argument(
+        "--src",
+        default=os.path.join(REPO_ROOT, "src"),
+        help="The src directory of the tree to benchmark (default: this tree)",
+    )
+    args = parser.parse_args()
+    sys.path.insert(0, os.path.abspath(args.src))
+
+    from loguru import logger
+
+    # Logging would dominate the timings
+    logger.remove()
+    return args
+
+
+def best_of(repeat: int, fn: Callable[[], object]) -> float:
+    """Fastest of `repeat` runs of `fn`, in seconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
@@ -0,0 +1,114 @@
+"""
+Time splitting a streamed Dify answer into sentences and blocks.
+
+The answer arrives in chunks of 1-6 characters, as SSE message events do.
+Trees with `StreamingTextSplitter` are timed through it; older trees through
+`AsyncLLM._split_complete_sentences` on the accumulated buffer, which is what
+`chat_completion` did per event.
+
+    python benchmarks/bench_dify_splitter.py
+"""
+
+import random
+import argparse
+
+from _common import parse_args, best_of
+
+PARAGRAPH = "这是一个比较长的段落，用来模拟模型的回答。它包含多种标点；也有英文 words and spaces, 以及换行。\n"
+CODE = (
+    "```python\n"
+    + "".join(
+        f"def f{i}(x):\n    return x * {i}  # 注释，不分句。\n" for i in range(40)
+    )
+    + "```\n"
+)
+TABLE = "| 名称 | 数值 |\n|---|---|\n" + "".join(
+    f"| 项目{i} | {i} |\n" for i in range(40)
+)
+ENGLISH = (
+    "This is a fairly long English sentence without CJK punctuation, so it "
+    "can only be split near spaces"
+)
+LONG_CJK = "中文段落，没有句号的长句子会一直累积直到超过阈值、然后在次要分隔符处切分"
+
+
+def markdown(repeat: int) -> str:
+    """Prose mixed with code fences and tables"""
+    return (PARAGRAPH * 3 + CODE + "说明如下。\n" + TABLE + "\n" + PARAGRAPH) * repeat
+
+
+def prose(repeat: int) -> str:
+    return ((ENGLISH + " ") * 3 + "\n" + LONG_CJK * 2 + "\n") * repeat
+
+
+def unbroken(size: int) -> str:
+    """A long run without any separator, e.g. base64 or a long URL"""
+    return "x" * size + "。"
+
+
+def chunk(text: str, seed: int = 0) -> list:
+    rnd = random.Random(seed)
+    chunks = []
+    i = 0
+    while i < len(text):
+        size = rnd.randint(1, 6)
+        chunks.append(text[i : i + size])
+        i += size
+    return chunks
+
+
+def splitter():
+    """A function splitting a list of chunks into the segments yielded"""
+    from open_llm_vtuber.agent.stateless_llm import dify_llm
+
+    if hasattr(dify_llm, "StreamingTextSplitter"):
+
+        def split(chunks):
+            text_splitter = dify_llm.StreamingTextSplitter()
+            segments = []
+            for text in chunks:
+                segments.extend(text_splitter.feed(text))
+            rest = text_splitter.flush()
+            return segments + [rest] if rest else segments
+
+        return split
+
+    llm = dify_llm.AsyncLLM.__new__(dify_llm.AsyncLLM)
+
+    def split_buffer(chunks):
+        buffer = ""
+        segments = []
+        for text in chunks:
+            buffer += text
+            result = llm._split_complete_sentences(buffer)
+            if result:
+                segments.append(result[0])
+                buffer = result[1]
+        return segments + [buffer] if buffer else segments
+
+    return split_buffer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parse_args(__doc__, parser)
+
+    split = splitter()
+    for name, text in (
+        ("markdown", markdown(16)),
+        ("prose", prose(160)),
+        ("unbroken", unbroken(20000)),
+    ):
+        chunks = chunk(text)
+        segments = split(chunks)
+        seconds = best_of(args.repeat, lambda: split(chunks))
+        lost = len(text.rstrip("\n")) - len("".join(segments).rstrip("\n"))
+        print(
+            f"{name:8s} chars={len(text):6d} segments={len(segments):5d} "
+            f"lost chars={lost:6d} {seconds * 1000:8.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Time finding and stripping the emotion tags of a sentence.
+
+Models with 8, 32 and 64 expressions are written to a temporary model
+dictionary. Trees with `extract_and_remove_emotions` are timed through it,
+older trees through `extract_emotion` plus `remove_emotion_keywords`, which
+is what they ran per sentence.
+
+    python benchmarks/bench_emotion_tags.py
+"""
+
+import os
+import json
+import random
+import tempfile
+import argparse
+
+from _common import parse_args, best_of
+
+SENTENCES = 2000
+
+
+def make_sentences(keys: list, seed: int = 0) -> list:
+    """Sentences with 0-3 tags each, half of them upper case"""
+    rnd = random.Random(seed)
+    sentences = []
+    for i in range(SENTENCES):
+        words = ["hello", "world", "[note]", "这是一个测试", "okay"] * 3
+        for _ in range(rnd.randint(0, 3)):
+            key = rnd.choice(keys)
+            words.insert(
+                rnd.randrange(len(words)), f"[{key.upper() if i % 2 else key}]"
+            )
+        sentences.append(" ".join(words))
+    return sentences
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--expressions", type=int, nargs="+", default=[8, 32, 64])
+    args = parse_args(__doc__, parser)
+
+    from open_llm_vtuber.live2d_model import Live2dModel
+
+    with tempfile.TemporaryDirectory() as workdir:
+        model_dict_path = os.path.join(workdir, "model_dict.json")
+        with open(model_dict_path, "w") as f:
+            json.dump(
+                [
+                    {
+                        "name": f"model_{count}",
+                        "emotionMap": {f"emotion_{i}": i for i in range(count)},
+                    }
+                    for count in args.expressions
+                ],
+                f,
+            )
+
+        for count in args.expressions:
+            model = Live2dModel(f"model_{count}", model_dict_path=model_dict_path)
+            sentences = make_sentences(list(model.emo_map))
+            if hasattr(model, "extract_and_remove_emotions"):
+                process = model.extract_and_remove_emotions
+            else:
+
+                def process(sentence):
+                    return (
+                        model.extract_emotion(sentence),
+                        model.remove_emotion_keywords(sentence),
+                    )
+
+            seconds = best_of(3, lambda: [process(s) for s in sentences])
+            print(
+                f"{count:3d} expressions: {seconds / SENTENCES * 1e6:6.1f} us per sentence"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Time storing a message into a chat history that already holds N messages,
+and listing the histories of a user.
+
+Histories are prefilled as files of the old single-json format, which every
+tree reads (newer trees migrate them on first access, before the timing).
+Runs in a temporary directory, on tmpfs where available.
+
+    python benchmarks/bench_history_storage.py
+"""
+
+import os
+import json
+import shutil
+import tempfile
+import argparse
+import time
+
+from _common import parse_args
+
+USER = "bench"
+CONTENT = "x" * 50
+
+
+def write_legacy_history(history_uid: str, messages: int, user: str = USER) -> None:
+    user_dir = os.path.join("chat_history", "users", user)
+    os.makedirs(user_dir, exist_ok=True)
+    records = [{"role": "metadata", "timestamp": "2025-01-01T00:00:00"}]
+    records += [
+        {
+            "role": "human" if i % 2 == 0 else "ai",
+            "timestamp": f"2025-01-01T00:{i // 60 % 60:02d}:{i % 60:02d}",
+            "content": CONTENT,
+        }
+        for i in range(messages)
+    ]
+    with open(os.path.join(user_dir, f"{history_uid}.json"), "w") as f:
+        json.dump(records, f, ensure_ascii=False, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 10000])
+    parser.add_argument("--stores", type=int, default=50)
+    parser.add_argument("--histories", type=int, default=200)
+    parser.add_argument("--history-size", type=int, default=500)
+    args = parse_args(__doc__, parser)
+
+    from open_llm_vtuber import chat_history_manager
+
+    tmpfs = "/dev/shm" if os.path.isdir("/dev/shm") else None
+    workdir = tempfile.mkdtemp(dir=tmpfs)
+    cwd = os.getcwd()
+    # The history root is relative to the working directory
+    os.chdir(workdir)
+    try:
+        for size in args.sizes:
+            history_uid = f"size_{size}"
+            write_legacy_history(history_uid, size)
+            # Migrates the history in trees that do
+            chat_history_manager.store_message(USER, history_uid, "human", CONTENT)
+            start = time.perf_counter()
+            for _ in range(args.stores):
+                chat_history_manager.store_message(USER, history_uid, "ai", CONTENT)
+            seconds = (time.perf_counter() - start) / args.stores
+            print(f"store_message, N={size:6d}: {seconds * 1000:7.3f} ms")
+
+        for i in range(args.histories):
+            write_legacy_history(f"list_{i:04d}", args.history_size, user="lister")
+        chat_history_manager.get_history_list("lister")
+        start = time.perf_counter()
+        histories = chat_history_manager.get_history_list("lister")
+        seconds = time.perf_counter() - start
+        print(
+            f"get_history_list, {len(histories)} histories of "
+            f"{args.history_size} messages: {seconds * 1000:.1f} ms"
+        )
+    finally:
+        if hasattr(chat_history_manager, "close_history_storage"):
+            chat_history_manager.close_history_storage()
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+Time one segmentation call of an unfinished reply buffer with pysbd.
+
+Trees with `SentenceSegmenter` are timed through it, reused across calls as
+it is within a reply; older trees through `segment_text_by_pysbd`.
+
+    python benchmarks/bench_segmentation.py
+"""
+
+import argparse
+
+from _common import parse_args, best_of
+
+SAMPLES = {
+    "en": "Well, the weather is nice today. I think we should go for a walk "
+    "in the park, don't you agree? It is",
+    "zh": "今天天气很好。我们去公园散步吧，你觉得怎么样？我觉得",
+    "ja": "今日はいい天気ですね。公園に散歩に行きましょう。どう思い",
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=200)
+    args = parse_args(__doc__, parser)
+
+    from open_llm_vtuber.utils import sentence_divider
+
+    for lang, text in SAMPLES.items():
+        if hasattr(sentence_divider, "SentenceSegmenter"):
+            segment = sentence_divider.SentenceSegmenter().segment
+        else:
+            segment = sentence_divider.segment_text_by_pysbd
+        segment(text)
+
+        def run():
+            for _ in range(args.calls):
+                segment(text)
+
+        seconds = best_of(3, run)
+        print(f"{lang}: {seconds / args.calls * 1000:.3f} ms per call")
+
+
+if __name__ == "__main__":
+    main()
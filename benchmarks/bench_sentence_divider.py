@@ -0,0 +1,84 @@
+"""
+Time SentenceDivider.process_stream on long streamed replies.
+
+A reply is a `<think>` block followed by the answer, streamed one word per
+token. `--period` is the chance of a sentence end after each word: with
+sparse punctuation the divider holds long unfinished sentences in its
+buffer, which is where rescanning the whole buffer per token hurts.
+
+    python benchmarks/bench_sentence_divider.py --method pysbd
+    python benchmarks/bench_sentence_divider.py --method pysbd --period 0.003
+"""
+
+import asyncio
+import random
+import argparse
+
+from _common import parse_args, best_of
+
+WORDS = [
+    "the",
+    "model",
+    "is",
+    "thinking",
+    "about",
+    "a",
+    "long",
+    "answer",
+    "with",
+    "many",
+    "words",
+    "and",
+    "Mr.",
+    "Smith",
+]
+
+
+def make_reply(tokens: int, period: float, seed: int = 0) -> list:
+    rnd = random.Random(seed)
+    reply = ["<think>"]
+    for i in range(1, tokens + 1):
+        reply.append(" " + rnd.choice(WORDS))
+        r = rnd.random()
+        if r < period:
+            reply.append(".")
+        elif r < period + 0.05:
+            reply.append(",")
+        if i == tokens // 3:
+            # A closing tag split across two tokens
+            reply += [" </thi", "nk>"]
+    reply.append(".")
+    return reply
+
+
+async def divide(reply: list, method: str) -> list:
+    from open_llm_vtuber.utils.sentence_divider import SentenceDivider
+
+    async def tokens():
+        for token in reply:
+            yield token
+
+    divider = SentenceDivider(segment_method=method)
+    return [sentence async for sentence in divider.process_stream(tokens())]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--method", choices=["regex", "pysbd"], default="pysbd")
+    parser.add_argument("--period", type=float, default=0.06)
+    parser.add_argument("--tokens", type=int, nargs="+", default=[500, 2000, 5000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parse_args(__doc__, parser)
+
+    for tokens in args.tokens:
+        reply = make_reply(tokens, args.period)
+        sentences = asyncio.run(divide(reply, args.method))
+        seconds = best_of(args.repeat, lambda: asyncio.run(divide(reply, args.method)))
+        print(
+            f"{args.method} period={args.period} tokens={tokens:5d} "
+            f"sentences={len(sentences):4d} {seconds:8.3f} s"
+        )
+
+
+if __name__ == "__main__":
+    main()
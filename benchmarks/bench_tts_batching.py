@@ -0,0 +1,212 @@
+"""
+Throughput of TTSEnginePool with and without batching waiting calls.
+
+Clients each queue the sentences of a reply at once on a pool with one
+replica, as the conversation loop does. The pool runs them one by one
+(max_batch_size 1) or hands the backlog to the engine's
+`generate_audio_batch` (max_batch_size 4 by default).
+
+The engine is sherpa-onnx as configured in `--config` (tts_model must be
+sherpa_onnx_tts). Without it, a stand-in is used: a VITS-sized stack of
+convolutions (6 encoder layers, x256 upsampling decoder) built with `onnx`
+and run by onnxruntime on CPU, padding the batch to its longest sentence.
+Batching only pays off with idle cores or a GPU; `--threads` sets the
+stand-in's intra-op threads.
+
+    python benchmarks/bench_tts_batching.py --clients 1 4
+    python benchmarks/bench_tts_batching.py --config conf.yaml
+"""
+
+import time
+import asyncio
+import argparse
+
+from _common import parse_args
+
+SENTENCES = [
+    "Hello there, how are you doing today?",
+    "I am fine, thanks for asking.",
+    "What a lovely day it is.",
+    "Let's go for a walk in the park later.",
+    "Sure, that sounds great!",
+    "See you at five.",
+]
+
+
+def stand_in_engine(threads: int):
+    import numpy as np
+    import onnxruntime
+    from onnx import TensorProto, helper, numpy_helper
+
+    from open_llm_vtuber.tts.tts_interface import TTSInterface
+
+    rng = np.random.default_rng(0)
+    channels = 192
+    nodes, weights = [], []
+
+    def conv(x, c_in, c_out, kernel, name, stride=0):
+        # stride: upsampling factor of a transposed convolution
+        shape = (c_in, c_out, kernel) if stride else (c_out, c_in, kernel)
+        weight = rng.standard_normal(shape) / np.sqrt(c_in * kernel)
+        weights.append(numpy_helper.from_array(weight.astype(np.float32), name + "_w"))
+        if stride:
+            nodes.append(
+                helper.make_node(
+                    "ConvTranspose",
+                    [x, name + "_w"],
+                    [name],
+                    strides=[stride],
+                    kernel_shape=[kernel],
+                    pads=[(kernel - stride) // 2] * 2,
+                )
+            )
+        else:
+            nodes.append(
+                helper.make_node(
+                    "Conv",
+                    [x, name + "_w"],
+                    [name],
+                    pads=[kernel // 2] * 2,
+                    kernel_shape=[kernel],
+                )
+            )
+        nodes.append(helper.make_node("Tanh", [name], [name + "_a"]))
+        return name + "_a"
+
+    x = "tokens"
+    for i in range(6):
+        x = conv(x, channels, channels, 5, f"enc{i}")
+    # Length regulator, about 8 frames per token
+    x = conv(x, channels, channels, 8, "expand", stride=8)
+    width = channels
+    for stage in range(4):
+        x = conv(x, width, width // 2, 8, f"up{stage}", stride=4)
+        width //= 2
+        for i in range(3):
+            x = conv(x, width, width, 3, f"res{stage}_{i}")
+    x = conv(x, width, 1, 7, "post")
+    graph = helper.make_graph(
+        nodes,
+        "vits_like",
+        [
+            helper.make_tensor_value_info(
+                "tokens", TensorProto.FLOAT, ["B", channels, "T"]
+            )
+        ],
+        [helper.make_tensor_value_info(x, TensorProto.FLOAT, ["B", 1, "S"])],
+        weights,
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 17)])
+    model.ir_version = 8
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = threads
+    session = onnxruntime.InferenceSession(
+        model.SerializeToString(), options, providers=["CPUExecutionProvider"]
+    )
+    embeddings = rng.standard_normal((256, channels)).astype(np.float32)
+
+    def synthesize(texts):
+        length = max(len(text) for text in texts)
+        tokens = np.zeros((len(texts), channels, length), np.float32)
+        for i, text in enumerate(texts):
+            ids = np.frombuffer(text.encode()[:length], np.uint8)
+            tokens[i, :, : len(ids)] = embeddings[ids].T
+        session.run(None, {"tokens": tokens})
+
+    class StandInEngine(TTSInterface):
+        supports_batch = True
+
+        def generate_audio(self, text, file_name_no_ext=None):
+            synthesize([text])
+            return text
+
+        def generate_audio_batch(self, texts, file_names_no_ext=None):
+            synthesize(texts)
+            return list(texts)
+
+        def remove_file(self, filepath, verbose=True):
+            pass
+
+    return StandInEngine()
+
+
+def sherpa_onnx_engine(config_path: str):
+    from open_llm_vtuber.config_manager import read_yaml, validate_config
+    from open_llm_vtuber.tts.tts_factory import TTSFactory
+
+    tts_config = validate_config(read_yaml(config_path)).character_config.tts_config
+    if tts_config.tts_model != "sherpa_onnx_tts":
+        raise SystemExit("--config must use tts_model: 'sherpa_onnx_tts'")
+    return TTSFactory.get_tts_engine(
+        "sherpa_onnx_tts", **tts_config.sherpa_onnx_tts.model_dump()
+    )
+
+
+async def serve(engine, max_batch_size: int, clients: int) -> tuple:
+    from open_llm_vtuber.tts.tts_engine_pool import TTSEnginePool
+
+    calls = 0
+    generate_audio, generate_audio_batch = (
+        engine.generate_audio,
+        engine.generate_audio_batch,
+    )
+
+    def count(method):
+        def counted(*args, **kwargs):
+            nonlocal calls
+            calls += 1
+            return method(*args, **kwargs)
+
+        return counted
+
+    engine.generate_audio = count(generate_audio)
+    engine.generate_audio_batch = count(generate_audio_batch)
+    pool = TTSEnginePool(lambda: engine, max_batch_size=max_batch_size)
+
+    async def reply(client):
+        paths = await asyncio.gather(
+            *(
+                pool.async_generate_audio(f"{sentence} {client}", priority=i)
+                for i, sentence in enumerate(SENTENCES)
+            )
+        )
+        for path in paths:
+            engine.remove_file(path, verbose=False)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(reply(client) for client in range(clients)))
+    seconds = time.perf_counter() - start
+    del engine.generate_audio, engine.generate_audio_batch
+    return seconds, calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--config", help="conf.yaml using sherpa_onnx_tts")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--max-batch-size", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parse_args(__doc__, parser)
+
+    if args.config:
+        engine = sherpa_onnx_engine(args.config)
+    else:
+        engine = stand_in_engine(args.threads)
+    engine.generate_audio(SENTENCES[0])
+
+    for clients in args.clients:
+        for max_batch_size in (1, args.max_batch_size):
+            seconds, calls = min(
+                asyncio.run(serve(engine, max_batch_size, clients))
+                for _ in range(args.repeat)
+            )
+            sentences = clients * len(SENTENCES)
+            print(
+                f"{clients} client(s), max_batch_size={max_batch_size}: "
+                f"{sentences / seconds:6.1f} sentences/s, {calls} engine calls"
+            )
+
+
+if __name__ == "__main__":
+    main()
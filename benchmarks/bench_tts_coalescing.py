@@ -0,0 +1,171 @@
+"""
+Replay one reply through TTSTaskManager against a fake remote TTS engine,
+without and with sentence coalescing.
+
+The engine takes a 150 ms round trip plus 4 ms per character, and returns
+60 ms of tone per character with a 150 ms pause after each sentence. The
+reply has 10 sentences of 3-38 characters, one every 50 ms. `--serial`
+makes the engine handle one request at a time, like a single-worker server.
+
+Reported per run: TTS requests, engine busy time, time to the first audio
+and to the last, how long playback would stall waiting for audio, and the
+largest gap between a sentence's payload length and its real audio length.
+
+    python benchmarks/bench_tts_coalescing.py
+    python benchmarks/bench_tts_coalescing.py --serial
+"""
+
+import io
+import os
+import re
+import json
+import math
+import time
+import wave
+import base64
+import struct
+import asyncio
+import argparse
+import tempfile
+
+from _common import parse_args
+
+RATE = 16000
+SENTENCES = [
+    "Hi!",
+    "Sure.",
+    "Let me think about that for a second.",
+    "Okay.",
+    "Yes.",
+    "The answer is forty-two, as you know.",
+    "Right?",
+    "Ha.",
+    "Anyway.",
+    "See you tomorrow, take care!",
+]
+MS_PER_CHAR = 60
+PAUSE_MS = 150
+
+
+def write_wav(path: str, sentences: list) -> None:
+    frames = bytearray()
+    for sentence in sentences:
+        tone = RATE * MS_PER_CHAR * len(sentence) // 1000
+        frames += b"".join(
+            struct.pack("<h", int(8000 * math.sin(2 * math.pi * 220 * i / RATE)))
+            for i in range(tone)
+        )
+        frames += b"\0\0" * (RATE * PAUSE_MS // 1000)
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(RATE)
+        f.writeframes(bytes(frames))
+
+
+def audio_ms(payload: dict) -> float:
+    with wave.open(io.BytesIO(base64.b64decode(payload["audio"]))) as f:
+        return f.getnframes() * 1000 / f.getframerate()
+
+
+def remote_engine(serial: bool, cache_dir: str):
+    from open_llm_vtuber.tts.tts_interface import TTSInterface
+
+    class RemoteEngine(TTSInterface):
+        def __init__(self):
+            self.requests = 0
+            self.busy = 0.0
+            self.lock = asyncio.Lock() if serial else None
+
+        async def async_generate_audio(self, text, file_name_no_ext=None):
+            if self.lock is None:
+                return await self._generate(text, file_name_no_ext)
+            async with self.lock:
+                return await self._generate(text, file_name_no_ext)
+
+        async def _generate(self, text, file_name_no_ext):
+            self.requests += 1
+            seconds = 0.15 + 0.004 * len(text)
+            self.busy += seconds
+            await asyncio.sleep(seconds)
+            path = os.path.join(cache_dir, f"{file_name_no_ext}.wav")
+            write_wav(path, re.split(r"(?<=[.!?])\s+", text.strip()))
+            return path
+
+        def generate_audio(self, text, file_name_no_ext=None):
+            raise NotImplementedError
+
+    return RemoteEngine()
+
+
+async def replay(max_chars: int, serial: bool, cache_dir: str) -> dict:
+    from open_llm_vtuber.agent.output_types import Actions, DisplayText
+    from open_llm_vtuber.conversations.tts_manager import TTSTaskManager
+
+    engine = remote_engine(serial, cache_dir)
+    manager = TTSTaskManager(coalesce_max_chars=max_chars, coalesce_max_wait=0.3)
+    payloads = []
+    start = time.perf_counter()
+
+    async def send(message):
+        payload = json.loads(message)
+        payload["sent_at"] = time.perf_counter() - start
+        payloads.append(payload)
+
+    for i, sentence in enumerate(SENTENCES):
+        await manager.speak(
+            sentence,
+            DisplayText(text=sentence),
+            Actions(expressions=[i]),
+            None,
+            engine,
+            send,
+        )
+        await asyncio.sleep(0.05)
+    manager.flush()
+    await asyncio.gather(*manager.task_list)
+    while len(payloads) < len(SENTENCES):
+        await asyncio.sleep(0.01)
+    manager.clear()
+
+    assert [p["display_text"]["text"] for p in payloads] == SENTENCES
+    # Playback of each payload starts once the previous one has played
+    end = stalls = 0.0
+    for payload in payloads:
+        if end and payload["sent_at"] > end:
+            stalls += payload["sent_at"] - end
+        end = max(end, payload["sent_at"]) + audio_ms(payload) / 1000
+    return {
+        "requests": engine.requests,
+        "engine_ms": engine.busy * 1000,
+        "first_ms": payloads[0]["sent_at"] * 1000,
+        "last_ms": payloads[-1]["sent_at"] * 1000,
+        "stall_ms": stalls * 1000,
+        "split_error_ms": max(
+            abs(audio_ms(p) - (MS_PER_CHAR * len(s) + PAUSE_MS))
+            for p, s in zip(payloads, SENTENCES)
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--serial", action="store_true")
+    parser.add_argument("--max-chars", type=int, nargs="+", default=[0, 80])
+    args = parse_args(__doc__, parser)
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for max_chars in args.max_chars:
+            result = asyncio.run(replay(max_chars, args.serial, cache_dir))
+            print(
+                f"coalesce_max_chars={max_chars:3d}: {result['requests']:2d} requests, "
+                f"engine {result['engine_ms']:5.0f} ms, "
+                f"first audio {result['first_ms']:4.0f} ms, "
+                f"last audio {result['last_ms']:5.0f} ms, "
+                f"stalls {result['stall_ms']:3.0f} ms, "
+                f"split error {result['split_error_ms']:3.0f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
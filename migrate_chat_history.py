@@ -0,0 +1,114 @@
+"""
+Convert chat histories between storage formats.
+
+- Without options: convert histories from the old single-json format
+  (`chat_history/users/<user_id>/<history_uid>.json`) into append-only logs
+  with metadata sidecars. Histories are also migrated lazily the first time
+  the server accesses them; run this once to convert everything up front.
+- With `--to-sqlite`: additionally copy all jsonl histories into the SQLite
+  database used by `chat_history.storage: 'sqlite'`, and the group
+  transcripts into the transcripts database next to them.
+
+Usage:
+    python migrate_chat_history.py [--dry-run] [--to-sqlite [DB_PATH]]
+"""
+
+import os
+import argparse
+from loguru import logger
+
+from src.open_llm_vtuber.history_storage.jsonl_history_storage import (
+    DEFAULT_HISTORY_ROOT,
+    JsonlHistoryStorage,
+)
+from src.open_llm_vtuber.history_storage.sqlite_history_storage import (
+    DEFAULT_DB_PATH,
+    SqliteHistoryStorage,
+)
+from src.open_llm_vtuber.history_storage.history_storage_interface import (
+    HistoryStorageInterface,
+)
+from src.open_llm_vtuber.history_storage.transcript_history_storage import (
+    DEFAULT_TRANSCRIPTS_DIR,
+)
+
+
+def copy_histories(
+    source: HistoryStorageInterface, target: HistoryStorageInterface
+) -> int:
+    """Copy every history missing in `target` from `source`. Returns the number copied."""
+    existing = set(target.list_history_ids())
+    copied = 0
+    for user_id, history_uid in source.list_history_ids():
+        if (user_id, history_uid) in existing:
+            continue
+        target.create_history(
+            user_id, history_uid, source.get_metadata(user_id, history_uid)
+        )
+        for message in source.get_messages(user_id, history_uid) or []:
+            target.append_message(user_id, history_uid, message)
+        copied += 1
+    return copied
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate chat histories")
+    parser.add_argument(
+        "--dry-run", action="store_true", help="Only list the histories to migrate"
+    )
+    parser.add_argument(
+        "--jsonl-dir",
+        default=DEFAULT_HISTORY_ROOT,
+        help="Directory of the jsonl histories",
+    )
+    parser.add_argument(
+        "--transcripts-dir",
+        default=DEFAULT_TRANSCRIPTS_DIR,
+        help="Directory of the group transcripts (chat_history.transcripts_dir)",
+    )
+    parser.add_argument(
+        "--to-sqlite",
+        nargs="?",
+        const=DEFAULT_DB_PATH,
+        metavar="DB_PATH",
+        help="Also copy all histories into this SQLite database",
+    )
+    args = parser.parse_args()
+
+    jsonl_storage = JsonlHistoryStorage(root=args.jsonl_dir)
+    legacy_paths = jsonl_storage.find_legacy_files()
+
+    if args.dry_run:
+        for path in legacy_paths:
+            logger.info(f"Would migrate: {path}")
+        logger.info(f"{len(legacy_paths)} histories in the old format.")
+        return
+
+    if legacy_paths:
+        migrated = sum(jsonl_storage.migrate_legacy_file(path) for path in legacy_paths)
+        logger.info(
+            f"Migrated {migrated} histories, {len(legacy_paths) - migrated} failed."
+        )
+    else:
+        logger.info("No chat history in the old format found.")
+
+    if args.to_sqlite:
+        sqlite_storage = SqliteHistoryStorage(db_path=args.to_sqlite)
+        copied = copy_histories(jsonl_storage, sqlite_storage)
+        logger.info(f"Copied {copied} histories into {args.to_sqlite}")
+        sqlite_storage.close()
+
+        # Transcripts have a database of their own, as configured by the server
+        transcripts_db = os.path.join(args.transcripts_dir, "transcripts.db")
+        jsonl_transcripts = JsonlHistoryStorage(root=args.transcripts_dir)
+        sqlite_transcripts = SqliteHistoryStorage(db_path=transcripts_db)
+        copied = copy_histories(jsonl_transcripts, sqlite_transcripts)
+        logger.info(f"Copied {copied} group transcripts into {transcripts_db}")
+        sqlite_transcripts.close()
+        jsonl_transcripts.close()
+
+    jsonl_storage.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -48,9 +48,36 @@ def parse_args():
     parser.add_argument(
         "--hf_mirror", action="store_true", help="Use Hugging Face mirror"
     )
+    parser.add_argument(
+        "--profile-imports",
+        action="store_true",
+        help="Report how long importing the server takes in a fresh interpreter, then exit",
+    )
+    parser.add_argument(
+        "--import-budget",
+        type=float,
+        default=None,
+        help="With --profile-imports, exit with status 1 if the import takes longer (seconds)",
+    )
     return parser.parse_args()
 
 
+def profile_server_imports(budget: float | None) -> int:
+    from src.open_llm_vtuber.utils.import_profiler import (
+        profile_imports,
+        format_report,
+    )
+
+    profile = profile_imports(
+        "src.open_llm_vtuber.server", cwd=str(Path(__file__).parent)
+    )
+    print(format_report(profile))
+    if budget is not None and profile.total > budget:
+        print(f"\nOver the import budget: {profile.total:.3f}s > {budget:.3f}s")
+        return 1
+    return 0
+
+
 @logger.catch
 def run(console_log_level: str):
     init_logger(console_log_level)
@@ -79,6 +106,8 @@ def run(console_log_level: str):
 
 if __name__ == "__main__":
     args = parse_args()
+    if args.profile_imports:
+        sys.exit(profile_server_imports(args.import_budget))
     console_log_level = "DEBUG" if args.verbose else "INFO"
     if args.verbose:
         logger.info("Running in verbose mode")
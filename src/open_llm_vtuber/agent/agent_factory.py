@@ -2,12 +2,28 @@ from typing import Type, Literal
 from loguru import logger
 
 from .agents.agent_interface import AgentInterface
-from .agents.basic_memory_agent import BasicMemoryAgent
 from .stateless_llm_factory import LLMFactory as StatelessLLMFactory
-from .agents.hume_ai import HumeAIAgent
 
 
 class AgentFactory:
+    @staticmethod
+    def get_agent_class(conversation_agent_choice: str) -> Type[AgentInterface]:
+        """Return the class `create_agent` builds for this choice, without building it"""
+        if conversation_agent_choice == "basic_memory_agent":
+            from .agents.basic_memory_agent import BasicMemoryAgent
+
+            return BasicMemoryAgent
+        elif conversation_agent_choice == "mem0_agent":
+            from .agents.mem0_llm import LLM as Mem0LLM
+
+            return Mem0LLM
+        elif conversation_agent_choice == "hume_ai_agent":
+            from .agents.hume_ai import HumeAIAgent
+
+            return HumeAIAgent
+        else:
+            raise ValueError(f"Unsupported agent type: {conversation_agent_choice}")
+
     @staticmethod
     def create_agent(
         conversation_agent_choice: str,
@@ -32,6 +48,8 @@ class AgentFactory:
         logger.info(f"Initializing agent: {conversation_agent_choice}")
 
         if conversation_agent_choice == "basic_memory_agent":
+            from .agents.basic_memory_agent import BasicMemoryAgent
+
             # Get the LLM provider choice from agent settings
             basic_memory_settings: dict = agent_settings.get("basic_memory_agent", {})
             llm_provider: str = basic_memory_settings.get("llm_provider")
@@ -66,6 +84,11 @@ class AgentFactory:
                 ),
                 segment_method=basic_memory_settings.get("segment_method", "pysbd"),
                 interrupt_method=interrupt_method,
+                context_token_budget=basic_memory_settings.get("context_token_budget"),
+                # Dify keeps the conversation memory on its server and only receives
+                # the latest message, so there is nothing to summarize locally.
+                summarize_context=basic_memory_settings.get("summarize_context", True)
+                and llm_provider != "dify_llm",
             )
 
         elif conversation_agent_choice == "mem0_agent":
@@ -91,6 +114,8 @@ class AgentFactory:
             )
 
         elif conversation_agent_choice == "hume_ai_agent":
+            from .agents.hume_ai import HumeAIAgent
+
             settings = agent_settings.get("hume_ai_agent", {})
             return HumeAIAgent(
                 api_key=settings.get("api_key"),
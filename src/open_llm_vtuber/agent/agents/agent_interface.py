@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import AsyncIterator, Dict
+from typing import Any, AsyncIterator, Dict, Optional
 from loguru import logger
 
 from ..output_types import BaseOutput
@@ -53,6 +53,16 @@ class AgentInterface(ABC):
         """
         pass
 
+    async def async_set_memory_from_history(
+        self, conf_uid: str, history_uid: str
+    ) -> None:
+        """
+        `set_memory_from_history` for the event loop. Agents that read a lot
+        of history override it to read in a thread; by default it runs
+        `set_memory_from_history` as is.
+        """
+        self.set_memory_from_history(conf_uid, history_uid)
+
     @abstractmethod
     def get_conversation_info(self) -> Dict[str, str]:
         """
@@ -73,3 +83,45 @@ class AgentInterface(ABC):
             user_id: str - User identifier
         """
         pass
+
+    def checkpoint_memory(self) -> Optional[Any]:
+        """
+        Mark the current chat memory, so a response generated ahead of time
+        can be taken back with `rollback_memory` if it is never used.
+
+        Returns:
+            Optional[Any] - Token for `rollback_memory`, or None if this agent
+            can't take a response back (the default)
+        """
+        return None
+
+    def rollback_memory(self, checkpoint: Any) -> None:
+        """
+        Remove what was added to the chat memory since `checkpoint_memory`.
+
+        Args:
+            checkpoint: Any - Token returned by `checkpoint_memory`
+        """
+        pass
+
+    def create_session(self) -> "AgentInterface":
+        """
+        Create the per-client state of this agent.
+
+        Agents that separate shared resources (LLM, pipeline) from memory
+        return a lightweight session object here. By default the agent has
+        no such split and every client uses the agent itself.
+
+        Returns:
+            AgentInterface - Object implementing this interface for one client
+        """
+        return self
+
+    @classmethod
+    def has_sessions(cls) -> bool:
+        """
+        Whether `create_session` keeps the per-client state out of the agent,
+        so one agent can serve every client. Agents without sessions keep
+        memory and connections in themselves and need one instance per client.
+        """
+        return cls.create_session is not AgentInterface.create_session
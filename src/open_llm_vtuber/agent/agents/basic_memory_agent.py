@@ -1,11 +1,27 @@
-from typing import AsyncIterator, List, Dict, Any, Callable, Literal
+from typing import (
+    AsyncIterator,
+    List,
+    Dict,
+    Any,
+    Callable,
+    Literal,
+    Optional,
+    Tuple,
+)
 from loguru import logger
+import asyncio
 import uuid
 
 from .agent_interface import AgentInterface
+from ..context_window import ContextWindow, count_message_tokens
 from ..output_types import SentenceOutput, DisplayText
 from ..stateless_llm.stateless_llm_interface import StatelessLLMInterface
-from ...chat_history_manager import get_history, get_metadata, update_metadate
+from ...chat_history_manager import (
+    get_history,
+    get_history_page,
+    get_metadata,
+    update_metadate,
+)
 from ..transformers import (
     sentence_divider,
     actions_extractor,
@@ -19,8 +35,14 @@ from prompts import prompt_loader
 
 class BasicMemoryAgent(AgentInterface):
     """
-    Agent with basic chat memory using a list to store messages.
+    Agent with basic chat memory kept in a token-budgeted context window.
     Implements text-based responses with sentence processing pipeline.
+
+    The agent itself only holds what every client can share: the LLM (and its
+    pooled HTTP client), the system prompt and the processing pipeline, which
+    is built once. Memory and conversation ids live in `BasicMemorySession`
+    objects created with `create_session`, one per client. Calling the
+    interface methods on the agent directly uses a default session.
     """
 
     _system: str = """You are an error message repeater. 
@@ -38,6 +60,8 @@ class BasicMemoryAgent(AgentInterface):
         faster_first_response: bool = True,
         segment_method: str = "pysbd",
         interrupt_method: Literal["system", "user"] = "user",
+        context_token_budget: Optional[int] = None,
+        summarize_context: bool = True,
     ):
         """
         Initialize the agent with LLM, system prompt and configuration
@@ -51,39 +75,36 @@ class BasicMemoryAgent(AgentInterface):
             segment_method: `str` - Method for sentence segmentation
             interrupt_method: `Literal["system", "user"]` -
                 Methods for writing interruptions signal in chat history.
+            context_token_budget: `int | None` - Token budget of the prompt.
+                Older turns are evicted when it is exceeded. None keeps everything.
+            summarize_context: `bool` - Whether to fold evicted turns into a
+                rolling summary generated in the background.
 
         """
         super().__init__()
-        self._memory = []
         self._live2d_model = live2d_model
         self._tts_preprocessor_config = tts_preprocessor_config
         self._faster_first_response = faster_first_response
         self._segment_method = segment_method
         self.interrupt_method = interrupt_method
-        # Flag to ensure a single interrupt handling per conversation
-        self._interrupt_handled = False
-        
-        # 新增：会话相关的属性
-        self._conversation_id = None
-        self._user_id = None
-        self._conf_uid = None
-        self._history_uid = None
-        
+        self._context_token_budget = context_token_budget
+        self._summarize_context_enabled = summarize_context
+        self._default_session: Optional["BasicMemorySession"] = None
+
         self._set_llm(llm)
         self.set_system(system)
         logger.info("BasicMemoryAgent initialized.")
 
     def _set_llm(self, llm: StatelessLLMInterface):
         """
-        Set the (stateless) LLM to be used for chat completion.
-        Instead of assigning directly to `self.chat`, store it to `_chat_function`
-        so that the async method chat remains intact.
+        Set the (stateless) LLM to be used for chat completion and build the
+        chat pipeline around it. The pipeline is shared by all sessions.
 
         Args:
             llm: StatelessLLMInterface - the LLM instance.
         """
         self._llm = llm
-        self.chat = self._chat_function_factory(llm.chat_completion)
+        self._chat_pipeline = self._chat_function_factory(llm.chat_completion)
 
     def set_system(self, system: str):
         """
@@ -98,6 +119,268 @@ class BasicMemoryAgent(AgentInterface):
 
         self._system = system
 
+    def create_session(self) -> "BasicMemorySession":
+        """
+        Create the per-client state for this agent. Cheap: a session holds
+        only its context window, conversation ids and the interrupt flag.
+        """
+        return BasicMemorySession(self)
+
+    @property
+    def default_session(self) -> "BasicMemorySession":
+        """Session used when the agent is called directly"""
+        if self._default_session is None:
+            self._default_session = self.create_session()
+        return self._default_session
+
+    # AgentInterface methods on the agent itself go to the default session
+
+    def chat(self, input_data: BatchInput) -> AsyncIterator[SentenceOutput]:
+        return self.default_session.chat(input_data)
+
+    def handle_interrupt(self, heard_response: str) -> None:
+        self.default_session.handle_interrupt(heard_response)
+
+    def set_memory_from_history(self, user_id: str, history_uid: str) -> None:
+        self.default_session.set_memory_from_history(user_id, history_uid)
+
+    async def async_set_memory_from_history(
+        self, user_id: str, history_uid: str
+    ) -> None:
+        await self.default_session.async_set_memory_from_history(user_id, history_uid)
+
+    def get_conversation_info(self) -> Dict[str, str]:
+        return self.default_session.get_conversation_info()
+
+    def set_conversation_info(
+        self, conversation_id: str = None, user_id: str = None
+    ) -> None:
+        self.default_session.set_conversation_info(conversation_id, user_id)
+
+    def reset_interrupt(self) -> None:
+        self.default_session.reset_interrupt()
+
+    def checkpoint_memory(self) -> Optional[Any]:
+        return self.default_session.checkpoint_memory()
+
+    def rollback_memory(self, checkpoint: Any) -> None:
+        self.default_session.rollback_memory(checkpoint)
+
+    def start_group_conversation(
+        self, human_name: str, ai_participants: List[str]
+    ) -> None:
+        self.default_session.start_group_conversation(human_name, ai_participants)
+
+    async def send_feedback(
+        self, message_id: str, rating: str, content: str = ""
+    ) -> bool:
+        return await self.default_session.send_feedback(message_id, rating, content)
+
+    async def update_api_key(self, api_key: str) -> None:
+        await self.default_session.update_api_key(api_key)
+
+    def _to_text_prompt(self, input_data: BatchInput) -> str:
+        """
+        Format BatchInput into a prompt string for the LLM.
+
+        Args:
+            input_data: BatchInput - The input data containing texts and images
+
+        Returns:
+            str - Formatted message string
+        """
+        message_parts = []
+
+        # Process text inputs in order
+        for text_data in input_data.texts:
+            if text_data.source == TextSource.INPUT:
+                message_parts.append(text_data.content)
+            elif text_data.source == TextSource.CLIPBOARD:
+                message_parts.append(f"[Clipboard content: {text_data.content}]")
+
+        # Process images in order
+        if input_data.images:
+            message_parts.append("\nImages in this message:")
+            for i, img_data in enumerate(input_data.images, 1):
+                source_desc = {
+                    ImageSource.CAMERA: "captured from camera",
+                    ImageSource.SCREEN: "screenshot",
+                    ImageSource.CLIPBOARD: "from clipboard",
+                    ImageSource.UPLOAD: "uploaded",
+                }[img_data.source]
+                message_parts.append(f"- Image {i} ({source_desc})")
+
+        return "\n".join(message_parts)
+
+    async def _summarize_context(
+        self, previous_summary: str, messages: List[Dict[str, Any]]
+    ) -> str:
+        """
+        Fold messages evicted from the context window into the rolling summary.
+        Runs in the background, never on the response path.
+
+        Raises:
+            RuntimeError: If the LLM returned an error or nothing, so the
+                context window keeps the previous summary
+        """
+        transcript = "\n".join(
+            f"{'User' if msg['role'] == 'user' else 'AI'}: {msg['content']}"
+            for msg in messages
+            if msg["role"] in ("user", "assistant")
+        )
+        if not transcript:
+            return previous_summary
+        prompt = prompt_loader.load_util("context_summary_prompt").format(
+            previous_summary=previous_summary or "(none)",
+            conversation=transcript,
+        )
+        summary = ""
+        async for token in self._llm.chat_completion(
+            [{"role": "user", "content": prompt}], None
+        ):
+            if not token.startswith("__"):
+                summary += token
+        summary = summary.strip()
+        if not summary:
+            raise RuntimeError("the LLM returned an empty summary")
+        if summary.startswith(self._llm.error_prefixes):
+            raise RuntimeError(summary)
+        return summary
+
+    def _chat_function_factory(
+        self, chat_func: Callable[..., AsyncIterator[str]]
+    ) -> Callable[..., AsyncIterator[SentenceOutput]]:
+        """
+        Create the chat pipeline with transformers
+
+        The pipeline:
+        LLM tokens -> sentence_divider -> actions_extractor -> display_processor -> tts_filter
+
+        The pipeline is built once per agent; the session whose memory is used
+        is passed on every call.
+        """
+
+        @tts_filter(self._tts_preprocessor_config)
+        @display_processor()
+        @actions_extractor(self._live2d_model)
+        @sentence_divider(
+            faster_first_response=self._faster_first_response,
+            segment_method=self._segment_method,
+            valid_tags=["think"],
+        )
+        async def chat_with_memory(
+            input_data: BatchInput, session: "BasicMemorySession"
+        ) -> AsyncIterator[str]:
+            """
+            Chat implementation with memory and processing pipeline
+
+            Args:
+                input_data: BatchInput
+                session: BasicMemorySession - Memory and conversation info of the client
+
+            Returns:
+                AsyncIterator[str] - Token stream from LLM
+            """
+
+            messages = session._to_messages(input_data)
+
+            # 获取 selection 参数
+            selection = input_data.texts[0].selection if input_data.texts else None
+            logger.info(f"Selection parameter: {selection}")
+
+            logger.info(
+                f"发送对话请求 - conversation_id: {session._conversation_id}, user_id: {session._user_id}"
+            )
+
+            # 会话单独设置的 API key 只随本次请求发送，不修改共享的 LLM
+            extra_kwargs = {"api_key": session._api_key} if session._api_key else {}
+
+            # 获取token流，传入会话信息
+            token_stream = chat_func(
+                messages,
+                session._context.system_prompt(self._system),
+                conversation_id=session._conversation_id,
+                user_id=session._user_id,
+                selection=selection,
+                **extra_kwargs,
+            )
+            complete_response = ""
+
+            async for token in token_stream:
+                # 检查是否是会话ID或消息ID的特殊标记
+                if token.startswith("__conversation_id:"):
+                    new_conversation_id = token.split(":", 1)[1]
+                    # logger.info(f"收到新的 conversation_id: {new_conversation_id}")
+                    # 更新会话ID并保存到元数据
+                    session.set_conversation_info(conversation_id=new_conversation_id)
+                    continue
+                elif token.startswith("__message_id:"):
+                    # 直接传递 message_id 标记，让装饰器链处理
+                    yield token
+                    continue
+
+                yield token
+                complete_response += token
+
+            # Store complete response
+            session._add_message(complete_response, "assistant")
+
+        return chat_with_memory
+
+
+class BasicMemorySession(AgentInterface):
+    """
+    Per-client state of a `BasicMemoryAgent`: the context window, the
+    conversation ids and the interrupt flag. Everything else (LLM, system
+    prompt, pipeline) is borrowed from the shared agent.
+    """
+
+    def __init__(self, agent: BasicMemoryAgent):
+        self._agent = agent
+        self._context = ContextWindow(
+            token_budget=agent._context_token_budget,
+            summarizer=agent._summarize_context
+            if agent._summarize_context_enabled
+            else None,
+            on_summary=self._save_context_summary,
+        )
+        # Flag to ensure a single interrupt handling per conversation
+        self._interrupt_handled = False
+
+        # 会话相关的属性
+        self._conversation_id = None
+        self._user_id = None
+        # 当前历史记录所属的用户，更新元数据时使用
+        self._conf_uid = None
+        self._history_uid = None
+        # 本会话单独设置的 API key，None 表示使用 LLM 配置中的 key
+        self._api_key = None
+
+    @property
+    def agent(self) -> BasicMemoryAgent:
+        """The shared agent this session belongs to"""
+        return self._agent
+
+    @property
+    def _llm(self) -> StatelessLLMInterface:
+        return self._agent._llm
+
+    def create_session(self) -> "BasicMemorySession":
+        """Create a new session on the same shared agent"""
+        return self._agent.create_session()
+
+    def chat(self, input_data: BatchInput) -> AsyncIterator[SentenceOutput]:
+        """
+        Chat with the shared pipeline using this session's memory.
+
+        Args:
+            input_data: BatchInput - User input data
+
+        Returns:
+            AsyncIterator[SentenceOutput] - Stream of processed sentences
+        """
+        return self._agent._chat_pipeline(input_data, self)
+
     def get_conversation_info(self) -> Dict[str, str]:
         """获取当前会话信息"""
         return {
@@ -107,7 +390,8 @@ class BasicMemoryAgent(AgentInterface):
 
     def set_conversation_info(self, conversation_id: str = None, user_id: str = None) -> None:
         """设置会话信息"""
-        if conversation_id:
+        # Dify 的流式回复里会反复带上同一个 conversation_id，没变化就不用更新元数据
+        if conversation_id and conversation_id != self._conversation_id:
             self._conversation_id = conversation_id
             # logger.info(f"设置新的 conversation_id: {conversation_id}")
             # 如果有 conf_uid 和 history_uid，更新元数据
@@ -157,33 +441,78 @@ class BasicMemoryAgent(AgentInterface):
             if display_text.avatar:
                 message_data["avatar"] = display_text.avatar
 
-        self._memory.append(message_data)
+        self._context.append(message_data)
 
     def set_memory_from_history(self, user_id: str, history_uid: str) -> None:
         """从历史记录加载对话记录和会话信息"""
-        self._user_id = user_id
-        self._history_uid = history_uid
-        
+        metadata, messages = self._read_history(user_id, history_uid)
+        self._load_history(user_id, history_uid, metadata, messages)
+
+    async def async_set_memory_from_history(
+        self, user_id: str, history_uid: str
+    ) -> None:
+        """`set_memory_from_history` reading the history in a thread"""
+        metadata, messages = await asyncio.to_thread(
+            self._read_history, user_id, history_uid
+        )
+        self._load_history(user_id, history_uid, metadata, messages)
+
+    def _read_history(self, user_id: str, history_uid: str) -> Tuple[dict, List[dict]]:
+        """Metadata and the messages to load; only reads, safe in any thread"""
         # 获取元数据中的会话信息
         metadata = get_metadata(user_id, history_uid)
         logger.info(f"加载历史记录元数据: {metadata}")
-        
+        # 加载对话历史，只保留预算内最近的消息，更早的内容由保存的摘要代替
+        return metadata, self._read_recent_history(user_id, history_uid)
+
+    def _load_history(
+        self,
+        user_id: str,
+        history_uid: str,
+        metadata: dict,
+        messages: List[dict],
+    ) -> None:
+        self._user_id = user_id
+        # Histories are stored per user
+        self._conf_uid = user_id
+        self._history_uid = history_uid
+
         if metadata:
             self._conversation_id = metadata.get("conversation_id")
-        
-        # 加载对话历史
-        messages = get_history(user_id, history_uid)
-        self._memory = []
-        self._memory.append({
-            "role": "system",
-            "content": self._system,
-        })
-
-        for msg in messages:
-            self._memory.append({
-                "role": "user" if msg["role"] == "human" else "assistant",
-                "content": msg["content"],
-            })
+
+        self._context.clear()
+        self._context.pin(
+            {
+                "role": "system",
+                "content": self._agent._system,
+            }
+        )
+        self._context.set_summary(metadata.get("context_summary", ""))
+        self._context.load(
+            [
+                {
+                    "role": "user" if msg["role"] == "human" else "assistant",
+                    "content": msg["content"],
+                }
+                for msg in messages
+            ]
+        )
+
+    def _read_recent_history(self, user_id: str, history_uid: str) -> List[dict]:
+        """Read the latest messages page by page until they fill the token budget"""
+        token_budget = self._context.token_budget
+        if not token_budget:
+            return get_history(user_id, history_uid)
+
+        messages: List[dict] = []
+        tokens = 0
+        cursor = None
+        while True:
+            page, cursor = get_history_page(user_id, history_uid, before=cursor)
+            messages[:0] = page
+            tokens += sum(count_message_tokens(msg) for msg in page)
+            if cursor is None or tokens >= token_budget:
+                return messages
 
     def handle_interrupt(self, heard_response: str) -> None:
         """
@@ -197,66 +526,34 @@ class BasicMemoryAgent(AgentInterface):
 
         self._interrupt_handled = True
 
-        if self._memory and self._memory[-1]["role"] == "assistant":
-            self._memory[-1]["content"] = heard_response + "..."
+        last_message = self._context.last_message
+        if last_message and last_message["role"] == "assistant":
+            self._context.update_last(heard_response + "...")
         else:
             if heard_response:
-                self._memory.append(
+                self._context.append(
                     {
                         "role": "assistant",
                         "content": heard_response + "...",
                     }
                 )
-        self._memory.append(
+        self._context.append(
             {
-                "role": "system" if self.interrupt_method == "system" else "user",
+                "role": "system"
+                if self._agent.interrupt_method == "system"
+                else "user",
                 "content": "[Interrupted by user]",
             }
         )
 
-    def _to_text_prompt(self, input_data: BatchInput) -> str:
-        """
-        Format BatchInput into a prompt string for the LLM.
-
-        Args:
-            input_data: BatchInput - The input data containing texts and images
-
-        Returns:
-            str - Formatted message string
-        """
-        message_parts = []
-
-        # Process text inputs in order
-        for text_data in input_data.texts:
-            if text_data.source == TextSource.INPUT:
-                message_parts.append(text_data.content)
-            elif text_data.source == TextSource.CLIPBOARD:
-                message_parts.append(f"[Clipboard content: {text_data.content}]")
-
-        # Process images in order
-        if input_data.images:
-            message_parts.append("\nImages in this message:")
-            for i, img_data in enumerate(input_data.images, 1):
-                source_desc = {
-                    ImageSource.CAMERA: "captured from camera",
-                    ImageSource.SCREEN: "screenshot",
-                    ImageSource.CLIPBOARD: "from clipboard",
-                    ImageSource.UPLOAD: "uploaded",
-                }[img_data.source]
-                message_parts.append(f"- Image {i} ({source_desc})")
-
-        return "\n".join(message_parts)
-
     def _to_messages(self, input_data: BatchInput) -> List[Dict[str, Any]]:
         """
         Prepare messages list with image support.
         """
-        messages = self._memory.copy()
-
+        text_prompt = self._agent._to_text_prompt(input_data)
         if input_data.images:
             content = []
-            text_content = self._to_text_prompt(input_data)
-            content.append({"type": "text", "text": text_content})
+            content.append({"type": "text", "text": text_prompt})
 
             for img_data in input_data.images:
                 content.append(
@@ -268,83 +565,20 @@ class BasicMemoryAgent(AgentInterface):
 
             user_message = {"role": "user", "content": content}
         else:
-            user_message = {"role": "user", "content": self._to_text_prompt(input_data)}
+            user_message = {"role": "user", "content": text_prompt}
 
-        messages.append(user_message)
+        # Add the message first so the window evicts old turns before the prompt is built
         self._add_message(user_message["content"], "user")
+        messages = self._context.to_messages()
+        messages[-1] = user_message
         return messages
 
-    def _chat_function_factory(
-        self, chat_func: Callable[[List[Dict[str, Any]], str], AsyncIterator[str]]
-    ) -> Callable[..., AsyncIterator[SentenceOutput]]:
-        """
-        Create the chat pipeline with transformers
-
-        The pipeline:
-        LLM tokens -> sentence_divider -> actions_extractor -> display_processor -> tts_filter
-        """
-
-        @tts_filter(self._tts_preprocessor_config)
-        @display_processor()
-        @actions_extractor(self._live2d_model)
-        @sentence_divider(
-            faster_first_response=self._faster_first_response,
-            segment_method=self._segment_method,
-            valid_tags=["think"],
-        )
-        async def chat_with_memory(input_data: BatchInput) -> AsyncIterator[str]:
-            """
-            Chat implementation with memory and processing pipeline
-
-            Args:
-                input_data: BatchInput
-
-            Returns:
-                AsyncIterator[str] - Token stream from LLM
-            """
-
-            messages = self._to_messages(input_data)
-            
-            # 获取 selection 参数
-            selection = input_data.texts[0].selection if input_data.texts else None
-            logger.info(f"Selection parameter: {selection}")
-            
-            logger.info(f"发送对话请求 - conversation_id: {self._conversation_id}, user_id: {self._user_id}")
-            
-            # 获取token流，传入会话信息
-            token_stream = chat_func(
-                messages, 
-                self._system,
-                conversation_id=self._conversation_id,
-                user_id=self._user_id,
-                selection=selection
+    def _save_context_summary(self, summary: str) -> None:
+        """Persist the rolling summary so it survives reloading the history"""
+        if self._conf_uid and self._history_uid:
+            update_metadate(
+                self._conf_uid, self._history_uid, {"context_summary": summary}
             )
-            complete_response = ""
-
-            async for token in token_stream:
-                # 检查是否是会话ID或消息ID的特殊标记
-                if token.startswith("__conversation_id:"):
-                    new_conversation_id = token.split(":", 1)[1]
-                    # logger.info(f"收到新的 conversation_id: {new_conversation_id}")
-                    # 更新会话ID并保存到元数据
-                    self.set_conversation_info(conversation_id=new_conversation_id)
-                    continue
-                elif token.startswith("__message_id:"):
-                    # 直接传递 message_id 标记，让装饰器链处理
-                    yield token
-                    continue
-                
-                yield token
-                complete_response += token
-
-            # Store complete response
-            self._add_message(complete_response, "assistant")
-
-        return chat_with_memory
-
-    async def chat(self, input_data: BatchInput) -> AsyncIterator[SentenceOutput]:
-        """Placeholder chat method that will be replaced at runtime"""
-        return self.chat(input_data)
 
     def reset_interrupt(self) -> None:
         """
@@ -352,6 +586,16 @@ class BasicMemoryAgent(AgentInterface):
         """
         self._interrupt_handled = False
 
+    def checkpoint_memory(self) -> Optional[int]:
+        """Mark the context window; None if the LLM service keeps its own conversation"""
+        if self._llm.keeps_conversation:
+            return None
+        return self._context.checkpoint()
+
+    def rollback_memory(self, checkpoint: int) -> None:
+        """Remove the messages added to the context window since `checkpoint`"""
+        self._context.rollback(checkpoint)
+
     def start_group_conversation(
         self, human_name: str, ai_participants: List[str]
     ) -> None:
@@ -370,7 +614,11 @@ class BasicMemoryAgent(AgentInterface):
             human_name=human_name, other_ais=other_ais
         )
 
-        self._memory.append({"role": "user", "content": group_context})
+        # Group context works like the persona and must never be evicted.
+        # Group turns start the conversation again on every input: replace it.
+        self._context.pin(
+            {"role": "user", "content": group_context}, key="group_context"
+        )
 
         logger.debug(f"Added group conversation context: '''{group_context}'''")
 
@@ -381,20 +629,26 @@ class BasicMemoryAgent(AgentInterface):
         content: str = ""
     ) -> bool:
         """发送消息反馈"""
+        extra_kwargs = {"api_key": self._api_key} if self._api_key else {}
         return await self._llm.send_feedback(
             message_id=message_id,
             rating=rating,
             user=self._user_id,
-            content=content
+            content=content,
+            **extra_kwargs,
         )
 
     async def update_api_key(self, api_key: str) -> None:
-        """更新 LLM 的 API key
-        
+        """更新本会话使用的 API key
+
+        LLM 实例由所有会话共享，因此 key 保存在会话中并随每次请求发送，
+        不会影响其他客户端。
+
         Args:
             api_key: 新的 API key
         """
         if hasattr(self._llm, 'update_api_key'):
-            await self._llm.update_api_key(api_key)
+            self._api_key = api_key
+            logger.info("已更新当前会话的 API key")
         else:
             logger.warning("LLM 不支持动态更新 API key")
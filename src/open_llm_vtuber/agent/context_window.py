@@ -0,0 +1,315 @@
+"""
+Token-budgeted context window for agents with chat memory.
+
+The window keeps pinned messages (system prompt, persona, group context) that
+are never evicted, a rolling summary of evicted turns, and the most recent
+messages that fit into the token budget. Token counts are computed once per
+message when it is added, so building the prompt never re-counts the history.
+Evicted turns are summarized in a background task, off the response path; if
+summarizing fails, they are kept and retried on the next turn.
+
+The summary goes into the system prompt (see `system_prompt`) rather than a
+message of its own, since some providers (e.g. Claude) drop system-role
+messages from the conversation.
+"""
+
+import asyncio
+import math
+import re
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+Message = Dict[str, Any]
+# (previous summary, evicted messages) -> new summary.
+# Raises (or returns an empty string) if the summary couldn't be generated.
+Summarizer = Callable[[str, List[Message]], Awaitable[str]]
+
+# Fixed per-message cost for role and formatting tokens
+MESSAGE_OVERHEAD_TOKENS = 4
+# Once over budget, evict down to this fraction of it, so evictions (and
+# summarization calls) happen in batches instead of on every turn
+EVICTION_LOW_WATERMARK = 0.75
+
+_CJK_PATTERN = re.compile(
+    r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]"
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of tokens in a text without loading a tokenizer.
+
+    CJK characters are counted as one token each, other text as one token
+    per four characters, which is close to BPE tokenizers for both.
+    """
+    if not text:
+        return 0
+    cjk_count = len(_CJK_PATTERN.findall(text))
+    return cjk_count + math.ceil((len(text) - cjk_count) / 4)
+
+
+def count_message_tokens(message: Message) -> int:
+    """Estimate the tokens of a chat message, including multimodal text parts."""
+    content = message.get("content", "")
+    if isinstance(content, list):
+        content = "".join(
+            item.get("text", "") for item in content if item.get("type") == "text"
+        )
+    return estimate_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+
+
+class ContextWindow:
+    """Sliding chat context bounded by a token budget."""
+
+    def __init__(
+        self,
+        token_budget: Optional[int] = None,
+        summarizer: Optional[Summarizer] = None,
+        min_recent_messages: int = 4,
+        on_summary: Optional[Callable[[str], None]] = None,
+    ):
+        """
+        Args:
+            token_budget: Maximum tokens of the prompt. None or 0 disables eviction.
+            summarizer: Async function folding evicted messages into the summary.
+                Without it, evicted messages are simply dropped.
+            min_recent_messages: Number of latest messages that are never evicted,
+                even if they exceed the budget on their own.
+            on_summary: Called with the new summary after each update,
+                e.g. to persist it.
+        """
+        self.token_budget = token_budget or None
+        self._summarizer = summarizer
+        self._min_recent_messages = min_recent_messages
+        self._on_summary = on_summary
+
+        # (message, tokens, key); a keyed message is replaced when pinned again
+        self._pinned: List[Tuple[Message, int, Optional[str]]] = []
+        self._messages: Deque[Tuple[Message, int]] = deque()
+        self._pinned_tokens = 0
+        self._message_tokens = 0
+
+        self._summary = ""
+        self._summary_tokens = 0
+        self._pending_eviction: List[Message] = []
+        self._summary_task: Optional[asyncio.Task] = None
+        # Number of messages appended so far, for checkpoint/rollback
+        self._appended = 0
+
+    @property
+    def summary(self) -> str:
+        return self._summary
+
+    @property
+    def total_tokens(self) -> int:
+        """Estimated tokens of the prompt returned by `to_messages`."""
+        return self._pinned_tokens + self._summary_tokens + self._message_tokens
+
+    @property
+    def last_message(self) -> Optional[Message]:
+        return self._messages[-1][0] if self._messages else None
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def clear(self) -> None:
+        """Drop pinned messages, the conversation and the summary."""
+        self._pinned.clear()
+        self._messages.clear()
+        self._pinned_tokens = 0
+        self._message_tokens = 0
+        self._pending_eviction.clear()
+        if self._summary_task and not self._summary_task.done():
+            self._summary_task.cancel()
+        self._summary_task = None
+        self.set_summary("")
+
+    def pin(self, message: Message, key: Optional[str] = None) -> None:
+        """
+        Add a message that always stays at the top of the prompt. With a
+        `key`, it replaces the message pinned earlier with the same key.
+        """
+        tokens = count_message_tokens(message)
+        if key is not None:
+            for i, (_, old_tokens, old_key) in enumerate(self._pinned):
+                if old_key == key:
+                    self._pinned[i] = (message, tokens, key)
+                    self._pinned_tokens += tokens - old_tokens
+                    return
+        self._pinned.append((message, tokens, key))
+        self._pinned_tokens += tokens
+
+    def set_summary(self, summary: str) -> None:
+        """Replace the rolling summary, e.g. when restoring a saved session."""
+        self._summary = summary or ""
+        self._summary_tokens = (
+            estimate_tokens(self._summary_text()) if self._summary else 0
+        )
+
+    def system_prompt(self, system: str) -> str:
+        """The system prompt for the next request, with the summary appended."""
+        if not self._summary:
+            return system
+        return f"{system}\n\n{self._summary_text()}" if system else self._summary_text()
+
+    def append(self, message: Message) -> None:
+        """Add a conversation message and evict old turns if over budget."""
+        tokens = count_message_tokens(message)
+        self._messages.append((message, tokens))
+        self._message_tokens += tokens
+        self._appended += 1
+        self._evict()
+        if self._pending_eviction and message.get("role") == "user":
+            # Retry a summary that failed on an earlier turn
+            self._schedule_summary()
+
+    def checkpoint(self) -> int:
+        """Mark the current end of the conversation for `rollback`."""
+        return self._appended
+
+    def rollback(self, checkpoint: int) -> None:
+        """
+        Remove the messages appended since `checkpoint`. Messages evicted in
+        the meantime stay evicted.
+        """
+        count = min(self._appended - checkpoint, len(self._messages))
+        for _ in range(max(count, 0)):
+            _, tokens = self._messages.pop()
+            self._message_tokens -= tokens
+        self._appended = checkpoint
+
+    def load(self, messages: List[Message]) -> None:
+        """
+        Bulk-load a stored conversation, keeping only the latest messages
+        that fit into the budget. Older messages are skipped without being
+        counted or summarized; restore their summary with `set_summary`.
+        """
+        kept: List[Tuple[Message, int]] = []
+        tokens_left = (
+            self.token_budget - self._pinned_tokens - self._summary_tokens
+            if self.token_budget
+            else None
+        )
+        for message in reversed(messages):
+            tokens = count_message_tokens(message)
+            if (
+                tokens_left is not None
+                and tokens > tokens_left
+                and len(kept) >= self._min_recent_messages
+            ):
+                break
+            kept.append((message, tokens))
+            if tokens_left is not None:
+                tokens_left -= tokens
+        # Don't start the window with an AI reply
+        while (
+            len(kept) > self._min_recent_messages
+            and kept[-1][0].get("role") == "assistant"
+        ):
+            kept.pop()
+        for message, tokens in reversed(kept):
+            self._messages.append((message, tokens))
+            self._message_tokens += tokens
+
+    def update_last(self, content: Any) -> None:
+        """Replace the content of the latest message and recount its tokens."""
+        if not self._messages:
+            return
+        message, tokens = self._messages.pop()
+        message["content"] = content
+        self._message_tokens -= tokens
+        self.append(message)
+
+    def to_messages(self) -> List[Message]:
+        """
+        Build the prompt: pinned messages, then recent messages. The summary
+        is not included; pass the system prompt through `system_prompt`.
+        """
+        messages = [message for message, _, _ in self._pinned]
+        messages.extend(message for message, _ in self._messages)
+        return messages
+
+    async def wait_for_summary(self) -> None:
+        """Wait until the background summarization has caught up."""
+        while self._summary_task and not self._summary_task.done():
+            await asyncio.shield(self._summary_task)
+
+    def _summary_text(self) -> str:
+        return f"Summary of the earlier conversation:\n{self._summary}"
+
+    def _evict(self) -> None:
+        if not self.token_budget:
+            return
+
+        if self.total_tokens <= self.token_budget:
+            return
+
+        target = self.token_budget * EVICTION_LOW_WATERMARK
+        evicted = []
+        while (
+            self.total_tokens > target
+            and len(self._messages) > self._min_recent_messages
+        ):
+            message, tokens = self._messages.popleft()
+            self._message_tokens -= tokens
+            evicted.append(message)
+            # Evict whole turns so the window never starts with an AI reply
+            while (
+                self._messages
+                and self._messages[0][0].get("role") == "assistant"
+                and len(self._messages) > self._min_recent_messages
+            ):
+                message, tokens = self._messages.popleft()
+                self._message_tokens -= tokens
+                evicted.append(message)
+
+        if not evicted:
+            return
+        logger.debug(
+            f"Context window: evicted {len(evicted)} messages, "
+            f"{self.total_tokens}/{self.token_budget} tokens left in prompt"
+        )
+        if self._summarizer:
+            self._pending_eviction.extend(evicted)
+            self._schedule_summary()
+
+    def _schedule_summary(self) -> None:
+        if self._summary_task and not self._summary_task.done():
+            # The running task picks up the new messages when it loops
+            return
+        try:
+            self._summary_task = asyncio.get_running_loop().create_task(
+                self._summarize_pending()
+            )
+        except RuntimeError:
+            # No event loop yet (e.g. loading history at startup);
+            # the next eviction inside the loop will schedule it.
+            pass
+
+    async def _summarize_pending(self) -> None:
+        while self._pending_eviction:
+            batch = self._pending_eviction
+            self._pending_eviction = []
+            try:
+                summary = await self._summarizer(self._summary, batch)
+                if not summary or not summary.strip():
+                    raise RuntimeError("the summarizer returned an empty summary")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Keep the old summary and the evicted messages; retry next turn
+                self._pending_eviction[:0] = batch
+                logger.error(
+                    f"Failed to summarize evicted context, "
+                    f"{len(self._pending_eviction)} messages pending: {e}"
+                )
+                return
+            self.set_summary(summary.strip())
+            logger.debug(f"Context summary updated: '''{self._summary}'''")
+            if self._on_summary:
+                try:
+                    self._on_summary(self._summary)
+                except Exception as e:
+                    logger.error(f"Failed to save context summary: {e}")
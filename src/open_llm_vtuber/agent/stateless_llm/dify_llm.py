@@ -1,11 +1,161 @@
-from typing import AsyncIterator, List, Dict, Any
+from typing import AsyncIterator, List, Dict, Any, Optional
 import json
-import aiohttp
 from loguru import logger
 
 from .stateless_llm_interface import StatelessLLMInterface
+from ...utils.http_client import http_clients
+
+# 分隔符优先级
+PRIMARY_ENDINGS = frozenset("。？！；")  # 主要分隔符
+SECONDARY_ENDINGS = frozenset("，、）】》\"'：")  # 次要分隔符
+SOFT_SPLIT_THRESHOLD = 50  # 没有主要分隔符时，超过该长度才尝试次要分隔符
+SOFT_SPLIT_WINDOW = 100  # 次要分隔符的搜索范围
+CODE_FENCE = "```"
+
+_TEXT, _CODE, _TABLE = "text", "code", "table"
+
+
+class StreamingTextSplitter:
+    """Dify 流式回复的增量分句器
+
+    每次请求创建一个实例。普通文本按分层分隔符切分（主要分隔符 > 换行 >
+    次要分隔符 > 空格），代码块和行首的表格整体输出。每个字符只扫描一次，
+    已扫描的位置保存在 `_pos` 中，新数据到达时从该位置继续。
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        self._pending = ""
+        self._pos = 0  # 下一个待扫描字符在 _pending 中的位置
+        self._state = _TEXT
+        self._at_line_start = True  # 当前行到 _pos 为止只有空白
+        self._has_content = False  # _pending 中已扫描部分是否有非空白字符
+
+    def feed(self, chunk: str) -> List[str]:
+        """追加一段流式文本，返回其中已完整的片段"""
+        self._pending += chunk
+        segments = []
+        while True:
+            if self._state == _CODE:
+                segment = self._scan_code()
+            elif self._state == _TABLE:
+                segment = self._scan_table()
+            else:
+                segment = self._scan_text()
+            if segment is None:
+                return segments
+            segments.append(segment)
+
+    def flush(self) -> str:
+        """返回剩余的不完整内容并重置状态"""
+        remaining = self._pending if self._pending.strip() else ""
+        self.reset()
+        return remaining
+
+    def _cut(self, end: int, at_line_start: bool) -> str:
+        segment = self._pending[:end]
+        self._pending = self._pending[end:]
+        self._pos = 0
+        self._state = _TEXT
+        self._at_line_start = at_line_start
+        self._has_content = False
+        return segment
+
+    def _scan_text(self) -> Optional[str]:
+        text = self._pending
+        n = len(text)
+        i = self._pos
+        while i < n:
+            ch = text[i]
+            if ch == "\n":
+                # 没有主要分隔符的行在换行处结束
+                if self._has_content:
+                    return self._cut(i + 1, at_line_start=True)
+                self._at_line_start = True
+            elif ch not in " \t":
+                if ch == "`":
+                    if n - i < len(CODE_FENCE) and CODE_FENCE.startswith(text[i:]):
+                        # 还不能确定是否为代码块，等待更多数据
+                        self._pos = i
+                        return None
+                    if text.startswith(CODE_FENCE, i):
+                        if self._has_content:
+                            # 先输出代码块之前的正文
+                            return self._cut(i, at_line_start=False)
+                        self._state = _CODE
+                        self._pos = i + len(CODE_FENCE)
+                        return self._scan_code()
+                if self._at_line_start:
+                    # 行首的表格；此时 _pending[:i] 只有空白（含空行），一并归入表格中
+                    if ch == "|":
+                        self._state = _TABLE
+                        self._pos = text.rfind("\n", 0, i) + 1
+                        return self._scan_table()
+                    self._at_line_start = False
+                self._has_content = True
+                if ch in PRIMARY_ENDINGS and i > 0:
+                    return self._cut(i + 1, at_line_start=False)
+            i += 1
+        self._pos = n
+
+        # 没有找到主要分隔符，文本过长时在窗口内最后一个次要分隔符或空格处切分
+        if n > SOFT_SPLIT_THRESHOLD and self._has_content:
+            window = text[:SOFT_SPLIT_WINDOW]
+            split_at = -1
+            for j in range(len(window) - 1, 0, -1):
+                if window[j] in SECONDARY_ENDINGS:
+                    split_at = j
+                    break
+            if split_at <= 0:
+                split_at = window.rfind(" ")
+            if split_at > 0:
+                segment = self._cut(split_at + 1, at_line_start=False)
+                # 剩余部分已确认不含换行和主要分隔符，只需更新内容标记
+                self._has_content = bool(self._pending.strip())
+                self._pos = len(self._pending)
+                return segment
+        return None
+
+    def _scan_code(self) -> Optional[str]:
+        text = self._pending
+        end = text.find(CODE_FENCE, self._pos)
+        if end == -1:
+            # 保留末尾可能构成半个围栏的字符
+            self._pos = max(self._pos, len(text) - len(CODE_FENCE) + 1)
+            return None
+        end += len(CODE_FENCE)
+        if end == len(text):
+            # 等待下一个字符，以便把围栏后的换行一起输出
+            self._pos = end - len(CODE_FENCE)
+            return None
+        if text[end] == "\n":
+            return self._cut(end + 1, at_line_start=True)
+        return self._cut(end, at_line_start=False)
+
+    def _scan_table(self) -> Optional[str]:
+        text = self._pending
+        while True:
+            line_end = text.find("\n", self._pos)
+            line = text[self._pos :] if line_end == -1 else text[self._pos : line_end]
+            stripped = line.lstrip(" \t")
+            if line_end == -1:
+                # 最后一行未完整：一旦能看出不是表格行，表格就结束了
+                if stripped and not stripped.startswith("|"):
+                    return self._cut(self._pos, at_line_start=True)
+                return None
+            if not stripped.startswith("|"):
+                return self._cut(self._pos, at_line_start=True)
+            self._pos = line_end + 1
+
 
 class AsyncLLM(StatelessLLMInterface):
+    # Dify 在服务端保存会话
+    keeps_conversation = True
+    # 出错时以文本形式返回的错误信息
+    error_prefixes = ("错误: ", "调用 Dify API 时发生错误")
+
     def __init__(
         self,
         base_url: str,
@@ -30,33 +180,37 @@ class AsyncLLM(StatelessLLMInterface):
         }
         self.model = model
         self.temperature = temperature
-        self.buffer = ""
-        self.newline_buffer = ""  # 添加新的缓冲区用于处理换行符
-        
+        # 启动时预先建立到 Dify 的连接
+        http_clients.register_warm_up(self.base_url)
+
         logger.info(f"已初始化 Dify LLM，API端点：{self.chat_endpoint}")
 
+    def _headers(self, api_key: Optional[str] = None) -> Dict[str, str]:
+        """返回请求头；传入 api_key 时只对本次请求生效"""
+        if not api_key:
+            return self.headers
+        return {**self.headers, "Authorization": f"Bearer {api_key}"}
+
     async def get_parameters(self) -> Dict[str, Any]:
         """获取 Dify 应用参数"""
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(
-                    self.parameters_endpoint,
-                    headers=self.headers
-                ) as response:
-                    if response.status != 200:
-                        raise Exception(f"获取参数失败: {response.status}")
-                    data = await response.json()
-                    # 提取 select options
-                    select_options = []
-                    for input_form in data.get("user_input_form", []):
-                        # 检查是否有 select 字段
-                        if "select" in input_form:
-                            select_data = input_form["select"]
-                            if "options" in select_data:
-                                select_options = select_data["options"]
-                                logger.info(f"获取到选项列表: {select_options}")
-                                break
-                    return {"select_options": select_options}
+            response = await http_clients.async_client.get(
+                self.parameters_endpoint, headers=self.headers
+            )
+            if response.status_code != 200:
+                raise Exception(f"获取参数失败: {response.status_code}")
+            data = response.json()
+            # 提取 select options
+            select_options = []
+            for input_form in data.get("user_input_form", []):
+                # 检查是否有 select 字段
+                if "select" in input_form:
+                    select_data = input_form["select"]
+                    if "options" in select_data:
+                        select_options = select_data["options"]
+                        logger.info(f"获取到选项列表: {select_options}")
+                        break
+            return {"select_options": select_options}
         except Exception as e:
             logger.error(f"获取 Dify 参数失败: {e}")
             return {"select_options": []}
@@ -67,7 +221,8 @@ class AsyncLLM(StatelessLLMInterface):
         system: str = None,
         conversation_id: str = "",
         user_id: str = None,
-        selection: str = None  # 新增参数
+        selection: str = None,  # 新增参数
+        api_key: str = None,
     ) -> AsyncIterator[str]:
         """生成聊天回复
 
@@ -77,13 +232,15 @@ class AsyncLLM(StatelessLLMInterface):
             conversation_id (str, optional): Dify 会话 ID
             user_id (str, optional): 用户标识
             selection (str, optional): 选择参数
+            api_key (str, optional): 本次请求使用的 API key，默认使用初始化时的 key
 
         Yields:
             str: API 响应的每个文本块
         """
         try:
             logger.info(f"准备发送请求到 Dify - conversation_id: {conversation_id}, user_id: {user_id}")
-            logger.info(f"api_key: {self.headers['Authorization']}")
+            headers = self._headers(api_key)
+            logger.info(f"api_key: {headers['Authorization']}")
             
             # 构建最后一条用户消息
             last_message = messages[-1]["content"] if messages else ""
@@ -106,198 +263,88 @@ class AsyncLLM(StatelessLLMInterface):
 
             logger.info(f"Dify 请求数据: {data}")
 
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    self.chat_endpoint,
-                    headers=self.headers,
-                    json=data
-                ) as response:
-                    if response.status != 200:
-                        error_text = await response.text()
-                        logger.error(f"Dify API返回错误: {response.status} - {error_text}")
-                        raise Exception(f"Dify API返回错误: {response.status} - {error_text}")
-
-                    # 处理SSE流式响应
-                    async for line in response.content:
-                        line = line.decode('utf-8').strip()
-                        if not line or line == "":
+            # 分句状态属于本次请求，避免多个会话共用同一个 LLM 实例时互相串话
+            splitter = StreamingTextSplitter()
+
+            async with http_clients.async_client.stream(
+                "POST", self.chat_endpoint, headers=headers, json=data
+            ) as response:
+                if response.status_code != 200:
+                    error_text = (await response.aread()).decode(
+                        "utf-8", errors="replace"
+                    )
+                    logger.error(
+                        f"Dify API返回错误: {response.status_code} - {error_text}"
+                    )
+                    raise Exception(
+                        f"Dify API返回错误: {response.status_code} - {error_text}"
+                    )
+
+                # 处理SSE流式响应
+                async for line in response.aiter_lines():
+                    line = line.strip()
+                    if not line or line == "":
+                        continue
+                    if line.startswith("data: "):
+                        try:
+                            event_data = json.loads(line[6:])  # 去掉"data: "前缀
+
+                            # 处理conversation_id
+                            if not conversation_id and event_data.get(
+                                "conversation_id"
+                            ):
+                                new_conversation_id = event_data["conversation_id"]
+                                yield f"__conversation_id:{new_conversation_id}"
+
+                            if event_data.get("event") == "error":
+                                error_msg = event_data.get("message", "未知错误")
+                                logger.error(f"Dify API错误: {error_msg}")
+                                yield f"错误: {error_msg}"
+                                break
+
+                            elif event_data.get("event") == "message":
+                                # 处理 message_id
+                                if event_data.get("message_id"):
+                                    yield f"__message_id:{event_data['message_id']}"
+
+                                answer = event_data.get("answer", "")
+                                if answer:
+                                    # 只扫描新到达的文本，可能一次产出多个完整片段
+                                    for complete_text in splitter.feed(answer):
+                                        # 特殊处理代码块
+                                        if "```" in complete_text:
+                                            logger.info(
+                                                f"Dify API 返回代码块: {complete_text}"
+                                            )
+                                        else:
+                                            logger.info(
+                                                f"Dify API 返回文本: {complete_text}"
+                                            )
+                                        yield complete_text
+
+                            elif event_data.get("event") == "message_end":
+                                # 输出剩余的缓冲区内容
+                                remaining = splitter.flush()
+                                if remaining:
+                                    logger.info(f"Dify API 返回最后内容: {remaining}")
+                                    yield remaining
+                                break
+
+                        except json.JSONDecodeError as e:
+                            logger.error(f"解析响应数据时出错: {e}")
                             continue
-                        if line.startswith("data: "):
-                            try:
-                                event_data = json.loads(line[6:])  # 去掉"data: "前缀
-                                
-                                # 处理conversation_id
-                                if not conversation_id and event_data.get("conversation_id"):
-                                    new_conversation_id = event_data["conversation_id"]
-                                    yield f"__conversation_id:{new_conversation_id}"
-                                
-                                if event_data.get("event") == "error":
-                                    error_msg = event_data.get("message", "未知错误")
-                                    logger.error(f"Dify API错误: {error_msg}")
-                                    yield f"错误: {error_msg}"
-                                    break
-                                
-                                elif event_data.get("event") == "message":
-                                    # 处理 message_id
-                                    if event_data.get("message_id"):
-                                        yield f"__message_id:{event_data['message_id']}"
-                                        
-                                    answer = event_data.get("answer", "")
-                                    if answer:
-                                        self.buffer += answer
-                                        # 检查是否有完整的句子或段落
-                                        sentences = self._split_complete_sentences(self.buffer)
-                                        if sentences:
-                                            complete_text = sentences[0]
-                                            self.buffer = sentences[1]
-                                            
-                                            # 特殊处理代码块
-                                            if '```' in complete_text:
-                                                logger.info(f"Dify API 返回代码块: {complete_text}")
-                                            else:
-                                                logger.info(f"Dify API 返回文本: {complete_text}")
-                                            yield complete_text
-                                
-                                elif event_data.get("event") == "message_end":
-                                    # 输出剩余的缓冲区内容
-                                    if self.buffer:
-                                        logger.info(f"Dify API 返回最后内容: {self.buffer}")
-                                        yield self.buffer
-                                        self.buffer = ""
-                                    break
-
-                            except json.JSONDecodeError as e:
-                                logger.error(f"解析响应数据时出错: {e}")
-                                continue
 
         except Exception as e:
             logger.error(f"调用 Dify API 时发生错误: {e}")
             yield f"调用 Dify API 时发生错误: {e}"
-        finally:
-            # 清理缓冲区
-            self.buffer = ""
-
-    def _split_complete_sentences(self, text: str) -> List[str]:
-        """
-        按顺序划分语句，处理普通文本、代码块和表格。
-        返回一个列表：[完整的句子/代码块/表格, 剩余的不完整内容]
-        """
-        if not text.strip():
-            return []
-
-        # 查找第一个特殊标记（代码块或表格）的位置
-        code_start = text.find('```')
-        table_start = text.find('|')
-        
-        # 没有特殊标记，按普通文本处理
-        if code_start == -1 and table_start == -1:
-            return self._split_normal_text(text)
-        
-        # # 确定第一个特殊标记的位置和类型
-        # first_special = min(
-        #     (pos for pos in [code_start, table_start] if pos != -1), 
-        #     default=-1
-        # )
-        
-        # # 如果特殊标记前有普通文本，强制输出
-        # if first_special > 0:
-        #     normal_text = text[:first_special]
-        #     # 在普通文本末尾添加换行符
-        #     if not normal_text.endswith('\n'):
-        #         normal_text += '\n'
-        #     return [normal_text, text[first_special:]]
-        
-        # 处理代码块
-        if code_start:
-            if text.count('```', code_start) < 2:
-                # 代码块未完成
-                return []
-            
-            end_idx = text.find('```', code_start + 3)
-            code_block = text[code_start:end_idx + 3]
-            remaining = text[end_idx + 3:]
-            
-            # 在代码块结束后添加换行符
-            if remaining and not remaining.startswith('\n'):
-                code_block += '\n'
-            
-            return [code_block, remaining]
-        
-        # 处理表格
-        if table_start:
-            lines = text[table_start:].split('\n')
-            table_lines = []
-            remaining_lines = []
-            in_table = False
-            
-            for i, line in enumerate(lines):
-                if line.strip().startswith('|'):
-                    if not in_table:
-                        in_table = True
-                    table_lines.append(line)
-                else:
-                    if in_table:
-                        # 表格结束
-                        remaining_lines = lines[i:]
-                        break
-                    remaining_lines.append(line)
-            
-            if table_lines:
-                table = '\n'.join(table_lines)
-                remaining = '\n'.join(remaining_lines)
-                return [table, remaining]
-            
-        return []
-
-    def _split_normal_text(self, text: str) -> List[str]:
-        """
-        处理普通文本的分句，使用分层的分隔符系统
-        返回一个列表：[完整的句子, 剩余的不完整内容]
-        """
-        # 定义分隔符优先级
-        primary_endings = ['。', '？', '！', '；']  # 主要分隔符
-        secondary_endings = ['，', '、', '）', '】', '》', '"', "'", '：']  # 次要分隔符
-        
-        # 从前向后查找第一个主要分隔符
-        for i in range(len(text)):
-            # 检查是否是主要分隔符
-            if text[i] in primary_endings:
-                if i > 0:
-                    return [text[:i+1], text[i+1:]]
-            # 如果遇到换行符，且之前的文本中没有任何主要分隔符
-            elif text[i] == '\n':
-                has_primary = any(ending in text[:i] for ending in primary_endings)
-                if not has_primary and i > 0:
-                    return [text[:i+1], text[i+1:]]
-        
-        # 如果没有找到主要分隔符，且文本长度超过50，尝试使用次要分隔符
-        if len(text) > 50:
-            # 在50个字符范围内查找最后一个次要分隔符
-            last_idx = -1
-            search_range = min(len(text), 100)  # 将搜索范围扩大到100个字符
-            
-            for i in range(search_range):
-                if text[i] in secondary_endings:
-                    last_idx = i
-            
-            if last_idx > 0:
-                # 找到次要分隔符，在此处分割
-                return [text[:last_idx+1], text[last_idx+1:]]
-            
-            # 如果连次要分隔符都没找到，再尝试查找空格
-            last_space = text[:search_range].rfind(' ')
-            if last_space > 0:
-                return [text[:last_space+1], text[last_space+1:]]
-        
-        # 如果文本较短或没有找到任何分隔符，返回空列表表示继续等待
-        return [] 
 
     async def send_feedback(
         self,
         message_id: str,
         rating: str,
         user: str,
-        content: str = ""
+        content: str = "",
+        api_key: str = None,
     ) -> bool:
         """发送消息反馈到 Dify API
         
@@ -306,24 +353,20 @@ class AsyncLLM(StatelessLLMInterface):
             rating: 反馈类型 ('like', 'dislike', 'null')
             user: 用户标识
             content: 反馈内容
+            api_key: 本次请求使用的 API key，默认使用初始化时的 key
         """
         try:
             feedback_endpoint = f"{self.base_url}/v1/messages/{message_id}/feedbacks"
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    feedback_endpoint,
-                    headers=self.headers,
-                    json={
-                        "rating": rating,
-                        "user": user,
-                        "content": content
-                    }
-                ) as response:
-                    if response.status != 200:
-                        logger.error(f"发送反馈失败: {response.status}")
-                        return False
-                    logger.info(f"发送反馈成功: {response.status}")
-                    return True
+            response = await http_clients.async_client.post(
+                feedback_endpoint,
+                headers=self._headers(api_key),
+                json={"rating": rating, "user": user, "content": content},
+            )
+            if response.status_code != 200:
+                logger.error(f"发送反馈失败: {response.status_code}")
+                return False
+            logger.info(f"发送反馈成功: {response.status_code}")
+            return True
         except Exception as e:
             logger.error(f"发送反馈时出错: {e}")
             return False 
@@ -18,6 +18,8 @@ from .stateless_llm_interface import StatelessLLMInterface
 
 
 class AsyncLLM(StatelessLLMInterface):
+    error_prefixes = ("Error calling the chat endpoint",)
+
     def __init__(
         self,
         model: str,
@@ -1,5 +1,5 @@
 import abc
-from typing import AsyncIterator, List, Dict, Any
+from typing import AsyncIterator, ClassVar, List, Dict, Any, Tuple
 
 
 class StatelessLLMInterface(metaclass=abc.ABCMeta):
@@ -18,6 +18,14 @@ class StatelessLLMInterface(metaclass=abc.ABCMeta):
 
     """
 
+    # True if the service keeps its own copy of the conversation (e.g. Dify),
+    # so a sent request can't be taken back
+    keeps_conversation: ClassVar[bool] = False
+
+    # Prefixes of the error messages the service yields as response text
+    # instead of raising, so callers can tell a failed completion apart
+    error_prefixes: ClassVar[Tuple[str, ...]] = ()
+
     @abc.abstractmethod
     async def chat_completion(
         self, messages: List[Dict[str, Any]], system: str = None
@@ -3,10 +3,6 @@ from typing import Type
 from loguru import logger
 
 from .stateless_llm.stateless_llm_interface import StatelessLLMInterface
-from .stateless_llm.openai_compatible_llm import AsyncLLM as OpenAICompatibleLLM
-from .stateless_llm.ollama_llm import OllamaLLM
-from .stateless_llm.claude_llm import AsyncLLM as ClaudeLLM
-from .stateless_llm.dify_llm import AsyncLLM as DifyLLM
 
 
 class LLMFactory:
@@ -29,6 +25,10 @@ class LLMFactory:
             or llm_provider == "groq_llm"
             or llm_provider == "mistral_llm"
         ):
+            from .stateless_llm.openai_compatible_llm import (
+                AsyncLLM as OpenAICompatibleLLM,
+            )
+
             return OpenAICompatibleLLM(
                 model=kwargs.get("model"),
                 base_url=kwargs.get("base_url"),
@@ -37,6 +37,8 @@ class LLMFactory:
                 project_id=kwargs.get("project_id"),
             )
         elif llm_provider == "dify_llm":
+            from .stateless_llm.dify_llm import AsyncLLM as DifyLLM
+
             return DifyLLM(
                 base_url=kwargs.get("base_url"),
                 llm_api_key=kwargs.get("llm_api_key"),
@@ -44,6 +46,8 @@ class LLMFactory:
                 temperature=kwargs.get("temperature", 1.0),
             )
         if llm_provider == "ollama_llm":
+            from .stateless_llm.ollama_llm import OllamaLLM
+
             return OllamaLLM(
                 model=kwargs.get("model"),
                 base_url=kwargs.get("base_url"),
@@ -62,6 +66,8 @@ class LLMFactory:
                 model_path=kwargs.get("model_path"),
             )
         elif llm_provider == "claude_llm":
+            from .stateless_llm.claude_llm import AsyncLLM as ClaudeLLM
+
             return ClaudeLLM(
                 system=kwargs.get("system_prompt"),
                 base_url=kwargs.get("base_url"),
@@ -1,5 +1,6 @@
 from typing import AsyncIterator, Tuple, Callable, List
 from functools import wraps
+from dataclasses import replace
 from .output_types import Actions, SentenceOutput, DisplayText
 from ..utils.tts_preprocessor import tts_filter as filter_text
 from ..live2d_model import Live2dModel
@@ -38,7 +39,9 @@ def sentence_divider(
 
 def actions_extractor(live2d_model: Live2dModel):
     """
-    Decorator that extracts actions from sentences
+    Decorator that extracts actions from sentences.
+    The emotion tags are removed from the sentence in the same pass, so the
+    display text and the TTS text never contain them.
     """
 
     def decorator(
@@ -55,9 +58,12 @@ def actions_extractor(live2d_model: Live2dModel):
                 if not any(
                     tag.state in [TagState.START, TagState.END] for tag in sentence.tags
                 ):
-                    expressions = live2d_model.extract_emotion(sentence.text)
+                    expressions, text = live2d_model.extract_and_remove_emotions(
+                        sentence.text
+                    )
                     if expressions:
                         actions.expressions = expressions
+                        sentence = replace(sentence, text=text)
                 yield sentence, actions
 
         return wrapper
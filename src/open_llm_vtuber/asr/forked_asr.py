@@ -0,0 +1,56 @@
+import threading
+from typing import List
+
+import numpy as np
+
+from .asr_interface import ASRInterface
+from ..utils.forked_worker import ForkedWorker
+
+
+class ForkedASREngine(ASRInterface):
+    """
+    An ASR engine loaded in this process, transcribing in forked worker
+    processes that share its model weights. Each call goes to the worker
+    with the fewest calls in progress.
+    """
+
+    def __init__(self, engine: ASRInterface, worker_processes: int, name: str = "asr"):
+        if worker_processes < 1:
+            raise ValueError(
+                f"ASR needs at least one worker process, got {worker_processes}"
+            )
+        self.engine = engine
+        self.SAMPLE_RATE = engine.SAMPLE_RATE
+        self._workers: List[ForkedWorker] = [
+            ForkedWorker(engine, name=name) for _ in range(worker_processes)
+        ]
+        self._in_flight = [0] * worker_processes
+        self._lock = threading.Lock()
+
+    def _lease(self) -> int:
+        with self._lock:
+            index = min(range(len(self._workers)), key=self._in_flight.__getitem__)
+            self._in_flight[index] += 1
+            return index
+
+    def _return(self, index: int) -> None:
+        with self._lock:
+            self._in_flight[index] -= 1
+
+    def transcribe_np(self, audio: np.ndarray) -> str:
+        index = self._lease()
+        try:
+            return self._workers[index].call("transcribe_np", audio)
+        finally:
+            self._return(index)
+
+    async def async_transcribe_np(self, audio: np.ndarray) -> str:
+        index = self._lease()
+        try:
+            return await self._workers[index].acall("transcribe_np", audio)
+        finally:
+            self._return(index)
+
+    def close(self) -> None:
+        for worker in self._workers:
+            worker.close()
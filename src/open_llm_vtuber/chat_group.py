@@ -1,15 +1,28 @@
-from typing import Dict, List, Optional, Set, Tuple, Callable, Any
+from typing import Dict, List, Optional, Set, Tuple, Callable, Any, Union
 from dataclasses import dataclass
 from fastapi import WebSocket
+import asyncio
 import json
+import time
 from loguru import logger
 
 
+# Seconds a broadcast waits for one member before leaving it behind
+BROADCAST_SEND_TIMEOUT = 2.0
+# Sends slower than this are logged as warnings
+SLOW_SEND_SECONDS = 0.5
+# Messages queued for a member left behind; newer ones are dropped beyond that
+MAX_BROADCAST_BACKLOG = 256
+
+
 @dataclass
 class Group:
     group_id: str
     owner_uid: str
     members: Set[str]  # Set of client_uids
+    # Shared transcript of the group conversation; a new one starts when the
+    # members change
+    transcript_id: str = ""
 
 
 class ChatGroupManager:
@@ -56,6 +69,7 @@ class ChatGroupManager:
         # Add invitee to group
         group = self.groups[inviter_group_id]
         group.members.add(invitee_uid)
+        group.transcript_id = ""
         self.client_group_map[invitee_uid] = inviter_group_id
 
         logger.info(f"Added client {invitee_uid} to group {inviter_group_id}")
@@ -81,6 +95,7 @@ class ChatGroupManager:
 
         # Remove target from group
         group.members.remove(target_uid)
+        group.transcript_id = ""
         self.client_group_map[target_uid] = ""  # Empty string means not in any group
 
         # If group becomes empty or only has owner, delete it
@@ -113,6 +128,7 @@ class ChatGroupManager:
         # Remove client from group
         if client_uid in group.members:
             group.members.remove(client_uid)
+            group.transcript_id = ""
         if client_uid in self.client_group_map:
             del self.client_group_map[client_uid]
 
@@ -268,6 +284,7 @@ async def handle_client_disconnect(
     """Handle client disconnection from group"""
     old_group_members = chat_group_manager.get_group_members(client_uid)
     chat_group_manager.remove_client(client_uid)
+    _backlogs.pop(client_uid, None)
 
     # Send updates to remaining group members
     for member_uid in old_group_members:
@@ -284,16 +301,128 @@ async def handle_client_disconnect(
             )
 
 
+@dataclass
+class _Backlog:
+    """Sends still running for a member a broadcast has left behind"""
+
+    websocket: WebSocket
+    # Latest send; each one waits for the previous, keeping the order
+    task: asyncio.Task
+    size: int
+
+
+# member_uid -> backlog, while the member is behind
+_backlogs: Dict[str, _Backlog] = {}
+
+
 async def broadcast_to_group(
     group_members: List[str],
-    message: Dict[str, Any],
+    message: Union[Dict[str, Any], str],
     client_connections: Dict[str, WebSocket],
     exclude_uid: Optional[str] = None,
+    timeout: float = BROADCAST_SEND_TIMEOUT,
+) -> Dict[str, Optional[float]]:
+    """
+    Broadcasts a message to all members in a group except the sender
+
+    The message is serialized once and sent to all members concurrently.
+    A member that doesn't receive it within `timeout` is left behind: the
+    send goes on in the background and later broadcasts are queued after it
+    without waiting, so a slow or dead client never delays the others.
+
+    Args:
+        message: The message, or its JSON text if already serialized
+
+    Returns:
+        Dict[str, Optional[float]]: Send latency in seconds of each member,
+        None if the member was left behind or the send failed
+    """
+    text = message if isinstance(message, str) else json.dumps(message)
+    member_uids = [
+        member_uid
+        for member_uid in group_members
+        if member_uid != exclude_uid and member_uid in client_connections
+    ]
+    latencies = await asyncio.gather(
+        *(
+            _send_to_member(member_uid, client_connections[member_uid], text, timeout)
+            for member_uid in member_uids
+        )
+    )
+    result = dict(zip(member_uids, latencies))
+    if result:
+        logger.debug(
+            "Broadcast send latency: "
+            + ", ".join(
+                f"{uid}={latency * 1000:.1f}ms"
+                if latency is not None
+                else f"{uid}=behind"
+                for uid, latency in result.items()
+            )
+        )
+    return result
+
+
+async def _send_to_member(
+    member_uid: str, websocket: WebSocket, text: str, timeout: float
+) -> Optional[float]:
+    backlog = _backlogs.get(member_uid)
+    if backlog is not None and (
+        backlog.websocket is not websocket or backlog.task.done()
+    ):
+        _backlogs.pop(member_uid, None)
+        backlog = None
+    if backlog is not None:
+        # Still behind: queue after its running sends without waiting
+        if backlog.size >= MAX_BROADCAST_BACKLOG:
+            logger.warning(f"Dropped broadcast to {member_uid}, too many sends pending")
+            return None
+        backlog.size += 1
+        backlog.task = asyncio.create_task(
+            _send_after(backlog.task, member_uid, websocket, text)
+        )
+        return None
+
+    start = time.perf_counter()
+    task = asyncio.ensure_future(websocket.send_text(text))
+    try:
+        # shield: a send cut in the middle would leave the connection unusable
+        await asyncio.wait_for(asyncio.shield(task), timeout)
+    except asyncio.TimeoutError:
+        logger.warning(
+            f"Broadcast to {member_uid} took longer than {timeout}s, leaving it behind"
+        )
+        task.add_done_callback(lambda t: _log_send_failure(member_uid, t))
+        _backlogs[member_uid] = _Backlog(websocket=websocket, task=task, size=1)
+        return None
+    except Exception as e:
+        logger.error(f"Failed to broadcast to {member_uid}: {e}")
+        return None
+
+    latency = time.perf_counter() - start
+    if latency > SLOW_SEND_SECONDS:
+        logger.warning(f"Slow broadcast to {member_uid}: {latency:.2f}s")
+    return latency
+
+
+async def _send_after(
+    previous: asyncio.Task, member_uid: str, websocket: WebSocket, text: str
 ) -> None:
-    """Broadcasts a message to all members in a group except the sender"""
-    for member_uid in group_members:
-        if member_uid != exclude_uid and member_uid in client_connections:
-            try:
-                await client_connections[member_uid].send_text(json.dumps(message))
-            except Exception as e:
-                logger.error(f"Failed to broadcast to {member_uid}: {e}")
+    try:
+        await previous
+    except Exception:
+        # Already logged
+        pass
+    try:
+        await websocket.send_text(text)
+    except Exception as e:
+        logger.error(f"Failed to broadcast to {member_uid}: {e}")
+    finally:
+        backlog = _backlogs.get(member_uid)
+        if backlog is not None:
+            backlog.size -= 1
+
+
+def _log_send_failure(member_uid: str, task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Failed to broadcast to {member_uid}: {task.exception()}")
@@ -1,11 +1,41 @@
+"""
+Chat history functions used by the server.
+
+The functions validate their arguments and delegate to a storage backend
+(see `history_storage`), selected with `system_config.chat_history.storage`:
+append-only JSONL logs (default) or a local SQLite database.
+Stored messages go through a write-behind queue, so `store_message` never
+waits on disk; reads see queued messages.
+Messages are also indexed for full-text search (`search_history`) unless
+`system_config.chat_history.search_index` is off.
+Histories idle for `archive_after_days` are moved into a compressed archive;
+they are still listed and read from there, and move back when written to.
+Group conversations write each message once into a shared transcript, one
+per group session (`create_group_transcript`, `add_group_transcript_members`,
+`store_group_message`), stored apart from the users' histories in
+`transcripts_dir`; member histories refer to it and show its messages when
+they are read.
+The server calls `configure_history_storage` at startup.
+"""
+
 import os
-import re
-import json
+import atexit
+import sqlite3
 import uuid
 from datetime import datetime
-from typing import Literal, List, TypedDict, Optional, Dict
+from typing import Literal, List, TypedDict, Optional, Tuple
 from loguru import logger
 
+from .config_manager.system import ChatHistoryConfig
+from .history_storage.history_storage_factory import HistoryStorageFactory
+from .history_storage.history_storage_interface import HistoryStorageInterface
+from .history_storage.history_archive import HistoryArchive
+from .history_storage.archiving_history_storage import ArchivingHistoryStorage
+from .history_storage.history_search_index import HistorySearchIndex
+from .history_storage.indexed_history_storage import IndexedHistoryStorage
+from .history_storage.transcript_history_storage import TranscriptHistoryStorage
+from .history_storage.write_behind_history_storage import WriteBehindHistoryStorage
+
 
 class HistoryMessage(TypedDict):
     role: Literal["human", "ai"]
@@ -23,48 +53,91 @@ class HistoryMetadata(TypedDict):
     user_id: Optional[str]  # 用户标识
 
 
-def _is_safe_filename(filename: str) -> bool:
-    """Validate filename for safety and allowed characters"""
-    if not filename or len(filename) > 255:
-        return False
-
-    # Allow alphanumeric, hyphen, underscore, and common unicode characters
-    # Block any filesystem special characters, control characters, and path separators
-    pattern = re.compile(r"^[\w\-_\u0020-\u007E\u00A0-\uFFFF]+$")
-    return bool(pattern.match(filename))
-
-
-def _sanitize_path_component(component: str) -> str:
-    """Sanitize and validate a path component"""
-    # Remove any path components, get just the basename
-    sanitized = os.path.basename(component.strip())
-
-    if not _is_safe_filename(sanitized):
-        raise ValueError(f"Invalid characters in path component: {component}")
+# Page size of paginated history reads
+DEFAULT_HISTORY_PAGE_SIZE = 50
+MAX_HISTORY_PAGE_SIZE = 500
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+
+_storage: Optional[TranscriptHistoryStorage] = None
+
+
+def configure_history_storage(config: ChatHistoryConfig) -> TranscriptHistoryStorage:
+    """Select the storage backend. Closes the previous one."""
+    global _storage
+    if _storage is not None:
+        _storage.close()
+    storage = HistoryStorageFactory.get_storage(
+        config.storage,
+        jsonl_dir=config.jsonl_dir,
+        sqlite_path=config.sqlite_path,
+    )
+    # Always wrapped, so histories archived earlier stay readable when
+    # archiving is turned off
+    storage = ArchivingHistoryStorage(
+        storage,
+        HistoryArchive(config.archive_dir),
+        archive_after_days=config.archive_after_days,
+    )
+    _storage = TranscriptHistoryStorage(
+        _write_behind(_indexed(storage, config.search_index_path, config), config),
+        _transcript_storage(config),
+    )
+    return _storage
+
+
+def _transcript_storage(config: ChatHistoryConfig) -> HistoryStorageInterface:
+    """Group transcripts get a backend and search index of their own"""
+    storage = HistoryStorageFactory.get_storage(
+        config.storage,
+        jsonl_dir=config.transcripts_dir,
+        sqlite_path=os.path.join(config.transcripts_dir, "transcripts.db"),
+    )
+    return _write_behind(
+        _indexed(
+            storage, os.path.join(config.transcripts_dir, "search_index.db"), config
+        ),
+        config,
+    )
+
+
+def _indexed(
+    storage: HistoryStorageInterface, index_path: str, config: ChatHistoryConfig
+) -> HistoryStorageInterface:
+    if not config.search_index:
+        return storage
+    try:
+        return IndexedHistoryStorage(storage, HistorySearchIndex(index_path))
+    except sqlite3.OperationalError as e:
+        # e.g. SQLite built without FTS5
+        logger.warning(f"Chat history search is disabled: {e}")
+        return storage
 
-    return sanitized
 
+def _write_behind(
+    storage: HistoryStorageInterface, config: ChatHistoryConfig
+) -> WriteBehindHistoryStorage:
+    return WriteBehindHistoryStorage(
+        storage,
+        durability=config.durability,
+        flush_interval=config.flush_interval,
+    )
 
-def _ensure_user_dir(user_id: str) -> str:
-    """确保用户目录存在并返回路径"""
-    if not user_id:
-        raise ValueError("user_id cannot be empty")
 
-    safe_user_id = _sanitize_path_component(user_id)
-    base_dir = os.path.join("chat_history", "users", safe_user_id)
-    os.makedirs(base_dir, exist_ok=True)
-    return base_dir
+def get_history_storage() -> TranscriptHistoryStorage:
+    """Return the storage backend, the default one if none was configured"""
+    if _storage is None:
+        configure_history_storage(ChatHistoryConfig())
+    return _storage
 
 
-def _get_safe_history_path(user_id: str, history_uid: str) -> str:
-    """Get sanitized path for history file"""
-    safe_user_id = _sanitize_path_component(user_id)
-    safe_history_uid = _sanitize_path_component(history_uid)
-    base_dir = os.path.join("chat_history", "users", safe_user_id)
-    full_path = os.path.normpath(os.path.join(base_dir, f"{safe_history_uid}.json"))
-    if not full_path.startswith(base_dir):
-        raise ValueError("Invalid path: Path traversal detected")
-    return full_path
+@atexit.register
+def close_history_storage() -> None:
+    """Flush queued messages and close the backend"""
+    global _storage
+    if _storage is not None:
+        _storage.close()
+        _storage = None
 
 
 def create_new_history(user_id: str) -> str:
@@ -74,25 +147,23 @@ def create_new_history(user_id: str) -> str:
         return ""
 
     history_uid = f"{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}_{uuid.uuid4().hex}"
-    user_dir = _ensure_user_dir(user_id)
 
     try:
-        filepath = os.path.join(user_dir, f"{history_uid}.json")
-        initial_data = [
+        get_history_storage().create_history(
+            user_id,
+            history_uid,
             {
                 "role": "metadata",
                 "timestamp": datetime.now().isoformat(timespec="seconds"),
                 "conversation_id": None,
-                "user_id": user_id
-            }
-        ]
-        with open(filepath, "w", encoding="utf-8") as f:
-            json.dump(initial_data, f, ensure_ascii=False, indent=2)
+                "user_id": user_id,
+            },
+        )
     except Exception as e:
         logger.error(f"Failed to create new history file: {e}")
         return ""
 
-    logger.debug(f"Created new history file with metadata: {filepath}")
+    logger.debug(f"Created new history with metadata: {history_uid}")
     return history_uid
 
 
@@ -123,22 +194,23 @@ def store_message(
             logger.warning("Missing history_uid")
         return
 
-    filepath = _get_safe_history_path(user_id, history_uid)
-    logger.debug(f"Storing {role} message to {filepath}")
+    logger.debug(f"Storing {role} message to {history_uid}")
+    get_history_storage().append_message(
+        user_id, history_uid, _make_message(role, content, name, avatar, message_id)
+    )
+    logger.debug(f"Successfully stored {role} message")
 
-    history_data = []
-    if os.path.exists(filepath):
-        try:
-            with open(filepath, "r", encoding="utf-8") as f:
-                history_data = json.load(f)
-        except Exception:
-            logger.error(f"Failed to load history file: {filepath}")
-            pass
 
-    now_str = datetime.now().isoformat(timespec="seconds")
+def _make_message(
+    role: str,
+    content: str,
+    name: str | None = None,
+    avatar: str | None = None,
+    message_id: str | None = None,
+) -> dict:
     new_item = {
         "role": role,
-        "timestamp": now_str,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
         "content": content,
     }
 
@@ -150,12 +222,84 @@ def store_message(
         new_item["name"] = name
     if avatar is not None:
         new_item["avatar"] = avatar
+    return new_item
 
-    history_data.append(new_item)
 
-    with open(filepath, "w", encoding="utf-8") as f:
-        json.dump(history_data, f, ensure_ascii=False, indent=2)
-    logger.debug(f"Successfully stored {role} message")
+def create_group_transcript(members: List[Tuple[str, str]]) -> str:
+    """Create the transcript of a group conversation, shared by its members
+
+    Args:
+        members: `(user_id, history_uid)` of each member's current history;
+            members without a history are skipped
+
+    Returns:
+        str: The transcript id, "" if it could not be created
+    """
+    members = [(user_id, uid) for user_id, uid in members if user_id and uid]
+    if not members:
+        return ""
+
+    try:
+        transcript_id = get_history_storage().create_transcript(members)
+    except Exception as e:
+        logger.error(f"Failed to create group transcript: {e}")
+        return ""
+
+    logger.debug(
+        f"Created group transcript {transcript_id} for {len(members)} histories"
+    )
+    return transcript_id
+
+
+def add_group_transcript_members(
+    transcript_id: str, members: List[Tuple[str, str]]
+) -> bool:
+    """Let member histories that don't share a group transcript yet join it
+
+    Args:
+        transcript_id: Id returned by `create_group_transcript`
+        members: `(user_id, history_uid)` of each member's current history;
+            members without a history are skipped
+
+    Returns:
+        bool: False if the transcript doesn't exist (anymore) or couldn't be
+            updated; the caller creates a new one
+    """
+    members = [(user_id, uid) for user_id, uid in members if user_id and uid]
+    if not transcript_id:
+        return False
+
+    try:
+        return get_history_storage().add_transcript_members(transcript_id, members)
+    except Exception as e:
+        logger.error(f"Failed to add members to group transcript {transcript_id}: {e}")
+        return False
+
+
+def store_group_message(
+    transcript_id: str,
+    role: Literal["human", "ai", "system"],
+    content: str,
+    name: str | None = None,
+    avatar: str | None = None,
+):
+    """Store a group conversation message once, for all member histories
+
+    Args:
+        transcript_id: Id returned by `create_group_transcript`
+        role: Message role
+        content: Message content
+        name: Optional display name (default None)
+        avatar: Optional avatar URL (default None)
+    """
+    if not transcript_id:
+        logger.warning("Missing transcript_id")
+        return
+
+    get_history_storage().append_transcript_message(
+        transcript_id, _make_message(role, content, name, avatar)
+    )
+    logger.debug(f"Stored {role} message to group transcript {transcript_id}")
 
 
 def get_metadata(user_id: str, history_uid: str) -> dict:
@@ -163,16 +307,8 @@ def get_metadata(user_id: str, history_uid: str) -> dict:
     if not user_id or not history_uid:
         return {}
 
-    filepath = _get_safe_history_path(user_id, history_uid)
-    if not os.path.exists(filepath):
-        return {}
-
     try:
-        with open(filepath, "r", encoding="utf-8") as f:
-            history_data = json.load(f)
-
-        if history_data and history_data[0]["role"] == "metadata":
-            return history_data[0]
+        return get_history_storage().get_metadata(user_id, history_uid)
     except Exception as e:
         logger.error(f"Failed to get metadata: {e}")
     return {}
@@ -187,34 +323,10 @@ def update_metadate(user_id: str, history_uid: str, metadata: dict) -> bool:
     if not user_id or not history_uid:
         return False
 
-    filepath = _get_safe_history_path(user_id, history_uid)
-    if not os.path.exists(filepath):
-        return False
-
     try:
-        with open(filepath, "r", encoding="utf-8") as f:
-            history_data = json.load(f)
-
-        if history_data and history_data[0]["role"] == "metadata":
-            # 更新现有元数据，保留其他字段
-            # if "conversation_id" in metadata:
-            #     logger.info(f"更新对话历史元数据 - 新的 conversation_id: {metadata['conversation_id']}")
-            history_data[0].update(metadata)
-        else:
-            # 如果没有元数据，创建新的
-            new_metadata = {
-                "role": "metadata",
-                "timestamp": datetime.now().isoformat(timespec="seconds"),
-            }
-            new_metadata.update(metadata)
-            history_data.insert(0, new_metadata)
-            logger.info(f"创建新的对话历史元数据: {new_metadata}")
-
-        with open(filepath, "w", encoding="utf-8") as f:
-            json.dump(history_data, f, ensure_ascii=False, indent=2)
-
-        logger.debug(f"更新对话历史 {history_uid} 的元数据成功")
-        return True
+        if get_history_storage().update_metadata(user_id, history_uid, metadata):
+            logger.debug(f"更新对话历史 {history_uid} 的元数据成功")
+            return True
     except Exception as e:
         logger.error(f"更新元数据失败: {e}")
     return False
@@ -229,20 +341,90 @@ def get_history(user_id: str, history_uid: str) -> List[HistoryMessage]:
             logger.warning("Missing history_uid")
         return []
 
-    filepath = _get_safe_history_path(user_id, history_uid)
+    try:
+        messages = get_history_storage().get_messages(user_id, history_uid)
+    except Exception as e:
+        logger.error(f"Failed to read history {history_uid}: {e}")
+        return []
 
-    if not os.path.exists(filepath):
-        logger.warning(f"History file not found: {filepath}")
+    if messages is None:
+        logger.warning(f"History not found: {history_uid}")
         return []
+    return messages
+
 
+def get_history_page(
+    user_id: str,
+    history_uid: str,
+    before: Optional[int] = None,
+    limit: int = DEFAULT_HISTORY_PAGE_SIZE,
+) -> Tuple[List[HistoryMessage], Optional[int]]:
+    """Read a page of chat history, starting from the latest messages
+
+    Only the messages of the page are read, not the whole history.
+
+    Args:
+        user_id: User identifier
+        history_uid: History unique identifier
+        before: Cursor returned with the previous page, None for the latest page
+        limit: Maximum number of messages in the page
+
+    Returns:
+        Tuple[List[HistoryMessage], Optional[int]]: The messages of the page,
+        oldest first, and the cursor of the next older page (None if there are
+        no older messages)
+    """
+    if not user_id or not history_uid:
+        logger.warning("Missing user_id or history_uid")
+        return [], None
+
+    limit = max(1, min(limit, MAX_HISTORY_PAGE_SIZE))
+    storage = get_history_storage()
     try:
-        with open(filepath, "r", encoding="utf-8") as f:
-            history_data = json.load(f)
-            # Filter out metadata
-            return [msg for msg in history_data if msg["role"] != "metadata"]
-    except Exception:
+        # The cursor is the index of the oldest message already sent, so it
+        # stays valid while new messages are appended
+        total = storage.count_messages(user_id, history_uid)
+        if total is None:
+            logger.warning(f"History not found: {history_uid}")
+            return [], None
+        end = total if before is None else max(0, min(before, total))
+        start = max(0, end - limit)
+        messages = storage.get_message_range(user_id, history_uid, start, end)
+    except Exception as e:
+        logger.error(f"Failed to read history {history_uid}: {e}")
+        return [], None
+
+    return messages, start if start > 0 else None
+
+
+def search_history(
+    user_id: str, query: str, limit: int = DEFAULT_SEARCH_LIMIT
+) -> List[dict]:
+    """Search the messages of all histories of a user
+
+    Args:
+        user_id: User identifier
+        query: Words to search for; Chinese and Japanese text is matched as substrings
+        limit: Maximum number of results
+
+    Returns:
+        List[dict]: Matching messages, best first, with `history_uid`,
+        `message_index`, `cursor` (the `before` of `get_history_page` for the
+        page ending with the message), `role`, `timestamp`, `name`, `snippet`
+        and `score`
+    """
+    if not user_id or not query or not query.strip():
         return []
 
+    limit = max(1, min(limit, MAX_SEARCH_LIMIT))
+    try:
+        return get_history_storage().search_messages(user_id, query, limit)
+    except NotImplementedError as e:
+        logger.warning(str(e))
+    except Exception as e:
+        logger.error(f"Failed to search chat history: {e}")
+    return []
+
 
 def delete_history(user_id: str, history_uid: str) -> bool:
     """Delete a specific history file"""
@@ -250,11 +432,9 @@ def delete_history(user_id: str, history_uid: str) -> bool:
         logger.warning("Missing user_id or history_uid")
         return False
 
-    filepath = _get_safe_history_path(user_id, history_uid)
     try:
-        if os.path.exists(filepath):
-            os.remove(filepath)
-            logger.debug(f"Successfully deleted history file: {filepath}")
+        if get_history_storage().delete_history(user_id, history_uid):
+            logger.debug(f"Successfully deleted history: {history_uid}")
             return True
     except Exception as e:
         logger.error(f"Failed to delete history file: {e}")
@@ -266,61 +446,23 @@ def get_history_list(user_id: str) -> List[dict]:
     if not user_id:
         return []
 
-    histories = []
-    user_dir = _ensure_user_dir(user_id)
-    empty_history_uids = []
-
+    storage = get_history_storage()
     try:
-        for filename in os.listdir(user_dir):
-            if not filename.endswith(".json"):
-                continue
-
-            history_uid = filename[:-5]
-            filepath = os.path.join(user_dir, filename)
-
-            try:
-                with open(filepath, "r", encoding="utf-8") as f:
-                    messages = json.load(f)
-
-                    # Filter out metadata for checking if history is empty
-                    actual_messages = [
-                        msg for msg in messages if msg["role"] != "metadata"
-                    ]
-                    if not actual_messages:
-                        empty_history_uids.append(history_uid)
-                        continue
-
-                    latest_message = actual_messages[-1]
-                    history_info = {
-                        "uid": history_uid,
-                        "latest_message": latest_message,
-                        "timestamp": (
-                            latest_message["timestamp"] if latest_message else None
-                        ),
-                    }
-                    histories.append(history_info)
-            except Exception as e:
-                logger.error(f"Error reading history file {filename}: {e}")
-                continue
-
-        # Clean up empty histories if there are other non-empty ones
-        if len(empty_history_uids) > 0 and len(os.listdir(user_dir)) > 1:
-            for uid in empty_history_uids:
-                try:
-                    os.remove(os.path.join(user_dir, f"{uid}.json"))
-                    logger.info(f"Removed empty history file: {uid}")
-                except Exception as e:
-                    logger.error(f"Failed to remove empty history file {uid}: {e}")
-
-        histories.sort(
-            key=lambda x: x["timestamp"] if x["timestamp"] else "", reverse=True
-        )
-        return histories
-
+        histories = storage.list_histories(user_id)
     except Exception as e:
         logger.error(f"Error listing histories: {e}")
         return []
 
+    # Clean up empty histories if there are other non-empty ones
+    if histories:
+        try:
+            for uid in storage.delete_empty_histories(user_id):
+                logger.info(f"Removed empty history file: {uid}")
+        except Exception as e:
+            logger.error(f"Failed to remove empty histories: {e}")
+
+    return histories
+
 
 def modify_latest_message(
     user_id: str,
@@ -333,36 +475,15 @@ def modify_latest_message(
         logger.warning("Missing user_id or history_uid")
         return False
 
-    filepath = _get_safe_history_path(user_id, history_uid)
-    if not os.path.exists(filepath):
-        logger.warning(f"History file not found: {filepath}")
-        return False
-
     try:
-        with open(filepath, "r", encoding="utf-8") as f:
-            history_data = json.load(f)
-
-        if not history_data:
-            logger.warning("History is empty")
-            return False
-
-        latest_message = history_data[-1]
-        if latest_message["role"] != role:
-            logger.warning(
-                f"Latest message role ({latest_message['role']}) doesn't match requested role ({role})"
-            )
-            return False
-
-        latest_message["content"] = new_content
-        with open(filepath, "w", encoding="utf-8") as f:
-            json.dump(history_data, f, ensure_ascii=False, indent=2)
-
-        logger.debug(f"Successfully modified latest {role} message")
-        return True
-
+        if get_history_storage().modify_latest_message(
+            user_id, history_uid, role, new_content
+        ):
+            logger.debug(f"Successfully modified latest {role} message")
+            return True
     except Exception as e:
         logger.error(f"Failed to modify latest message: {e}")
-        return False
+    return False
 
 
 def rename_history_file(
@@ -373,12 +494,10 @@ def rename_history_file(
         logger.warning("Missing required parameters for rename")
         return False
 
-    old_filepath = _get_safe_history_path(user_id, old_history_uid)
-    new_filepath = _get_safe_history_path(user_id, new_history_uid)
-
     try:
-        if os.path.exists(old_filepath):
-            os.rename(old_filepath, new_filepath)
+        if get_history_storage().rename_history(
+            user_id, old_history_uid, new_history_uid
+        ):
             logger.info(
                 f"Renamed history file from {old_history_uid} to {new_history_uid}"
             )
@@ -7,7 +7,12 @@ and utility functions for loading/saving configurations.
 
 # Import main configuration classes
 from .main import Config
-from .system import SystemConfig
+from .system import (
+    SystemConfig,
+    HttpClientConfig,
+    ChatHistoryConfig,
+    EngineRegistryConfig,
+)
 from .character import CharacterConfig
 from .stateless_llm import (
     OpenAICompatibleConfig,
@@ -67,6 +72,9 @@ __all__ = [
     # Main configuration classes
     "Config",
     "SystemConfig",
+    "HttpClientConfig",
+    "ChatHistoryConfig",
+    "EngineRegistryConfig",
     "CharacterConfig",
     # LLM related classes
     "OpenAICompatibleConfig",
@@ -30,6 +30,8 @@ class BasicMemoryAgentConfig(I18nMixin, BaseModel):
 
     faster_first_response: Optional[bool] = Field(True, alias="faster_first_response")
     segment_method: Literal["regex", "pysbd"] = Field("pysbd", alias="segment_method")
+    context_token_budget: Optional[int] = Field(None, alias="context_token_budget")
+    summarize_context: Optional[bool] = Field(True, alias="summarize_context")
     DESCRIPTIONS: ClassVar[Dict[str, Description]] = {
         "llm_provider": Description(
             en="LLM provider to use for this agent",
@@ -43,6 +45,14 @@ class BasicMemoryAgentConfig(I18nMixin, BaseModel):
             en="Method for segmenting sentences: 'regex' or 'pysbd' (default: 'pysbd')",
             zh="分割句子的方法：'regex' 或 'pysbd'（默认：'pysbd'）",
         ),
+        "context_token_budget": Description(
+            en="Maximum tokens of chat history sent to the LLM. Older turns are evicted when exceeded. Leave empty to keep the full history",
+            zh="发送给 LLM 的聊天记录最大 token 数，超出时移除较早的对话。留空则保留全部历史",
+        ),
+        "summarize_context": Description(
+            en="Fold evicted turns into a rolling summary generated in the background (default: True)",
+            zh="将被移除的对话在后台合并为滚动摘要（默认：True）",
+        ),
     }
 
 
@@ -288,6 +288,7 @@ class ASRConfig(I18nMixin):
         "groq_whisper_asr",
         "sherpa_onnx_asr",
     ] = Field(..., alias="asr_model")
+    worker_processes: int = Field(0, alias="worker_processes")
     azure_asr: Optional[AzureASRConfig] = Field(None, alias="azure_asr")
     faster_whisper: Optional[FasterWhisperConfig] = Field(None, alias="faster_whisper")
     whisper_cpp: Optional[WhisperCPPConfig] = Field(None, alias="whisper_cpp")
@@ -304,6 +305,10 @@ class ASRConfig(I18nMixin):
         "asr_model": Description(
             en="Speech-to-text model to use", zh="要使用的语音识别模型"
         ),
+        "worker_processes": Description(
+            en="Transcribe in this many processes forked after the model is loaded, sharing one copy of its weights, so transcriptions run on several cores. For local CPU models on Linux/macOS; not for GPU models. 0 transcribes in the server process",
+            zh="在模型加载后分叉出这么多个进程进行识别，共享同一份模型权重，使识别可以同时使用多个 CPU 核心。适用于 Linux/macOS 上的本地 CPU 模型，不适用于 GPU 模型。0 表示在服务器进程中识别",
+        ),
         "azure_asr": Description(en="Configuration for Azure ASR", zh="Azure ASR 配置"),
         "faster_whisper": Description(
             en="Configuration for Faster Whisper", zh="Faster Whisper 配置"
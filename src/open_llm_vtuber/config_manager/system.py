@@ -1,9 +1,128 @@
 # config_manager/system.py
-from pydantic import Field, model_validator
-from typing import Dict, ClassVar
+from pydantic import BaseModel, Field, model_validator
+from typing import Dict, ClassVar, Literal
 from .i18n import I18nMixin, Description
 
 
+class HttpClientConfig(I18nMixin, BaseModel):
+    """Settings for the shared HTTP client used by LLM, TTS and translation providers."""
+
+    max_connections: int = Field(100, alias="max_connections")
+    max_keepalive_connections: int = Field(20, alias="max_keepalive_connections")
+    keepalive_expiry: float = Field(60.0, alias="keepalive_expiry")
+    connect_timeout: float = Field(10.0, alias="connect_timeout")
+    read_timeout: float = Field(300.0, alias="read_timeout")
+    http2: bool = Field(False, alias="http2")
+    warm_up: bool = Field(True, alias="warm_up")
+
+    DESCRIPTIONS: ClassVar[Dict[str, Description]] = {
+        "max_connections": Description(
+            en="Maximum number of concurrent connections", zh="最大并发连接数"
+        ),
+        "max_keepalive_connections": Description(
+            en="Maximum number of idle keep-alive connections",
+            zh="最大空闲保活连接数",
+        ),
+        "keepalive_expiry": Description(
+            en="Seconds an idle connection is kept open", zh="空闲连接保持的秒数"
+        ),
+        "connect_timeout": Description(
+            en="Timeout in seconds for establishing a connection",
+            zh="建立连接的超时时间（秒）",
+        ),
+        "read_timeout": Description(
+            en="Timeout in seconds between received chunks (streaming LLM replies included)",
+            zh="两次收到数据之间的超时时间（秒），包括流式 LLM 回复",
+        ),
+        "http2": Description(
+            en="Enable HTTP/2 (requires the optional 'h2' package)",
+            zh="启用 HTTP/2（需要安装可选的 'h2' 包）",
+        ),
+        "warm_up": Description(
+            en="Open connections to provider hosts at server startup",
+            zh="服务器启动时预先连接各服务提供方的主机",
+        ),
+    }
+
+
+class ChatHistoryConfig(I18nMixin, BaseModel):
+    """Settings for where chat histories are stored."""
+
+    storage: Literal["jsonl", "sqlite"] = Field("jsonl", alias="storage")
+    jsonl_dir: str = Field("chat_history/users", alias="jsonl_dir")
+    sqlite_path: str = Field("chat_history/chat_history.db", alias="sqlite_path")
+    durability: Literal["none", "batched", "fsync"] = Field(
+        "batched", alias="durability"
+    )
+    flush_interval: float = Field(1.0, alias="flush_interval")
+    search_index: bool = Field(True, alias="search_index")
+    search_index_path: str = Field(
+        "chat_history/search_index.db", alias="search_index_path"
+    )
+    archive_after_days: float = Field(30, alias="archive_after_days")
+    archive_dir: str = Field("chat_history/archive", alias="archive_dir")
+    transcripts_dir: str = Field("chat_history/transcripts", alias="transcripts_dir")
+
+    DESCRIPTIONS: ClassVar[Dict[str, Description]] = {
+        "storage": Description(
+            en="Storage backend for chat histories: 'jsonl' (one append-only file per history) or 'sqlite' (one local database)",
+            zh="聊天记录的存储后端：'jsonl'（每个对话一个只追加文件）或 'sqlite'（一个本地数据库）",
+        ),
+        "jsonl_dir": Description(
+            en="Directory of the jsonl histories", zh="jsonl 聊天记录的目录"
+        ),
+        "sqlite_path": Description(
+            en="Path of the SQLite database file", zh="SQLite 数据库文件路径"
+        ),
+        "durability": Description(
+            en="When queued messages reach the disk: 'none' (flushed periodically), 'batched' (flushed periodically and fsynced per batch) or 'fsync' (written and fsynced one by one right away)",
+            zh="队列中的消息何时写入磁盘：'none'（定期写入）、'batched'（定期写入，每批 fsync 一次）或 'fsync'（立即逐条写入并 fsync）",
+        ),
+        "flush_interval": Description(
+            en="Seconds between flushes of queued messages in 'none' and 'batched' modes",
+            zh="'none' 和 'batched' 模式下两次写入之间的秒数",
+        ),
+        "search_index": Description(
+            en="Keep a full-text search index of the chat histories",
+            zh="为聊天记录维护全文搜索索引",
+        ),
+        "search_index_path": Description(
+            en="Path of the search index database (rebuilt from the histories if deleted)",
+            zh="搜索索引数据库的路径（删除后会根据聊天记录重建）",
+        ),
+        "archive_after_days": Description(
+            en="Days without new messages after which a history is moved into the compressed archive (0 to disable)",
+            zh="对话多少天没有新消息后移入压缩归档（0 表示不归档）",
+        ),
+        "archive_dir": Description(
+            en="Directory of the compressed history archive",
+            zh="聊天记录压缩归档的目录",
+        ),
+        "transcripts_dir": Description(
+            en="Directory of the group conversation transcripts, kept apart from the users' histories (with their own database and search index in 'sqlite' mode)",
+            zh="群聊记录的目录，与用户的聊天记录分开存放（'sqlite' 模式下使用单独的数据库和搜索索引）",
+        ),
+    }
+
+
+class EngineRegistryConfig(I18nMixin, BaseModel):
+    """Settings for the engines shared between clients and characters."""
+
+    idle_ttl: float = Field(600.0, alias="idle_ttl")
+    memory_budget_mb: float = Field(0, alias="memory_budget_mb")
+
+    DESCRIPTIONS: ClassVar[Dict[str, Description]] = {
+        "idle_ttl": Description(
+            en="Seconds an engine no client uses stays loaded (0 to unload at once)",
+            zh="没有客户端使用的引擎保留加载的秒数（0 表示立即卸载）",
+        ),
+        "memory_budget_mb": Description(
+            en="Estimated memory (MB) of loaded engines beyond which unused ones are unloaded, least recently used first (0 for no limit)",
+            zh="已加载引擎的估算内存上限（MB），超出后卸载未使用的引擎，最久未用的优先（0 表示不限制）",
+        ),
+    }
+
+
 class SystemConfig(I18nMixin):
     """System configuration settings."""
 
@@ -12,6 +131,15 @@ class SystemConfig(I18nMixin):
     port: int = Field(..., alias="port")
     config_alts_dir: str = Field(..., alias="config_alts_dir")
     tool_prompts: Dict[str, str] = Field(..., alias="tool_prompts")
+    http_client: HttpClientConfig = Field(
+        default_factory=HttpClientConfig, alias="http_client"
+    )
+    chat_history: ChatHistoryConfig = Field(
+        default_factory=ChatHistoryConfig, alias="chat_history"
+    )
+    engine_registry: EngineRegistryConfig = Field(
+        default_factory=EngineRegistryConfig, alias="engine_registry"
+    )
 
     DESCRIPTIONS: ClassVar[Dict[str, Description]] = {
         "conf_version": Description(en="Configuration version", zh="配置文件版本"),
@@ -24,6 +152,17 @@ class SystemConfig(I18nMixin):
             en="Tool prompts to be inserted into persona prompt",
             zh="要插入到角色提示词中的工具提示词",
         ),
+        "http_client": Description(
+            en="Shared HTTP client settings for remote providers",
+            zh="远程服务提供方共用的 HTTP 客户端设置",
+        ),
+        "chat_history": Description(
+            en="Chat history storage settings", zh="聊天记录存储设置"
+        ),
+        "engine_registry": Description(
+            en="Sharing and unloading of loaded engines",
+            zh="已加载引擎的共享与卸载设置",
+        ),
     }
 
     @model_validator(mode="after")
@@ -317,6 +317,13 @@ class TTSConfig(I18nMixin):
         "fish_api_tts",
         "sherpa_onnx_tts",
     ] = Field(..., alias="tts_model")
+    replicas: int = Field(1, alias="replicas")
+    max_concurrency: Optional[int] = Field(None, alias="max_concurrency")
+    max_queue_size: int = Field(256, alias="max_queue_size")
+    max_batch_size: int = Field(1, alias="max_batch_size")
+    worker_processes: int = Field(0, alias="worker_processes")
+    coalesce_max_chars: int = Field(0, alias="coalesce_max_chars")
+    coalesce_max_wait: float = Field(0.3, alias="coalesce_max_wait")
 
     azure_tts: Optional[AzureTTSConfig] = Field(None, alias="azure_tts")
     bark_tts: Optional[BarkTTSConfig] = Field(None, alias="bark_tts")
@@ -336,6 +343,34 @@ class TTSConfig(I18nMixin):
         "tts_model": Description(
             en="Text-to-speech model to use", zh="要使用的文本转语音模型"
         ),
+        "replicas": Description(
+            en="Number of instances of the TTS engine sharing the synthesis work",
+            zh="分担语音合成任务的 TTS 引擎实例数量",
+        ),
+        "max_concurrency": Description(
+            en="Synthesis calls allowed at the same time on one instance. Empty: 1 for local models (bark, coqui, melo, sherpa-onnx), 4 for the others",
+            zh="单个实例同时允许的合成请求数。留空时本地模型（bark、coqui、melo、sherpa-onnx）为 1，其他为 4",
+        ),
+        "max_queue_size": Description(
+            en="Synthesis calls allowed to wait for a free instance; further calls are shown as text without audio. 0 means unbounded",
+            zh="允许排队等待空闲实例的合成请求数，超出的句子只显示文字不播放语音。0 表示不限制",
+        ),
+        "max_batch_size": Description(
+            en="When synthesis calls are waiting, up to this many are synthesized in one batched call. Only used by engines with batched synthesis (sherpa-onnx, also set its max_num_sentences). Helps with several CPU threads or a GPU; on a single thread batching gains nothing. 1 disables batching",
+            zh="有合成请求排队时，最多将这么多请求合并为一次批量合成。仅对支持批量合成的引擎（sherpa-onnx，需同时设置其 max_num_sentences）生效。在多线程 CPU 或 GPU 上有效，单线程时没有收益。1 表示不批量合成",
+        ),
+        "worker_processes": Description(
+            en="Synthesize in this many processes forked after the model is loaded, sharing one copy of its weights; they replace the replicas. For local CPU models on Linux/macOS; not for GPU models. 0 synthesizes in the server process",
+            zh="在模型加载后分叉出这么多个进程进行合成，共享同一份模型权重，取代 replicas 设置。适用于 Linux/macOS 上的本地 CPU 模型，不适用于 GPU 模型。0 表示在服务器进程中合成",
+        ),
+        "coalesce_max_chars": Description(
+            en="Consecutive short sentences waiting behind unsent audio are synthesized with one request, up to this many characters. The first sentence is never delayed. Saves requests to remote engines and can improve prosody, but the merged sentences may wait up to coalesce_max_wait, playback can stall briefly between merged requests, and since the merged audio is cut back into sentences at estimated positions, text display and lip-sync can be slightly off at sentence boundaries. 0 (default) disables merging",
+            zh="排在尚未发送的语音之后的连续短句合并为一次合成请求，合并后最多这么多字符。第一句话不会被延迟。可减少对远程引擎的请求并改善语调，但被合并的句子最多会等待 coalesce_max_wait，合并请求之间的播放可能会短暂停顿；且合并后的语音按估算的位置切回各句，文字显示和口型在句子边界处可能略有偏差。0（默认）表示不合并",
+        ),
+        "coalesce_max_wait": Description(
+            en="Seconds a merged request waits for more sentences at most",
+            zh="合并请求等待后续句子的最长时间（秒）",
+        ),
         "azure_tts": Description(en="Configuration for Azure TTS", zh="Azure TTS 配置"),
         "bark_tts": Description(en="Configuration for Bark TTS", zh="Bark TTS 配置"),
         "edge_tts": Description(en="Configuration for Edge TTS", zh="Edge TTS 配置"),
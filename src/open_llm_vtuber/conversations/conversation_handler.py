@@ -7,7 +7,7 @@ from fastapi import WebSocket
 from loguru import logger
 
 from ..chat_group import ChatGroupManager
-from ..chat_history_manager import store_message
+from ..chat_history_manager import store_group_message, store_message
 from ..service_context import ServiceContext
 from .group_conversation import process_group_conversation
 from .single_conversation import process_single_conversation
@@ -70,6 +70,7 @@ async def handle_conversation_trigger(
                     selection=selection,
                     images=images,
                     session_emoji=session_emoji,
+                    group=group,
                 )
             )
     else:
@@ -138,6 +139,7 @@ async def handle_group_interrupt(
     # Get state and speaker info before cancellation
     state = GroupConversationState.get_state(group_id)
     current_speaker_uid = state.current_speaker_uid if state else None
+    transcript_id = state.transcript_id if state else ""
 
     # Get context from current speaker
     context = None
@@ -161,11 +163,28 @@ async def handle_group_interrupt(
 
     # Store messages with speaker info
     if context and group:
+        if transcript_id:
+            # Stored once in the shared transcript of the group
+            try:
+                store_group_message(
+                    transcript_id,
+                    role="ai",
+                    content=heard_response,
+                    name=context.character_config.character_name,
+                    avatar=context.character_config.avatar,
+                )
+                store_group_message(
+                    transcript_id, role="system", content="[Interrupted by user]"
+                )
+            except Exception as e:
+                logger.error(f"Error storing interrupt in group transcript: {e}")
         for member_uid in group.members:
             if member_uid in client_contexts:
                 try:
                     member_ctx = client_contexts[member_uid]
                     member_ctx.agent_engine.handle_interrupt(heard_response)
+                    if transcript_id:
+                        continue
                     user_id = member_ctx.agent_engine.get_conversation_info()["user_id"]
                     store_message(
                         user_id=user_id,
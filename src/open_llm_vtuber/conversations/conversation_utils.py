@@ -125,6 +125,8 @@ async def handle_sentence_output(
             tts_engine=tts_engine,
             websocket_send=websocket_send,
         )
+    # No more sentences will join a merged TTS call
+    tts_manager.flush()
     return full_response, message_id
 
 
@@ -200,12 +202,14 @@ async def finalize_conversation_turn(
             logger.warning(f"No playback completion response from {client_uid}")
             return
 
-    await websocket_send(json.dumps({"type": "force-new-message"}))
+    # Serialized once for the speaker and the group
+    force_new_message = json.dumps({"type": "force-new-message"})
+    await websocket_send(force_new_message)
 
     if broadcast_ctx and broadcast_ctx.broadcast_func:
         await broadcast_ctx.broadcast_func(
             broadcast_ctx.group_members,
-            {"type": "force-new-message"},
+            force_new_message,
             broadcast_ctx.current_client_uid,
         )
 
@@ -218,12 +222,14 @@ async def send_conversation_end_signal(
     session_emoji: str = "😊",
 ) -> None:
     """Send conversation chain end signal"""
-    chain_end_msg = {
-        "type": "control",
-        "text": "conversation-chain-end",
-    }
+    chain_end_msg = json.dumps(
+        {
+            "type": "control",
+            "text": "conversation-chain-end",
+        }
+    )
 
-    await websocket_send(json.dumps(chain_end_msg))
+    await websocket_send(chain_end_msg)
 
     if broadcast_ctx and broadcast_ctx.broadcast_func and broadcast_ctx.group_members:
         await broadcast_ctx.broadcast_func(
@@ -1,4 +1,4 @@
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, AsyncIterator, Dict, List, Optional, Union
 import asyncio
 import json
 from loguru import logger
@@ -17,10 +17,16 @@ from .types import (
     BroadcastFunc,
     GroupConversationState,
     BroadcastContext,
+    PrefetchedResponse,
     WebSocketSend,
 )
 from ..service_context import ServiceContext
-from ..chat_history_manager import store_message
+from ..chat_group import Group
+from ..chat_history_manager import (
+    add_group_transcript_members,
+    create_group_transcript,
+    store_group_message,
+)
 from .tts_manager import TTSTaskManager
 
 
@@ -33,6 +39,7 @@ async def process_group_conversation(
     user_input: Union[str, np.ndarray],
     images: Optional[List[Dict[str, Any]]] = None,
     session_emoji: str = np.random.choice(EMOJI_LIST),
+    group: Optional[Group] = None,
 ) -> None:
     """Process group conversation
 
@@ -45,9 +52,17 @@ async def process_group_conversation(
         user_input: Text or audio input from user
         images: Optional list of image data
         session_emoji: Emoji identifier for the conversation
+        group: The chat group, which keeps the shared transcript between inputs
     """
     # Create TTSTaskManager for each member
-    tts_managers = {uid: TTSTaskManager() for uid in group_members}
+    tts_managers = {
+        uid: TTSTaskManager.from_config(
+            client_contexts[uid].character_config.tts_config
+            if uid in client_contexts
+            else None
+        )
+        for uid in group_members
+    }
 
     try:
         logger.info(f"Group Conversation Chain {session_emoji} started!")
@@ -83,16 +98,22 @@ async def process_group_conversation(
             initiator_client_uid=initiator_client_uid,
         )
 
-        # 为每个组成员存储人类消息，使用各自的 user_id
+        # 群聊消息只写入一份共享记录，各成员的聊天记录引用它；
+        # 每个群聊会话只创建一次，成员换了新的聊天记录时再加入
+        member_histories = []
         for member_uid in group_members:
             member_context = client_contexts[member_uid]
             user_id = member_context.agent_engine.get_conversation_info()["user_id"]
-            store_message(
-                user_id=user_id,
-                history_uid=member_context.history_uid,
-                role="human",
-                content=input_text,
-                name=human_name,
+            member_histories.append((user_id, member_context.history_uid))
+        transcript_id = group.transcript_id if group else ""
+        if not add_group_transcript_members(transcript_id, member_histories):
+            transcript_id = create_group_transcript(member_histories)
+            if group:
+                group.transcript_id = transcript_id
+        state.transcript_id = transcript_id
+        if state.transcript_id:
+            store_group_message(
+                state.transcript_id, role="human", content=input_text, name=human_name
             )
 
         state.conversation_history = [f"{human_name}: {input_text}"]
@@ -129,6 +150,8 @@ async def process_group_conversation(
         )
         raise
     finally:
+        # A response generated for a turn that won't happen is taken back
+        discard_prefetched_response(state, client_contexts)
         # Cleanup all TTS managers
         for uid, tts_manager in tts_managers.items():
             cleanup_conversation(tts_manager, session_emoji)
@@ -237,11 +260,27 @@ async def handle_group_member_turn(
         f"(client {current_member_uid}) receiving context:\n{new_context}"
     )
 
+    prefetch = take_prefetched_response(
+        state, client_contexts, current_member_uid, new_context
+    )
     full_response = await process_member_response(
         context=context,
         batch_input=batch_input,
         current_ws_send=current_ws_send,
         tts_manager=tts_manager,
+        prefetch=prefetch,
+    )
+
+    # 当前发言者的回复已经完整，在播放语音的同时生成下一位成员的回复
+    start_prefetched_response(
+        state=state,
+        client_contexts=client_contexts,
+        images=images,
+        ai_message=(
+            f"{context.character_config.character_name}: {full_response}"
+            if full_response
+            else ""
+        ),
     )
 
     if tts_manager.task_list:
@@ -266,13 +305,9 @@ async def handle_group_member_turn(
         state.conversation_history.append(ai_message)
         logger.info(f"Appended complete response: {ai_message}")
 
-        # 为每个组成员存储消息，使用各自的 user_id
-        for member_uid in group_members:
-            member_context = client_contexts[member_uid]
-            user_id = member_context.agent_engine.get_conversation_info()["user_id"]
-            store_message(
-                user_id=user_id,
-                history_uid=member_context.history_uid,
+        if state.transcript_id:
+            store_group_message(
+                state.transcript_id,
                 role="ai",
                 content=full_response,
                 name=context.character_config.character_name,
@@ -315,20 +350,142 @@ async def handle_member_error(
     )
 
 
+def start_prefetched_response(
+    state: GroupConversationState,
+    client_contexts: Dict[str, ServiceContext],
+    images: Optional[List[Dict[str, Any]]],
+    ai_message: str,
+) -> None:
+    """Start generating the next speaker's response before its turn
+
+    Args:
+        ai_message: Transcript line of the response that just ended, "" if none
+    """
+    next_member_uid = state.group_queue[0] if state.group_queue else None
+    if next_member_uid is None or next_member_uid not in client_contexts:
+        return
+    agent = client_contexts[next_member_uid].agent_engine
+    # Only agents that can take the response back, in case it isn't used
+    checkpoint = agent.checkpoint_memory()
+    if checkpoint is None:
+        return
+
+    new_messages = state.conversation_history[state.memory_index[next_member_uid] :]
+    if ai_message:
+        new_messages = new_messages + [ai_message]
+    input_text = "\n".join(new_messages)
+    outputs: "asyncio.Queue[Any]" = asyncio.Queue()
+    task = asyncio.create_task(
+        _generate_prefetched_response(
+            agent,
+            create_batch_input(input_text=input_text, images=images, from_name="Human"),
+            outputs,
+        )
+    )
+    state.prefetch = PrefetchedResponse(
+        member_uid=next_member_uid,
+        input_text=input_text,
+        outputs=outputs,
+        task=task,
+        checkpoint=checkpoint,
+    )
+    logger.debug(f"Prefetching response of client {next_member_uid}")
+
+
+async def _generate_prefetched_response(
+    agent: Any, batch_input: Any, outputs: "asyncio.Queue[Any]"
+) -> None:
+    try:
+        async for output in agent.chat(batch_input):
+            await outputs.put(output)
+    except Exception as e:
+        # Handed to the turn that uses the response
+        await outputs.put(e)
+        return
+    await outputs.put(None)
+
+
+def take_prefetched_response(
+    state: GroupConversationState,
+    client_contexts: Dict[str, ServiceContext],
+    member_uid: str,
+    input_text: str,
+) -> Optional[PrefetchedResponse]:
+    """Return the prefetched response if it was generated for this turn"""
+    prefetch = state.prefetch
+    if prefetch is None:
+        return None
+    if prefetch.member_uid != member_uid or prefetch.input_text != input_text:
+        logger.info(
+            f"Prefetched response of client {prefetch.member_uid} doesn't match "
+            f"the conversation anymore, discarding it"
+        )
+        discard_prefetched_response(state, client_contexts)
+        return None
+    state.prefetch = None
+    logger.info(
+        f"Using response of client {member_uid} prefetched during the previous turn"
+    )
+    return prefetch
+
+
+def discard_prefetched_response(
+    state: GroupConversationState, client_contexts: Dict[str, ServiceContext]
+) -> None:
+    """Stop the prefetched response and remove it from the speaker's memory"""
+    prefetch = state.prefetch
+    if prefetch is None:
+        return
+    state.prefetch = None
+    prefetch.task.cancel()
+    context = client_contexts.get(prefetch.member_uid)
+    if context:
+        context.agent_engine.rollback_memory(prefetch.checkpoint)
+    logger.debug(f"Discarded prefetched response of client {prefetch.member_uid}")
+
+
+async def _replay_prefetched_response(
+    prefetch: PrefetchedResponse, agent: Any, batch_input: Any
+) -> AsyncIterator[Any]:
+    """Outputs of a prefetched response, generated again if it failed before the first one"""
+    item = await prefetch.outputs.get()
+    if isinstance(item, Exception):
+        logger.warning(f"Prefetched response failed, generating it again: {item}")
+        agent.rollback_memory(prefetch.checkpoint)
+        async for output in agent.chat(batch_input):
+            yield output
+        return
+    while item is not None:
+        if isinstance(item, Exception):
+            raise item
+        yield item
+        item = await prefetch.outputs.get()
+
+
 async def process_member_response(
     context: ServiceContext,
     batch_input: Any,
     current_ws_send: WebSocketSend,
     tts_manager: TTSTaskManager,
+    prefetch: Optional[PrefetchedResponse] = None,
 ) -> str:
-    """Process group member's response"""
+    """Process group member's response
+
+    Args:
+        prefetch: Response generated ahead of the turn for this batch_input
+    """
     full_response = ""
 
     try:
-        agent_output = context.agent_engine.chat(batch_input)
+        if prefetch is not None:
+            agent_output = _replay_prefetched_response(
+                prefetch, context.agent_engine, batch_input
+            )
+        else:
+            agent_output = context.agent_engine.chat(batch_input)
 
         async for output in agent_output:
-            response_part = await process_agent_output(
+            response_part, _ = await process_agent_output(
                 output=output,
                 character_config=context.character_config,
                 live2d_model=context.live2d_model,
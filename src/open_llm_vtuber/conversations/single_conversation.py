@@ -43,7 +43,7 @@ async def process_single_conversation(
         str: Complete response text
     """
     # Create TTSTaskManager for this conversation
-    tts_manager = TTSTaskManager()
+    tts_manager = TTSTaskManager.from_config(context.character_config.tts_config)
 
     try:
         # Send initial signals
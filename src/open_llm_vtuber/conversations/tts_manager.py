@@ -2,21 +2,59 @@ import asyncio
 import json
 import re
 import uuid
+from dataclasses import dataclass, field
 from datetime import datetime
 from typing import List, Optional, Dict
 from loguru import logger
 
 from ..agent.output_types import DisplayText, Actions
+from ..config_manager import TTSConfig
 from ..live2d_model import Live2dModel
 from ..tts.tts_interface import TTSInterface
-from ..utils.stream_audio import prepare_audio_payload
+from ..tts.tts_engine_pool import TTSEnginePool
+from ..utils.stream_audio import prepare_audio_payload, prepare_split_audio_payloads
 from .types import WebSocketSend
 
 
+@dataclass
+class _Sentence:
+    tts_text: str
+    display_text: DisplayText
+    actions: Optional[Actions]
+    sequence_number: int
+
+
+@dataclass
+class _Batch:
+    """Consecutive short sentences synthesized with one TTS call"""
+
+    sentences: List[_Sentence]
+    closed: asyncio.Event = field(default_factory=asyncio.Event)
+
+    @property
+    def chars(self) -> int:
+        return sum(len(sentence.tts_text) for sentence in self.sentences)
+
+
 class TTSTaskManager:
     """Manages TTS tasks and ensures ordered delivery to frontend while allowing parallel TTS generation"""
 
-    def __init__(self) -> None:
+    def __init__(
+        self, coalesce_max_chars: int = 0, coalesce_max_wait: float = 0.3
+    ) -> None:
+        """
+        Args:
+            coalesce_max_chars: Consecutive sentences are synthesized with one
+                TTS call while their texts stay within this many characters.
+                Only sentences queued behind audio that hasn't been sent yet
+                are merged, so the first sentence is never delayed. 0 disables it.
+            coalesce_max_wait: Seconds a merged call waits for more sentences
+                at most. It starts earlier if the audio ahead of it is sent first.
+        """
+        self.coalesce_max_chars = coalesce_max_chars
+        self.coalesce_max_wait = coalesce_max_wait
+        # The batch still accepting sentences
+        self._open_batch: Optional[_Batch] = None
         self.task_list: List[asyncio.Task] = []
         self._lock = asyncio.Lock()
         # Queue to store ordered payloads
@@ -27,6 +65,15 @@ class TTSTaskManager:
         self._sequence_counter = 0
         self._next_sequence_to_send = 0
 
+    @classmethod
+    def from_config(cls, tts_config: Optional[TTSConfig]) -> "TTSTaskManager":
+        if tts_config is None:
+            return cls()
+        return cls(
+            coalesce_max_chars=tts_config.coalesce_max_chars,
+            coalesce_max_wait=tts_config.coalesce_max_wait,
+        )
+
     async def speak(
         self,
         tts_text: str,
@@ -49,6 +96,8 @@ class TTSTaskManager:
         """
         if len(re.sub(r'[\s.,!?，。！？\'"』」）】\s]+', "", tts_text)) == 0:
             logger.debug("Empty TTS text, sending silent display payload")
+            # Only consecutive sentences are merged
+            self._close_open_batch()
             # logger.info(f"🏃 Message ID: {display_text.message_id}")
             # Get current sequence number for silent payload
             current_sequence = self._sequence_counter
@@ -77,6 +126,13 @@ class TTSTaskManager:
                 self._process_payload_queue(websocket_send)
             )
 
+        if self._coalesce(
+            _Sentence(tts_text, display_text, actions, current_sequence),
+            live2d_model,
+            tts_engine,
+        ):
+            return
+
         # Create and queue the TTS task
         task = asyncio.create_task(
             self._process_tts(
@@ -90,6 +146,105 @@ class TTSTaskManager:
         )
         self.task_list.append(task)
 
+    def _coalesce(
+        self, sentence: _Sentence, live2d_model: Live2dModel, tts_engine: TTSInterface
+    ) -> bool:
+        """
+        Add the sentence to a merged TTS call if it can wait for one.
+        Returns False if the sentence has to be synthesized on its own.
+        """
+        if not self.coalesce_max_chars:
+            return False
+        size = len(sentence.tts_text)
+        batch = self._open_batch
+        if (
+            batch is not None
+            and not batch.closed.is_set()
+            and batch.chars + size <= self.coalesce_max_chars
+        ):
+            batch.sentences.append(sentence)
+            return True
+
+        self._close_open_batch()
+        # Nothing is waiting to be sent ahead of it: merging would delay the audio
+        if self._next_sequence_to_send >= sentence.sequence_number:
+            return False
+        if size >= self.coalesce_max_chars:
+            return False
+        batch = _Batch(sentences=[sentence])
+        self._open_batch = batch
+        self.task_list.append(
+            asyncio.create_task(self._process_batch(batch, live2d_model, tts_engine))
+        )
+        return True
+
+    def flush(self) -> None:
+        """Start the merged TTS call still waiting for sentences; called at the end of a reply"""
+        self._close_open_batch()
+
+    def _close_open_batch(self) -> None:
+        if self._open_batch is not None:
+            self._open_batch.closed.set()
+            self._open_batch = None
+
+    async def _process_batch(
+        self, batch: _Batch, live2d_model: Live2dModel, tts_engine: TTSInterface
+    ) -> None:
+        """Synthesize the sentences of a batch with one call and queue one payload per sentence"""
+        try:
+            await asyncio.wait_for(batch.closed.wait(), self.coalesce_max_wait)
+        except asyncio.TimeoutError:
+            pass
+        if self._open_batch is batch:
+            self._close_open_batch()
+        batch.closed.set()
+
+        sentences = batch.sentences
+        if len(sentences) == 1:
+            sentence = sentences[0]
+            await self._process_tts(
+                tts_text=sentence.tts_text,
+                display_text=sentence.display_text,
+                actions=sentence.actions,
+                live2d_model=live2d_model,
+                tts_engine=tts_engine,
+                sequence_number=sentence.sequence_number,
+            )
+            return
+
+        logger.debug(f"🏃Merging {len(sentences)} sentences into one TTS call")
+        audio_file_path = None
+        try:
+            audio_file_path = await self._generate_audio(
+                tts_engine,
+                " ".join(sentence.tts_text for sentence in sentences),
+                sentences[0].sequence_number,
+            )
+            payloads = prepare_split_audio_payloads(
+                audio_path=audio_file_path,
+                weights=[len(sentence.tts_text) for sentence in sentences],
+                display_texts=[sentence.display_text for sentence in sentences],
+                actions_list=[sentence.actions for sentence in sentences],
+            )
+        except Exception as e:
+            logger.error(f"Error preparing merged audio payload: {e}")
+            # Queue silent payloads for error case
+            payloads = [
+                prepare_audio_payload(
+                    audio_path=None,
+                    display_text=sentence.display_text,
+                    actions=sentence.actions,
+                )
+                for sentence in sentences
+            ]
+        finally:
+            if audio_file_path:
+                tts_engine.remove_file(audio_file_path)
+                logger.debug("Audio cache file cleaned.")
+
+        for sentence, payload in zip(sentences, payloads):
+            await self._payload_queue.put((payload, sentence.sequence_number))
+
     async def _process_payload_queue(self, websocket_send: WebSocketSend) -> None:
         """
         Process and send payloads in correct order.
@@ -109,6 +264,15 @@ class TTSTaskManager:
                     await websocket_send(json.dumps(next_payload))
                     self._next_sequence_to_send += 1
 
+                # The audio ahead of the open batch is out, stop waiting for more sentences
+                batch = self._open_batch
+                if (
+                    batch is not None
+                    and self._next_sequence_to_send
+                    >= batch.sentences[0].sequence_number
+                ):
+                    self._close_open_batch()
+
                 self._payload_queue.task_done()
 
             except asyncio.CancelledError:
@@ -141,7 +305,9 @@ class TTSTaskManager:
         """Process TTS generation and queue the result for ordered delivery"""
         audio_file_path = None
         try:
-            audio_file_path = await self._generate_audio(tts_engine, tts_text)
+            audio_file_path = await self._generate_audio(
+                tts_engine, tts_text, sequence_number
+            )
             payload = prepare_audio_payload(
                 audio_path=audio_file_path,
                 display_text=display_text,
@@ -165,17 +331,27 @@ class TTSTaskManager:
                 tts_engine.remove_file(audio_file_path)
                 logger.debug("Audio cache file cleaned.")
 
-    async def _generate_audio(self, tts_engine: TTSInterface, text: str) -> str:
+    async def _generate_audio(
+        self, tts_engine: TTSInterface, text: str, sequence_number: int = 0
+    ) -> str:
         """Generate audio file from text"""
         logger.debug(f"🏃Generating audio for '''{text}'''...")
+        file_name_no_ext = (
+            f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{str(uuid.uuid4())[:8]}"
+        )
+        if isinstance(tts_engine, TTSEnginePool):
+            # Earlier sentences of a reply get a free engine first
+            return await tts_engine.async_generate_audio(
+                text=text, file_name_no_ext=file_name_no_ext, priority=sequence_number
+            )
         return await tts_engine.async_generate_audio(
-            text=text,
-            file_name_no_ext=f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{str(uuid.uuid4())[:8]}",
+            text=text, file_name_no_ext=file_name_no_ext
         )
 
     def clear(self) -> None:
         """Clear all pending tasks and reset state"""
         self.task_list.clear()
+        self._close_open_batch()
         if self._sender_task:
             self._sender_task.cancel()
         self._sequence_counter = 0
@@ -1,4 +1,15 @@
-from typing import List, Dict, Callable, Optional, TypedDict, Awaitable, ClassVar
+import asyncio
+from typing import (
+    Any,
+    List,
+    Dict,
+    Callable,
+    Optional,
+    TypedDict,
+    Awaitable,
+    ClassVar,
+    Union,
+)
 from dataclasses import dataclass, field
 from pydantic import BaseModel
 
@@ -6,7 +17,11 @@ from ..agent.output_types import Actions, DisplayText
 
 # Type definitions
 WebSocketSend = Callable[[str], Awaitable[None]]
-BroadcastFunc = Callable[[List[str], dict, Optional[str]], Awaitable[None]]
+# (members, message or its JSON text, excluded member) -> send latency per member
+BroadcastFunc = Callable[
+    [List[str], Union[dict, str], Optional[str]],
+    Awaitable[Dict[str, Optional[float]]],
+]
 
 
 class AudioPayload(TypedDict):
@@ -39,6 +54,20 @@ class ConversationConfig(BaseModel):
     character_name: str = "AI"
 
 
+@dataclass
+class PrefetchedResponse:
+    """Response of the next group speaker, generated while the current one plays"""
+
+    member_uid: str
+    # The context the response was generated for
+    input_text: str
+    # Agent outputs as they are generated, ended by None
+    outputs: "asyncio.Queue[Any]"
+    task: asyncio.Task
+    # Token of the speaker's agent memory before the response
+    checkpoint: Any
+
+
 @dataclass
 class GroupConversationState:
     """State for group conversation"""
@@ -52,6 +81,10 @@ class GroupConversationState:
     group_queue: List[str] = field(default_factory=list)
     session_emoji: str = ""
     current_speaker_uid: Optional[str] = None
+    # Shared transcript the group messages are stored in
+    transcript_id: str = ""
+    # Next speaker's response, generated ahead of its turn
+    prefetch: Optional[PrefetchedResponse] = None
 
     def __post_init__(self):
         """Register state instance after initialization"""
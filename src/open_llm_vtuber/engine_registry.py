@@ -0,0 +1,263 @@
+"""
+Process-wide registry of loaded engines (ASR, TTS, VAD, agents, translators...).
+
+Service contexts don't build engines themselves: they acquire them from the
+module level `engine_registry` with the engine's config, and release them when
+the client disconnects or switches to a config that needs another engine. An
+engine is keyed by its kind and a canonical hash of its config, so every
+context asking for the same config shares one instance, and switching to a
+character whose engines are already loaded takes no model loading at all.
+
+Engines nobody holds stay loaded for `idle_ttl` seconds, so switching back and
+forth between characters stays fast. Once the loaded engines together take
+more than `memory_budget_mb`, unused ones are dropped, least recently released
+first.
+"""
+
+import os
+import json
+import hashlib
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, TypeVar
+
+from loguru import logger
+from pydantic import BaseModel
+
+from .config_manager.system import EngineRegistryConfig
+
+
+T = TypeVar("T")
+
+
+def config_key(kind: str, config: Any) -> str:
+    """Canonical hash of an engine config; dict key order doesn't matter"""
+    if isinstance(config, BaseModel):
+        config = config.model_dump()
+    blob = json.dumps(
+        {"kind": kind, "config": config},
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def _rss_bytes() -> Optional[int]:
+    """Resident memory of the process, None where it can't be read cheaply"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE")
+
+
+@dataclass
+class _Entry:
+    kind: str
+    key: str
+    engine: Any = None
+    refcount: int = 0
+    # Estimated memory taken by the engine, from the RSS growth while building it.
+    # Engines built at the same time each count part of the others' memory.
+    size_bytes: int = 0
+    released_at: float = 0.0
+    # Set once the engine is built (or failed to); waiters block on it
+    ready: threading.Event = field(default_factory=threading.Event)
+    error: Optional[BaseException] = None
+
+
+class EngineRegistry:
+    """Shares engines between service contexts, with reference counting and eviction."""
+
+    def __init__(self, config: Optional[EngineRegistryConfig] = None):
+        self._config = config or EngineRegistryConfig()
+        # 所有状态由这把锁保护；创建引擎时不持有锁
+        self._lock = threading.Lock()
+        self._entries: Dict[str, _Entry] = {}
+        # id(engine) -> key, to release by engine
+        self._keys_by_engine: Dict[int, str] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def configure(self, config: EngineRegistryConfig) -> None:
+        """Apply new settings; idle engines over the new limits are evicted"""
+        self._config = config
+        self.evict()
+
+    def contains(self, kind: str, config: Any) -> bool:
+        """Whether an engine for this config is loaded (or being loaded)"""
+        with self._lock:
+            return config_key(kind, config) in self._entries
+
+    def acquire(self, kind: str, config: Any, factory: Callable[[], T]) -> T:
+        """
+        Return the engine for `config`, building it with `factory` if it isn't loaded.
+        Concurrent calls for the same config build it once. Every successful
+        call must be matched by a `release`.
+
+        Args:
+            kind: Engine kind, e.g. "tts"; part of the key
+            config: Everything the engine is built from (a pydantic model or
+                JSON-serializable data)
+            factory: Builds the engine. Called without holding any lock.
+        """
+        key = config_key(kind, config)
+        with self._lock:
+            entry = self._entries.get(key)
+            builder = entry is None
+            if builder:
+                entry = _Entry(kind=kind, key=key)
+                self._entries[key] = entry
+            entry.refcount += 1
+
+        if builder:
+            self._build(entry, factory)
+        else:
+            entry.ready.wait()
+            if entry.error is not None:
+                with self._lock:
+                    entry.refcount -= 1
+                raise entry.error
+            logger.debug(f"Reusing loaded {kind} engine {key[:12]}")
+        return entry.engine
+
+    def _build(self, entry: _Entry, factory: Callable[[], Any]) -> None:
+        rss_before = _rss_bytes()
+        start = time.perf_counter()
+        try:
+            engine = factory()
+        except BaseException as e:
+            with self._lock:
+                entry.error = e
+                self._entries.pop(entry.key, None)
+            entry.ready.set()
+            raise
+        rss_after = _rss_bytes()
+        with self._lock:
+            entry.engine = engine
+            if rss_before is not None and rss_after is not None:
+                entry.size_bytes = max(rss_after - rss_before, 0)
+            self._keys_by_engine[id(engine)] = entry.key
+        entry.ready.set()
+        logger.info(
+            f"Loaded {entry.kind} engine {type(engine).__name__} in "
+            f"{time.perf_counter() - start:.2f}s "
+            f"(~{entry.size_bytes / 1024 / 1024:.0f} MB)"
+        )
+
+    def retain(self, engine: Any) -> bool:
+        """Take one more reference to an engine from the registry. False if it isn't registered."""
+        with self._lock:
+            key = self._keys_by_engine.get(id(engine))
+            if key is None:
+                return False
+            self._entries[key].refcount += 1
+            return True
+
+    def release(self, engine: Any) -> None:
+        """Drop a reference taken by `acquire` or `retain`"""
+        if engine is None:
+            return
+        with self._lock:
+            key = self._keys_by_engine.get(id(engine))
+            if key is None:
+                return
+            entry = self._entries[key]
+            entry.refcount -= 1
+            if entry.refcount > 0:
+                return
+            entry.refcount = 0
+            entry.released_at = time.monotonic()
+            self._ensure_sweeper()
+        self.evict()
+
+    def evict(self) -> int:
+        """Drop idle engines past their TTL or over the memory budget. Returns the count."""
+        now = time.monotonic()
+        idle_ttl = self._config.idle_ttl
+        budget = self._config.memory_budget_mb * 1024 * 1024
+        with self._lock:
+            idle = sorted(
+                (
+                    e
+                    for e in self._entries.values()
+                    if e.refcount == 0 and e.ready.is_set()
+                ),
+                key=lambda e: e.released_at,
+            )
+            evicted: List[_Entry] = [e for e in idle if now - e.released_at >= idle_ttl]
+            if budget > 0:
+                total = sum(e.size_bytes for e in self._entries.values()) - sum(
+                    e.size_bytes for e in evicted
+                )
+                for e in idle:
+                    if total <= budget:
+                        break
+                    if e not in evicted:
+                        evicted.append(e)
+                        total -= e.size_bytes
+            for e in evicted:
+                del self._entries[e.key]
+                self._keys_by_engine.pop(id(e.engine), None)
+
+        for e in evicted:
+            logger.info(
+                f"Unloaded idle {e.kind} engine {type(e.engine).__name__} "
+                f"(~{e.size_bytes / 1024 / 1024:.0f} MB)"
+            )
+            self._close(e.engine)
+        return len(evicted)
+
+    @staticmethod
+    def _close(engine: Any) -> None:
+        close = getattr(engine, "close", None)
+        if callable(close):
+            try:
+                close()
+            except Exception as e:
+                logger.warning(f"Failed to close {type(engine).__name__}: {e}")
+
+    def _ensure_sweeper(self) -> None:
+        # Caller holds _lock
+        if self._thread is None and self._config.idle_ttl > 0:
+            self._thread = threading.Thread(
+                target=self._run, name="engine-registry-sweeper", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(max(min(self._config.idle_ttl / 4, 60), 1)):
+            try:
+                self.evict()
+            except Exception as e:
+                logger.error(f"Failed to evict idle engines: {e}")
+
+    def stats(self) -> List[dict]:
+        """Loaded engines with their reference counts, for logging and debugging"""
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    "kind": e.kind,
+                    "engine": type(e.engine).__name__ if e.engine is not None else None,
+                    "refcount": e.refcount,
+                    "size_mb": round(e.size_bytes / 1024 / 1024, 1),
+                    "idle_seconds": round(now - e.released_at, 1)
+                    if e.refcount == 0
+                    else 0,
+                }
+                for e in self._entries.values()
+            ]
+
+    def close(self) -> None:
+        """Stop the sweeper; loaded engines are left to the process exit"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+engine_registry = EngineRegistry()
@@ -0,0 +1,275 @@
+"""
+Storage backend wrapper that moves idle histories into a `HistoryArchive`.
+
+A background thread periodically packs every history whose latest message is
+older than `archive_after_days` into the archive, `ARCHIVE_BATCH_SIZE` at a
+time with one archive index write per batch, and deletes them from the
+backend once the archive is on disk. Archived histories stay visible: they are listed from the archive
+index and read straight from their segment. The first write to an archived
+history (a new message, an edit, a metadata update or a rename) moves it
+back into the backend.
+"""
+
+import threading
+from contextlib import ExitStack
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Literal, Optional, Tuple
+from loguru import logger
+
+from .history_storage_interface import HistoryStorageInterface
+from .history_archive import ArchivedHistory, HistoryArchive
+
+
+# Histories of a user archived together, with one index write. Writes to the
+# histories in the batch wait for it.
+ARCHIVE_BATCH_SIZE = 64
+
+
+class ArchivingHistoryStorage(HistoryStorageInterface):
+    """Delegates to a backend and keeps idle histories in a compressed archive."""
+
+    def __init__(
+        self,
+        storage: HistoryStorageInterface,
+        archive: HistoryArchive,
+        archive_after_days: float = 30,
+        check_interval: float = 3600,
+    ):
+        """
+        Args:
+            storage: The backend holding the active histories
+            archive: Where idle histories are moved to
+            archive_after_days: Days without new messages before a history is
+                archived. 0 disables archiving; archived histories stay readable.
+            check_interval: Seconds between two searches for idle histories
+        """
+        self.storage = storage
+        self.archive = archive
+        self.archive_after_days = archive_after_days
+        self.check_interval = check_interval
+        # 归档和写入互斥，避免归档时丢掉同时写入的消息
+        # Per history, so writes to other histories don't wait for each other
+        self._locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        if archive_after_days > 0:
+            self._thread = threading.Thread(
+                target=self._run, name="history-archiver", daemon=True
+            )
+            self._thread.start()
+
+    def _lock(self, user_id: str, history_uids: Iterable[str]) -> ExitStack:
+        """Lock some histories of a user, in sorted order so two callers can't deadlock"""
+        stack = ExitStack()
+        for history_uid in sorted(set(history_uids)):
+            with self._locks_guard:
+                lock = self._locks.get((user_id, history_uid))
+                if lock is None:
+                    lock = self._locks[(user_id, history_uid)] = threading.Lock()
+            stack.enter_context(lock)
+        return stack
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.archive_idle_histories()
+            except Exception as e:
+                logger.error(f"Failed to archive idle chat histories: {e}")
+            self._stop.wait(self.check_interval)
+
+    def archive_idle_histories(self) -> int:
+        """Archive every history idle for longer than `archive_after_days`. Returns the count."""
+        cutoff = (datetime.now() - timedelta(days=self.archive_after_days)).isoformat(
+            timespec="seconds"
+        )
+        user_ids = sorted({user_id for user_id, _ in self.storage.list_history_ids()})
+        archived = 0
+        for user_id in user_ids:
+            idle = [
+                history["uid"]
+                for history in self.storage.list_histories(user_id)
+                if history["timestamp"] and history["timestamp"] < cutoff
+            ]
+            for start in range(0, len(idle), ARCHIVE_BATCH_SIZE):
+                if self._stop.is_set():
+                    break
+                archived += self.archive_histories(
+                    user_id, idle[start : start + ARCHIVE_BATCH_SIZE], cutoff
+                )
+        if archived:
+            logger.info(f"Archived {archived} idle chat histories")
+        return archived
+
+    def archive_history(
+        self, user_id: str, history_uid: str, cutoff: Optional[str] = None
+    ) -> bool:
+        """
+        Move a history from the backend into the archive.
+
+        Args:
+            cutoff: Only archive it if its latest message is older than this timestamp
+        """
+        return self.archive_histories(user_id, [history_uid], cutoff) == 1
+
+    def archive_histories(
+        self, user_id: str, history_uids: List[str], cutoff: Optional[str] = None
+    ) -> int:
+        """
+        Move histories of a user from the backend into the archive, with one
+        archive index write for all of them. Returns the count.
+
+        Args:
+            cutoff: Only archive those whose latest message is older than this timestamp
+        """
+        with self._lock(user_id, history_uids):
+            batch: List[ArchivedHistory] = []
+            for history_uid in history_uids:
+                messages = self.storage.get_messages(user_id, history_uid)
+                if not messages:
+                    continue
+                if cutoff and (messages[-1].get("timestamp") or "") >= cutoff:
+                    # A message arrived since the history was listed
+                    continue
+                metadata = self.storage.get_metadata(user_id, history_uid)
+                batch.append((history_uid, metadata, messages))
+            if not batch:
+                return 0
+            try:
+                self.archive.add_many(user_id, batch)
+            except Exception as e:
+                logger.error(f"Failed to archive {len(batch)} histories: {e}")
+                return 0
+            # Only deleted once the archive index holding them is on disk
+            for history_uid, _, _ in batch:
+                self.storage.delete_history(user_id, history_uid)
+        logger.debug(f"Archived {len(batch)} histories of {user_id}")
+        return len(batch)
+
+    def _archived(self, user_id: str, history_uid: str) -> Optional[dict]:
+        """The archived history if it isn't in the backend, else None"""
+        if self.archive.get_entry(user_id, history_uid) is None:
+            return None
+        return self.archive.read(user_id, history_uid)
+
+    def _rehydrate(self, user_id: str, history_uid: str) -> None:
+        """Move an archived history back into the backend before writing to it"""
+        # Caller holds the lock of the history
+        data = self._archived(user_id, history_uid)
+        if data is None:
+            return
+        if self.storage.count_messages(user_id, history_uid) is None:
+            self.storage.create_history(user_id, history_uid, data["metadata"])
+            if data["messages"]:
+                self.storage.append_messages(
+                    user_id, history_uid, data["messages"], sync=True
+                )
+        self.archive.remove(user_id, history_uid)
+        logger.debug(f"Restored archived history {history_uid}")
+
+    def create_history(self, user_id: str, history_uid: str, metadata: dict) -> None:
+        self.storage.create_history(user_id, history_uid, metadata)
+
+    def append_message(self, user_id: str, history_uid: str, message: dict) -> None:
+        self.append_messages(user_id, history_uid, [message])
+
+    def append_messages(
+        self, user_id: str, history_uid: str, messages: List[dict], sync: bool = False
+    ) -> None:
+        with self._lock(user_id, [history_uid]):
+            self._rehydrate(user_id, history_uid)
+            self.storage.append_messages(user_id, history_uid, messages, sync=sync)
+
+    def get_messages(self, user_id: str, history_uid: str) -> Optional[List[dict]]:
+        data = self._archived(user_id, history_uid)
+        if data is not None:
+            return [dict(message) for message in data["messages"]]
+        return self.storage.get_messages(user_id, history_uid)
+
+    def count_messages(self, user_id: str, history_uid: str) -> Optional[int]:
+        entry = self.archive.get_entry(user_id, history_uid)
+        if entry is not None:
+            return entry["message_count"]
+        return self.storage.count_messages(user_id, history_uid)
+
+    def get_message_range(
+        self, user_id: str, history_uid: str, start: int, end: int
+    ) -> List[dict]:
+        data = self._archived(user_id, history_uid)
+        if data is not None:
+            return [dict(message) for message in data["messages"][start:end]]
+        return self.storage.get_message_range(user_id, history_uid, start, end)
+
+    def get_metadata(self, user_id: str, history_uid: str) -> dict:
+        data = self._archived(user_id, history_uid)
+        if data is not None:
+            return dict(data["metadata"])
+        return self.storage.get_metadata(user_id, history_uid)
+
+    def update_metadata(self, user_id: str, history_uid: str, metadata: dict) -> bool:
+        with self._lock(user_id, [history_uid]):
+            self._rehydrate(user_id, history_uid)
+            return self.storage.update_metadata(user_id, history_uid, metadata)
+
+    def modify_latest_message(
+        self,
+        user_id: str,
+        history_uid: str,
+        role: Literal["human", "ai", "system"],
+        new_content: str,
+    ) -> bool:
+        with self._lock(user_id, [history_uid]):
+            self._rehydrate(user_id, history_uid)
+            return self.storage.modify_latest_message(
+                user_id, history_uid, role, new_content
+            )
+
+    def delete_history(self, user_id: str, history_uid: str) -> bool:
+        with self._lock(user_id, [history_uid]):
+            deleted = self.archive.remove(user_id, history_uid)
+            return self.storage.delete_history(user_id, history_uid) or deleted
+
+    def rename_history(
+        self, user_id: str, old_history_uid: str, new_history_uid: str
+    ) -> bool:
+        with self._lock(user_id, [old_history_uid, new_history_uid]):
+            if self.archive.rename(user_id, old_history_uid, new_history_uid):
+                return True
+            return self.storage.rename_history(
+                user_id, old_history_uid, new_history_uid
+            )
+
+    def list_histories(self, user_id: str) -> List[dict]:
+        histories = self.storage.list_histories(user_id)
+        active = {history["uid"] for history in histories}
+        histories.extend(
+            {
+                "uid": history_uid,
+                "latest_message": entry["latest_message"],
+                "timestamp": entry["timestamp"],
+            }
+            for history_uid, entry in self.archive.list_entries(user_id).items()
+            if history_uid not in active and entry["latest_message"]
+        )
+        histories.sort(
+            key=lambda x: x["timestamp"] if x["timestamp"] else "", reverse=True
+        )
+        return histories
+
+    def delete_empty_histories(self, user_id: str) -> List[str]:
+        return self.storage.delete_empty_histories(user_id)
+
+    def list_history_ids(self) -> List[tuple]:
+        ids = set(self.storage.list_history_ids())
+        for user_id in self.archive.list_users():
+            ids.update(
+                (user_id, history_uid)
+                for history_uid in self.archive.list_entries(user_id)
+            )
+        return sorted(ids)
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.storage.close()
@@ -0,0 +1,349 @@
+"""
+Compressed archive of chat histories that are no longer used.
+
+Each user has a directory `<root>/<user_id>/` holding a few segment files and
+an index:
+
+- `segment-NNNNNN.bin`: histories appended one after the other, each one a
+  zlib-compressed JSON blob `{"metadata": {...}, "messages": [...]}`.
+  A new segment is started when the current one reaches `SEGMENT_MAX_BYTES`.
+- `index.json`: for every archived history, the segment, offset and length
+  of its blob, plus its latest message, so histories can be listed without
+  opening any segment. It is written once per batch of archived histories,
+  and fsynced (with its directory) before the caller deletes the originals.
+
+A segment is removed once none of its histories is left in the index. Once
+more than `COMPACT_DEAD_RATIO` of it belongs to removed histories, its live
+blobs are copied into a new segment and the old one is removed.
+"""
+
+import os
+import json
+import zlib
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from loguru import logger
+
+from .jsonl_history_storage import _sanitize_path_component
+
+
+DEFAULT_ARCHIVE_ROOT = os.path.join("chat_history", "archive")
+SEGMENT_MAX_BYTES = 64 * 1024 * 1024
+INDEX_FILENAME = "index.json"
+# Number of decompressed histories kept in memory for repeated reads
+BLOB_CACHE_SIZE = 8
+# A segment is compacted once this fraction of it belongs to removed
+# histories, and they take at least COMPACT_MIN_DEAD_BYTES
+COMPACT_DEAD_RATIO = 0.5
+COMPACT_MIN_DEAD_BYTES = 1024 * 1024
+
+_SEGMENT_PREFIX = "segment-"
+_SEGMENT_SUFFIX = ".bin"
+
+
+# (history_uid, metadata, messages) of a history to archive
+ArchivedHistory = Tuple[str, dict, List[dict]]
+
+
+def _fsync_directory(path: str) -> None:
+    """Make renames and new files in a directory durable"""
+    if os.name == "nt":
+        # Directories can't be opened on Windows; NTFS journals the rename
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _segment_name(number: int) -> str:
+    return f"{_SEGMENT_PREFIX}{number:06d}{_SEGMENT_SUFFIX}"
+
+
+class HistoryArchive:
+    """Per-user compressed segment files with an offset index."""
+
+    def __init__(self, root: str = DEFAULT_ARCHIVE_ROOT):
+        """
+        Args:
+            root: Directory holding one sub-directory per user
+        """
+        self.root = root
+        # 所有修改都持有这把锁；读取只在内存索引上加锁
+        self._lock = threading.RLock()
+        # user_id -> {history_uid: entry}
+        self._indexes: Dict[str, Dict[str, dict]] = {}
+        self._blob_cache: "OrderedDict[Tuple[str, str], dict]" = OrderedDict()
+
+    def _user_dir(self, user_id: str) -> str:
+        return os.path.join(self.root, _sanitize_path_component(user_id))
+
+    def _index(self, user_id: str) -> Dict[str, dict]:
+        """The index of a user, loaded on first use"""
+        with self._lock:
+            index = self._indexes.get(user_id)
+            if index is None:
+                index_path = os.path.join(self._user_dir(user_id), INDEX_FILENAME)
+                index = {}
+                if os.path.exists(index_path):
+                    try:
+                        with open(index_path, "r", encoding="utf-8") as f:
+                            index = json.load(f)
+                    except Exception as e:
+                        logger.error(
+                            f"Failed to load history archive index {index_path}: {e}"
+                        )
+                self._indexes[user_id] = index
+            return index
+
+    def _save_index(self, user_id: str) -> None:
+        """
+        Replace the index file and fsync it and its directory: once this
+        returns, the index survives a crash, and the histories it points to
+        may be deleted from where they came from.
+        """
+        user_dir = self._user_dir(user_id)
+        os.makedirs(user_dir, exist_ok=True)
+        index_path = os.path.join(user_dir, INDEX_FILENAME)
+        tmp_path = f"{index_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                self._index(user_id), f, ensure_ascii=False, separators=(",", ":")
+            )
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, index_path)
+        _fsync_directory(user_dir)
+
+    def get_entry(self, user_id: str, history_uid: str) -> Optional[dict]:
+        """Return the index entry of an archived history, or None"""
+        with self._lock:
+            return self._index(user_id).get(history_uid)
+
+    def list_entries(self, user_id: str) -> Dict[str, dict]:
+        with self._lock:
+            return dict(self._index(user_id))
+
+    def list_users(self) -> List[str]:
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(
+            user_id
+            for user_id in os.listdir(self.root)
+            if os.path.isdir(os.path.join(self.root, user_id))
+        )
+
+    def _segments(self, user_id: str) -> List[str]:
+        return sorted(
+            name
+            for name in os.listdir(self._user_dir(user_id))
+            if name.startswith(_SEGMENT_PREFIX) and name.endswith(_SEGMENT_SUFFIX)
+        )
+
+    def _new_segment(self, user_id: str) -> str:
+        segments = self._segments(user_id)
+        if not segments:
+            return _segment_name(1)
+        latest = segments[-1]
+        return _segment_name(
+            int(latest[len(_SEGMENT_PREFIX) : -len(_SEGMENT_SUFFIX)]) + 1
+        )
+
+    def _current_segment(self, user_id: str, size: int) -> str:
+        """Name of the segment the next blob of `size` bytes goes into"""
+        segments = self._segments(user_id)
+        if segments:
+            latest = segments[-1]
+            if (
+                os.path.getsize(os.path.join(self._user_dir(user_id), latest)) + size
+                <= SEGMENT_MAX_BYTES
+            ):
+                return latest
+        return self._new_segment(user_id)
+
+    def _append_blobs(
+        self, user_id: str, blobs: List[bytes], segment: Optional[str] = None
+    ) -> List[Tuple[str, int]]:
+        """
+        Append blobs to the current segment (or to `segment`), starting new
+        segments when full. Every segment written to is fsynced.
+
+        Returns:
+            List[Tuple[str, int]]: Segment and offset of each blob
+        """
+        # Caller holds _lock
+        user_dir = self._user_dir(user_id)
+        locations = []
+        f = None
+        try:
+            for blob in blobs:
+                if f is not None:
+                    f.flush()
+                current = segment or self._current_segment(user_id, len(blob))
+                if f is None or current != os.path.basename(f.name):
+                    if f is not None:
+                        os.fsync(f.fileno())
+                        f.close()
+                    f = open(os.path.join(user_dir, current), "ab")
+                locations.append((current, f.tell()))
+                f.write(blob)
+        finally:
+            if f is not None:
+                f.flush()
+                os.fsync(f.fileno())
+                f.close()
+        _fsync_directory(user_dir)
+        return locations
+
+    def add(
+        self, user_id: str, history_uid: str, metadata: dict, messages: List[dict]
+    ) -> None:
+        """Archive one history, see `add_many`"""
+        self.add_many(user_id, [(history_uid, metadata, messages)])
+
+    def add_many(self, user_id: str, histories: List[ArchivedHistory]) -> None:
+        """
+        Append histories to the segments of their user, with one index write
+        for all of them. Blobs and index are fsynced before this returns, so
+        the caller may then delete the originals.
+        """
+        if not histories:
+            return
+        blobs = [
+            zlib.compress(
+                json.dumps(
+                    {"metadata": metadata, "messages": messages}, ensure_ascii=False
+                ).encode("utf-8"),
+                9,
+            )
+            for _, metadata, messages in histories
+        ]
+        with self._lock:
+            os.makedirs(self._user_dir(user_id), exist_ok=True)
+            locations = self._append_blobs(user_id, blobs)
+
+            index = self._index(user_id)
+            replaced = set()
+            archived_at = datetime.now().isoformat(timespec="seconds")
+            for (history_uid, _, messages), blob, (segment, offset) in zip(
+                histories, blobs, locations
+            ):
+                latest_message = messages[-1] if messages else None
+                if history_uid in index:
+                    replaced.add(index[history_uid]["segment"])
+                index[history_uid] = {
+                    "segment": segment,
+                    "offset": offset,
+                    "length": len(blob),
+                    "message_count": len(messages),
+                    "latest_message": latest_message,
+                    "timestamp": latest_message.get("timestamp")
+                    if latest_message
+                    else None,
+                    "archived_at": archived_at,
+                }
+                self._blob_cache.pop((user_id, history_uid), None)
+            self._save_index(user_id)
+            for segment in replaced:
+                self._reclaim_segment(user_id, segment)
+
+    def read(self, user_id: str, history_uid: str) -> Optional[dict]:
+        """Return `{"metadata": ..., "messages": [...]}` of an archived history"""
+        key = (user_id, history_uid)
+        with self._lock:
+            cached = self._blob_cache.get(key)
+            if cached is not None:
+                self._blob_cache.move_to_end(key)
+                return cached
+            entry = self._index(user_id).get(history_uid)
+            if entry is None:
+                return None
+            with open(
+                os.path.join(self._user_dir(user_id), entry["segment"]), "rb"
+            ) as f:
+                f.seek(entry["offset"])
+                blob = f.read(entry["length"])
+            data = json.loads(zlib.decompress(blob).decode("utf-8"))
+            self._blob_cache[key] = data
+            if len(self._blob_cache) > BLOB_CACHE_SIZE:
+                self._blob_cache.popitem(last=False)
+            return data
+
+    def remove(self, user_id: str, history_uid: str) -> bool:
+        """Drop a history from the index, and its segment if nothing else uses it"""
+        with self._lock:
+            entry = self._index(user_id).pop(history_uid, None)
+            if entry is None:
+                return False
+            self._save_index(user_id)
+            self._blob_cache.pop((user_id, history_uid), None)
+            self._reclaim_segment(user_id, entry["segment"])
+        return True
+
+    def rename(self, user_id: str, old_history_uid: str, new_history_uid: str) -> bool:
+        with self._lock:
+            index = self._index(user_id)
+            if old_history_uid not in index:
+                return False
+            index[new_history_uid] = index.pop(old_history_uid)
+            self._save_index(user_id)
+            self._blob_cache.pop((user_id, old_history_uid), None)
+        return True
+
+    def _reclaim_segment(self, user_id: str, segment: str) -> None:
+        """Remove a segment no history uses, compact one that is mostly unused"""
+        # Caller holds _lock
+        live = {
+            history_uid: entry
+            for history_uid, entry in self._index(user_id).items()
+            if entry["segment"] == segment
+        }
+        segment_path = os.path.join(self._user_dir(user_id), segment)
+        try:
+            if not live:
+                os.remove(segment_path)
+                return
+            dead_bytes = os.path.getsize(segment_path) - sum(
+                entry["length"] for entry in live.values()
+            )
+            if (
+                dead_bytes >= COMPACT_MIN_DEAD_BYTES
+                and dead_bytes >= COMPACT_DEAD_RATIO * os.path.getsize(segment_path)
+            ):
+                self._compact_segment(user_id, segment, live)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(
+                f"Failed to reclaim history archive segment {segment_path}: {e}"
+            )
+
+    def _compact_segment(
+        self, user_id: str, segment: str, live: Dict[str, dict]
+    ) -> None:
+        """
+        Copy the live blobs of a segment into a new one, point the index to
+        them, then remove the old segment. A crash in between leaves an
+        unused copy, never an index pointing to missing data.
+        """
+        # Caller holds _lock
+        segment_path = os.path.join(self._user_dir(user_id), segment)
+        blobs = []
+        with open(segment_path, "rb") as f:
+            for entry in live.values():
+                f.seek(entry["offset"])
+                blobs.append(f.read(entry["length"]))
+        new_segment = self._new_segment(user_id)
+        locations = self._append_blobs(user_id, blobs, segment=new_segment)
+        for entry, (_, offset) in zip(live.values(), locations):
+            entry["segment"] = new_segment
+            entry["offset"] = offset
+        self._save_index(user_id)
+        os.remove(segment_path)
+        logger.debug(
+            f"Compacted history archive segment {segment} of {user_id} "
+            f"into {new_segment}"
+        )
@@ -0,0 +1,340 @@
+"""
+Full-text search index over chat history messages.
+
+The index is a local SQLite FTS5 table, kept up to date by
+`IndexedHistoryStorage` as messages are stored, edited and deleted.
+FTS5 only splits text on spaces and punctuation, so messages are tokenized
+here before they are indexed: words of space-separated languages are kept
+as they are, runs of Chinese, Japanese and Korean characters are split into
+overlapping bigrams ("你好世界" -> "你好 好世 世界"), and the last character of
+each run is indexed on its own as well. A query run is searched as a phrase
+of its bigrams, which matches it as a substring; a single character is
+searched as a prefix, which matches the bigrams starting with it and the
+character at the end of a run.
+"""
+
+import os
+import re
+import hashlib
+import sqlite3
+import threading
+from typing import List, Optional
+from loguru import logger
+
+
+DEFAULT_INDEX_PATH = os.path.join("chat_history", "search_index.db")
+
+# Characters around the match in result snippets
+SNIPPET_CONTEXT_CHARS = 40
+MAX_QUERY_LENGTH = 200
+# Bumped when messages are tokenized differently; older indexes are rebuilt
+INDEX_VERSION = 2
+
+_CJK_CHARS = r"\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff"
+_CJK_RUN_PATTERN = re.compile(f"([{_CJK_CHARS}]+)")
+_WORD_PATTERN = re.compile(r"[^\W_]+")
+_CJK_CHAR_PATTERN = re.compile(f"[{_CJK_CHARS}]")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS indexed_messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    history_uid TEXT NOT NULL,
+    message_index INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    timestamp TEXT,
+    name TEXT,
+    content TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_indexed_messages_history
+    ON indexed_messages (user_id, history_uid, message_index);
+CREATE TABLE IF NOT EXISTS indexed_histories (
+    user_id TEXT NOT NULL,
+    history_uid TEXT NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, history_uid)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS message_terms USING fts5(owner, terms);
+"""
+_DROP_SCHEMA = """
+DROP TABLE IF EXISTS message_terms;
+DROP TABLE IF EXISTS indexed_messages;
+DROP TABLE IF EXISTS indexed_histories;
+"""
+
+
+def tokenize(text: str) -> List[List[str]]:
+    """
+    Split a text into runs of search terms, lowercased.
+
+    Returns:
+        List[List[str]]: One list per word or CJK run; CJK runs are split into bigrams
+    """
+    runs = []
+    for i, part in enumerate(_CJK_RUN_PATTERN.split(text.lower())):
+        if i % 2:
+            # CJK run
+            if len(part) == 1:
+                runs.append([part])
+            else:
+                runs.append([part[j : j + 2] for j in range(len(part) - 1)])
+        else:
+            runs.extend([word] for word in _WORD_PATTERN.findall(part))
+    return runs
+
+
+def _index_terms(text: str) -> str:
+    terms = []
+    for run in tokenize(text):
+        terms.extend(run)
+        if len(run[-1]) == 2 and _CJK_CHAR_PATTERN.match(run[-1]):
+            # A bigram run: single-character queries find its last character
+            # only as a term of its own
+            terms.append(run[-1][-1])
+    return " ".join(terms)
+
+
+def _owner_term(user_id: str) -> str:
+    """A single search term standing for the user, to search only their messages"""
+    return "u" + hashlib.sha1(user_id.encode("utf-8")).hexdigest()[:16]
+
+
+def _match_expression(user_id: str, query: str) -> Optional[str]:
+    runs = tokenize(query[:MAX_QUERY_LENGTH])
+    if not runs:
+        return None
+    phrases = []
+    for run in runs:
+        phrase = '"' + " ".join(run) + '"'
+        if len(run) == 1 and len(run[0]) == 1 and _CJK_CHAR_PATTERN.match(run[0]):
+            # A single CJK character is indexed as part of bigrams
+            phrase += "*"
+        elif run is runs[-1] and len(run) == 1 and run[0].isascii():
+            # The last word may still be being typed
+            phrase += "*"
+        phrases.append(phrase)
+    return f"owner:{_owner_term(user_id)} AND terms:({' '.join(phrases)})"
+
+
+def make_snippet(content: str, query: str) -> str:
+    """Cut the part of a message around the first match of the query"""
+    lowered = content.lower()
+    position = -1
+    for run in sorted(
+        (part.strip() for part in re.split(r"[\s\W_]+", query.lower())),
+        key=len,
+        reverse=True,
+    ):
+        if run:
+            position = lowered.find(run)
+            if position >= 0:
+                break
+    if position < 0:
+        position = 0
+    start = max(0, position - SNIPPET_CONTEXT_CHARS)
+    end = min(len(content), position + SNIPPET_CONTEXT_CHARS * 2)
+    snippet = content[start:end].replace("\n", " ")
+    if start > 0:
+        snippet = "…" + snippet
+    if end < len(content):
+        snippet += "…"
+    return snippet
+
+
+class HistorySearchIndex:
+    """Inverted index of history messages in a local SQLite FTS5 database."""
+
+    def __init__(self, db_path: str = DEFAULT_INDEX_PATH):
+        """
+        Args:
+            db_path: Path of the index database, created if it doesn't exist
+
+        Raises:
+            sqlite3.OperationalError: If SQLite was built without FTS5
+        """
+        self.db_path = db_path
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        # 写入线程和搜索请求共用一个连接并加锁；多个连接会争抢 SQLite 的
+        # 写锁，等锁时 SQLite 每次要休眠几十毫秒
+        self._conn = sqlite3.connect(db_path, timeout=10, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # The index can be rebuilt from the histories, no need to sync
+        self._conn.execute("PRAGMA synchronous=OFF")
+        (version,) = self._conn.execute("PRAGMA user_version").fetchone()
+        if version != INDEX_VERSION:
+            # Histories are indexed again on their user's next search
+            self._conn.executescript(_DROP_SCHEMA)
+            self._conn.execute(f"PRAGMA user_version = {INDEX_VERSION}")
+        self._conn.executescript(_SCHEMA)
+        logger.info(f"Using chat history search index: {db_path}")
+
+    def indexed_history_uids(self, user_id: str) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT history_uid FROM indexed_histories WHERE user_id = ?",
+                (user_id,),
+            ).fetchall()
+        return [history_uid for (history_uid,) in rows]
+
+    def add_history(
+        self, user_id: str, history_uid: str, messages: List[dict] = ()
+    ) -> None:
+        """Start indexing a history, with the messages it already has"""
+        with self._lock, self._conn as conn:
+            self._delete_messages(conn, user_id, history_uid)
+            conn.execute(
+                "INSERT OR REPLACE INTO indexed_histories "
+                "(user_id, history_uid, message_count) VALUES (?, ?, 0)",
+                (user_id, history_uid),
+            )
+            self._insert_messages(conn, user_id, history_uid, messages)
+
+    def add_messages(
+        self, user_id: str, history_uid: str, messages: List[dict]
+    ) -> None:
+        """Index messages appended to a history. Ignored if the history isn't indexed."""
+        with self._lock, self._conn as conn:
+            self._insert_messages(conn, user_id, history_uid, messages)
+
+    def _insert_messages(
+        self,
+        conn: sqlite3.Connection,
+        user_id: str,
+        history_uid: str,
+        messages: List[dict],
+    ) -> None:
+        row = conn.execute(
+            "SELECT message_count FROM indexed_histories "
+            "WHERE user_id = ? AND history_uid = ?",
+            (user_id, history_uid),
+        ).fetchone()
+        if row is None or not messages:
+            return
+        owner = _owner_term(user_id)
+        message_index = row[0]
+        for message in messages:
+            cursor = conn.execute(
+                "INSERT INTO indexed_messages "
+                "(user_id, history_uid, message_index, role, timestamp, name, content) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    user_id,
+                    history_uid,
+                    message_index,
+                    message.get("role", ""),
+                    message.get("timestamp"),
+                    message.get("name"),
+                    message.get("content", ""),
+                ),
+            )
+            conn.execute(
+                "INSERT INTO message_terms (rowid, owner, terms) VALUES (?, ?, ?)",
+                (cursor.lastrowid, owner, _index_terms(message.get("content", ""))),
+            )
+            message_index += 1
+        conn.execute(
+            "UPDATE indexed_histories SET message_count = ? "
+            "WHERE user_id = ? AND history_uid = ?",
+            (message_index, user_id, history_uid),
+        )
+
+    def update_latest_message(
+        self, user_id: str, history_uid: str, new_content: str
+    ) -> None:
+        """Re-index the latest message of a history after it was edited"""
+        with self._lock, self._conn as conn:
+            row = conn.execute(
+                "SELECT id FROM indexed_messages WHERE user_id = ? AND history_uid = ? "
+                "ORDER BY message_index DESC LIMIT 1",
+                (user_id, history_uid),
+            ).fetchone()
+            if row is None:
+                return
+            conn.execute(
+                "UPDATE indexed_messages SET content = ? WHERE id = ?",
+                (new_content, row[0]),
+            )
+            conn.execute(
+                "UPDATE message_terms SET terms = ? WHERE rowid = ?",
+                (_index_terms(new_content), row[0]),
+            )
+
+    def _delete_messages(
+        self, conn: sqlite3.Connection, user_id: str, history_uid: str
+    ) -> None:
+        # One lookup per rowid; FTS5 would scan the whole table for `rowid IN (...)`
+        conn.executemany(
+            "DELETE FROM message_terms WHERE rowid = ?",
+            conn.execute(
+                "SELECT id FROM indexed_messages WHERE user_id = ? AND history_uid = ?",
+                (user_id, history_uid),
+            ).fetchall(),
+        )
+        conn.execute(
+            "DELETE FROM indexed_messages WHERE user_id = ? AND history_uid = ?",
+            (user_id, history_uid),
+        )
+
+    def delete_history(self, user_id: str, history_uid: str) -> None:
+        with self._lock, self._conn as conn:
+            self._delete_messages(conn, user_id, history_uid)
+            conn.execute(
+                "DELETE FROM indexed_histories WHERE user_id = ? AND history_uid = ?",
+                (user_id, history_uid),
+            )
+
+    def rename_history(
+        self, user_id: str, old_history_uid: str, new_history_uid: str
+    ) -> None:
+        with self._lock, self._conn as conn:
+            for table in ("indexed_messages", "indexed_histories"):
+                conn.execute(
+                    f"UPDATE {table} SET history_uid = ? "
+                    "WHERE user_id = ? AND history_uid = ?",
+                    (new_history_uid, user_id, old_history_uid),
+                )
+
+    def search(self, user_id: str, query: str, limit: int = 20) -> List[dict]:
+        """
+        Find the messages of a user matching all words of the query, best first.
+
+        Returns:
+            List[dict]: Items with `history_uid`, `message_index` (position of
+            the message in the history), `cursor`, `role`, `timestamp`, `name`,
+            `snippet` and `score`. Pass `cursor` as `before` of
+            `get_history_page` to load the page ending with the message.
+        """
+        expression = _match_expression(user_id, query)
+        if expression is None:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT m.history_uid, m.message_index, m.role, m.timestamp, m.name, "
+                "m.content, bm25(message_terms, 0.0, 1.0) AS score "
+                "FROM message_terms JOIN indexed_messages m ON m.id = message_terms.rowid "
+                "WHERE message_terms MATCH ? AND m.user_id = ? "
+                "ORDER BY score LIMIT ?",
+                (expression, user_id, limit),
+            ).fetchall()
+        return [
+            {
+                "history_uid": history_uid,
+                "message_index": message_index,
+                # `before` is exclusive: the page ends just before it
+                "cursor": message_index + 1,
+                "role": role,
+                "timestamp": timestamp,
+                "name": name,
+                "snippet": make_snippet(content, query),
+                # bm25() is lower for better matches
+                "score": round(-score, 4),
+            }
+            for history_uid, message_index, role, timestamp, name, content, score in rows
+        ]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,21 @@
+from .history_storage_interface import HistoryStorageInterface
+
+
+class HistoryStorageFactory:
+    @staticmethod
+    def get_storage(storage_type: str, **kwargs) -> HistoryStorageInterface:
+        storage_type = storage_type.lower()
+        if storage_type == "jsonl":
+            from .jsonl_history_storage import JsonlHistoryStorage, DEFAULT_HISTORY_ROOT
+
+            return JsonlHistoryStorage(
+                root=kwargs.get("jsonl_dir") or DEFAULT_HISTORY_ROOT
+            )
+        elif storage_type == "sqlite":
+            from .sqlite_history_storage import SqliteHistoryStorage, DEFAULT_DB_PATH
+
+            return SqliteHistoryStorage(
+                db_path=kwargs.get("sqlite_path") or DEFAULT_DB_PATH
+            )
+        else:
+            raise ValueError(f"Unsupported chat history storage: {storage_type}")
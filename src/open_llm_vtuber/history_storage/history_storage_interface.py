@@ -0,0 +1,122 @@
+import abc
+from typing import List, Literal, Optional
+
+
+class HistoryStorageInterface(metaclass=abc.ABCMeta):
+    """
+    Storage backend behind the `chat_history_manager` functions.
+
+    Messages and metadata are plain dicts in the format of `HistoryMessage`
+    and `HistoryMetadata`. Arguments are validated by `chat_history_manager`
+    before they reach the backend.
+    """
+
+    @abc.abstractmethod
+    def create_history(self, user_id: str, history_uid: str, metadata: dict) -> None:
+        """Create an empty history with the given metadata"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def append_message(self, user_id: str, history_uid: str, message: dict) -> None:
+        """Append a message, creating the history if it doesn't exist"""
+        raise NotImplementedError
+
+    def append_messages(
+        self, user_id: str, history_uid: str, messages: List[dict], sync: bool = False
+    ) -> None:
+        """
+        Append several messages at once.
+
+        Args:
+            sync: Whether the messages must reach the disk (fsync) before returning
+        """
+        for message in messages:
+            self.append_message(user_id, history_uid, message)
+
+    @abc.abstractmethod
+    def get_messages(self, user_id: str, history_uid: str) -> Optional[List[dict]]:
+        """Return all messages in order, or None if the history doesn't exist"""
+        raise NotImplementedError
+
+    def count_messages(self, user_id: str, history_uid: str) -> Optional[int]:
+        """Return the number of messages, or None if the history doesn't exist"""
+        messages = self.get_messages(user_id, history_uid)
+        return None if messages is None else len(messages)
+
+    def get_message_range(
+        self, user_id: str, history_uid: str, start: int, end: int
+    ) -> List[dict]:
+        """
+        Return the messages with index in [start, end), oldest first.
+
+        Message indices count from the start of the history, so they stay valid
+        while new messages are appended. Backends should override this to avoid
+        reading the whole history for a page.
+        """
+        return (self.get_messages(user_id, history_uid) or [])[start:end]
+
+    @abc.abstractmethod
+    def get_metadata(self, user_id: str, history_uid: str) -> dict:
+        """Return the metadata, or an empty dict if the history doesn't exist"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def update_metadata(self, user_id: str, history_uid: str, metadata: dict) -> bool:
+        """Merge fields into the metadata. Returns False if the history doesn't exist."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def modify_latest_message(
+        self,
+        user_id: str,
+        history_uid: str,
+        role: Literal["human", "ai", "system"],
+        new_content: str,
+    ) -> bool:
+        """Replace the content of the latest message if it has the given role"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def delete_history(self, user_id: str, history_uid: str) -> bool:
+        """Delete a history. Returns False if it didn't exist."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def rename_history(
+        self, user_id: str, old_history_uid: str, new_history_uid: str
+    ) -> bool:
+        """Give a history a new uid. Returns False if it didn't exist."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def list_histories(self, user_id: str) -> List[dict]:
+        """
+        List the non-empty histories of a user, latest first.
+
+        Returns:
+            List[dict]: Items with `uid`, `latest_message` and `timestamp`
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def delete_empty_histories(self, user_id: str) -> List[str]:
+        """Delete the histories of a user without messages and return their uids"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def list_history_ids(self) -> List[tuple]:
+        """Return (user_id, history_uid) of every stored history, e.g. for migrations"""
+        raise NotImplementedError
+
+    def search_messages(self, user_id: str, query: str, limit: int) -> List[dict]:
+        """
+        Full-text search over the messages of a user, best matches first.
+
+        Raises:
+            NotImplementedError: If the storage has no search index
+        """
+        raise NotImplementedError("Chat history search is not enabled")
+
+    def close(self) -> None:
+        """Release files, connections and background workers"""
+        pass
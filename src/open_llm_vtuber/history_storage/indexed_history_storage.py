@@ -0,0 +1,177 @@
+"""
+Storage backend wrapper that keeps the full-text search index up to date.
+
+Every write to the backend is mirrored into a `HistorySearchIndex`. Histories
+stored before the index existed are indexed the first time their user
+searches.
+"""
+
+import threading
+from typing import Dict, List, Literal, Optional, Set, Tuple
+from loguru import logger
+
+from .history_storage_interface import HistoryStorageInterface
+from .history_search_index import HistorySearchIndex
+
+
+class IndexedHistoryStorage(HistoryStorageInterface):
+    """Delegates to a backend and indexes the stored messages for search."""
+
+    def __init__(self, storage: HistoryStorageInterface, index: HistorySearchIndex):
+        """
+        Args:
+            storage: The backend the histories are stored in
+            index: The search index to update
+        """
+        self.storage = storage
+        self.index = index
+        # 写入后端和更新索引一起进行，避免补建索引时漏掉同时写入的消息
+        # Per history, so a slow write doesn't hold up changes to other histories
+        self._locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        # Users whose existing histories have been indexed since startup
+        self._indexed_users: Set[str] = set()
+
+    def _lock(self, user_id: str, history_uid: str) -> threading.Lock:
+        with self._locks_guard:
+            lock = self._locks.get((user_id, history_uid))
+            if lock is None:
+                lock = self._locks[(user_id, history_uid)] = threading.Lock()
+            return lock
+
+    def _update_index(self, action: str, update, *args) -> None:
+        """Index failures never fail the write; the history is re-indexed later"""
+        try:
+            update(*args)
+        except Exception as e:
+            logger.error(f"Failed to update chat history search index ({action}): {e}")
+            # Index the history again from the backend on the next search
+            user_id, history_uid = args[0], args[1]
+            try:
+                self.index.delete_history(user_id, history_uid)
+            except Exception:
+                pass
+            self._indexed_users.discard(user_id)
+
+    def create_history(self, user_id: str, history_uid: str, metadata: dict) -> None:
+        # A new history has no messages to race with, no need for the lock
+        self.storage.create_history(user_id, history_uid, metadata)
+        self._update_index("create", self.index.add_history, user_id, history_uid)
+
+    def append_message(self, user_id: str, history_uid: str, message: dict) -> None:
+        self.append_messages(user_id, history_uid, [message])
+
+    def append_messages(
+        self, user_id: str, history_uid: str, messages: List[dict], sync: bool = False
+    ) -> None:
+        with self._lock(user_id, history_uid):
+            self.storage.append_messages(user_id, history_uid, messages, sync=sync)
+            self._update_index(
+                "append", self.index.add_messages, user_id, history_uid, messages
+            )
+
+    def get_messages(self, user_id: str, history_uid: str) -> Optional[List[dict]]:
+        return self.storage.get_messages(user_id, history_uid)
+
+    def count_messages(self, user_id: str, history_uid: str) -> Optional[int]:
+        return self.storage.count_messages(user_id, history_uid)
+
+    def get_message_range(
+        self, user_id: str, history_uid: str, start: int, end: int
+    ) -> List[dict]:
+        return self.storage.get_message_range(user_id, history_uid, start, end)
+
+    def get_metadata(self, user_id: str, history_uid: str) -> dict:
+        return self.storage.get_metadata(user_id, history_uid)
+
+    def update_metadata(self, user_id: str, history_uid: str, metadata: dict) -> bool:
+        return self.storage.update_metadata(user_id, history_uid, metadata)
+
+    def modify_latest_message(
+        self,
+        user_id: str,
+        history_uid: str,
+        role: Literal["human", "ai", "system"],
+        new_content: str,
+    ) -> bool:
+        with self._lock(user_id, history_uid):
+            if not self.storage.modify_latest_message(
+                user_id, history_uid, role, new_content
+            ):
+                return False
+            self._update_index(
+                "edit",
+                self.index.update_latest_message,
+                user_id,
+                history_uid,
+                new_content,
+            )
+        return True
+
+    def delete_history(self, user_id: str, history_uid: str) -> bool:
+        with self._lock(user_id, history_uid):
+            deleted = self.storage.delete_history(user_id, history_uid)
+            self._update_index(
+                "delete", self.index.delete_history, user_id, history_uid
+            )
+        return deleted
+
+    def rename_history(
+        self, user_id: str, old_history_uid: str, new_history_uid: str
+    ) -> bool:
+        # Sorted, so two renames of the same pair can't deadlock
+        first, second = sorted([old_history_uid, new_history_uid])
+        with self._lock(user_id, first), self._lock(user_id, second):
+            if not self.storage.rename_history(
+                user_id, old_history_uid, new_history_uid
+            ):
+                return False
+            self._update_index(
+                "rename",
+                self.index.rename_history,
+                user_id,
+                old_history_uid,
+                new_history_uid,
+            )
+        return True
+
+    def list_histories(self, user_id: str) -> List[dict]:
+        return self.storage.list_histories(user_id)
+
+    def delete_empty_histories(self, user_id: str) -> List[str]:
+        removed = self.storage.delete_empty_histories(user_id)
+        for history_uid in removed:
+            with self._lock(user_id, history_uid):
+                self._update_index(
+                    "delete", self.index.delete_history, user_id, history_uid
+                )
+        return removed
+
+    def list_history_ids(self) -> List[tuple]:
+        return self.storage.list_history_ids()
+
+    def _index_existing_histories(self, user_id: str) -> None:
+        """Index the histories of a user that were stored without the index"""
+        if user_id in self._indexed_users:
+            return
+        indexed = set(self.index.indexed_history_uids(user_id))
+        count = 0
+        for history in self.storage.list_histories(user_id):
+            history_uid = history["uid"]
+            if history_uid in indexed:
+                continue
+            with self._lock(user_id, history_uid):
+                messages = self.storage.get_messages(user_id, history_uid) or []
+                self.index.add_history(user_id, history_uid, messages)
+            count += 1
+        self._indexed_users.add(user_id)
+        if count:
+            logger.info(f"Indexed {count} chat histories of user {user_id} for search")
+
+    def search_messages(self, user_id: str, query: str, limit: int) -> List[dict]:
+        self._index_existing_histories(user_id)
+        return self.index.search(user_id, query, limit)
+
+    def close(self) -> None:
+        self.storage.close()
+        self.index.close()
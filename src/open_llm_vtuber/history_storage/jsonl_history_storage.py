@@ -0,0 +1,651 @@
+"""
+Chat history stored as append-only JSONL logs.
+
+Every history is a log `<root>/<user_id>/<history_uid>.jsonl` with one JSON
+record per line, plus a small metadata sidecar `<history_uid>.meta.json`.
+Storing a message appends a single line instead of rewriting the whole
+history, and a crash can at most lose the line being written. Editing the
+latest message appends an edit record; logs with many edit records are
+compacted in a background thread.
+
+Pages of a history are read backwards from the end of the log, parsing only
+the lines of the page; the message count of each log is cached in memory.
+
+Histories in the old format (`<history_uid>.json`, one JSON array with the
+metadata as first element) are migrated the first time they are accessed,
+or all at once with `migrate_chat_history.py`.
+"""
+
+import os
+import re
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import BinaryIO, Dict, Iterator, List, Literal, Optional, Set, Tuple
+from loguru import logger
+
+from .history_storage_interface import HistoryStorageInterface
+
+
+DEFAULT_HISTORY_ROOT = os.path.join("chat_history", "users")
+LOG_SUFFIX = ".jsonl"
+META_SUFFIX = ".meta.json"
+LEGACY_SUFFIX = ".json"
+
+# Number of edit records in a log before it is compacted
+COMPACT_EDIT_THRESHOLD = 32
+# Size of the blocks read from the end of a log to find the latest message
+_TAIL_BLOCK_SIZE = 4096
+# Size of the blocks read from the end of a log for a page of messages
+_PAGE_BLOCK_SIZE = 65536
+
+_EDIT_OP = "edit_last"
+# Edit records are written by this module, so they always start like this
+_EDIT_PREFIX = b'{"op": "' + _EDIT_OP.encode() + b'"'
+
+
+def _is_safe_filename(filename: str) -> bool:
+    """Validate filename for safety and allowed characters"""
+    if not filename or len(filename) > 255:
+        return False
+
+    # Allow alphanumeric, hyphen, underscore, and common unicode characters
+    # Block any filesystem special characters, control characters, and path separators
+    pattern = re.compile(r"^[\w\-_\u0020-\u007E\u00A0-\uFFFF]+$")
+    return bool(pattern.match(filename))
+
+
+def _sanitize_path_component(component: str) -> str:
+    """Sanitize and validate a path component"""
+    # Remove any path components, get just the basename
+    sanitized = os.path.basename(component.strip())
+
+    if not _is_safe_filename(sanitized):
+        raise ValueError(f"Invalid characters in path component: {component}")
+
+    return sanitized
+
+
+def is_legacy_history_file(filename: str) -> bool:
+    return filename.endswith(LEGACY_SUFFIX) and not filename.endswith(META_SUFFIX)
+
+
+def _now() -> str:
+    return datetime.now().isoformat(timespec="seconds")
+
+
+def _write_json_atomic(filepath: str, data) -> None:
+    """Write a json file through a temporary file so readers never see half of it"""
+    tmp_path = f"{filepath}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, filepath)
+
+
+def _encode_record(record: dict) -> bytes:
+    return (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def _parse_records(data: bytes, log_path: str) -> Tuple[List[dict], int]:
+    """
+    Parse log lines into messages, applying edit records.
+
+    Returns:
+        Tuple[List[dict], int]: The messages and the number of edit records seen
+    """
+    messages: List[dict] = []
+    edits = 0
+    for line in data.splitlines():
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            logger.warning(f"Skipping corrupted record in history log: {log_path}")
+            continue
+        if record.get("op") == _EDIT_OP:
+            edits += 1
+            if messages:
+                messages[-1]["content"] = record["content"]
+            continue
+        messages.append(record)
+    return messages, edits
+
+
+def _is_message_line(line: bytes) -> bool:
+    """Tell message records from edit records and partial lines without parsing them"""
+    line = line.rstrip()
+    return line.endswith(b"}") and not line.startswith(_EDIT_PREFIX)
+
+
+def _iter_lines_reversed(
+    f: BinaryIO, end: int, block_size: int = _TAIL_BLOCK_SIZE
+) -> Iterator[bytes]:
+    """Yield the lines of a file before position `end`, last line first"""
+    pos = end
+    remainder = b""
+    while pos > 0:
+        read_size = min(block_size, pos)
+        pos -= read_size
+        f.seek(pos)
+        lines = (f.read(read_size) + remainder).split(b"\n")
+        # The first line may continue in the previous block
+        remainder = lines[0]
+        yield from reversed(lines[1:])
+    yield remainder
+
+
+def _read_last_message(log_path: str) -> Optional[dict]:
+    """Find the latest message of a log by reading it backwards from the end"""
+    with open(log_path, "rb") as f:
+        latest_edit = None
+        for line in _iter_lines_reversed(f, f.seek(0, os.SEEK_END)):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("op") == _EDIT_OP:
+                # Records are read backwards, so the first edit is the latest one
+                if latest_edit is None:
+                    latest_edit = record
+                continue
+            if latest_edit is not None:
+                record["content"] = latest_edit["content"]
+            return record
+    return None
+
+
+def _read_message_range(f: BinaryIO, end: int, skip: int, count: int) -> List[dict]:
+    """
+    Read `count` messages that come before the last `skip` messages of a log.
+    Only the lines of the returned messages are parsed.
+
+    Args:
+        f: The log, opened in binary mode
+        end: Size of the log when the message count was taken
+    """
+    messages: List[dict] = []
+    latest_edit: Optional[bytes] = None
+    for line in _iter_lines_reversed(f, end, _PAGE_BLOCK_SIZE):
+        if line.startswith(_EDIT_PREFIX):
+            # An edit applies to the nearest message before it; the first
+            # one seen backwards is the latest
+            if latest_edit is None:
+                latest_edit = line
+            continue
+        if not _is_message_line(line):
+            continue
+        edit, latest_edit = latest_edit, None
+        if skip:
+            skip -= 1
+            continue
+        count -= 1
+        try:
+            record = json.loads(line)
+            if edit is not None:
+                record["content"] = json.loads(edit)["content"]
+        except ValueError:
+            logger.warning(f"Skipping corrupted record in history log: {f.name}")
+        else:
+            messages.append(record)
+        if count <= 0:
+            break
+    messages.reverse()
+    return messages
+
+
+class JsonlHistoryStorage(HistoryStorageInterface):
+    """History backend writing one append-only log per history."""
+
+    def __init__(self, root: str = DEFAULT_HISTORY_ROOT):
+        """
+        Args:
+            root: Directory holding one sub-directory per user
+        """
+        self.root = root
+        # 每个日志文件一把锁：追加、压缩、重命名和删除互斥
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        # 各日志中尚未压缩的编辑记录数
+        self._edit_counts: Dict[str, int] = {}
+        self._compaction_scheduled: Set[str] = set()
+        # 各日志的消息数，第一次分页读取时统计，之后随追加更新
+        self._message_counts: Dict[str, int] = {}
+        self._compaction_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="history-compaction"
+        )
+
+    def _ensure_user_dir(self, user_id: str) -> str:
+        """确保用户目录存在并返回路径"""
+        if not user_id:
+            raise ValueError("user_id cannot be empty")
+
+        safe_user_id = _sanitize_path_component(user_id)
+        base_dir = os.path.join(self.root, safe_user_id)
+        os.makedirs(base_dir, exist_ok=True)
+        return base_dir
+
+    def _get_safe_history_path(
+        self, user_id: str, history_uid: str, suffix: str = LOG_SUFFIX
+    ) -> str:
+        """Get sanitized path for a history file (log, metadata sidecar or legacy file)"""
+        safe_user_id = _sanitize_path_component(user_id)
+        safe_history_uid = _sanitize_path_component(history_uid)
+        base_dir = os.path.join(self.root, safe_user_id)
+        full_path = os.path.normpath(
+            os.path.join(base_dir, f"{safe_history_uid}{suffix}")
+        )
+        if not full_path.startswith(os.path.normpath(base_dir)):
+            raise ValueError("Invalid path: Path traversal detected")
+        return full_path
+
+    def _get_lock(self, log_path: str) -> threading.Lock:
+        with self._locks_guard:
+            lock = self._locks.get(log_path)
+            if lock is None:
+                lock = self._locks[log_path] = threading.Lock()
+            return lock
+
+    def _append_record(self, log_path: str, record: dict) -> None:
+        """Append one record to a log"""
+        self._append_records(log_path, [record])
+
+    def _append_records(
+        self, log_path: str, records: List[dict], sync: bool = False
+    ) -> None:
+        """Append records to a log with a single write"""
+        data = b"".join(_encode_record(record) for record in records)
+        with self._get_lock(log_path):
+            f = open(log_path, "a+b")
+            try:
+                # A crash may have left a partial last line; start a new line so
+                # it doesn't swallow this record
+                if f.tell() > 0:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        data = b"\n" + data
+                f.write(data)
+                f.flush()
+            except BaseException:
+                f.close()
+                raise
+            if log_path in self._message_counts:
+                self._message_counts[log_path] += sum(
+                    1 for record in records if record.get("op") != _EDIT_OP
+                )
+        # The records are readable once written; reads of the log don't wait
+        # for them to reach the disk
+        with f:
+            if sync:
+                os.fsync(f.fileno())
+
+    def _count_log_messages(self, log_path: str) -> int:
+        """Number of messages in a log. Caller holds the lock of the log."""
+        count = self._message_counts.get(log_path)
+        if count is None:
+            with open(log_path, "rb") as f:
+                count = sum(1 for line in f if _is_message_line(line))
+            self._message_counts[log_path] = count
+        return count
+
+    def _read_log(self, log_path: str) -> List[dict]:
+        """Read all messages of a log, with edits applied"""
+        with open(log_path, "rb") as f:
+            data = f.read()
+        messages, edits = _parse_records(data, log_path)
+        if edits >= COMPACT_EDIT_THRESHOLD:
+            self._edit_counts[log_path] = edits
+            self._schedule_compaction(log_path)
+        return messages
+
+    def _schedule_compaction(self, log_path: str) -> None:
+        with self._locks_guard:
+            if log_path in self._compaction_scheduled:
+                return
+            self._compaction_scheduled.add(log_path)
+        self._compaction_executor.submit(self._compact_log, log_path)
+
+    def _compact_log(self, log_path: str) -> None:
+        """
+        Rewrite a log without edit records and corrupted lines.
+
+        The log is read and rewritten without holding its lock; records appended
+        meanwhile are copied over under the lock right before the swap.
+        """
+        try:
+            with self._get_lock(log_path):
+                if not os.path.exists(log_path):
+                    return
+                compacted_size = os.path.getsize(log_path)
+
+            with open(log_path, "rb") as f:
+                data = f.read(compacted_size)
+            messages, _ = _parse_records(data, log_path)
+
+            tmp_path = f"{log_path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(b"".join(_encode_record(message) for message in messages))
+
+            with self._get_lock(log_path):
+                if not os.path.exists(log_path):
+                    # Deleted or renamed while compacting
+                    os.remove(tmp_path)
+                    return
+                with open(log_path, "rb") as f:
+                    f.seek(compacted_size)
+                    tail = f.read()
+                with open(tmp_path, "ab") as f:
+                    f.write(tail)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, log_path)
+                self._edit_counts[log_path] = _parse_records(tail, log_path)[1]
+                # Corrupted lines are gone, count again on the next page read
+                self._message_counts.pop(log_path, None)
+
+            logger.debug(f"Compacted history log {log_path}: {len(messages)} messages")
+        except Exception as e:
+            logger.error(f"Failed to compact history log {log_path}: {e}")
+        finally:
+            with self._locks_guard:
+                self._compaction_scheduled.discard(log_path)
+
+    def migrate_legacy_file(self, legacy_path: str) -> bool:
+        """
+        Convert a history in the old single-json format into a log and a metadata sidecar.
+        The legacy file is removed once both are written.
+
+        Args:
+            legacy_path: Path of the `<history_uid>.json` file
+
+        Returns:
+            bool: Whether the history was migrated
+        """
+        base_path = legacy_path[: -len(LEGACY_SUFFIX)]
+        log_path = base_path + LOG_SUFFIX
+        meta_path = base_path + META_SUFFIX
+
+        try:
+            with open(legacy_path, "r", encoding="utf-8") as f:
+                history_data = json.load(f)
+        except Exception as e:
+            logger.error(f"Failed to load legacy history file {legacy_path}: {e}")
+            return False
+
+        metadata = {}
+        if history_data and history_data[0].get("role") == "metadata":
+            metadata = history_data[0]
+            history_data = history_data[1:]
+
+        try:
+            with self._get_lock(log_path):
+                if os.path.exists(log_path):
+                    logger.warning(
+                        f"Both legacy and new history exist, keeping the new one: {log_path}"
+                    )
+                    return False
+                tmp_path = f"{log_path}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(b"".join(_encode_record(msg) for msg in history_data))
+                if metadata or not os.path.exists(meta_path):
+                    _write_json_atomic(
+                        meta_path, metadata or {"role": "metadata", "timestamp": _now()}
+                    )
+                os.replace(tmp_path, log_path)
+                self._message_counts.pop(log_path, None)
+            os.remove(legacy_path)
+        except Exception as e:
+            logger.error(f"Failed to migrate legacy history file {legacy_path}: {e}")
+            return False
+
+        logger.info(f"Migrated history {legacy_path} ({len(history_data)} messages)")
+        return True
+
+    def find_legacy_files(self) -> List[str]:
+        """Return the paths of all histories still in the old format"""
+        if not os.path.isdir(self.root):
+            return []
+        paths = []
+        for user_id in sorted(os.listdir(self.root)):
+            user_dir = os.path.join(self.root, user_id)
+            if not os.path.isdir(user_dir):
+                continue
+            paths.extend(
+                os.path.join(user_dir, filename)
+                for filename in sorted(os.listdir(user_dir))
+                if is_legacy_history_file(filename)
+            )
+        return paths
+
+    def _resolve_log_path(self, user_id: str, history_uid: str) -> str:
+        """Get the log path of a history, migrating it first if it is in the old format"""
+        log_path = self._get_safe_history_path(user_id, history_uid)
+        if not os.path.exists(log_path):
+            legacy_path = self._get_safe_history_path(
+                user_id, history_uid, LEGACY_SUFFIX
+            )
+            if os.path.exists(legacy_path):
+                self.migrate_legacy_file(legacy_path)
+        return log_path
+
+    def create_history(self, user_id: str, history_uid: str, metadata: dict) -> None:
+        self._ensure_user_dir(user_id)
+        _write_json_atomic(
+            self._get_safe_history_path(user_id, history_uid, META_SUFFIX), metadata
+        )
+        open(self._get_safe_history_path(user_id, history_uid), "ab").close()
+
+    def append_message(self, user_id: str, history_uid: str, message: dict) -> None:
+        self._ensure_user_dir(user_id)
+        log_path = self._resolve_log_path(user_id, history_uid)
+        self._append_record(log_path, message)
+
+    def append_messages(
+        self, user_id: str, history_uid: str, messages: List[dict], sync: bool = False
+    ) -> None:
+        self._ensure_user_dir(user_id)
+        log_path = self._resolve_log_path(user_id, history_uid)
+        self._append_records(log_path, messages, sync)
+
+    def get_messages(self, user_id: str, history_uid: str) -> Optional[List[dict]]:
+        log_path = self._resolve_log_path(user_id, history_uid)
+        if not os.path.exists(log_path):
+            return None
+        return self._read_log(log_path)
+
+    def count_messages(self, user_id: str, history_uid: str) -> Optional[int]:
+        log_path = self._resolve_log_path(user_id, history_uid)
+        with self._get_lock(log_path):
+            if not os.path.exists(log_path):
+                return None
+            return self._count_log_messages(log_path)
+
+    def get_message_range(
+        self, user_id: str, history_uid: str, start: int, end: int
+    ) -> List[dict]:
+        log_path = self._resolve_log_path(user_id, history_uid)
+        with self._get_lock(log_path):
+            if not os.path.exists(log_path):
+                return []
+            total = self._count_log_messages(log_path)
+            # Keep reading the file we counted, even if compaction replaces it
+            f = open(log_path, "rb")
+            size = f.seek(0, os.SEEK_END)
+        with f:
+            end = min(end, total)
+            if start >= end:
+                return []
+            return _read_message_range(f, size, total - end, end - start)
+
+    def get_metadata(self, user_id: str, history_uid: str) -> dict:
+        self._resolve_log_path(user_id, history_uid)
+        meta_path = self._get_safe_history_path(user_id, history_uid, META_SUFFIX)
+        if not os.path.exists(meta_path):
+            return {}
+        with open(meta_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def update_metadata(self, user_id: str, history_uid: str, metadata: dict) -> bool:
+        log_path = self._resolve_log_path(user_id, history_uid)
+        if not os.path.exists(log_path):
+            return False
+
+        meta_path = self._get_safe_history_path(user_id, history_uid, META_SUFFIX)
+        with self._get_lock(log_path):
+            current = {}
+            if os.path.exists(meta_path):
+                with open(meta_path, "r", encoding="utf-8") as f:
+                    current = json.load(f)
+
+            if current:
+                # 更新现有元数据，保留其他字段
+                current.update(metadata)
+            else:
+                # 如果没有元数据，创建新的
+                current = {
+                    "role": "metadata",
+                    "timestamp": _now(),
+                }
+                current.update(metadata)
+                logger.info(f"创建新的对话历史元数据: {current}")
+
+            _write_json_atomic(meta_path, current)
+        return True
+
+    def modify_latest_message(
+        self,
+        user_id: str,
+        history_uid: str,
+        role: Literal["human", "ai", "system"],
+        new_content: str,
+    ) -> bool:
+        log_path = self._resolve_log_path(user_id, history_uid)
+        if not os.path.exists(log_path):
+            logger.warning(f"History file not found: {log_path}")
+            return False
+
+        latest_message = _read_last_message(log_path)
+        if not latest_message:
+            logger.warning("History is empty")
+            return False
+
+        if latest_message["role"] != role:
+            logger.warning(
+                f"Latest message role ({latest_message['role']}) doesn't match requested role ({role})"
+            )
+            return False
+
+        # 追加一条编辑记录，读取时覆盖最新消息的内容
+        self._append_record(
+            log_path, {"op": _EDIT_OP, "timestamp": _now(), "content": new_content}
+        )
+        edits = self._edit_counts.get(log_path, 0) + 1
+        self._edit_counts[log_path] = edits
+        if edits >= COMPACT_EDIT_THRESHOLD:
+            self._schedule_compaction(log_path)
+        return True
+
+    def delete_history(self, user_id: str, history_uid: str) -> bool:
+        """Remove the log and the metadata sidecar of a history"""
+        log_path = self._get_safe_history_path(user_id, history_uid)
+        removed = False
+        with self._get_lock(log_path):
+            for suffix in (LOG_SUFFIX, META_SUFFIX, LEGACY_SUFFIX):
+                filepath = self._get_safe_history_path(user_id, history_uid, suffix)
+                if os.path.exists(filepath):
+                    os.remove(filepath)
+                    removed = True
+            self._edit_counts.pop(log_path, None)
+            self._message_counts.pop(log_path, None)
+        return removed
+
+    def rename_history(
+        self, user_id: str, old_history_uid: str, new_history_uid: str
+    ) -> bool:
+        old_log_path = self._resolve_log_path(user_id, old_history_uid)
+        with self._get_lock(old_log_path):
+            if not os.path.exists(old_log_path):
+                return False
+            for suffix in (META_SUFFIX, LOG_SUFFIX):
+                old_filepath = self._get_safe_history_path(
+                    user_id, old_history_uid, suffix
+                )
+                if os.path.exists(old_filepath):
+                    os.rename(
+                        old_filepath,
+                        self._get_safe_history_path(user_id, new_history_uid, suffix),
+                    )
+            self._edit_counts.pop(old_log_path, None)
+            self._message_counts.pop(old_log_path, None)
+        return True
+
+    def _migrate_user_dir(self, user_dir: str) -> List[str]:
+        """Migrate the legacy files of a user and return the log file names"""
+        filenames = os.listdir(user_dir)
+        legacy = [f for f in filenames if is_legacy_history_file(f)]
+        if legacy:
+            # 旧格式的历史记录先迁移
+            for filename in legacy:
+                self.migrate_legacy_file(os.path.join(user_dir, filename))
+            filenames = os.listdir(user_dir)
+        return [f for f in filenames if f.endswith(LOG_SUFFIX)]
+
+    def list_histories(self, user_id: str) -> List[dict]:
+        user_dir = self._ensure_user_dir(user_id)
+        histories = []
+        for filename in self._migrate_user_dir(user_dir):
+            try:
+                # 只读取文件末尾来找到最新消息
+                latest_message = _read_last_message(os.path.join(user_dir, filename))
+            except Exception as e:
+                logger.error(f"Error reading history file {filename}: {e}")
+                continue
+            if not latest_message:
+                continue
+            histories.append(
+                {
+                    "uid": filename[: -len(LOG_SUFFIX)],
+                    "latest_message": latest_message,
+                    "timestamp": latest_message.get("timestamp"),
+                }
+            )
+
+        histories.sort(
+            key=lambda x: x["timestamp"] if x["timestamp"] else "", reverse=True
+        )
+        return histories
+
+    def delete_empty_histories(self, user_id: str) -> List[str]:
+        user_dir = self._ensure_user_dir(user_id)
+        removed = []
+        for filename in self._migrate_user_dir(user_dir):
+            if _read_last_message(os.path.join(user_dir, filename)):
+                continue
+            history_uid = filename[: -len(LOG_SUFFIX)]
+            try:
+                self.delete_history(user_id, history_uid)
+                removed.append(history_uid)
+            except Exception as e:
+                logger.error(f"Failed to remove empty history file {history_uid}: {e}")
+        return removed
+
+    def list_history_ids(self) -> List[tuple]:
+        if not os.path.isdir(self.root):
+            return []
+        ids = []
+        for user_id in sorted(os.listdir(self.root)):
+            user_dir = os.path.join(self.root, user_id)
+            if not os.path.isdir(user_dir):
+                continue
+            ids.extend(
+                (user_id, filename[: -len(LOG_SUFFIX)])
+                for filename in sorted(self._migrate_user_dir(user_dir))
+            )
+        return ids
+
+    def close(self) -> None:
+        """Wait for pending compactions"""
+        self._compaction_executor.shutdown(wait=True)
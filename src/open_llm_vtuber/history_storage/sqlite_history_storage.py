@@ -0,0 +1,349 @@
+"""
+Chat history stored in a local SQLite database.
+
+Every history has a row in `histories` with its metadata and a denormalized
+copy of its latest message, so listing the histories of a user is a single
+indexed query that never touches the messages. The database runs in WAL mode,
+so readers don't block the writer.
+"""
+
+import os
+import json
+import sqlite3
+import threading
+from typing import List, Literal, Optional
+from loguru import logger
+
+from .history_storage_interface import HistoryStorageInterface
+
+
+DEFAULT_DB_PATH = os.path.join("chat_history", "chat_history.db")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS histories (
+    user_id TEXT NOT NULL,
+    history_uid TEXT NOT NULL,
+    metadata TEXT NOT NULL,
+    latest_message TEXT,
+    latest_timestamp TEXT,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, history_uid)
+);
+CREATE INDEX IF NOT EXISTS idx_histories_latest
+    ON histories (user_id, latest_timestamp);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    history_uid TEXT NOT NULL,
+    role TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    content TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_messages_history
+    ON messages (user_id, history_uid, timestamp);
+"""
+
+
+def _dumps(data: dict) -> str:
+    return json.dumps(data, ensure_ascii=False)
+
+
+class SqliteHistoryStorage(HistoryStorageInterface):
+    """History backend on a single local SQLite file."""
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
+        """
+        Args:
+            db_path: Path of the database file, created if it doesn't exist
+        """
+        self.db_path = db_path
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        # sqlite3 connections can't be shared between threads; one per thread
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._conn().executescript(_SCHEMA)
+        logger.info(f"Using SQLite chat history storage: {db_path}")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # With WAL, NORMAL only risks the last transactions on power loss
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def create_history(self, user_id: str, history_uid: str, metadata: dict) -> None:
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO histories (user_id, history_uid, metadata) "
+                "VALUES (?, ?, ?)",
+                (user_id, history_uid, _dumps(metadata)),
+            )
+
+    def append_message(self, user_id: str, history_uid: str, message: dict) -> None:
+        self.append_messages(user_id, history_uid, [message])
+
+    def append_messages(
+        self, user_id: str, history_uid: str, messages: List[dict], sync: bool = False
+    ) -> None:
+        if not messages:
+            return
+        conn = self._conn()
+        # FULL syncs the WAL on every commit
+        conn.execute(f"PRAGMA synchronous={'FULL' if sync else 'NORMAL'}")
+        latest = _dumps(messages[-1])
+        timestamp = messages[-1].get("timestamp", "")
+        with conn:
+            conn.executemany(
+                "INSERT INTO messages "
+                "(user_id, history_uid, role, timestamp, content, data) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        user_id,
+                        history_uid,
+                        message["role"],
+                        message.get("timestamp", ""),
+                        message.get("content", ""),
+                        _dumps(message),
+                    )
+                    for message in messages
+                ],
+            )
+            conn.execute(
+                "INSERT INTO histories "
+                "(user_id, history_uid, metadata, latest_message, latest_timestamp, message_count) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (user_id, history_uid) DO UPDATE SET "
+                "latest_message = excluded.latest_message, "
+                "latest_timestamp = excluded.latest_timestamp, "
+                "message_count = message_count + excluded.message_count",
+                (
+                    user_id,
+                    history_uid,
+                    _dumps({"role": "metadata", "timestamp": timestamp}),
+                    latest,
+                    timestamp,
+                    len(messages),
+                ),
+            )
+
+    def _exists(self, user_id: str, history_uid: str) -> bool:
+        row = (
+            self._conn()
+            .execute(
+                "SELECT 1 FROM histories WHERE user_id = ? AND history_uid = ?",
+                (user_id, history_uid),
+            )
+            .fetchone()
+        )
+        return row is not None
+
+    def get_messages(self, user_id: str, history_uid: str) -> Optional[List[dict]]:
+        rows = (
+            self._conn()
+            .execute(
+                "SELECT data FROM messages WHERE user_id = ? AND history_uid = ? "
+                "ORDER BY timestamp, id",
+                (user_id, history_uid),
+            )
+            .fetchall()
+        )
+        if not rows and not self._exists(user_id, history_uid):
+            return None
+        return [json.loads(data) for (data,) in rows]
+
+    def count_messages(self, user_id: str, history_uid: str) -> Optional[int]:
+        row = (
+            self._conn()
+            .execute(
+                "SELECT message_count FROM histories WHERE user_id = ? AND history_uid = ?",
+                (user_id, history_uid),
+            )
+            .fetchone()
+        )
+        return row[0] if row else None
+
+    def get_message_range(
+        self, user_id: str, history_uid: str, start: int, end: int
+    ) -> List[dict]:
+        total = self.count_messages(user_id, history_uid) or 0
+        end = min(end, total)
+        if start >= end:
+            return []
+        if total - end < start:
+            # Pages near the end (the usual case) are read backwards, so
+            # OFFSET doesn't step over the whole history
+            rows = (
+                self._conn()
+                .execute(
+                    "SELECT data FROM messages WHERE user_id = ? AND history_uid = ? "
+                    "ORDER BY timestamp DESC, id DESC LIMIT ? OFFSET ?",
+                    (user_id, history_uid, end - start, total - end),
+                )
+                .fetchall()
+            )
+            rows.reverse()
+        else:
+            rows = (
+                self._conn()
+                .execute(
+                    "SELECT data FROM messages WHERE user_id = ? AND history_uid = ? "
+                    "ORDER BY timestamp, id LIMIT ? OFFSET ?",
+                    (user_id, history_uid, end - start, start),
+                )
+                .fetchall()
+            )
+        return [json.loads(data) for (data,) in rows]
+
+    def get_metadata(self, user_id: str, history_uid: str) -> dict:
+        row = (
+            self._conn()
+            .execute(
+                "SELECT metadata FROM histories WHERE user_id = ? AND history_uid = ?",
+                (user_id, history_uid),
+            )
+            .fetchone()
+        )
+        return json.loads(row[0]) if row else {}
+
+    def update_metadata(self, user_id: str, history_uid: str, metadata: dict) -> bool:
+        with self._conn() as conn:
+            row = conn.execute(
+                "SELECT metadata FROM histories WHERE user_id = ? AND history_uid = ?",
+                (user_id, history_uid),
+            ).fetchone()
+            if row is None:
+                return False
+            current = json.loads(row[0])
+            current.update(metadata)
+            conn.execute(
+                "UPDATE histories SET metadata = ? WHERE user_id = ? AND history_uid = ?",
+                (_dumps(current), user_id, history_uid),
+            )
+        return True
+
+    def modify_latest_message(
+        self,
+        user_id: str,
+        history_uid: str,
+        role: Literal["human", "ai", "system"],
+        new_content: str,
+    ) -> bool:
+        with self._conn() as conn:
+            row = conn.execute(
+                "SELECT latest_message FROM histories WHERE user_id = ? AND history_uid = ?",
+                (user_id, history_uid),
+            ).fetchone()
+            if row is None:
+                logger.warning(f"History not found: {user_id}/{history_uid}")
+                return False
+            if row[0] is None:
+                logger.warning("History is empty")
+                return False
+
+            latest_message = json.loads(row[0])
+            if latest_message["role"] != role:
+                logger.warning(
+                    f"Latest message role ({latest_message['role']}) doesn't match requested role ({role})"
+                )
+                return False
+
+            latest_message["content"] = new_content
+            data = _dumps(latest_message)
+            conn.execute(
+                "UPDATE messages SET content = ?, data = ? WHERE id = ("
+                "SELECT id FROM messages WHERE user_id = ? AND history_uid = ? "
+                "ORDER BY timestamp DESC, id DESC LIMIT 1)",
+                (new_content, data, user_id, history_uid),
+            )
+            conn.execute(
+                "UPDATE histories SET latest_message = ? "
+                "WHERE user_id = ? AND history_uid = ?",
+                (data, user_id, history_uid),
+            )
+        return True
+
+    def delete_history(self, user_id: str, history_uid: str) -> bool:
+        with self._conn() as conn:
+            conn.execute(
+                "DELETE FROM messages WHERE user_id = ? AND history_uid = ?",
+                (user_id, history_uid),
+            )
+            deleted = conn.execute(
+                "DELETE FROM histories WHERE user_id = ? AND history_uid = ?",
+                (user_id, history_uid),
+            ).rowcount
+        return deleted > 0
+
+    def rename_history(
+        self, user_id: str, old_history_uid: str, new_history_uid: str
+    ) -> bool:
+        with self._conn() as conn:
+            renamed = conn.execute(
+                "UPDATE histories SET history_uid = ? WHERE user_id = ? AND history_uid = ?",
+                (new_history_uid, user_id, old_history_uid),
+            ).rowcount
+            if not renamed:
+                return False
+            conn.execute(
+                "UPDATE messages SET history_uid = ? WHERE user_id = ? AND history_uid = ?",
+                (new_history_uid, user_id, old_history_uid),
+            )
+        return True
+
+    def list_histories(self, user_id: str) -> List[dict]:
+        rows = (
+            self._conn()
+            .execute(
+                "SELECT history_uid, latest_message, latest_timestamp FROM histories "
+                "WHERE user_id = ? AND message_count > 0 "
+                "ORDER BY latest_timestamp DESC",
+                (user_id,),
+            )
+            .fetchall()
+        )
+        return [
+            {
+                "uid": history_uid,
+                "latest_message": json.loads(latest_message),
+                "timestamp": timestamp,
+            }
+            for history_uid, latest_message, timestamp in rows
+        ]
+
+    def delete_empty_histories(self, user_id: str) -> List[str]:
+        with self._conn() as conn:
+            rows = conn.execute(
+                "SELECT history_uid FROM histories WHERE user_id = ? AND message_count = 0",
+                (user_id,),
+            ).fetchall()
+            conn.execute(
+                "DELETE FROM histories WHERE user_id = ? AND message_count = 0",
+                (user_id,),
+            )
+        return [history_uid for (history_uid,) in rows]
+
+    def list_history_ids(self) -> List[tuple]:
+        return (
+            self._conn()
+            .execute(
+                "SELECT user_id, history_uid FROM histories ORDER BY user_id, history_uid"
+            )
+            .fetchall()
+        )
+
+    def close(self) -> None:
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
@@ -0,0 +1,511 @@
+"""
+Storage wrapper that shares group conversation transcripts between members.
+
+A group conversation writes each message once, into a transcript. Transcripts
+are kept in a storage of their own, apart from the users' histories, as
+histories of `TRANSCRIPT_OWNER`; no user id can reach them. Each member history
+only gets one reference record `{"role": "transcript", "transcript_id": ...,
+"offset": n}` per group conversation, added when it joins the transcript,
+and lists its transcripts in its metadata (`group_transcripts`). The
+transcript's metadata lists its members.
+
+Reads expand the references: a member sees its own messages with the
+transcript messages from `offset` on in place of each reference. Where the
+references sit in a member history is read the first time the history is
+opened and kept in memory, as are the message counts of the transcripts;
+histories without transcripts are passed through unchanged.
+"""
+
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Literal, Optional, Tuple
+from loguru import logger
+
+from .history_storage_interface import HistoryStorageInterface
+
+
+DEFAULT_TRANSCRIPTS_DIR = os.path.join("chat_history", "transcripts")
+# Owner of the transcripts in the transcript storage
+TRANSCRIPT_OWNER = "group"
+TRANSCRIPT_ROLE = "transcript"
+# Number of member histories whose layout is kept in memory
+LAYOUT_CACHE_SIZE = 256
+# Number of transcripts whose message count is kept in memory
+TRANSCRIPT_COUNT_CACHE_SIZE = 256
+# Transcript search results fetched per requested result, before keeping
+# those of the user's histories
+_SEARCH_OVERFETCH = 4
+
+_HistoryKey = Tuple[str, str]
+# ("own", start, end) for messages of the history itself (indices in its
+# own records), ("transcript", transcript_id, offset) for a reference
+_Segment = Tuple[str, object, object]
+
+
+class TranscriptHistoryStorage(HistoryStorageInterface):
+    """Delegates to a backend and expands shared group transcripts on read."""
+
+    def __init__(
+        self, storage: HistoryStorageInterface, transcripts: HistoryStorageInterface
+    ):
+        """
+        Args:
+            storage: The storage the users' histories are kept in
+            transcripts: The storage the group transcripts are kept in
+        """
+        self.storage = storage
+        self.transcripts = transcripts
+        self._lock = threading.RLock()
+        # 成员对话的结构：自己的消息和引用的转录各占哪一段；None 表示没有引用
+        self._layouts: "OrderedDict[_HistoryKey, Optional[List[_Segment]]]" = (
+            OrderedDict()
+        )
+        # Message count of each transcript, so reads don't count them again
+        self._transcript_counts: "OrderedDict[str, int]" = OrderedDict()
+
+    # Transcripts
+
+    def create_transcript(self, members: List[_HistoryKey]) -> str:
+        """
+        Create a transcript shared by some member histories.
+
+        Args:
+            members: `(user_id, history_uid)` of the member histories
+
+        Returns:
+            str: The transcript id
+        """
+        transcript_id = (
+            f"{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}_{uuid.uuid4().hex}"
+        )
+        self.transcripts.create_history(
+            TRANSCRIPT_OWNER,
+            transcript_id,
+            {
+                "role": "metadata",
+                "timestamp": datetime.now().isoformat(timespec="seconds"),
+                "members": [list(member) for member in members],
+            },
+        )
+        with self._lock:
+            self._set_transcript_count(transcript_id, 0)
+            for user_id, history_uid in members:
+                self._add_reference(user_id, history_uid, transcript_id, 0)
+        return transcript_id
+
+    def add_transcript_members(
+        self, transcript_id: str, members: List[_HistoryKey]
+    ) -> bool:
+        """
+        Let more histories share a transcript, e.g. of a member that started a
+        new history. They see the transcript messages stored from now on.
+        Histories already sharing it are skipped.
+
+        Returns:
+            bool: False if the transcript doesn't exist (anymore)
+        """
+        with self._lock:
+            offset = self._transcript_count(transcript_id)
+            if offset is None:
+                return False
+            current = [
+                tuple(member)
+                for member in self.transcripts.get_metadata(
+                    TRANSCRIPT_OWNER, transcript_id
+                ).get("members", [])
+            ]
+            added = [
+                member
+                for member in dict.fromkeys(tuple(member) for member in members)
+                if member not in current
+            ]
+            if not added:
+                return True
+            for user_id, history_uid in added:
+                self._add_reference(user_id, history_uid, transcript_id, offset)
+            self.transcripts.update_metadata(
+                TRANSCRIPT_OWNER,
+                transcript_id,
+                {"members": [list(member) for member in current + added]},
+            )
+        return True
+
+    def _add_reference(
+        self, user_id: str, history_uid: str, transcript_id: str, offset: int
+    ) -> None:
+        with self._lock:
+            # Read the layout before the reference is added
+            layout = self._layout(user_id, history_uid)
+            own_count = self.storage.count_messages(user_id, history_uid) or 0
+            self.storage.append_message(
+                user_id,
+                history_uid,
+                {
+                    "role": TRANSCRIPT_ROLE,
+                    "timestamp": datetime.now().isoformat(timespec="seconds"),
+                    "transcript_id": transcript_id,
+                    "offset": offset,
+                },
+            )
+            transcripts = self.storage.get_metadata(user_id, history_uid).get(
+                "group_transcripts", []
+            )
+            self.storage.update_metadata(
+                user_id,
+                history_uid,
+                {"group_transcripts": transcripts + [transcript_id]},
+            )
+            if layout is None:
+                layout = [("own", 0, own_count)] if own_count else []
+            self._set_layout(
+                (user_id, history_uid),
+                layout + [("transcript", transcript_id, offset)],
+            )
+
+    def append_transcript_message(self, transcript_id: str, message: dict) -> None:
+        """Append a message to a transcript, seen by all its members"""
+        with self._lock:
+            self.transcripts.append_message(TRANSCRIPT_OWNER, transcript_id, message)
+            if transcript_id in self._transcript_counts:
+                self._transcript_counts[transcript_id] += 1
+
+    def _transcript_count(self, transcript_id: str) -> Optional[int]:
+        """Message count of a transcript, None if it doesn't exist"""
+        with self._lock:
+            if transcript_id in self._transcript_counts:
+                self._transcript_counts.move_to_end(transcript_id)
+                return self._transcript_counts[transcript_id]
+            count = self.transcripts.count_messages(TRANSCRIPT_OWNER, transcript_id)
+            if count is not None:
+                self._set_transcript_count(transcript_id, count)
+            return count
+
+    def _set_transcript_count(self, transcript_id: str, count: int) -> None:
+        # Caller holds _lock
+        self._transcript_counts[transcript_id] = count
+        self._transcript_counts.move_to_end(transcript_id)
+        if len(self._transcript_counts) > TRANSCRIPT_COUNT_CACHE_SIZE:
+            self._transcript_counts.popitem(last=False)
+
+    def _update_members(
+        self, transcript_id: str, old: _HistoryKey, new: Optional[_HistoryKey]
+    ) -> None:
+        """Replace or remove a member of a transcript; delete it once it has none"""
+        members = [
+            tuple(member)
+            for member in self.transcripts.get_metadata(
+                TRANSCRIPT_OWNER, transcript_id
+            ).get("members", [])
+        ]
+        if old not in members:
+            return
+        members = [member for member in members if member != old]
+        if new is not None:
+            members.append(new)
+        if members:
+            self.transcripts.update_metadata(
+                TRANSCRIPT_OWNER,
+                transcript_id,
+                {"members": [list(member) for member in members]},
+            )
+        else:
+            self.transcripts.delete_history(TRANSCRIPT_OWNER, transcript_id)
+            self._transcript_counts.pop(transcript_id, None)
+            logger.debug(
+                f"Deleted group transcript {transcript_id} with no members left"
+            )
+
+    # Layouts
+
+    def _set_layout(self, key: _HistoryKey, layout: Optional[List[_Segment]]) -> None:
+        # Caller holds _lock
+        self._layouts[key] = layout
+        self._layouts.move_to_end(key)
+        if len(self._layouts) > LAYOUT_CACHE_SIZE:
+            self._layouts.popitem(last=False)
+
+    def _layout(self, user_id: str, history_uid: str) -> Optional[List[_Segment]]:
+        """The segments of a member history, None if it has no transcripts"""
+        key = (user_id, history_uid)
+        with self._lock:
+            if key in self._layouts:
+                self._layouts.move_to_end(key)
+                return self._layouts[key]
+            layout = None
+            if self.storage.get_metadata(user_id, history_uid).get("group_transcripts"):
+                layout = []
+                for index, message in enumerate(
+                    self.storage.get_messages(user_id, history_uid) or []
+                ):
+                    if message.get("role") == TRANSCRIPT_ROLE:
+                        layout.append(
+                            ("transcript", message["transcript_id"], message["offset"])
+                        )
+                    elif layout and layout[-1][0] == "own":
+                        layout[-1] = ("own", layout[-1][1], index + 1)
+                    else:
+                        layout.append(("own", index, index + 1))
+            self._set_layout(key, layout)
+            return layout
+
+    def _segment_lengths(
+        self, user_id: str, history_uid: str, layout: List[_Segment]
+    ) -> List[int]:
+        lengths = []
+        for kind, first, second in layout:
+            if kind == "own":
+                lengths.append(second - first)
+            else:
+                count = self._transcript_count(first) or 0
+                lengths.append(max(count - second, 0))
+        return lengths
+
+    # HistoryStorageInterface
+
+    def create_history(self, user_id: str, history_uid: str, metadata: dict) -> None:
+        self.storage.create_history(user_id, history_uid, metadata)
+
+    def append_message(self, user_id: str, history_uid: str, message: dict) -> None:
+        self.append_messages(user_id, history_uid, [message])
+
+    def append_messages(
+        self, user_id: str, history_uid: str, messages: List[dict], sync: bool = False
+    ) -> None:
+        with self._lock:
+            key = (user_id, history_uid)
+            layout = self._layouts.get(key)
+            if layout:
+                index = self.storage.count_messages(user_id, history_uid) or 0
+                # Replaced rather than changed in place, readers may be using it
+                if layout[-1][0] == "own":
+                    layout = layout[:-1] + [
+                        ("own", layout[-1][1], index + len(messages))
+                    ]
+                else:
+                    layout = layout + [("own", index, index + len(messages))]
+                self._layouts[key] = layout
+            self.storage.append_messages(user_id, history_uid, messages, sync=sync)
+
+    def get_messages(self, user_id: str, history_uid: str) -> Optional[List[dict]]:
+        layout = self._layout(user_id, history_uid)
+        if layout is None:
+            return self.storage.get_messages(user_id, history_uid)
+        own = self.storage.get_messages(user_id, history_uid) or []
+        messages = []
+        for kind, first, second in layout:
+            if kind == "own":
+                messages.extend(own[first:second])
+            else:
+                transcript = self.transcripts.get_messages(TRANSCRIPT_OWNER, first)
+                messages.extend((transcript or [])[second:])
+        return messages
+
+    def count_messages(self, user_id: str, history_uid: str) -> Optional[int]:
+        layout = self._layout(user_id, history_uid)
+        if layout is None:
+            return self.storage.count_messages(user_id, history_uid)
+        return sum(self._segment_lengths(user_id, history_uid, layout))
+
+    def get_message_range(
+        self, user_id: str, history_uid: str, start: int, end: int
+    ) -> List[dict]:
+        layout = self._layout(user_id, history_uid)
+        if layout is None:
+            return self.storage.get_message_range(user_id, history_uid, start, end)
+        messages = []
+        position = 0
+        for (kind, first, second), length in zip(
+            layout, self._segment_lengths(user_id, history_uid, layout)
+        ):
+            # Part of [start, end) inside this segment, relative to it
+            low = max(start - position, 0)
+            high = min(end - position, length)
+            position += length
+            if low >= high:
+                continue
+            if kind == "own":
+                messages.extend(
+                    self.storage.get_message_range(
+                        user_id, history_uid, first + low, first + high
+                    )
+                )
+            else:
+                messages.extend(
+                    self.transcripts.get_message_range(
+                        TRANSCRIPT_OWNER, first, second + low, second + high
+                    )
+                )
+        return messages
+
+    def get_metadata(self, user_id: str, history_uid: str) -> dict:
+        return self.storage.get_metadata(user_id, history_uid)
+
+    def update_metadata(self, user_id: str, history_uid: str, metadata: dict) -> bool:
+        return self.storage.update_metadata(user_id, history_uid, metadata)
+
+    def modify_latest_message(
+        self,
+        user_id: str,
+        history_uid: str,
+        role: Literal["human", "ai", "system"],
+        new_content: str,
+    ) -> bool:
+        layout = self._layout(user_id, history_uid)
+        if layout and layout[-1][0] == "transcript":
+            # The latest message the member sees is the transcript's
+            return self.transcripts.modify_latest_message(
+                TRANSCRIPT_OWNER, layout[-1][1], role, new_content
+            )
+        return self.storage.modify_latest_message(
+            user_id, history_uid, role, new_content
+        )
+
+    def delete_history(self, user_id: str, history_uid: str) -> bool:
+        with self._lock:
+            transcripts = self.storage.get_metadata(user_id, history_uid).get(
+                "group_transcripts", []
+            )
+            deleted = self.storage.delete_history(user_id, history_uid)
+            self._layouts.pop((user_id, history_uid), None)
+            for transcript_id in transcripts:
+                self._update_members(transcript_id, (user_id, history_uid), None)
+        return deleted
+
+    def rename_history(
+        self, user_id: str, old_history_uid: str, new_history_uid: str
+    ) -> bool:
+        with self._lock:
+            if not self.storage.rename_history(
+                user_id, old_history_uid, new_history_uid
+            ):
+                return False
+            layout = self._layouts.pop((user_id, old_history_uid), None)
+            if layout is not None:
+                self._set_layout((user_id, new_history_uid), layout)
+            for transcript_id in self.storage.get_metadata(
+                user_id, new_history_uid
+            ).get("group_transcripts", []):
+                self._update_members(
+                    transcript_id,
+                    (user_id, old_history_uid),
+                    (user_id, new_history_uid),
+                )
+        return True
+
+    def list_histories(self, user_id: str) -> List[dict]:
+        histories = self.storage.list_histories(user_id)
+        for history in histories:
+            reference = history["latest_message"]
+            if reference.get("role") != TRANSCRIPT_ROLE:
+                continue
+            # Show the latest message of the transcript instead
+            count = self._transcript_count(reference["transcript_id"])
+            latest = (
+                self.transcripts.get_message_range(
+                    TRANSCRIPT_OWNER, reference["transcript_id"], count - 1, count
+                )
+                if count and count > reference["offset"]
+                else []
+            )
+            if latest:
+                history["latest_message"] = latest[0]
+                history["timestamp"] = latest[0].get("timestamp")
+        histories.sort(
+            key=lambda x: x["timestamp"] if x["timestamp"] else "", reverse=True
+        )
+        return histories
+
+    def delete_empty_histories(self, user_id: str) -> List[str]:
+        # A history referencing a transcript has a record, so it isn't empty
+        removed = self.storage.delete_empty_histories(user_id)
+        with self._lock:
+            for history_uid in removed:
+                self._layouts.pop((user_id, history_uid), None)
+        return removed
+
+    def list_history_ids(self) -> List[tuple]:
+        return self.storage.list_history_ids()
+
+    def search_messages(self, user_id: str, query: str, limit: int) -> List[dict]:
+        results = []
+        for item in self.storage.search_messages(user_id, query, limit):
+            # Member histories have transcript messages in between their own
+            message_index = self._view_index(
+                user_id, item["history_uid"], None, item["message_index"]
+            )
+            if message_index is not None:
+                results.append(
+                    {
+                        **item,
+                        "message_index": message_index,
+                        "cursor": message_index + 1,
+                    }
+                )
+
+        # Group messages are indexed once, under their transcript
+        members: Dict[str, Optional[str]] = {}
+        for item in self.transcripts.search_messages(
+            TRANSCRIPT_OWNER, query, limit * _SEARCH_OVERFETCH
+        ):
+            transcript_id = item["history_uid"]
+            if transcript_id not in members:
+                members[transcript_id] = next(
+                    (
+                        history_uid
+                        for member_user_id, history_uid in self.transcripts.get_metadata(
+                            TRANSCRIPT_OWNER, transcript_id
+                        ).get("members", [])
+                        if member_user_id == user_id
+                    ),
+                    None,
+                )
+            history_uid = members[transcript_id]
+            if history_uid is None:
+                continue
+            message_index = self._view_index(
+                user_id, history_uid, transcript_id, item["message_index"]
+            )
+            if message_index is not None:
+                results.append(
+                    {
+                        **item,
+                        "history_uid": history_uid,
+                        "message_index": message_index,
+                        "cursor": message_index + 1,
+                    }
+                )
+        results.sort(key=lambda item: item["score"], reverse=True)
+        return results[:limit]
+
+    def _view_index(
+        self,
+        user_id: str,
+        history_uid: str,
+        transcript_id: Optional[str],
+        index: int,
+    ) -> Optional[int]:
+        """
+        Index in the view of a member history of one of its own messages
+        (`transcript_id` None) or of a transcript message
+        """
+        layout = self._layout(user_id, history_uid)
+        if layout is None:
+            return index if transcript_id is None else None
+        position = 0
+        for (kind, first, second), length in zip(
+            layout, self._segment_lengths(user_id, history_uid, layout)
+        ):
+            if transcript_id is None:
+                if kind == "own" and first <= index < second:
+                    return position + index - first
+            elif kind == "transcript" and first == transcript_id and index >= second:
+                return position + index - second
+            position += length
+        return None
+
+    def close(self) -> None:
+        self.storage.close()
+        self.transcripts.close()
@@ -0,0 +1,659 @@
+"""
+Write-behind layer in front of a history storage backend.
+
+`append_message` only puts the message into an in-memory queue and returns,
+so conversation turns and interrupt handlers never wait on disk. A writer
+thread flushes the queue in batches, one write per history, on a timer and
+at shutdown. Reads merge the queued messages with the stored ones, so they
+always see every message that was appended.
+
+Reads, edits of the latest message and metadata updates never wait for the
+writer: messages being written are kept in memory until their write is done,
+together with the number of messages stored before them, so a read that runs
+during a write drops whatever part of the batch it sees in the backend and
+takes the batch from memory instead. Edits of messages already handed to the
+writer are queued and written before the messages appended after them.
+
+Metadata is cached in memory. Updates that change nothing are skipped, and
+changed metadata is written by the writer thread together with the messages.
+
+Searches don't wait for the writer either: queued messages are matched in
+memory and merged with the backend results. Deleting or renaming a history
+pauses its writes, waits only for a write of that history in progress, and
+moves or drops its queued messages and metadata.
+
+Durability modes:
+- "none": flushed on the timer, never fsynced
+- "batched": flushed on the timer, fsynced once per batch
+- "fsync": every message is handed to the writer thread at once and fsynced
+"""
+
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Literal,
+    Optional,
+    Set,
+    Tuple,
+)
+from loguru import logger
+
+from .history_storage_interface import HistoryStorageInterface
+from .history_search_index import make_snippet
+
+
+Durability = Literal["none", "batched", "fsync"]
+_HistoryKey = Tuple[str, str]
+# (role, new content) of an edit of the latest message
+_Edit = Tuple[str, str]
+
+# Number of histories whose metadata is kept in memory; only entries already
+# written are evicted
+METADATA_CACHE_SIZE = 1024
+
+
+@dataclass
+class _Write:
+    """Messages of one history taken from the queue and being written"""
+
+    # Messages stored before the write started
+    base: int
+    messages: List[dict]
+    # Edit of the message before `messages`, written first
+    edit: Optional[_Edit] = None
+
+
+@dataclass
+class _Snapshot:
+    """Queue state of one history, consistent with a backend read"""
+
+    writing: Optional[_Write]
+    pending: List[dict]
+    edit: Optional[_Edit]
+
+    def merge(
+        self, stored_count: int, stored: List[dict], start: int = 0
+    ) -> List[dict]:
+        """
+        Combine messages `start..` read from the backend, which held
+        `stored_count` messages, with the messages in memory.
+        """
+        stored = list(stored)
+        tail: List[dict] = []
+        if self.writing is not None:
+            # The read may have seen part of the batch being written
+            stored_count = self.writing.base
+            del stored[max(stored_count - start, 0) :]
+            tail = [dict(message) for message in self.writing.messages]
+            if self.writing.edit is not None:
+                self._apply_edit(
+                    self.writing.edit,
+                    stored_count - 1,
+                    start,
+                    stored_count,
+                    stored,
+                    tail,
+                )
+        if self.edit is not None:
+            self._apply_edit(
+                self.edit,
+                stored_count + len(tail) - 1,
+                start,
+                stored_count,
+                stored,
+                tail,
+            )
+        tail += self.pending
+        return stored + tail[max(start - stored_count, 0) :]
+
+    @staticmethod
+    def _apply_edit(
+        edit: _Edit,
+        index: int,
+        start: int,
+        stored_count: int,
+        stored: List[dict],
+        tail: List[dict],
+    ) -> None:
+        # `stored` holds the stored messages from `start`, `tail` the messages
+        # after the stored ones
+        if index >= stored_count:
+            messages, position = tail, index - stored_count
+        else:
+            messages, position = stored, index - start
+        if 0 <= position < len(messages):
+            messages[position] = {**messages[position], "content": edit[1]}
+
+
+class WriteBehindHistoryStorage(HistoryStorageInterface):
+    """Queues appended messages in memory and writes them in the background."""
+
+    def __init__(
+        self,
+        storage: HistoryStorageInterface,
+        durability: Durability = "batched",
+        flush_interval: float = 1.0,
+    ):
+        """
+        Args:
+            storage: The backend the messages are written to
+            durability: When messages are written and fsynced, see module doc
+            flush_interval: Seconds between flushes in "none" and "batched" modes
+        """
+        if durability not in ("none", "batched", "fsync"):
+            raise ValueError(f"Unsupported history durability mode: {durability}")
+        self.storage = storage
+        self.durability = durability
+        self.flush_interval = flush_interval
+
+        # 待写入的消息，按对话分组，保持追加顺序
+        self._pending: "OrderedDict[_HistoryKey, List[dict]]" = OrderedDict()
+        # 对已交给写线程的最新消息的修改，在之后追加的消息之前写入
+        self._edits: Dict[_HistoryKey, _Edit] = {}
+        # 正在写入的批次，写完后才移除，读取时用来补全
+        self._writing: Dict[_HistoryKey, _Write] = {}
+        # Number of writes started per history; reads retry if it changes
+        self._write_counts: Dict[_HistoryKey, int] = {}
+        # 正在删除或重命名的对话，写线程暂不写入
+        self._paused: Set[_HistoryKey] = set()
+        self._writing_metadata: Set[_HistoryKey] = set()
+        # 保护以上状态；入队只需要这把锁，持有时间很短
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        # Notified when a write finishes, for deletes and renames waiting on it
+        self._written = threading.Condition(self._lock)
+        # 只在写后端时持有（写线程、删除、重命名），读取和入队都不需要
+        # 加锁顺序：_io_lock -> _lock
+        self._io_lock = threading.RLock()
+        # 元数据缓存（最近使用的在后面）和尚未写入的条目，同样由 _lock 保护
+        self._metadata: "OrderedDict[_HistoryKey, dict]" = OrderedDict()
+        self._dirty_metadata: Set[_HistoryKey] = set()
+        self._closed = False
+        self._thread = threading.Thread(
+            target=self._run, name="history-writer", daemon=True
+        )
+        self._thread.start()
+
+    # Writer thread
+
+    def _run(self) -> None:
+        while True:
+            with self._wake:
+                if self.durability == "fsync":
+                    while (
+                        not self._pending
+                        and not self._edits
+                        and not self._dirty_metadata
+                        and not self._closed
+                    ):
+                        self._wake.wait()
+                elif not self._closed:
+                    self._wake.wait(self.flush_interval)
+                closed = self._closed
+            self.flush()
+            if closed:
+                return
+
+    def flush(self) -> None:
+        """Write every queued message and changed metadata to the backend"""
+        with self._io_lock:
+            with self._lock:
+                keys = list(self._pending) + [
+                    key for key in self._edits if key not in self._pending
+                ]
+                metadata_keys = list(self._dirty_metadata)
+            self._write_keys(keys)
+            self._write_metadata(metadata_keys)
+
+    def _flush_keys(self, keys: List[_HistoryKey]) -> None:
+        """Write the queued messages and metadata of some histories before changing them"""
+        with self._io_lock:
+            self._write_keys(keys)
+            self._write_metadata(keys)
+
+    def _write_metadata(self, keys: Iterable[_HistoryKey]) -> None:
+        # Caller holds _io_lock
+        for key in keys:
+            with self._lock:
+                if key not in self._dirty_metadata or key in self._paused:
+                    continue
+                self._dirty_metadata.discard(key)
+                metadata = dict(self._metadata[key])
+                self._writing_metadata.add(key)
+            try:
+                self.storage.update_metadata(key[0], key[1], metadata)
+            except Exception as e:
+                logger.error(
+                    f"Failed to write metadata of history {key[1]}, "
+                    f"retrying on the next flush: {e}"
+                )
+                with self._lock:
+                    if key in self._metadata:
+                        self._dirty_metadata.add(key)
+            finally:
+                with self._lock:
+                    self._writing_metadata.discard(key)
+                    self._written.notify_all()
+
+    def _write_keys(self, keys: List[_HistoryKey]) -> None:
+        # Caller holds _io_lock, so only this thread writes to the backend
+        bases = {}
+        for key in keys:
+            try:
+                bases[key] = self.storage.count_messages(*key) or 0
+            except ValueError:
+                # Invalid user_id or history_uid, reported by the write
+                bases[key] = 0
+        with self._lock:
+            batch = []
+            for key in keys:
+                if key in self._paused:
+                    # Written on the next flush, under its new name if renamed
+                    continue
+                messages = self._pending.pop(key, [])
+                edit = self._edits.pop(key, None)
+                if not messages and edit is None:
+                    continue
+                self._writing[key] = _Write(bases[key], messages, edit)
+                self._write_counts[key] = self._write_counts.get(key, 0) + 1
+                batch.append(key)
+        for key in batch:
+            self._write(key, self._writing[key])
+
+    def _write(self, key: _HistoryKey, write: _Write) -> None:
+        # Caller holds _io_lock
+        user_id, history_uid = key
+        sync = self.durability != "none"
+        failed_edit = write.edit
+        written = 0
+        try:
+            if write.edit is not None:
+                role, new_content = write.edit
+                self.storage.modify_latest_message(
+                    user_id, history_uid, role, new_content
+                )
+                failed_edit = None
+            if self.durability == "fsync":
+                for message in write.messages:
+                    self.storage.append_messages(
+                        user_id, history_uid, [message], sync=True
+                    )
+                    written += 1
+            elif write.messages:
+                self.storage.append_messages(
+                    user_id, history_uid, write.messages, sync=sync
+                )
+                written = len(write.messages)
+        except ValueError as e:
+            # Invalid user_id or history_uid, retrying won't help
+            logger.error(
+                f"Dropped {len(write.messages)} messages for history {history_uid}: {e}"
+            )
+            written = len(write.messages)
+            failed_edit = None
+        except Exception as e:
+            logger.error(
+                f"Failed to write {len(write.messages) - written} messages to "
+                f"history {history_uid}, retrying on the next flush: {e}"
+            )
+        with self._lock:
+            del self._writing[key]
+            self._requeue(key, write.messages[written:], failed_edit)
+            self._written.notify_all()
+
+    def _requeue(
+        self, key: _HistoryKey, messages: List[dict], edit: Optional[_Edit]
+    ) -> None:
+        # Caller holds _lock
+        newer_edit = self._edits.pop(key, None)
+        if messages:
+            if newer_edit is not None:
+                # It was made to the last of these messages while they were written
+                messages[-1] = {**messages[-1], "content": newer_edit[1]}
+            if edit is not None:
+                self._edits[key] = edit
+            # Put them back in front of messages queued meanwhile
+            self._pending[key] = messages + self._pending.get(key, [])
+            self._pending.move_to_end(key, last=False)
+        elif newer_edit is not None or edit is not None:
+            self._edits[key] = newer_edit or edit
+
+    # Reads
+
+    def _read(self, key: _HistoryKey, read: Callable[[], Any]) -> Tuple[Any, _Snapshot]:
+        """
+        Run a backend read together with a snapshot of the queue. No write of
+        the history starts between the two, so the snapshot tells which part
+        of what was read may belong to a write in progress.
+        """
+        while True:
+            with self._lock:
+                write_count = self._write_counts.get(key, 0)
+                snapshot = _Snapshot(
+                    writing=self._writing.get(key),
+                    pending=[dict(message) for message in self._pending.get(key, [])],
+                    edit=self._edits.get(key),
+                )
+            result = read()
+            with self._lock:
+                if self._write_counts.get(key, 0) == write_count:
+                    return result, snapshot
+
+    # HistoryStorageInterface
+
+    def create_history(self, user_id: str, history_uid: str, metadata: dict) -> None:
+        self.storage.create_history(user_id, history_uid, metadata)
+
+    def append_message(self, user_id: str, history_uid: str, message: dict) -> None:
+        self.append_messages(user_id, history_uid, [message])
+
+    def append_messages(
+        self, user_id: str, history_uid: str, messages: List[dict], sync: bool = False
+    ) -> None:
+        if sync:
+            with self._io_lock:
+                self._flush_keys([(user_id, history_uid)])
+                self.storage.append_messages(user_id, history_uid, messages, sync=True)
+            return
+        with self._wake:
+            if self._closed:
+                raise RuntimeError("History storage is closed")
+            self._pending.setdefault((user_id, history_uid), []).extend(messages)
+            if self.durability == "fsync":
+                self._wake.notify()
+
+    def get_messages(self, user_id: str, history_uid: str) -> Optional[List[dict]]:
+        stored, snapshot = self._read(
+            (user_id, history_uid),
+            lambda: self.storage.get_messages(user_id, history_uid),
+        )
+        if stored is None and snapshot.writing is None:
+            return snapshot.pending or None
+        stored = stored or []
+        return snapshot.merge(len(stored), stored)
+
+    def count_messages(self, user_id: str, history_uid: str) -> Optional[int]:
+        stored, snapshot = self._read(
+            (user_id, history_uid),
+            lambda: self.storage.count_messages(user_id, history_uid),
+        )
+        if snapshot.writing is not None:
+            stored = snapshot.writing.base + len(snapshot.writing.messages)
+        elif stored is None:
+            return len(snapshot.pending) or None
+        return stored + len(snapshot.pending)
+
+    def get_message_range(
+        self, user_id: str, history_uid: str, start: int, end: int
+    ) -> List[dict]:
+        def read() -> Tuple[int, List[dict]]:
+            stored_count = self.storage.count_messages(user_id, history_uid) or 0
+            return stored_count, self.storage.get_message_range(
+                user_id, history_uid, start, min(end, stored_count)
+            )
+
+        (stored_count, messages), snapshot = self._read((user_id, history_uid), read)
+        # Queued messages come right after the stored ones
+        return snapshot.merge(stored_count, messages, start)[: max(end - start, 0)]
+
+    def _cache_metadata(self, key: _HistoryKey, metadata: dict) -> None:
+        # Caller holds _lock
+        self._metadata[key] = metadata
+        self._metadata.move_to_end(key)
+        if len(self._metadata) <= METADATA_CACHE_SIZE:
+            return
+        for old_key in list(self._metadata):
+            if len(self._metadata) <= METADATA_CACHE_SIZE:
+                break
+            if old_key != key and old_key not in self._dirty_metadata:
+                del self._metadata[old_key]
+
+    def get_metadata(self, user_id: str, history_uid: str) -> dict:
+        key = (user_id, history_uid)
+        with self._lock:
+            cached = self._metadata.get(key)
+            if cached is not None:
+                self._metadata.move_to_end(key)
+                return dict(cached)
+        metadata = self.storage.get_metadata(user_id, history_uid)
+        if metadata:
+            with self._lock:
+                # An update may have been cached meanwhile; it is newer
+                if key not in self._metadata:
+                    self._cache_metadata(key, dict(metadata))
+        return metadata
+
+    def update_metadata(self, user_id: str, history_uid: str, metadata: dict) -> bool:
+        key = (user_id, history_uid)
+        loaded = self.get_metadata(user_id, history_uid)
+        if not loaded and self.count_messages(user_id, history_uid) is None:
+            # No such history
+            return False
+
+        with self._wake:
+            # Without stored metadata, the backend creates it when it's written
+            current = self._metadata.get(key, loaded)
+            updated = {**current, **metadata}
+            if updated == current:
+                return True
+            self._cache_metadata(key, updated)
+            self._dirty_metadata.add(key)
+            if self.durability == "fsync":
+                self._wake.notify()
+        return True
+
+    def modify_latest_message(
+        self,
+        user_id: str,
+        history_uid: str,
+        role: Literal["human", "ai", "system"],
+        new_content: str,
+    ) -> bool:
+        key = (user_id, history_uid)
+        while True:
+            with self._lock:
+                pending = self._pending.get(key)
+                if pending:
+                    # The latest message hasn't been written yet; edit it in memory
+                    if pending[-1]["role"] != role:
+                        logger.warning(
+                            f"Latest message role ({pending[-1]['role']}) doesn't match requested role ({role})"
+                        )
+                        return False
+                    pending[-1] = {**pending[-1], "content": new_content}
+                    return True
+
+            # The latest message is stored or being written; queue the edit
+            count = self.count_messages(user_id, history_uid)
+            if not count:
+                logger.warning(f"No messages to modify in history {history_uid}")
+                return False
+            (latest,) = self.get_message_range(user_id, history_uid, count - 1, count)
+            if latest["role"] != role:
+                logger.warning(
+                    f"Latest message role ({latest['role']}) doesn't match requested role ({role})"
+                )
+                return False
+            with self._wake:
+                if self._pending.get(key):
+                    # A message was appended meanwhile, it's the latest now
+                    continue
+                self._edits[key] = (role, new_content)
+                if self.durability == "fsync":
+                    self._wake.notify()
+            return True
+
+    def _pause(self, keys: List[_HistoryKey]) -> None:
+        """Keep the writer off some histories and wait for their writes in progress"""
+        with self._lock:
+            self._paused.update(keys)
+            while any(
+                key in self._writing or key in self._writing_metadata for key in keys
+            ):
+                self._written.wait()
+
+    def _resume(self, keys: List[_HistoryKey]) -> None:
+        with self._wake:
+            self._paused.difference_update(keys)
+            if self.durability == "fsync":
+                self._wake.notify()
+
+    def delete_history(self, user_id: str, history_uid: str) -> bool:
+        key = (user_id, history_uid)
+        # Doesn't wait for the writer, only for a write of this history
+        self._pause([key])
+        try:
+            with self._lock:
+                dropped = self._pending.pop(key, None)
+                self._edits.pop(key, None)
+                self._forget_metadata([key])
+            return self.storage.delete_history(user_id, history_uid) or bool(dropped)
+        finally:
+            self._resume([key])
+
+    def _forget_metadata(self, keys: Iterable[_HistoryKey]) -> None:
+        # Caller holds _lock
+        for key in keys:
+            self._metadata.pop(key, None)
+            self._dirty_metadata.discard(key)
+
+    def rename_history(
+        self, user_id: str, old_history_uid: str, new_history_uid: str
+    ) -> bool:
+        old, new = (user_id, old_history_uid), (user_id, new_history_uid)
+        # The queue moves along with the history, it isn't written first
+        self._pause([old, new])
+        try:
+            if not self.storage.rename_history(
+                user_id, old_history_uid, new_history_uid
+            ):
+                return False
+            with self._lock:
+                if old in self._pending:
+                    self._pending[new] = self._pending.pop(old)
+                if old in self._edits:
+                    self._edits[new] = self._edits.pop(old)
+                metadata = self._metadata.get(old)
+                dirty = old in self._dirty_metadata
+                self._forget_metadata([old, new])
+                if metadata is not None:
+                    self._cache_metadata(new, metadata)
+                    if dirty:
+                        self._dirty_metadata.add(new)
+            return True
+        finally:
+            self._resume([old, new])
+
+    def list_histories(self, user_id: str) -> List[dict]:
+        # Taken before reading the backend: messages written meanwhile are
+        # both in the backend and here
+        with self._lock:
+            latest_pending: Dict[str, dict] = {
+                history_uid: dict(write.messages[-1])
+                for (uid, history_uid), write in self._writing.items()
+                if uid == user_id and write.messages
+            }
+            latest_pending.update(
+                (history_uid, dict(messages[-1]))
+                for (uid, history_uid), messages in self._pending.items()
+                if uid == user_id and messages
+            )
+        histories = self.storage.list_histories(user_id)
+        if not latest_pending:
+            return histories
+
+        by_uid = {history["uid"]: history for history in histories}
+        for history_uid, message in latest_pending.items():
+            by_uid[history_uid] = {
+                "uid": history_uid,
+                "latest_message": message,
+                "timestamp": message.get("timestamp"),
+            }
+        return sorted(
+            by_uid.values(),
+            key=lambda x: x["timestamp"] if x["timestamp"] else "",
+            reverse=True,
+        )
+
+    def delete_empty_histories(self, user_id: str) -> List[str]:
+        with self._io_lock:
+            # Histories with queued messages are not empty
+            with self._lock:
+                keys = [key for key in self._pending if key[0] == user_id]
+            self._flush_keys(keys)
+            removed = self.storage.delete_empty_histories(user_id)
+            with self._lock:
+                self._forget_metadata((user_id, history_uid) for history_uid in removed)
+            return removed
+
+    def search_messages(self, user_id: str, query: str, limit: int) -> List[dict]:
+        # Queued messages and edits are indexed when they are written; until
+        # then they are matched here, without waiting for the writer
+        with self._lock:
+            queued = {
+                key[1]: len(self._pending.get(key, []))
+                + len(self._writing[key].messages if key in self._writing else [])
+                + (1 if key in self._edits or key in self._writing else 0)
+                for key in [*self._pending, *self._edits, *self._writing]
+                if key[0] == user_id
+            }
+        results = self.storage.search_messages(user_id, query, limit)
+        if not queued:
+            return results
+
+        words = [word for word in query.lower().split() if word]
+        # Substring matches can't be scored like the index does; they are the
+        # newest messages, so they rank with the best stored match
+        score = max((item["score"] for item in results), default=0.0)
+        matches = []
+        tails = {}
+        for history_uid, count in queued.items():
+            total = self.count_messages(user_id, history_uid) or 0
+            start = max(total - count, 0)
+            tails[history_uid] = start
+            for offset, message in enumerate(
+                self.get_message_range(user_id, history_uid, start, total)
+            ):
+                content = message.get("content")
+                if not isinstance(content, str) or not words:
+                    continue
+                if all(word in content.lower() for word in words):
+                    matches.append(
+                        {
+                            "history_uid": history_uid,
+                            "message_index": start + offset,
+                            "cursor": start + offset + 1,
+                            "role": message.get("role"),
+                            "timestamp": message.get("timestamp"),
+                            "name": message.get("name"),
+                            "snippet": make_snippet(content, query),
+                            "score": score,
+                        }
+                    )
+        # Stored results of queued (or edited) messages are replaced by the above
+        results = [
+            item
+            for item in results
+            if item["message_index"] < tails.get(item["history_uid"], float("inf"))
+        ]
+        return (matches[::-1] + results)[:limit]
+
+    def list_history_ids(self) -> List[tuple]:
+        self.flush()
+        return self.storage.list_history_ids()
+
+    def close(self) -> None:
+        """Flush the queue, stop the writer thread and close the backend"""
+        with self._wake:
+            if self._closed:
+                return
+            self._closed = True
+            self._wake.notify()
+        self._thread.join()
+        self.storage.close()
@@ -1,5 +1,7 @@
+import re
 import json
 import chardet
+from typing import List, Optional, Tuple
 from loguru import logger
 
 # This class will only prepare the payload for the live2d model
@@ -17,6 +19,7 @@ class Live2dModel:
         model_info (dict): The information of the Live2D model.
         emo_map (dict): The emotion map of the Live2D model.
         emo_str (str): The string representation of the emotion map of the Live2D model.
+        emo_pattern (re.Pattern | None): One regex matching every `[key]` tag of the emotion map, None if the map is empty.
     """
 
     model_dict_path: str
@@ -24,6 +27,7 @@ class Live2dModel:
     model_info: dict
     emo_map: dict
     emo_str: str
+    emo_pattern: Optional[re.Pattern]
 
     def __init__(
         self, live2d_model_name: str, model_dict_path: str = "model_dict.json"
@@ -34,7 +38,7 @@ class Live2dModel:
 
     def set_model(self, model_name: str) -> None:
         """
-        Set the model with its name and load the model information. This method will initialize the `self.model_info`, `self.emo_map`, and `self.emo_str` attributes.
+        Set the model with its name and load the model information. This method will initialize the `self.model_info`, `self.emo_map`, `self.emo_str` and `self.emo_pattern` attributes.
         This method is called in the constructor.
 
         Parameters:
@@ -51,6 +55,23 @@ class Live2dModel:
         self.emo_str: str = " ".join([f"[{key}]," for key in self.emo_map.keys()])
         # emo_str is a string of the keys in the emoMap dictionary. The keys are enclosed in square brackets.
         # example: `"[fear], [anger], [disgust], [sadness], [joy], [neutral], [surprise]"`
+        self.emo_pattern: Optional[re.Pattern] = self._compile_emotion_pattern(
+            self.emo_map.keys()
+        )
+
+    @staticmethod
+    def _compile_emotion_pattern(keys) -> Optional[re.Pattern]:
+        """
+        Compile the emotion keys into one alternation matching `[key1]`, `[key2]`...,
+        so a sentence is scanned once no matter how many expressions the model has.
+        """
+        keys = list(keys)
+        if not keys:
+            return None
+        return re.compile(
+            r"\[(" + "|".join(re.escape(key) for key in keys) + r")\]",
+            re.IGNORECASE,
+        )
 
     def _load_file_content(self, file_path: str) -> str:
         """Load the content of a file with robust encoding handling."""
@@ -143,6 +164,32 @@ class Live2dModel:
 
         return matched_model
 
+    def extract_and_remove_emotions(self, text: str) -> Tuple[List[int], str]:
+        """
+        Find the emotion keywords in a string and remove them, in one pass.
+
+        Parameters:
+            text (str): The string to check for emotions.
+
+        Returns:
+            Tuple[List[int], str]: The values (the expression index) of the emotions found, in order,
+            and the string with the emotion keywords removed.
+        """
+        if self.emo_pattern is None or "[" not in text:
+            return [], text
+
+        expression_list = []
+        parts = []
+        last_end = 0
+        for match in self.emo_pattern.finditer(text):
+            expression_list.append(self.emo_map[match.group(1).lower()])
+            parts.append(text[last_end : match.start()])
+            last_end = match.end()
+        if not expression_list:
+            return [], text
+        parts.append(text[last_end:])
+        return expression_list, "".join(parts)
+
     def extract_emotion(self, str_to_check: str) -> list:
         """
         Check the input string for any emotion keywords and return a list of values (the expression index) of the emotions found in the string.
@@ -153,45 +200,24 @@ class Live2dModel:
         Returns:
             list: A list of values of the emotions found in the string. An empty list is returned if no emotions are found.
         """
-
-        expression_list = []
-        str_to_check = str_to_check.lower()
-
-        i = 0
-        while i < len(str_to_check):
-            if str_to_check[i] != "[":
-                i += 1
-                continue
-            for key in self.emo_map.keys():
-                emo_tag = f"[{key}]"
-                if str_to_check[i : i + len(emo_tag)] == emo_tag:
-                    expression_list.append(self.emo_map[key])
-                    i += len(emo_tag) - 1
-                    break
-            i += 1
-        return expression_list
+        if self.emo_pattern is None or "[" not in str_to_check:
+            return []
+        return [
+            self.emo_map[match.group(1).lower()]
+            for match in self.emo_pattern.finditer(str_to_check)
+        ]
 
     def remove_emotion_keywords(self, target_str: str) -> str:
         """
         Remove the emotion keywords from the input string and return the cleaned string.
 
         Parameters:
-            str_to_check (str): The string to check for emotions.
+            target_str (str): The string to remove the emotions from.
 
         Returns:
             str: The cleaned string with the emotion keywords removed.
         """
-
-        lower_str = target_str.lower()
-
-        for key in self.emo_map.keys():
-            lower_key = f"[{key}]".lower()
-            while lower_key in lower_str:
-                start_index = lower_str.find(lower_key)
-                end_index = start_index + len(lower_key)
-                target_str = target_str[:start_index] + target_str[end_index:]
-                lower_str = lower_str[:start_index] + lower_str[end_index:]
-        return target_str
+        return self.extract_and_remove_emotions(target_str)[1]
 
     @staticmethod
     def get_all_models(model_dict_path: str = "model_dict.json") -> list:
@@ -1,5 +1,6 @@
 import os
 import shutil
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 from starlette.middleware.cors import CORSMiddleware
@@ -9,6 +10,9 @@ from starlette.responses import Response
 from .routes import init_client_ws_route, init_webtool_routes
 from .service_context import ServiceContext
 from .config_manager.utils import Config
+from .utils.http_client import http_clients
+from .chat_history_manager import configure_history_storage, close_history_storage
+from .engine_registry import engine_registry
 
 
 class CustomStaticFiles(StaticFiles):
@@ -27,9 +31,19 @@ class AvatarStaticFiles(StaticFiles):
         return await super().get_response(path, scope)
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warm up provider connections at startup; close them, the history storage and the engine registry at shutdown."""
+    await http_clients.warm_up()
+    yield
+    await http_clients.aclose()
+    close_history_storage()
+    engine_registry.close()
+
+
 class WebSocketServer:
     def __init__(self, config: Config):
-        self.app = FastAPI()
+        self.app = FastAPI(lifespan=lifespan)
 
         # Add CORS
         self.app.add_middleware(
@@ -40,6 +54,11 @@ class WebSocketServer:
             allow_headers=["*"],
         )
 
+        # Configure the shared HTTP client before engines start using it
+        http_clients.configure(config.system_config.http_client)
+        configure_history_storage(config.system_config.chat_history)
+        engine_registry.configure(config.system_config.engine_registry)
+
         # Load configurations and initialize the default context cache
         default_context_cache = ServiceContext()
         default_context_cache.load_from_config(config)
@@ -1,5 +1,9 @@
 import os
 import json
+import time
+import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Collection, Dict, Tuple
 
 from loguru import logger
 from fastapi import WebSocket
@@ -17,6 +21,7 @@ from .tts.tts_factory import TTSFactory
 from .vad.vad_factory import VADFactory
 from .agent.agent_factory import AgentFactory
 from .translate.translate_factory import TranslateFactory
+from .engine_registry import engine_registry
 
 from .config_manager import (
     Config,
@@ -54,6 +59,9 @@ class ServiceContext:
 
         self.history_uid: str = ""  # Add history_uid field
 
+        # 从 engine_registry 获取的引擎，按类型记录，断开或切换时释放
+        self._shared_engines: Dict[str, Any] = {}
+
     def __str__(self):
         return (
             f"ServiceContext:\n"
@@ -124,38 +132,127 @@ class ServiceContext:
             self.character_config = config.character_config
 
         # update all sub-configs
+        # 各引擎在线程中并行初始化，只有 agent 需要等待它依赖的步骤
+        character_config = config.character_config
+        # Engines with worker processes fork them while they are built; a fork
+        # while another thread is loading a model can deadlock the child
+        forking = [
+            name
+            for name, engine_config in (
+                ("asr", character_config.asr_config),
+                ("tts", character_config.tts_config),
+            )
+            if getattr(engine_config, "worker_processes", 0) > 0
+        ]
+        self._run_init_steps(
+            {
+                # init live2d from character config
+                "live2d": (
+                    lambda: self.init_live2d(character_config.live2d_model_name),
+                    (),
+                ),
+                "asr": (lambda: self.init_asr(character_config.asr_config), ()),
+                "tts": (lambda: self.init_tts(character_config.tts_config), ()),
+                "vad": (lambda: self.init_vad(character_config.vad_config), ()),
+                "translate": (
+                    lambda: self.init_translate(
+                        character_config.tts_preprocessor_config.translator_config
+                    ),
+                    (),
+                ),
+                # The system prompt lists the Live2D expressions, and the agent
+                # is built with the translator settings of the preprocessor
+                "agent": (
+                    lambda: self.init_agent(
+                        character_config.agent_config,
+                        character_config.persona_prompt,
+                    ),
+                    ("live2d", "translate"),
+                ),
+            },
+            exclusive=forking,
+        )
 
-        # init live2d from character config
-        self.init_live2d(config.character_config.live2d_model_name)
+        # store typed config references
+        self.config = config
+        self.system_config = config.system_config or self.system_config
+        self.character_config = config.character_config
 
-        # init asr from character config
-        self.init_asr(config.character_config.asr_config)
+    def _run_init_steps(
+        self,
+        steps: Dict[str, Tuple[Callable[[], None], Tuple[str, ...]]],
+        exclusive: Collection[str] = (),
+    ) -> Dict[str, float]:
+        """
+        Run init steps concurrently, each after the steps it depends on, and
+        log how long each one took.
 
-        # init tts from character config
-        self.init_tts(config.character_config.tts_config)
+        Args:
+            steps: name -> (init function, names of the steps it needs first).
+                A step is listed after the steps it depends on.
+            exclusive: Steps run one at a time once all the others have
+                finished, e.g. because they fork worker processes. No other
+                step may depend on them.
 
-        # init vad from character config
-        self.init_vad(config.character_config.vad_config)
+        Returns:
+            Dict[str, float]: Seconds each step took
 
-        # init agent from character config
-        self.init_agent(
-            config.character_config.agent_config,
-            config.character_config.persona_prompt,
+        Raises:
+            The error of the first failing step, once every step has finished
+        """
+        futures = {}
+        started: Dict[str, float] = {}
+        timings: Dict[str, float] = {}
+        start = time.perf_counter()
+
+        def run(name: str, init: Callable[[], None], deps: Tuple[str, ...]) -> None:
+            for dep in deps:
+                # Raises if the dependency failed
+                futures[dep].result()
+            started[name] = time.perf_counter() - start
+            init()
+            timings[name] = time.perf_counter() - start - started[name]
+
+        # One thread per step, so waiting on a dependency never starves another step
+        with ThreadPoolExecutor(
+            max_workers=max(len(steps) - len(exclusive), 1),
+            thread_name_prefix="engine-init",
+        ) as pool:
+            for name, (init, deps) in steps.items():
+                if name not in exclusive:
+                    futures[name] = pool.submit(run, name, init, deps)
+        for name, (init, deps) in steps.items():
+            if name in exclusive:
+                futures[name] = Future()
+                try:
+                    run(name, init, deps)
+                    futures[name].set_result(None)
+                except Exception as e:
+                    futures[name].set_exception(e)
+        wall = time.perf_counter() - start
+
+        report = "\n".join(
+            f"  {name:<10} start +{started[name]:.2f}s  took {timings[name]:.2f}s"
+            for name in sorted(timings, key=started.get)
         )
-
-        self.init_translate(
-            config.character_config.tts_preprocessor_config.translator_config
+        logger.info(
+            f"Engines initialized in {wall:.2f}s "
+            f"(sequential would take {sum(timings.values()):.2f}s):\n{report}"
         )
 
-        # store typed config references
-        self.config = config
-        self.system_config = config.system_config or self.system_config
-        self.character_config = config.character_config
+        for name, future in futures.items():
+            error = future.exception()
+            if error is not None:
+                logger.error(f"Failed to initialize {name}: {error}")
+                raise error
+        return timings
 
     def init_live2d(self, live2d_model_name: str) -> None:
         logger.info(f"Initializing Live2D: {live2d_model_name}")
         try:
-            self.live2d_model = Live2dModel(live2d_model_name)
+            self.live2d_model = self._acquire_engine(
+                "live2d", live2d_model_name, lambda: Live2dModel(live2d_model_name)
+            )
             self.character_config.live2d_model_name = live2d_model_name
         except Exception as e:
             logger.critical(f"Error initializing Live2D: {e}")
@@ -164,33 +261,95 @@ class ServiceContext:
     def init_asr(self, asr_config: ASRConfig) -> None:
         if not self.asr_engine or (self.character_config.asr_config != asr_config):
             logger.info(f"Initializing ASR: {asr_config.asr_model}")
-            self.asr_engine = ASRFactory.get_asr_system(
-                asr_config.asr_model,
-                **getattr(asr_config, asr_config.asr_model).model_dump(),
+            settings = getattr(asr_config, asr_config.asr_model).model_dump()
+            self.asr_engine = self._acquire_engine(
+                "asr",
+                {
+                    "model": asr_config.asr_model,
+                    "settings": settings,
+                    "worker_processes": asr_config.worker_processes,
+                },
+                lambda: self._build_asr_engine(asr_config),
             )
             # saving config should be done after successful initialization
             self.character_config.asr_config = asr_config
         else:
             logger.info("ASR already initialized with the same config.")
 
+    @staticmethod
+    def _build_asr_engine(asr_config: ASRConfig) -> ASRInterface:
+        asr_engine = ASRFactory.get_asr_system(
+            asr_config.asr_model,
+            **getattr(asr_config, asr_config.asr_model).model_dump(),
+        )
+        if asr_config.worker_processes > 0:
+            from .utils.forked_worker import fork_available
+
+            if not fork_available():
+                logger.warning(
+                    "ASR worker processes need fork, which this platform doesn't "
+                    "support. Transcribing in the server process."
+                )
+                return asr_engine
+            from .asr.forked_asr import ForkedASREngine
+
+            return ForkedASREngine(
+                asr_engine, asr_config.worker_processes, name=asr_config.asr_model
+            )
+        return asr_engine
+
     def init_tts(self, tts_config: TTSConfig) -> None:
         if not self.tts_engine or (self.character_config.tts_config != tts_config):
             logger.info(f"Initializing TTS: {tts_config.tts_model}")
-            self.tts_engine = TTSFactory.get_tts_engine(
-                tts_config.tts_model,
-                **getattr(tts_config, tts_config.tts_model.lower()).model_dump(),
+            self.tts_engine = self._acquire_engine(
+                "tts",
+                self._tts_engine_key(tts_config),
+                lambda: self._build_tts_engine(tts_config),
             )
             # saving config should be done after successful initialization
             self.character_config.tts_config = tts_config
         else:
             logger.info("TTS already initialized with the same config.")
 
+    @staticmethod
+    def _tts_engine_key(tts_config: TTSConfig) -> dict:
+        """The parts of the TTS config the engine is built from"""
+        return tts_config.model_dump(
+            include={
+                "tts_model",
+                tts_config.tts_model.lower(),
+                "replicas",
+                "max_concurrency",
+                "max_queue_size",
+                "max_batch_size",
+                "worker_processes",
+            }
+        )
+
+    @classmethod
+    def is_tts_engine_loaded(cls, tts_config: TTSConfig) -> bool:
+        return engine_registry.contains("tts", cls._tts_engine_key(tts_config))
+
+    @staticmethod
+    def _build_tts_engine(tts_config: TTSConfig) -> TTSInterface:
+        return TTSFactory.get_tts_engine_pool(
+            tts_config.tts_model,
+            replicas=tts_config.replicas,
+            max_concurrency=tts_config.max_concurrency,
+            max_queue_size=tts_config.max_queue_size,
+            max_batch_size=tts_config.max_batch_size,
+            worker_processes=tts_config.worker_processes,
+            **getattr(tts_config, tts_config.tts_model.lower()).model_dump(),
+        )
+
     def init_vad(self, vad_config: VADConfig) -> None:
         if not self.vad_engine or (self.character_config.vad_config != vad_config):
             logger.info(f"Initializing VAD: {vad_config.vad_model}")
-            self.vad_engine = VADFactory.get_vad_engine(
-                vad_config.vad_model,
-                **getattr(vad_config, vad_config.vad_model.lower()).model_dump(),
+            settings = getattr(vad_config, vad_config.vad_model.lower()).model_dump()
+            self.vad_engine = self._acquire_engine(
+                "vad",
+                {"model": vad_config.vad_model, "settings": settings},
+                lambda: VADFactory.get_vad_engine(vad_config.vad_model, **settings),
             )
             # saving config should be done after successful initialization
             self.character_config.vad_config = vad_config
@@ -214,8 +373,8 @@ class ServiceContext:
         # Pass avatar to agent factory
         avatar = self.character_config.avatar or ""  # Get avatar from config
 
-        try:
-            self.agent_engine = AgentFactory.create_agent(
+        def create_agent() -> AgentInterface:
+            return AgentFactory.create_agent(
                 conversation_agent_choice=agent_config.conversation_agent_choice,
                 agent_settings=agent_config.agent_settings.model_dump(),
                 llm_configs=agent_config.llm_configs.model_dump(),
@@ -225,6 +384,31 @@ class ServiceContext:
                 character_avatar=avatar,  # Add avatar parameter
             )
 
+        try:
+            agent_class = AgentFactory.get_agent_class(
+                agent_config.conversation_agent_choice
+            )
+            if agent_class.has_sessions():
+                agent = self._acquire_engine(
+                    "agent",
+                    {
+                        "agent_config": agent_config.model_dump(),
+                        "system_prompt": system_prompt,
+                        # The agent keeps the Live2D model to extract expressions
+                        "live2d_model": self.character_config.live2d_model_name,
+                        "tts_preprocessor_config": self.character_config.tts_preprocessor_config.model_dump(),
+                        "avatar": avatar,
+                    },
+                    create_agent,
+                )
+                # The context keeps its own session; other clients get sessions
+                # of the same agent in `WebSocketHandler._init_service_context`
+                self.agent_engine = agent.create_session()
+            else:
+                # 没有会话的 agent 自己保存记忆和连接，不能在客户端之间共享
+                self.agent_engine = create_agent()
+                engine_registry.release(self._shared_engines.pop("agent", None))
+
             logger.debug(f"Agent choice: {agent_config.conversation_agent_choice}")
             logger.debug(f"System prompt: {system_prompt}")
 
@@ -251,11 +435,18 @@ class ServiceContext:
             logger.info(
                 f"Initializing Translator: {translator_config.translate_provider}"
             )
-            self.translate_engine = TranslateFactory.get_translator(
-                translator_config.translate_provider,
-                getattr(
-                    translator_config, translator_config.translate_provider
-                ).model_dump(),
+            settings = getattr(
+                translator_config, translator_config.translate_provider
+            ).model_dump()
+            self.translate_engine = self._acquire_engine(
+                "translate",
+                {
+                    "provider": translator_config.translate_provider,
+                    "settings": settings,
+                },
+                lambda: TranslateFactory.get_translator(
+                    translator_config.translate_provider, settings
+                ),
             )
             self.character_config.tts_preprocessor_config.translator_config = (
                 translator_config
@@ -263,29 +454,80 @@ class ServiceContext:
         else:
             logger.info("Translation already initialized with the same config.")
 
+    async def build_tts_engine(self, tts_config: TTSConfig) -> TTSInterface:
+        """
+        在后台线程中创建TTS引擎，模型加载时不阻塞事件循环。
+        The engine comes from `engine_registry`; pass it to `swap_tts_engine`,
+        or give it back with `engine_registry.release`.
+        """
+        logger.info(f"Building TTS engine: {tts_config.tts_model}")
+        build = asyncio.ensure_future(
+            asyncio.to_thread(
+                engine_registry.acquire,
+                "tts",
+                self._tts_engine_key(tts_config),
+                lambda: self._build_tts_engine(tts_config),
+            )
+        )
+        try:
+            return await asyncio.shield(build)
+        except asyncio.CancelledError:
+            # The thread keeps running; release what it acquires
+            build.add_done_callback(
+                lambda f: (
+                    None
+                    if f.cancelled() or f.exception()
+                    else engine_registry.release(f.result())
+                )
+            )
+            raise
+
+    def swap_tts_engine(self, tts_engine: TTSInterface, tts_config: TTSConfig) -> None:
+        """
+        Switch to a ready TTS engine built by `build_tts_engine`. Engine and
+        config change together, with no await in between; turns already
+        running keep the old engine.
+        """
+        engine_registry.release(self._shared_engines.get("tts"))
+        self._shared_engines["tts"] = tts_engine
+        self.tts_engine = tts_engine
+        self.character_config.tts_config = tts_config
+        logger.info(f"Switched TTS engine to: {tts_config.tts_model}")
+
     async def reinit_tts(self, tts_config: TTSConfig) -> None:
         """强制重新初始化TTS引擎"""
         try:
             logger.info(f"Reinitializing TTS: {tts_config.tts_model}")
-            
-            # # 清理旧的TTS引擎
-            # if hasattr(self.tts_engine, 'cleanup'):
-            #     await self.tts_engine.cleanup()
-            
-            # 创建新的TTS引擎
-            self.tts_engine = TTSFactory.get_tts_engine(
-                tts_config.tts_model,
-                **getattr(tts_config, tts_config.tts_model.lower()).model_dump(),
-            )
-            
-            # 保存新的配置
-            self.character_config.tts_config = tts_config
-            logger.info(f"Successfully reinitialized TTS engine: {tts_config.tts_model}")
-            
+            # 旧引擎在新引擎就绪前继续使用
+            tts_engine = await self.build_tts_engine(tts_config)
+            self.swap_tts_engine(tts_engine, tts_config)
         except Exception as e:
             logger.error(f"Failed to reinitialize TTS engine: {e}")
             raise
 
+    # ==== Shared engines
+
+    def _acquire_engine(
+        self, kind: str, config: Any, factory: Callable[[], Any]
+    ) -> Any:
+        """Get an engine from the registry and release the one of the same kind held before"""
+        engine = engine_registry.acquire(kind, config, factory)
+        engine_registry.release(self._shared_engines.get(kind))
+        self._shared_engines[kind] = engine
+        return engine
+
+    def share_engines(self, context: "ServiceContext") -> None:
+        """Hold references to the engines of another context, used with `load_cache`"""
+        for kind, engine in context._shared_engines.items():
+            if engine_registry.retain(engine):
+                self._shared_engines[kind] = engine
+
+    def release_engines(self) -> None:
+        """Give back every engine taken from the registry, when the client disconnects"""
+        for engine in self._shared_engines.values():
+            engine_registry.release(engine)
+        self._shared_engines.clear()
+
     # ==== utils
 
     def construct_system_prompt(self, persona_prompt: str) -> str:
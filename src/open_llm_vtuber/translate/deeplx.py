@@ -1,7 +1,7 @@
 import json
-import httpx
 from loguru import logger
 from .translate_interface import TranslateInterface
+from ..utils.http_client import http_clients
 
 
 class DeepLXTranslate(TranslateInterface):
@@ -11,13 +11,16 @@ class DeepLXTranslate(TranslateInterface):
     def __init__(self, api_endpoint: str, target_lang: str):
         self.api_endpoint = api_endpoint
         self.target_lang = target_lang
+        http_clients.register_warm_up(self.api_endpoint, blocking=True)
 
     # translate v2 endpoint from DeepLX
     def translate(self, text: str) -> str:
         try:
             data = {"text": [text], "target_lang": self.target_lang}
             post_data = json.dumps(data)
-            req = httpx.post(url=self.api_endpoint, data=post_data).text
+            req = http_clients.sync_client.post(
+                url=self.api_endpoint, data=post_data
+            ).text
             res = json.loads(req)["translations"]
             res = " ".join([d["text"] for d in res])
         except Exception as e:
@@ -4,10 +4,10 @@ import json
 import time
 from datetime import datetime
 
-import httpx
 from loguru import logger
 
 from .translate_interface import TranslateInterface
+from ..utils.http_client import http_clients
 
 
 def sign(key, msg):
@@ -36,6 +36,7 @@ class TencentTranslate(TranslateInterface):
         self.algorithm = "TC3-HMAC-SHA256"
         self.source_lang = source_lang
         self.target_lang = target_lang
+        http_clients.register_warm_up("https://" + self.host, blocking=True)
 
     def create_signature(self, date, service):
         """Create signature"""
@@ -110,7 +111,7 @@ class TencentTranslate(TranslateInterface):
         headers = self._prepare_headers(payload, timestamp, date)
 
         try:
-            response = httpx.post(
+            response = http_clients.sync_client.post(
                 url="https://" + self.host, headers=headers, data=payload
             )
             res = response.json()
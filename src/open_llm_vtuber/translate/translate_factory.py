@@ -1,5 +1,3 @@
-from .deeplx import DeepLXTranslate
-from .tencent import TencentTranslate
 from .translate_interface import TranslateInterface
 
 
@@ -10,11 +8,15 @@ class TranslateFactory:
     ) -> TranslateInterface:
         translate_provider = translate_provider.lower()
         if translate_provider == "deeplx":
+            from .deeplx import DeepLXTranslate
+
             return DeepLXTranslate(
                 api_endpoint=translate_provider_config.get("deeplx_api_endpoint"),
                 target_lang=translate_provider_config.get("deeplx_target_lang"),
             )
         elif translate_provider == "tencent":
+            from .tencent import TencentTranslate
+
             return TencentTranslate(
                 secret_id=translate_provider_config.get("secret_id"),
                 secret_key=translate_provider_config.get("secret_key"),
@@ -0,0 +1,41 @@
+from typing import List, Optional
+
+from .tts_interface import TTSInterface
+from ..utils.forked_worker import ForkedWorker
+
+
+class ForkedTTSEngine(TTSInterface):
+    """
+    A TTS engine loaded in this process, synthesizing in a forked worker process.
+    Several of them over one engine serve as the replicas of a `TTSEnginePool`
+    that share one copy of the model weights.
+    """
+
+    def __init__(self, engine: TTSInterface, name: str = "tts"):
+        self.engine = engine
+        self.supports_batch = engine.supports_batch
+        self._worker = ForkedWorker(engine, name=name)
+
+    def generate_audio(self, text: str, file_name_no_ext=None) -> str:
+        return self._worker.call("generate_audio", text, file_name_no_ext)
+
+    async def async_generate_audio(self, text: str, file_name_no_ext=None) -> str:
+        return await self._worker.acall("generate_audio", text, file_name_no_ext)
+
+    def generate_audio_batch(
+        self, texts: List[str], file_names_no_ext: Optional[List[str]] = None
+    ) -> List[str]:
+        return self._worker.call("generate_audio_batch", texts, file_names_no_ext)
+
+    async def async_generate_audio_batch(
+        self, texts: List[str], file_names_no_ext: Optional[List[str]] = None
+    ) -> List[str]:
+        return await self._worker.acall(
+            "generate_audio_batch", texts, file_names_no_ext
+        )
+
+    def remove_file(self, filepath: str, verbose: bool = True) -> None:
+        self.engine.remove_file(filepath, verbose)
+
+    def close(self) -> None:
+        self._worker.close()
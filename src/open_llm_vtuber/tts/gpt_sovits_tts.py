@@ -3,9 +3,9 @@
 ####
 
 import re
-import requests
 from loguru import logger
 from .tts_interface import TTSInterface
+from ..utils.http_client import http_clients
 
 
 class TTSEngine(TTSInterface):
@@ -30,6 +30,7 @@ class TTSEngine(TTSInterface):
         self.batch_size = batch_size
         self.media_type = media_type
         self.streaming_mode = streaming_mode
+        http_clients.register_warm_up(self.api_url, blocking=True)
 
     def generate_audio(self, text, file_name_no_ext=None):
         file_name = self.generate_cache_file_name(file_name_no_ext, self.media_type)
@@ -48,7 +49,7 @@ class TTSEngine(TTSInterface):
         }
 
         # Send POST request to the TTS API
-        response = requests.get(self.api_url, params=data, timeout=120)
+        response = http_clients.sync_client.get(self.api_url, params=data, timeout=120)
 
         # Check if the request was successful
         if response.status_code == 200:
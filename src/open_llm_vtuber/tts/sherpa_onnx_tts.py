@@ -2,15 +2,20 @@ import sys
 import os
 
 import sherpa_onnx
+import numpy as np
 import soundfile as sf
 from loguru import logger
 from .tts_interface import TTSInterface
+from ..utils.stream_audio import split_samples_at_pauses
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(current_dir)
 
 
 class TTSEngine(TTSInterface):
+    # OfflineTts runs up to max_num_sentences sentences in one forward pass
+    supports_batch = True
+
     def __init__(
         self,
         vits_model,
@@ -110,3 +115,48 @@ class TTSEngine(TTSInterface):
         except Exception as e:
             logger.critical(f"\nError: sherpa-onnx unable to generate audio: {e}")
             return None
+
+    def generate_audio_batch(self, texts, file_names_no_ext=None):
+        """
+        Generate one audio file per text with a single sherpa-onnx call.
+
+        The texts are joined so that OfflineTts synthesizes up to
+        `max_num_sentences` of them in each batched forward pass, then the
+        audio is cut back at the pauses between the texts.
+
+        Parameters:
+            texts (List[str]): The texts to speak.
+            file_names_no_ext (List[str], optional): Name of each file without extension.
+
+        Returns:
+            List[str]: The path to the audio file of each text.
+        """
+        if file_names_no_ext is None:
+            file_names_no_ext = [None] * len(texts)
+        if len(texts) == 1:
+            return [self.generate_audio(texts[0], file_names_no_ext[0])]
+
+        audio = self.tts.generate(" ".join(texts), sid=self.sid, speed=self.speed)
+        if len(audio.samples) == 0:
+            raise RuntimeError(
+                "sherpa-onnx unable to generate audio. Please read previous error messages."
+            )
+        pieces = split_samples_at_pauses(
+            np.asarray(audio.samples, dtype=np.float32),
+            audio.sample_rate,
+            weights=[len(text) for text in texts],
+        )
+
+        file_names = []
+        for i, (samples, file_name_no_ext) in enumerate(zip(pieces, file_names_no_ext)):
+            file_name = self.generate_cache_file_name(
+                file_name_no_ext or f"temp_{i}", self.file_extension
+            )
+            sf.write(
+                file_name,
+                samples,
+                samplerate=audio.sample_rate,
+                subtype="PCM_16",
+            )
+            file_names.append(file_name)
+        return file_names
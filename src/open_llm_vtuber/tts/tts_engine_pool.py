@@ -0,0 +1,438 @@
+"""
+A pool of TTS engine replicas behind the `TTSInterface`.
+
+Every synthesis call leases a slot on one replica. A replica accepts at most
+`max_concurrency` calls at a time, so engines that aren't safe to call
+concurrently (sherpa-onnx, Coqui, Melo, Bark) run one sentence at a time and
+local models don't oversubscribe the CPU. Calls that can't get a slot wait in
+a bounded queue, served by priority: the lowest sequence number first, so the
+first sentence of every reply goes ahead of the rest of the backlog. Calls
+arriving while the queue is full fail at once.
+
+When the engine supports batched synthesis (`TTSInterface.supports_batch`)
+and calls are waiting, the call granted a slot takes the next waiting calls
+with it, up to `max_batch_size`, and synthesizes all of them in one batched
+call. The other calls get their audio without using a slot.
+"""
+
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+from loguru import logger
+
+from .tts_interface import TTSInterface
+
+
+# Calls allowed at the same time on one replica, when not configured.
+# Local models are not safe to call concurrently, or saturate the CPU anyway
+DEFAULT_MAX_CONCURRENCY = 4
+ENGINE_MAX_CONCURRENCY: Dict[str, int] = {
+    "bark_tts": 1,
+    "coqui_tts": 1,
+    "melo_tts": 1,
+    "sherpa_onnx_tts": 1,
+    "pyttsx3_tts": 1,
+}
+DEFAULT_MAX_QUEUE_SIZE = 256
+DEFAULT_MAX_BATCH_SIZE = 1
+# Waits longer than this are logged
+SLOW_WAIT_SECONDS = 2.0
+
+
+class TTSPoolFullError(RuntimeError):
+    """Raised when a synthesis call arrives while the pool queue is full."""
+
+
+@dataclass
+class _Replica:
+    engine: TTSInterface
+    in_flight: int = 0
+    completed: int = 0
+    failed: int = 0
+    busy_seconds: float = 0.0
+    batches: int = 0
+
+
+@dataclass(order=True)
+class _Waiter:
+    priority: int
+    order: int
+    # Set for async callers
+    future: Optional[asyncio.Future] = field(default=None, compare=False)
+    loop: Optional[asyncio.AbstractEventLoop] = field(default=None, compare=False)
+    # Set for sync callers
+    event: Optional[threading.Event] = field(default=None, compare=False)
+    text: str = field(default="", compare=False)
+    file_name_no_ext: Optional[str] = field(default=None, compare=False)
+    # The slot granted to the call
+    replica: Optional[int] = field(default=None, compare=False)
+    # Calls synthesized in the same batch, when the call leads a batch
+    followers: List["_Waiter"] = field(default_factory=list, compare=False)
+    # Result of the call, when it is served by another call's batch
+    served: bool = field(default=False, compare=False)
+    path: Optional[str] = field(default=None, compare=False)
+    error: Optional[BaseException] = field(default=None, compare=False)
+    cancelled: bool = field(default=False, compare=False)
+
+    def wake(self) -> None:
+        # Caller holds the pool lock
+        if self.event is not None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+
+
+class TTSEnginePool(TTSInterface):
+    """Spreads synthesis calls over replicas of one engine, with a concurrency limit per replica."""
+
+    def __init__(
+        self,
+        engine_factory: Callable[[], TTSInterface],
+        replicas: int = 1,
+        max_concurrency: int = 1,
+        max_queue_size: int = DEFAULT_MAX_QUEUE_SIZE,
+        max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+        name: str = "tts",
+    ):
+        """
+        Args:
+            engine_factory: Builds one replica of the engine
+            replicas: Number of engine instances
+            max_concurrency: Calls allowed at the same time on one replica
+            max_queue_size: Calls allowed to wait for a slot. 0 means unbounded
+            max_batch_size: Waiting calls synthesized together in one batched
+                call, if the engine supports it. 1 disables batching
+            name: Engine name, used in logs
+        """
+        if replicas < 1:
+            raise ValueError(f"TTS pool needs at least one replica, got {replicas}")
+        if max_concurrency < 1:
+            raise ValueError(
+                f"TTS pool concurrency must be at least 1, got {max_concurrency}"
+            )
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue_size = max_queue_size
+        self._replicas: List[_Replica] = [
+            _Replica(engine=engine_factory()) for _ in range(replicas)
+        ]
+        self.max_batch_size = (
+            max_batch_size if self._replicas[0].engine.supports_batch else 1
+        )
+        # 所有状态都由这把锁保护；持有时间很短，可以在事件循环里使用
+        self._lock = threading.Lock()
+        self._waiters: List[_Waiter] = []
+        self._order = itertools.count()
+        self._started_at = time.monotonic()
+        self._waited = 0
+        self._wait_seconds = 0.0
+        self._max_queued = 0
+        self._rejected = 0
+        logger.info(
+            f"TTS pool for {name}: {replicas} replica(s), "
+            f"{max_concurrency} call(s) per replica"
+            + (
+                f", batches of up to {self.max_batch_size}"
+                if self.max_batch_size > 1
+                else ""
+            )
+        )
+
+    @property
+    def engines(self) -> List[TTSInterface]:
+        return [replica.engine for replica in self._replicas]
+
+    # Slot leasing
+
+    def _free_replica(self) -> Optional[int]:
+        # Caller holds _lock. The least busy replica with a free slot
+        best = None
+        for index, replica in enumerate(self._replicas):
+            if replica.in_flight >= self.max_concurrency:
+                continue
+            if best is None or replica.in_flight < self._replicas[best].in_flight:
+                best = index
+        return best
+
+    def _enqueue(self, priority: int, **kwargs) -> _Waiter:
+        # Caller holds _lock
+        queued = sum(1 for waiter in self._waiters if not waiter.cancelled)
+        if self.max_queue_size and queued >= self.max_queue_size:
+            self._rejected += 1
+            raise TTSPoolFullError(
+                f"TTS pool for {self.name} has {queued} calls waiting, rejecting"
+            )
+        waiter = _Waiter(priority=priority, order=next(self._order), **kwargs)
+        heapq.heappush(self._waiters, waiter)
+        self._max_queued = max(self._max_queued, queued + 1)
+        return waiter
+
+    def _try_acquire(self) -> Optional[int]:
+        # Caller holds _lock. Only takes a slot if nobody is waiting for one
+        if any(not waiter.cancelled for waiter in self._waiters):
+            return None
+        index = self._free_replica()
+        if index is not None:
+            self._replicas[index].in_flight += 1
+        return index
+
+    def _release(
+        self, index: int, seconds: float, failed: bool, calls: int = 1
+    ) -> None:
+        with self._lock:
+            replica = self._replicas[index]
+            replica.in_flight -= 1
+            replica.busy_seconds += seconds
+            if failed:
+                replica.failed += calls
+            else:
+                replica.completed += calls
+            self._grant_waiters()
+
+    def _grant_waiters(self) -> None:
+        # Caller holds _lock. Hands free slots to the waiters in priority order
+        while self._waiters:
+            if self._waiters[0].cancelled:
+                heapq.heappop(self._waiters)
+                continue
+            index = self._free_replica()
+            if index is None:
+                return
+            waiter = heapq.heappop(self._waiters)
+            self._replicas[index].in_flight += 1
+            waiter.replica = index
+            if waiter.event is None:
+                waiter.followers = self._take_followers()
+            waiter.wake()
+
+    def _take_followers(self) -> List[_Waiter]:
+        # Caller holds _lock. The next async calls in priority order, for a batch
+        followers = []
+        while self._waiters and len(followers) < self.max_batch_size - 1:
+            waiter = self._waiters[0]
+            if waiter.cancelled:
+                heapq.heappop(self._waiters)
+                continue
+            if waiter.event is not None:
+                break
+            followers.append(heapq.heappop(self._waiters))
+        return followers
+
+    async def _acquire(
+        self, priority: int, text: str, file_name_no_ext: Optional[str]
+    ) -> _Waiter:
+        """Wait until the call is granted a slot or served by another call's batch"""
+        with self._lock:
+            index = self._try_acquire()
+            if index is not None:
+                return _Waiter(priority=priority, order=0, replica=index)
+            loop = asyncio.get_running_loop()
+            waiter = self._enqueue(
+                priority,
+                future=loop.create_future(),
+                loop=loop,
+                text=text,
+                file_name_no_ext=file_name_no_ext,
+            )
+            self._grant_waiters()
+        start = time.monotonic()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            with self._lock:
+                waiter.cancelled = True
+                granted = waiter.replica
+                path = waiter.path
+            if granted is not None:
+                # The slot was granted just as the call was cancelled
+                self._abandon_followers(waiter)
+                self._release(granted, 0.0, failed=False, calls=0)
+            if path:
+                # Served by a batch just as the call was cancelled
+                self._replicas[0].engine.remove_file(path)
+            raise
+        self._record_wait(time.monotonic() - start)
+        return waiter
+
+    def _abandon_followers(self, waiter: _Waiter) -> None:
+        """Put back the followers of a batch that never started"""
+        if not waiter.followers:
+            return
+        with self._lock:
+            for follower in waiter.followers:
+                if not follower.cancelled:
+                    heapq.heappush(self._waiters, follower)
+            waiter.followers = []
+            self._grant_waiters()
+
+    def _acquire_sync(self, priority: int) -> int:
+        with self._lock:
+            index = self._try_acquire()
+            if index is not None:
+                return index
+            waiter = self._enqueue(priority, event=threading.Event(), text="")
+            self._grant_waiters()
+        start = time.monotonic()
+        waiter.event.wait()
+        self._record_wait(time.monotonic() - start)
+        return waiter.replica
+
+    def _record_wait(self, seconds: float) -> None:
+        with self._lock:
+            self._waited += 1
+            self._wait_seconds += seconds
+        if seconds > SLOW_WAIT_SECONDS:
+            logger.warning(
+                f"TTS call waited {seconds:.1f}s for a free {self.name} replica"
+            )
+
+    # TTSInterface
+
+    async def async_generate_audio(
+        self, text: str, file_name_no_ext=None, priority: int = 0
+    ) -> str:
+        """
+        Generate the audio on the first replica with a free slot.
+
+        priority: int
+            lower goes first when calls have to wait, e.g. the sentence's
+            sequence number in its reply
+
+        Raises:
+            TTSPoolFullError: if the queue is full
+        """
+        waiter = await self._acquire(priority, text, file_name_no_ext)
+        if waiter.served:
+            if waiter.error is not None:
+                raise waiter.error
+            return waiter.path
+        if waiter.followers:
+            # The batch keeps running for the followers if this call is cancelled
+            batch = asyncio.ensure_future(self._run_batch(waiter))
+            try:
+                return await asyncio.shield(batch)
+            except asyncio.CancelledError:
+                with self._lock:
+                    waiter.cancelled = True
+                    path = waiter.path
+                if path:
+                    self._replicas[0].engine.remove_file(path)
+                raise
+
+        index = waiter.replica
+        start = time.monotonic()
+        failed = True
+        try:
+            result = await self._replicas[index].engine.async_generate_audio(
+                text, file_name_no_ext
+            )
+            failed = False
+            return result
+        finally:
+            self._release(index, time.monotonic() - start, failed)
+
+    async def _run_batch(self, leader: _Waiter) -> str:
+        """Synthesize a call and its followers together and hand out the results"""
+        with self._lock:
+            leader.followers = [
+                follower for follower in leader.followers if not follower.cancelled
+            ]
+        batch = [leader] + leader.followers
+        index = leader.replica
+        engine = self._replicas[index].engine
+        start = time.monotonic()
+        paths: List[Optional[str]] = []
+        error: Optional[BaseException] = None
+        try:
+            paths = await engine.async_generate_audio_batch(
+                [waiter.text for waiter in batch],
+                [waiter.file_name_no_ext for waiter in batch],
+            )
+        except Exception as e:
+            error = e
+        finally:
+            seconds = time.monotonic() - start
+            with self._lock:
+                self._replicas[index].batches += 1
+            self._release(index, seconds, error is not None, calls=len(batch))
+            logger.debug(
+                f"TTS batch of {len(batch)} on {self.name} took {seconds:.2f}s"
+            )
+
+        for i, follower in enumerate(leader.followers, start=1):
+            with self._lock:
+                follower.served = True
+                follower.error = error
+                follower.path = paths[i] if error is None else None
+                cancelled = follower.cancelled
+                if not cancelled:
+                    follower.wake()
+            if cancelled and follower.path:
+                engine.remove_file(follower.path)
+        if error is not None:
+            raise error
+        with self._lock:
+            leader.path = paths[0]
+            cancelled = leader.cancelled
+        if cancelled and paths[0]:
+            engine.remove_file(paths[0])
+        return paths[0]
+
+    def generate_audio(self, text: str, file_name_no_ext=None) -> str:
+        index = self._acquire_sync(0)
+        start = time.monotonic()
+        failed = True
+        try:
+            result = self._replicas[index].engine.generate_audio(text, file_name_no_ext)
+            failed = False
+            return result
+        finally:
+            self._release(index, time.monotonic() - start, failed)
+
+    def remove_file(self, filepath: str, verbose: bool = True) -> None:
+        self._replicas[0].engine.remove_file(filepath, verbose)
+
+    def close(self) -> None:
+        """Close the replicas that hold resources, such as worker processes"""
+        for replica in self._replicas:
+            close = getattr(replica.engine, "close", None)
+            if callable(close):
+                close()
+
+    def stats(self) -> dict:
+        """Utilization of every replica and queue statistics since the pool was created"""
+        with self._lock:
+            elapsed = max(time.monotonic() - self._started_at, 1e-9)
+            return {
+                "engine": self.name,
+                "replicas": [
+                    {
+                        "in_flight": replica.in_flight,
+                        "completed": replica.completed,
+                        "failed": replica.failed,
+                        "batches": replica.batches,
+                        "busy_seconds": round(replica.busy_seconds, 3),
+                        # Share of the replica's slot time spent synthesizing
+                        "utilization": round(
+                            replica.busy_seconds / (elapsed * self.max_concurrency), 4
+                        ),
+                    }
+                    for replica in self._replicas
+                ],
+                "queued": sum(1 for waiter in self._waiters if not waiter.cancelled),
+                "max_queued": self._max_queued,
+                "waited": self._waited,
+                "avg_wait_seconds": round(self._wait_seconds / self._waited, 4)
+                if self._waited
+                else 0.0,
+                "rejected": self._rejected,
+            }
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
@@ -1,5 +1,13 @@
-from typing import Type
+from typing import Optional, Type
+from loguru import logger
 from .tts_interface import TTSInterface
+from .tts_engine_pool import (
+    TTSEnginePool,
+    DEFAULT_MAX_BATCH_SIZE,
+    DEFAULT_MAX_CONCURRENCY,
+    DEFAULT_MAX_QUEUE_SIZE,
+    ENGINE_MAX_CONCURRENCY,
+)
 
 
 class TTSFactory:
@@ -116,6 +124,59 @@ class TTSFactory:
         else:
             raise ValueError(f"Unknown TTS engine type: {engine_type}")
 
+    @staticmethod
+    def get_tts_engine_pool(
+        engine_type,
+        replicas: int = 1,
+        max_concurrency: Optional[int] = None,
+        max_queue_size: int = DEFAULT_MAX_QUEUE_SIZE,
+        max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+        worker_processes: int = 0,
+        **kwargs,
+    ) -> TTSEnginePool:
+        """
+        Build `replicas` instances of an engine behind a `TTSEnginePool`.
+        `max_concurrency` defaults to 1 for local models, which can't be
+        called concurrently, and to DEFAULT_MAX_CONCURRENCY for the others.
+
+        With `worker_processes`, the engine is loaded once and the replicas
+        are that many worker processes forked from it, sharing its weights.
+        """
+        if max_concurrency is None:
+            max_concurrency = ENGINE_MAX_CONCURRENCY.get(
+                engine_type, DEFAULT_MAX_CONCURRENCY
+            )
+        if worker_processes > 0:
+            from ..utils.forked_worker import fork_available
+
+            if not fork_available():
+                logger.warning(
+                    "TTS worker processes need fork, which this platform doesn't "
+                    "support. Synthesizing in the server process."
+                )
+                worker_processes = 0
+        if worker_processes > 0:
+            from .forked_tts import ForkedTTSEngine
+
+            engine = TTSFactory.get_tts_engine(engine_type, **kwargs)
+            replicas = worker_processes
+            engines = iter(
+                [ForkedTTSEngine(engine, name=engine_type) for _ in range(replicas)]
+            )
+        else:
+            engines = (
+                TTSFactory.get_tts_engine(engine_type, **kwargs)
+                for _ in range(replicas)
+            )
+        return TTSEnginePool(
+            lambda: next(engines),
+            replicas=replicas,
+            max_concurrency=max_concurrency,
+            max_queue_size=max_queue_size,
+            max_batch_size=max_batch_size,
+            name=engine_type,
+        )
+
 
 # Example usage:
 # tts_engine = TTSFactory.get_tts_engine("azure", api_key="your_api_key", region="your_region", voice="your_voice")
@@ -1,11 +1,16 @@
 import abc
 import os
 import asyncio
+from typing import ClassVar, List, Optional
 
 from loguru import logger
 
 
 class TTSInterface(metaclass=abc.ABCMeta):
+    # True if generate_audio_batch synthesizes several texts in one batched call.
+    # The engine pool only hands a backlog to engines that set it.
+    supports_batch: ClassVar[bool] = False
+
     async def async_generate_audio(self, text: str, file_name_no_ext=None) -> str:
         """
         Asynchronously generate speech audio file using TTS.
@@ -39,6 +44,42 @@ class TTSInterface(metaclass=abc.ABCMeta):
         """
         raise NotImplementedError
 
+    async def async_generate_audio_batch(
+        self, texts: List[str], file_names_no_ext: Optional[List[str]] = None
+    ) -> List[str]:
+        """
+        Asynchronously generate one audio file per text, see `generate_audio_batch`.
+        """
+        return await asyncio.to_thread(
+            self.generate_audio_batch, texts, file_names_no_ext
+        )
+
+    def generate_audio_batch(
+        self, texts: List[str], file_names_no_ext: Optional[List[str]] = None
+    ) -> List[str]:
+        """
+        Generate one audio file per text.
+
+        By default, this calls generate_audio for each text. Engines that can
+        synthesize several sentences in one batched forward pass override it
+        and set `supports_batch`.
+
+        texts: List[str]
+            the texts to speak
+        file_names_no_ext (optional): List[str]
+            name of each file without file extension
+
+        Returns:
+        List[str]: the path to the audio file of each text, in order
+
+        """
+        if file_names_no_ext is None:
+            file_names_no_ext = [None] * len(texts)
+        return [
+            self.generate_audio(text, file_name_no_ext)
+            for text, file_name_no_ext in zip(texts, file_names_no_ext)
+        ]
+
     def remove_file(self, filepath: str, verbose: bool = True) -> None:
         """
         Remove a file from the file system.
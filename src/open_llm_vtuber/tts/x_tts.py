@@ -1,6 +1,6 @@
-import requests
 from loguru import logger
 from .tts_interface import TTSInterface
+from ..utils.http_client import http_clients
 
 
 class TTSEngine(TTSInterface):
@@ -15,6 +15,7 @@ class TTSEngine(TTSInterface):
         self.language = language
         self.new_audio_dir = "cache"
         self.file_extension = "wav"
+        http_clients.register_warm_up(self.api_url, blocking=True)
 
     def generate_audio(self, text, file_name_no_ext=None):
         file_name = self.generate_cache_file_name(file_name_no_ext, self.file_extension)
@@ -27,7 +28,7 @@ class TTSEngine(TTSInterface):
         }
 
         # Send POST request to the TTS API
-        response = requests.post(self.api_url, json=data, timeout=120)
+        response = http_clients.sync_client.post(self.api_url, json=data, timeout=120)
 
         # Check if the request was successful
         if response.status_code == 200:
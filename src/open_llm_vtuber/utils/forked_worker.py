@@ -0,0 +1,132 @@
+"""
+Worker processes forked from an engine loaded in the server process.
+
+Local ASR and TTS models are CPU bound and mostly not thread safe, so in one
+process they keep one core busy at a time. A `ForkedWorker` forks a child
+process after the engine has been loaded: the child inherits the engine, and
+the model weights stay in memory pages shared copy-on-write with the server
+process instead of being loaded once per worker. Method calls are sent to the
+child, and their results (audio paths, transcriptions) sent back.
+
+Needs the "fork" start method (Linux, macOS). Engines holding a GPU context
+can't be used from a forked child. Fork while no other thread is loading a
+model: only CPython's and loguru's locks are reset in the child, and a lock
+held by onnxruntime, torch or OpenMP at the time of the fork stays held there
+forever. `ServiceContext.load_from_config` builds engines with worker
+processes after the engines loaded in parallel.
+"""
+
+import os
+import gc
+import signal
+import asyncio
+import itertools
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict
+
+from loguru import logger
+
+
+# Objects the workers call into, inherited by the children when they are forked
+_targets: Dict[int, Any] = {}
+_target_ids = itertools.count()
+# gc.freeze is process-wide; forks run one at a time
+_fork_lock = threading.Lock()
+
+
+def fork_available() -> bool:
+    return "fork" in multiprocessing.get_all_start_methods()
+
+
+def _init_child() -> None:
+    # Ctrl+C stops the server, which shuts the workers down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _pid() -> int:
+    return os.getpid()
+
+
+def _call(target_id: int, method: str, args: tuple) -> Any:
+    return getattr(_targets[target_id], method)(*args)
+
+
+class ForkedWorker:
+    """One child process forked from this one, running methods of an object loaded here."""
+
+    def __init__(self, target: Any, name: str = "worker"):
+        """
+        Args:
+            target: The loaded engine the child calls into
+            name: Used in logs
+        """
+        if not fork_available():
+            raise RuntimeError(
+                "Worker processes need the 'fork' start method, "
+                "which is not available on this platform"
+            )
+        self.name = name
+        self._target_id = next(_target_ids)
+        _targets[self._target_id] = target
+        self._executor: ProcessPoolExecutor = None
+        self.pid: int = None
+        # Callers that see the child die at the same time fork it again once
+        self._restart_lock = threading.Lock()
+        self._fork()
+
+    def _fork(self) -> None:
+        executor = ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=multiprocessing.get_context("fork"),
+            initializer=_init_child,
+        )
+        with _fork_lock:
+            # 冻结现有对象：子进程的垃圾回收不再写这些对象，内存页保持共享
+            gc.freeze()
+            try:
+                # The child is forked on the first submit
+                self.pid = executor.submit(_pid).result()
+            finally:
+                gc.unfreeze()
+        self._executor = executor
+        logger.info(f"Forked {self.name} worker process {self.pid}")
+
+    def _restart(self, broken: ProcessPoolExecutor, error: Exception) -> None:
+        """Fork a new child in place of the one of `broken`, unless done already"""
+        with self._restart_lock:
+            if self._executor is not broken:
+                return
+            logger.error(
+                f"{self.name} worker process {self.pid} died ({error}), "
+                "forking a new one"
+            )
+            broken.shutdown(wait=False, cancel_futures=True)
+            self._fork()
+
+    def call(self, method: str, *args) -> Any:
+        """Call `method` of the target in the child and return its result"""
+        executor = self._executor
+        try:
+            return executor.submit(_call, self._target_id, method, args).result()
+        except BrokenProcessPool as e:
+            self._restart(executor, e)
+            raise
+
+    async def acall(self, method: str, *args) -> Any:
+        """`call` without blocking the event loop"""
+        executor = self._executor
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                executor, _call, self._target_id, method, args
+            )
+        except BrokenProcessPool as e:
+            # Forking waits for the new child to start
+            await asyncio.to_thread(self._restart, executor, e)
+            raise
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        _targets.pop(self._target_id, None)
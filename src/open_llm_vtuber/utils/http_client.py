@@ -0,0 +1,138 @@
+"""
+Shared HTTP clients for remote providers.
+
+Providers that talk to HTTP services (Dify, Ollama, GPT-SoVITS, XTTS, DeepLX,
+Tencent translate...) get their clients from the module level `http_clients`
+manager instead of opening a new connection per request. The manager keeps one
+connection pool per host, so DNS, TCP and TLS setup is paid once and reused by
+every session. The server configures it at startup, warms up the registered
+hosts and closes the pools at shutdown.
+"""
+
+import asyncio
+import weakref
+from typing import Optional, Set, Tuple
+
+import httpx
+from loguru import logger
+
+from ..config_manager.system import HttpClientConfig
+
+
+class HttpClientManager:
+    """Owns the pooled sync and async httpx clients shared by all providers."""
+
+    def __init__(self, config: Optional[HttpClientConfig] = None):
+        self._config = config or HttpClientConfig()
+        self._sync_client: Optional[httpx.Client] = None
+        # httpx.AsyncClient connections are bound to the event loop they were opened on
+        self._async_clients: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self._warm_up_origins: Set[Tuple[str, bool]] = set()
+
+    def configure(self, config: HttpClientConfig) -> None:
+        """Apply new settings. Clients created before are closed lazily."""
+        self._config = config
+        if self._sync_client is not None:
+            self._sync_client.close()
+            self._sync_client = None
+        # Async clients cannot be closed from here without a running loop;
+        # drop them so the next call builds a client with the new settings.
+        self._async_clients.clear()
+
+    def _client_kwargs(self) -> dict:
+        config = self._config
+        http2 = config.http2
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logger.warning(
+                    "http2 is enabled but the 'h2' package is not installed. "
+                    "Falling back to HTTP/1.1. Install it with `pip install h2`."
+                )
+                http2 = False
+        return {
+            "limits": httpx.Limits(
+                max_connections=config.max_connections,
+                max_keepalive_connections=config.max_keepalive_connections,
+                keepalive_expiry=config.keepalive_expiry,
+            ),
+            "timeout": httpx.Timeout(
+                config.read_timeout, connect=config.connect_timeout
+            ),
+            "http2": http2,
+        }
+
+    @property
+    def sync_client(self) -> httpx.Client:
+        """Pooled client for blocking providers. Safe to share between threads."""
+        if self._sync_client is None:
+            self._sync_client = httpx.Client(**self._client_kwargs())
+        return self._sync_client
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        """Pooled client for the currently running event loop."""
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(**self._client_kwargs())
+            self._async_clients[loop] = client
+        return client
+
+    def register_warm_up(self, url: str, blocking: bool = False) -> None:
+        """Remember the host of `url` so a connection is opened at startup.
+
+        Args:
+            url: Any url on the host the provider talks to
+            blocking: Whether the provider uses `sync_client` instead of `async_client`
+        """
+        try:
+            origin = httpx.URL(url).copy_with(path="/", query=None, fragment=None)
+        except Exception as e:
+            logger.debug(f"Not warming up invalid url '{url}': {e}")
+            return
+        if origin.host:
+            self._warm_up_origins.add((str(origin), blocking))
+
+    async def warm_up(self) -> None:
+        """Open a keep-alive connection to every registered host."""
+        if not self._config.warm_up or not self._warm_up_origins:
+            return
+
+        timeout = self._config.connect_timeout
+
+        async def _touch(origin: str, blocking: bool) -> None:
+            try:
+                # Any response means DNS, TCP and TLS are done and the
+                # connection is back in the pool.
+                if blocking:
+                    response = await asyncio.to_thread(
+                        self.sync_client.head, origin, timeout=timeout
+                    )
+                else:
+                    response = await self.async_client.head(origin, timeout=timeout)
+                logger.debug(f"Warmed up {origin} ({response.status_code})")
+            except Exception as e:
+                logger.warning(f"Failed to warm up connection to {origin}: {e}")
+
+        await asyncio.gather(
+            *(_touch(origin, blocking) for origin, blocking in self._warm_up_origins)
+        )
+        logger.info(
+            f"Warmed up HTTP connections to {len(self._warm_up_origins)} host(s)"
+        )
+
+    async def aclose(self) -> None:
+        """Close all pooled connections."""
+        current_loop = asyncio.get_running_loop()
+        for loop, client in list(self._async_clients.items()):
+            if loop is current_loop:
+                await client.aclose()
+        self._async_clients.clear()
+        if self._sync_client is not None:
+            self._sync_client.close()
+            self._sync_client = None
+
+
+http_clients = HttpClientManager()
@@ -0,0 +1,81 @@
+"""
+Measure how long importing a module takes in a fresh interpreter.
+
+Providers and engines are imported by their factories only when a config
+selects them, so the server starts without loading SDKs it doesn't use. This
+module checks that it stays that way: it runs `python -X importtime` on a
+module in a subprocess (so nothing is cached yet) and sums the time per
+top-level package.
+
+Usage: `uv run run_server.py --profile-imports [--import-budget 1.0]`
+"""
+
+import os
+import sys
+import subprocess
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+
+@dataclass
+class ImportProfile:
+    module: str
+    # Wall time of the whole import, in seconds
+    total: float
+    # (module, self seconds, cumulative seconds) for every imported module
+    modules: List[Tuple[str, float, float]] = field(default_factory=list)
+
+    def by_package(self) -> Dict[str, float]:
+        """Self time summed per top-level package, largest first"""
+        packages: Dict[str, float] = defaultdict(float)
+        for name, self_time, _ in self.modules:
+            packages[name.split(".")[0]] += self_time
+        return dict(sorted(packages.items(), key=lambda item: item[1], reverse=True))
+
+
+def profile_imports(module: str, cwd: Optional[str] = None) -> ImportProfile:
+    """
+    Import `module` in a new interpreter with `-X importtime`.
+
+    Raises:
+        RuntimeError: If the import fails
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=cwd,
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    modules = []
+    total_us = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:") :].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            # The header line
+            continue
+        self_us, cumulative_us = int(parts[0]), int(parts[1])
+        name = parts[2].rstrip()
+        # Top-level imports are not indented past the single separator space
+        if not name[1:].startswith(" "):
+            total_us += cumulative_us
+        modules.append((name.strip(), self_us / 1e6, cumulative_us / 1e6))
+    return ImportProfile(module=module, total=total_us / 1e6, modules=modules)
+
+
+def format_report(profile: ImportProfile, top: int = 15) -> str:
+    lines = [f"Importing {profile.module} took {profile.total:.3f}s", "", "By package:"]
+    for package, seconds in list(profile.by_package().items())[:top]:
+        lines.append(f"  {seconds:8.3f}s  {package}")
+    lines += ["", "Slowest modules (self time):"]
+    for name, self_time, cumulative in sorted(
+        profile.modules, key=lambda m: m[1], reverse=True
+    )[:top]:
+        lines.append(f"  {self_time:8.3f}s  {name}  (cumulative {cumulative:.3f}s)")
+    return "\n".join(lines)
@@ -1,8 +1,8 @@
 import re
+from functools import lru_cache
 from typing import List, Tuple, AsyncIterator, Optional
 import pysbd
 from loguru import logger
-from langdetect import detect
 from enum import Enum
 from dataclasses import dataclass
 
@@ -78,6 +78,11 @@ def detect_language(text: str) -> str:
     Detect text language and check if it's supported by pysbd.
     Returns None for unsupported languages.
     """
+    # Imported on first use, so servers that never segment with pysbd skip it
+    from langdetect import detect, DetectorFactory
+
+    # langdetect is non-deterministic unless seeded
+    DetectorFactory.seed = 0
     try:
         detected = detect(text)
         return detected if detected in SUPPORTED_LANGUAGES else None
@@ -86,6 +91,34 @@ def detect_language(text: str) -> str:
         return None
 
 
+# Precompiled patterns, so the hot path never rebuilds a regex per token
+_COMMA_PATTERN = re.compile("|".join(re.escape(c) for c in dict.fromkeys(COMMAS)))
+_END_PUNCTUATION_PATTERN = re.compile(
+    "|".join(re.escape(p) for p in sorted(END_PUNCTUATIONS, key=len, reverse=True))
+)
+_PUNCTUATION_PATTERN = re.compile(
+    _COMMA_PATTERN.pattern + "|" + _END_PUNCTUATION_PATTERN.pattern
+)
+# Matches the shortest text ending with any end punctuation
+_SENTENCE_PATTERN = re.compile(
+    r"(.*?(?:[" + "|".join(re.escape(p) for p in END_PUNCTUATIONS) + r"]))",
+    re.DOTALL,
+)
+# CJK sentences end with full-width marks (or a period that is not part of a
+# number), optionally followed by closing quotes and brackets
+_CJK_SENTENCE_PATTERN = re.compile(
+    r".*?(?:[。！？!?…]+|(?<!\d)\.(?!\d)\.*)[」』”’）)】\]]*",
+    re.DOTALL,
+)
+# Any letter outside the Han, kana, Hangul and full-width ranges
+_NON_CJK_LETTER_PATTERN = re.compile(
+    r"[^\W\d_\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]"
+)
+_CJK_LETTER_PATTERN = re.compile(
+    r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]"
+)
+
+
 def is_complete_sentence(text: str) -> bool:
     """
     Check if text ends with sentence-ending punctuation and not abbreviation.
@@ -116,7 +149,7 @@ def contains_comma(text: str) -> bool:
     Returns:
         bool: Whether the text contains a comma
     """
-    return any(comma in text for comma in COMMAS)
+    return _COMMA_PATTERN.search(text) is not None
 
 
 def comma_splitter(text: str) -> Tuple[str, str]:
@@ -131,14 +164,13 @@ def comma_splitter(text: str) -> Tuple[str, str]:
         Tuple[str, str]: (split text with comma, remaining text)
     """
     if not text:
-        return [], ""
+        return "", ""
 
-    for comma in COMMAS:
-        if comma in text:
-            split_text = text.split(comma, 1)
-            # Return first part with the comma
-            return split_text[0].strip() + comma, split_text[1].strip()
-    return text, ""
+    match = _COMMA_PATTERN.search(text)
+    if not match:
+        return text, ""
+    # Return first part with the comma
+    return text[: match.start()].strip() + match.group(), text[match.end() :].strip()
 
 
 def has_punctuation(text: str) -> bool:
@@ -151,10 +183,7 @@ def has_punctuation(text: str) -> bool:
     Returns:
         bool: Whether the text is a punctuation mark
     """
-    for punct in COMMAS + END_PUNCTUATIONS:
-        if punct in text:
-            return True
-    return False
+    return _PUNCTUATION_PATTERN.search(text) is not None
 
 
 def contains_end_punctuation(text: str) -> bool:
@@ -167,7 +196,7 @@ def contains_end_punctuation(text: str) -> bool:
     Returns:
         bool: Whether the text contains ending punctuation
     """
-    return any(punct in text for punct in END_PUNCTUATIONS)
+    return _END_PUNCTUATION_PATTERN.search(text) is not None
 
 
 def segment_text_by_regex(text: str) -> Tuple[List[str], str]:
@@ -185,38 +214,99 @@ def segment_text_by_regex(text: str) -> Tuple[List[str], str]:
         return [], ""
 
     complete_sentences = []
-    remaining_text = text.strip()
-
-    # Create pattern for matching sentences ending with any end punctuation
-    escaped_punctuations = [re.escape(p) for p in END_PUNCTUATIONS]
-    pattern = r"(.*?(?:[" + "|".join(escaped_punctuations) + r"]))"
+    text = text.strip()
+    # Start of the sentence being built and position to resume matching from
+    start = 0
+    pos = 0
 
-    while remaining_text:
-        match = re.search(pattern, remaining_text)
+    while pos < len(text):
+        match = _SENTENCE_PATTERN.match(text, pos)
         if not match:
             break
 
-        end_pos = match.end(1)
-        potential_sentence = remaining_text[:end_pos].strip()
+        pos = match.end(1)
+        potential_sentence = text[start:pos].strip()
 
-        # Skip if sentence ends with abbreviation
+        # An abbreviation does not end the sentence, keep extending it
         if any(potential_sentence.endswith(abbrev) for abbrev in ABBREVIATIONS):
-            remaining_text = remaining_text[end_pos:].lstrip()
             continue
 
         complete_sentences.append(potential_sentence)
-        remaining_text = remaining_text[end_pos:].lstrip()
+        start = pos
+
+    return complete_sentences, text[start:].lstrip()
+
+
+def is_cjk_only(text: str) -> bool:
+    """
+    Check if the letters in text are all Chinese, Japanese or Korean.
+
+    Args:
+        text: Text to check
+
+    Returns:
+        bool: Whether text has CJK letters and no letters of other scripts
+    """
+    return (
+        _CJK_LETTER_PATTERN.search(text) is not None
+        and _NON_CJK_LETTER_PATTERN.search(text) is None
+    )
 
-    return complete_sentences, remaining_text
 
+def segment_text_by_cjk(text: str) -> Tuple[List[str], str]:
+    """
+    Segment CJK-only text into complete sentences.
+    CJK sentence endings are unambiguous, so this skips pysbd entirely.
 
-def segment_text_by_pysbd(text: str) -> Tuple[List[str], str]:
+    Args:
+        text: Text to segment into sentences
+
+    Returns:
+        Tuple[List[str], str]: (list of complete sentences, remaining incomplete text)
+    """
+    if not text:
+        return [], ""
+
+    complete_sentences = []
+    text = text.strip()
+    pos = 0
+    while pos < len(text):
+        match = _CJK_SENTENCE_PATTERN.match(text, pos)
+        if not match:
+            break
+        sentence = match.group().strip()
+        if sentence:
+            complete_sentences.append(sentence)
+        pos = match.end()
+
+    return complete_sentences, text[pos:].lstrip()
+
+
+@lru_cache(maxsize=None)
+def get_pysbd_segmenter(language: str) -> pysbd.Segmenter:
+    """
+    Get the pysbd segmenter for a language.
+    Segmenters compile their rules on construction, so one is kept per language.
+
+    Args:
+        language: Language code supported by pysbd
+
+    Returns:
+        pysbd.Segmenter: The cached segmenter
+    """
+    return pysbd.Segmenter(language=language, clean=False)
+
+
+def segment_text_by_pysbd(
+    text: str, language: Optional[str] = None
+) -> Tuple[List[str], str]:
     """
     Segment text into complete sentences and remaining text.
     Uses pysbd for supported languages, falls back to regex for others.
 
     Args:
         text: Text to segment into sentences
+        language: Language of the text. Detected from the text if not given.
 
     Returns:
         Tuple[List[str], str]: (list of complete sentences, remaining incomplete text)
@@ -226,12 +316,11 @@ def segment_text_by_pysbd(text: str) -> Tuple[List[str], str]:
 
     try:
         # Detect language
-        lang = detect_language(text)
+        lang = language or detect_language(text)
 
         if lang is not None:
             # Use pysbd for supported languages
-            segmenter = pysbd.Segmenter(language=lang, clean=False)
-            sentences = segmenter.segment(text)
+            sentences = get_pysbd_segmenter(lang).segment(text)
 
             if not sentences:
                 return [], text
@@ -266,6 +355,72 @@ def segment_text_by_pysbd(text: str) -> Tuple[List[str], str]:
         return segment_text_by_regex(text)
 
 
+class SentenceSegmenter:
+    """
+    Segments the text of one reply with pysbd.
+
+    The language is detected once per reply instead of once per call. It is
+    only detected again after the script of the text (CJK or not) changed for
+    `switch_after` calls in a row, so a single quoted word does not flip it.
+    CJK-only text takes a fast path that skips pysbd entirely.
+    """
+
+    def __init__(self, min_detect_length: int = 20, switch_after: int = 2):
+        """
+        Initialize the SentenceSegmenter.
+
+        Args:
+            min_detect_length: Minimum text length to trust language detection
+            switch_after: Consecutive calls in another script before re-detecting
+        """
+        self.min_detect_length = min_detect_length
+        self.switch_after = switch_after
+        self.reset()
+
+    def reset(self) -> None:
+        """Forget the detected language, for a new reply"""
+        self._language: Optional[str] = None
+        self._detected = False
+        self._is_cjk = False
+        self._script_changes = 0
+
+    def segment(self, text: str) -> Tuple[List[str], str]:
+        """
+        Segment text into complete sentences and remaining text.
+
+        Args:
+            text: Text to segment into sentences
+
+        Returns:
+            Tuple[List[str], str]: (list of complete sentences, remaining incomplete text)
+        """
+        if not text:
+            return [], ""
+
+        is_cjk = is_cjk_only(text)
+        if self._detected and is_cjk != self._is_cjk:
+            self._script_changes += 1
+            if self._script_changes >= self.switch_after:
+                logger.debug("Script of the reply changed, detecting language again")
+                self._detected = False
+        else:
+            self._script_changes = 0
+
+        if not self._detected:
+            self._is_cjk = is_cjk
+            self._script_changes = 0
+            if not is_cjk:
+                self._language = detect_language(text)
+            # Short text gives unreliable results, so try again next call
+            self._detected = is_cjk or len(text) >= self.min_detect_length
+
+        if self._is_cjk:
+            return segment_text_by_cjk(text)
+        if self._language is None:
+            return segment_text_by_regex(text)
+        return segment_text_by_pysbd(text, language=self._language)
+
+
 class TagState(Enum):
     """State of a tag in text"""
 
@@ -316,10 +471,26 @@ class SentenceDivider:
         self.faster_first_response = faster_first_response
         self.segment_method = segment_method
         self.valid_tags = valid_tags or ["think"]
+        self._segmenter = SentenceSegmenter()
         self._is_first_sentence = True
         self._buffer = ""
         # Replace active_tags dict with a stack to handle nesting
         self._tag_stack = []
+        # Offset in the buffer up to which text was already scanned for triggers
+        self._scan_pos = 0
+
+        tag_names = "|".join(re.escape(tag) for tag in self.valid_tags)
+        # One pattern for every tag form: </tag>, <tag/> and <tag>
+        self._tag_pattern = re.compile(
+            rf"</(?P<end>{tag_names})>|<(?P<self>{tag_names})/>|<(?P<start>{tag_names})>"
+        )
+        # Anything that may complete a region: the end of a tag or a punctuation
+        self._trigger_pattern = re.compile(
+            rf"(?:{tag_names})/?>|{_PUNCTUATION_PATTERN.pattern}"
+        )
+        # Rescan a few characters before the offset so a tag split across
+        # tokens (e.g. "</thi" + "nk>") is still detected
+        self._scan_overlap = max(len(tag) for tag in self.valid_tags) + 2
 
     def _get_current_tags(self) -> List[TagInfo]:
         """
@@ -350,63 +521,75 @@ class SentenceDivider:
         Returns:
             Tuple of (TagInfo if tag found else None, remaining text)
         """
-        # Find the first occurrence of any tag
-        first_tag = None
-        first_pos = len(text)
-        tag_type = None
-        matched_tag = None
-
-        # Check for self-closing tags
-        for tag in self.valid_tags:
-            pattern = f"<{tag}/>"
-            match = re.search(pattern, text)
-            if match and match.start() < first_pos:
-                first_pos = match.start()
-                first_tag = match
-                tag_type = TagState.SELF_CLOSING
-                matched_tag = tag
-
-        # Check for opening tags
-        for tag in self.valid_tags:
-            pattern = f"<{tag}>"
-            match = re.search(pattern, text)
-            if match and match.start() < first_pos:
-                first_pos = match.start()
-                first_tag = match
-                tag_type = TagState.START
-                matched_tag = tag
-
-        # Check for closing tags
-        for tag in self.valid_tags:
-            pattern = f"</{tag}>"
-            match = re.search(pattern, text)
-            if match and match.start() < first_pos:
-                first_pos = match.start()
-                first_tag = match
-                tag_type = TagState.END
-                matched_tag = tag
-
-        if not first_tag:
+        match = self._tag_pattern.search(text)
+        if not match:
             return None, text
 
-        # Handle the found tag
-        if tag_type == TagState.START:
+        if match.group("start"):
+            matched_tag = match.group("start")
+            tag_type = TagState.START
             # Push new tag onto stack
             self._tag_stack.append(TagInfo(matched_tag, TagState.START))
-        elif tag_type == TagState.END:
+        elif match.group("end"):
+            matched_tag = match.group("end")
+            tag_type = TagState.END
             # Verify matching tags
             if not self._tag_stack or self._tag_stack[-1].name != matched_tag:
                 logger.warning(f"Mismatched closing tag: {matched_tag}")
             else:
                 self._tag_stack.pop()
+        else:
+            matched_tag = match.group("self")
+            tag_type = TagState.SELF_CLOSING
 
-        return (TagInfo(matched_tag, tag_type), text[first_tag.end() :].lstrip())
+        return (TagInfo(matched_tag, tag_type), text[match.end() :].lstrip())
 
-    async def _process_buffer(self) -> List[SentenceWithTags]:
+    def _segment_complete_region(
+        self, text: str, scan_from: int = 0
+    ) -> Tuple[List[str], str]:
+        """
+        Segment only the part of text that ends with the last end punctuation.
+        The trailing incomplete part is never handed to the segmenter.
+
+        Args:
+            text: Text to segment
+            scan_from: Offset before which text holds no new end punctuation
+
+        Returns:
+            Tuple[List[str], str]: (list of complete sentences, remaining text)
+        """
+        region_end = -1
+        for match in _END_PUNCTUATION_PATTERN.finditer(text, scan_from):
+            region_end = match.end()
+        if region_end == -1:
+            return [], text
+
+        sentences, remaining = self._segment_text(text[:region_end])
+        tail = text[region_end:]
+        if remaining:
+            return sentences, remaining + tail
+        return sentences, tail.lstrip()
+
+    def _wrap_sentences(
+        self, sentences: List[str], current_tags: List[TagInfo]
+    ) -> List[SentenceWithTags]:
+        """Attach the current tags to every non-empty sentence"""
+        tags = current_tags or [TagInfo("", TagState.NONE)]
+        return [
+            SentenceWithTags(text=sentence.strip(), tags=tags)
+            for sentence in sentences
+            if sentence.strip()
+        ]
+
+    async def _process_buffer(self, scan_from: int = 0) -> List[SentenceWithTags]:
         """
         Process the current buffer and return complete sentences with tags.
         Handles tags that may appear anywhere in the buffer.
 
+        Args:
+            scan_from: Offset of the first unscanned character. Text before it
+                holds no tag and no end punctuation that was not handled yet.
+
         Returns:
             List[SentenceWithTags]: List of sentences with their tag information
         """
@@ -414,76 +597,34 @@ class SentenceDivider:
 
         while self._buffer.strip():
             # Find the next tag position
-            next_tag_pos = len(self._buffer)
-            for tag in self.valid_tags:
-                patterns = [f"<{tag}>", f"</{tag}>", f"<{tag}/>"]
-                for pattern in patterns:
-                    pos = self._buffer.find(pattern)
-                    if pos != -1 and pos < next_tag_pos:
-                        next_tag_pos = pos
-
-            if next_tag_pos == 0:
-                # Tag is at the start of buffer
-                tag_info, remaining = self._extract_tag(self._buffer)
-                if tag_info:
-                    result.append(
-                        SentenceWithTags(
-                            text=self._buffer[
-                                : len(self._buffer) - len(remaining)
-                            ].strip(),
-                            tags=[tag_info],  # Tag itself is a single-item list
-                        )
+            tag_match = self._tag_pattern.search(self._buffer, scan_from)
+
+            if tag_match:
+                if tag_match.start() > 0:
+                    # Tag is in the middle - process text before tag first
+                    text_before_tag = self._buffer[: tag_match.start()]
+                    current_tags = self._get_current_tags()
+
+                    # Process complete sentences in text before tag, the
+                    # incomplete rest is flushed because the tag closes it
+                    sentences, remaining = self._segment_complete_region(
+                        text_before_tag
                     )
-                    self._buffer = remaining
-                    continue
-
-            elif next_tag_pos < len(self._buffer):
-                # Tag is in the middle - process text before tag first
-                text_before_tag = self._buffer[:next_tag_pos]
-                current_tags = self._get_current_tags()
-
-                # Process complete sentences in text before tag
-                if contains_end_punctuation(text_before_tag):
-                    sentences, remaining = self._segment_text(text_before_tag)
-                    for sentence in sentences:
-                        if sentence.strip():
-                            result.append(
-                                SentenceWithTags(
-                                    text=sentence.strip(),
-                                    tags=current_tags or [TagInfo("", TagState.NONE)],
-                                )
-                            )
-
-                    if remaining.strip():
-                        result.append(
-                            SentenceWithTags(
-                                text=remaining.strip(),
-                                tags=current_tags or [TagInfo("", TagState.NONE)],
-                            )
-                        )
-
-                elif text_before_tag.strip():
-                    # No complete sentence but has content
-                    result.append(
-                        SentenceWithTags(
-                            text=text_before_tag.strip(),
-                            tags=current_tags or [TagInfo("", TagState.NONE)],
-                        )
+                    result.extend(
+                        self._wrap_sentences(sentences + [remaining], current_tags)
                     )
+                    self._buffer = self._buffer[tag_match.start() :]
 
                 # Process the tag
-                self._buffer = self._buffer[next_tag_pos:]
                 tag_info, remaining = self._extract_tag(self._buffer)
-                if tag_info:
-                    result.append(
-                        SentenceWithTags(
-                            text=self._buffer[
-                                : len(self._buffer) - len(remaining)
-                            ].strip(),
-                            tags=[tag_info],
-                        )
+                result.append(
+                    SentenceWithTags(
+                        text=self._buffer[: len(self._buffer) - len(remaining)].strip(),
+                        tags=[tag_info],  # Tag itself is a single-item list
                     )
-                    self._buffer = remaining
+                )
+                self._buffer = remaining
+                scan_from = 0
                 continue
 
             # No tags found - process normal text
@@ -496,30 +637,20 @@ class SentenceDivider:
                 and contains_comma(self._buffer)
             ):
                 sentence, remaining = comma_splitter(self._buffer)
-                if sentence.strip():
-                    result.append(
-                        SentenceWithTags(
-                            text=sentence.strip(),
-                            tags=current_tags or [TagInfo("", TagState.NONE)],
-                        )
-                    )
+                result.extend(self._wrap_sentences([sentence], current_tags))
                 self._buffer = remaining
                 self._is_first_sentence = False
+                scan_from = 0
                 continue
 
             # Process normal sentences
-            if contains_end_punctuation(self._buffer):
-                sentences, remaining = self._segment_text(self._buffer)
+            if contains_end_punctuation(self._buffer[scan_from:]):
+                sentences, remaining = self._segment_complete_region(
+                    self._buffer, scan_from
+                )
                 self._buffer = remaining
                 self._is_first_sentence = False
-                for sentence in sentences:
-                    if sentence.strip():
-                        result.append(
-                            SentenceWithTags(
-                                text=sentence.strip(),
-                                tags=current_tags or [TagInfo("", TagState.NONE)],
-                            )
-                        )
+                result.extend(self._wrap_sentences(sentences, current_tags))
             break
 
         return result
@@ -529,6 +660,9 @@ class SentenceDivider:
         Process a stream of tokens and yield complete sentences with tag information.
         pysbd may not able to handle ...
 
+        Only the text appended since the last scan is searched for tags and
+        punctuation, so the cost per token does not grow with the buffer.
+
         Args:
             segment_stream: An async iterator yielding segments
 
@@ -536,19 +670,22 @@ class SentenceDivider:
             SentenceWithTags: Complete sentences with their tag information
         """
         self._full_response = []
+        self._scan_pos = 0
+        self._segmenter.reset()
 
         async for segment in segment_stream:
             self._buffer += segment
             self._full_response.append(segment)
 
-            # Process buffer after punctuation, when buffer gets too long,
-            # or when we see a tag
-            should_process = any(
-                re.search(f"{tag}(?:/)?>", self._buffer) for tag in self.valid_tags
-            ) or has_punctuation(self._buffer)
+            # Process buffer after punctuation or when we see the end of a tag
+            scan_from = max(0, self._scan_pos - self._scan_overlap)
+            should_process = self._trigger_pattern.search(self._buffer, scan_from)
+            self._scan_pos = len(self._buffer)
 
             if should_process:
-                sentences = await self._process_buffer()
+                sentences = await self._process_buffer(scan_from)
+                # Whatever is left was already scanned
+                self._scan_pos = len(self._buffer)
                 for sentence in sentences:
                     yield sentence
 
@@ -566,17 +703,15 @@ class SentenceDivider:
                 sentences, remaining = self._segment_text(self._buffer)
                 current_tags = self._get_current_tags()
 
-                for sentence in sentences:
-                    if sentence.strip():
-                        yield SentenceWithTags(
-                            text=sentence.strip(),
-                            tags=current_tags or [TagInfo("", TagState.NONE)],
-                        )
+                for sentence in self._wrap_sentences(sentences, current_tags):
+                    yield sentence
             if remaining.strip():
                 yield SentenceWithTags(
                     text=remaining.strip(),
                     tags=current_tags or [TagInfo("", TagState.NONE)],
                 )
+        self._buffer = ""
+        self._scan_pos = 0
 
     @property
     def complete_response(self) -> str:
@@ -587,10 +722,12 @@ class SentenceDivider:
         """Segment text using the configured method"""
         if self.segment_method == "regex":
             return segment_text_by_regex(text)
-        return segment_text_by_pysbd(text)
+        return self._segmenter.segment(text)
 
     def reset(self):
         """Reset the divider state for a new conversation"""
+        self._segmenter.reset()
         self._is_first_sentence = True
         self._buffer = ""
         self._tag_stack = []
+        self._scan_pos = 0
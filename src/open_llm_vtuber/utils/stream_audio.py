@@ -1,11 +1,16 @@
 import base64
-from pydub import AudioSegment
-from pydub.utils import make_chunks
+from typing import TYPE_CHECKING, List, Optional
+import numpy as np
 from ..agent.output_types import Actions
 from ..agent.output_types import DisplayText
 from loguru import logger
 
-def _get_volume_by_chunks(audio: AudioSegment, chunk_length_ms: int) -> list:
+# pydub is imported where audio is decoded, it looks for ffmpeg when imported
+if TYPE_CHECKING:
+    from pydub import AudioSegment
+
+
+def _get_volume_by_chunks(audio: "AudioSegment", chunk_length_ms: int) -> list:
     """
     Calculate the normalized volume (RMS) for each chunk of the audio.
 
@@ -16,6 +21,8 @@ def _get_volume_by_chunks(audio: AudioSegment, chunk_length_ms: int) -> list:
     Returns:
         list: Normalized volumes for each chunk.
     """
+    from pydub.utils import make_chunks
+
     chunks = make_chunks(audio, chunk_length_ms)
     volumes = [chunk.rms for chunk in chunks]
     max_volume = max(volumes)
@@ -60,6 +67,8 @@ def prepare_audio_payload(
             "forwarded": forwarded,
         }
 
+    from pydub import AudioSegment
+
     try:
         audio = AudioSegment.from_file(audio_path)
         audio_bytes = audio.export(format="wav").read()
@@ -84,5 +93,125 @@ def prepare_audio_payload(
     return payload
 
 
+def _find_split_chunks(
+    volumes: List[float], weights: List[float], search_chunks: int
+) -> List[int]:
+    """
+    Chunk indices where the audio of consecutive sentences is cut.
+
+    Each cut is first placed in proportion to the weights (the length of each
+    sentence's text), then moved to the quietest chunk nearby, which is
+    usually the pause between the two sentences.
+    """
+    total_chunks = len(volumes)
+    total_weight = sum(weights) or 1
+    cuts = []
+    previous = 0
+    cumulative = 0.0
+    for weight in weights[:-1]:
+        cumulative += weight
+        expected = round(total_chunks * cumulative / total_weight)
+        low = max(previous + 1, expected - search_chunks)
+        high = min(total_chunks - 1, expected + search_chunks)
+        if low > high:
+            cut = min(max(expected, previous), total_chunks)
+        else:
+            cut = min(
+                range(low, high + 1), key=lambda i: (volumes[i], abs(i - expected))
+            )
+        cuts.append(cut)
+        previous = cut
+    return cuts
+
+
+def split_samples_at_pauses(
+    samples: np.ndarray,
+    sample_rate: int,
+    weights: List[float],
+    chunk_length_ms: int = 20,
+    search_ms: int = 400,
+) -> List[np.ndarray]:
+    """
+    Cut raw samples holding several sentences into one array per sentence,
+    placing the cuts like `prepare_split_audio_payloads`.
+
+    Parameters:
+        samples (np.ndarray): Mono samples of all the sentences
+        sample_rate (int): Sample rate of the samples
+        weights (List[float]): Relative length of each sentence, usually its text length
+
+    Returns:
+        List[np.ndarray]: The samples of each sentence, in order
+    """
+    chunk_size = max(1, sample_rate * chunk_length_ms // 1000)
+    chunk_count = -(-len(samples) // chunk_size)
+    padded = np.zeros(chunk_count * chunk_size, dtype=np.float64)
+    padded[: len(samples)] = samples
+    volumes = np.sqrt(
+        np.mean(np.square(padded.reshape(chunk_count, chunk_size)), axis=1)
+    )
+    cuts = _find_split_chunks(volumes.tolist(), weights, search_ms // chunk_length_ms)
+    bounds = [0] + [cut * chunk_size for cut in cuts] + [len(samples)]
+    return [samples[bounds[i] : bounds[i + 1]] for i in range(len(weights))]
+
+
+def prepare_split_audio_payloads(
+    audio_path: str,
+    weights: List[float],
+    display_texts: List[DisplayText],
+    actions_list: List[Optional[Actions]],
+    chunk_length_ms: int = 20,
+    forwarded: bool = False,
+    search_ms: int = 400,
+) -> List[dict]:
+    """
+    Cut the audio of several sentences synthesized together into one payload
+    per sentence, so every sentence keeps its own display text and actions.
+
+    Parameters:
+        audio_path (str): The path to the audio file holding all the sentences
+        weights (List[float]): Relative length of each sentence, usually its text length
+        display_texts (List[DisplayText]): The display text of each sentence
+        actions_list (List[Actions]): The actions of each sentence
+        search_ms (int): How far from its proportional position a cut may move to find a pause
+
+    Returns:
+        List[dict]: One audio payload per sentence, in order
+    """
+    from pydub import AudioSegment
+
+    try:
+        audio = AudioSegment.from_file(audio_path)
+    except Exception as e:
+        raise ValueError(f"Error loading generated audio file '{audio_path}': {e}")
+    # 整段音频统一归一化，切分后各句的口型幅度保持一致
+    volumes = _get_volume_by_chunks(audio, chunk_length_ms)
+    cuts = _find_split_chunks(volumes, weights, search_ms // chunk_length_ms)
+    bounds = [0] + cuts + [len(volumes)]
+
+    payloads = []
+    for i, (display_text, actions) in enumerate(zip(display_texts, actions_list)):
+        start, end = bounds[i], bounds[i + 1]
+        if isinstance(display_text, DisplayText):
+            display_text = display_text.to_dict()
+        audio_base64 = None
+        if end > start:
+            segment = audio[start * chunk_length_ms : end * chunk_length_ms]
+            audio_bytes = segment.export(format="wav").read()
+            audio_base64 = base64.b64encode(audio_bytes).decode("utf-8")
+        payloads.append(
+            {
+                "type": "audio",
+                "audio": audio_base64,
+                "volumes": volumes[start:end],
+                "slice_length": chunk_length_ms,
+                "display_text": display_text,
+                "actions": actions.to_dict() if actions else None,
+                "forwarded": forwarded,
+            }
+        )
+    return payloads
+
+
 # Example usage:
 # payload, duration = prepare_audio_payload("path/to/audio.mp3", display_text="Hello", expression_list=[0,1,2])
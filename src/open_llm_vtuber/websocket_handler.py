@@ -1,4 +1,4 @@
-from typing import Dict, List, Optional, Callable, TypedDict
+from typing import Dict, List, Optional, Callable, TypedDict, Union
 from fastapi import WebSocket, WebSocketDisconnect
 import asyncio
 import json
@@ -8,6 +8,8 @@ from loguru import logger
 import os
 
 from .service_context import ServiceContext
+from .config_manager import TTSConfig
+from .engine_registry import engine_registry
 from .chat_group import (
     ChatGroupManager,
     handle_group_operation,
@@ -18,8 +20,11 @@ from .message_handler import message_handler
 from .utils.stream_audio import prepare_audio_payload
 from .chat_history_manager import (
     create_new_history,
-    get_history,
+    get_history_page,
     delete_history,
+    search_history,
+    DEFAULT_HISTORY_PAGE_SIZE,
+    DEFAULT_SEARCH_LIMIT,
     get_history_list,
 )
 from .config_manager.utils import scan_config_alts_directory, scan_bg_directory
@@ -37,6 +42,8 @@ class MessageType(Enum):
     HISTORY = [
         "fetch-history-list",
         "fetch-and-set-history",
+        "fetch-history-page",
+        "search-history",
         "create-new-history",
         "delete-history",
     ]
@@ -57,6 +64,9 @@ class WSMessage(TypedDict, total=False):
     audio: Optional[List[float]]
     images: Optional[List[str]]
     history_uid: Optional[str]
+    before: Optional[int]
+    limit: Optional[int]
+    query: Optional[str]
     file: Optional[str]
     display_text: Optional[dict]
 
@@ -73,6 +83,8 @@ class WebSocketHandler:
         self.current_conversation_tasks: Dict[str, Optional[asyncio.Task]] = {}
         self.default_context_cache = default_context_cache
         self.received_data_buffers: Dict[str, np.ndarray] = {}
+        # 每个客户端正在进行的TTS引擎切换
+        self.tts_swap_tasks: Dict[str, asyncio.Task] = {}
 
         # Message handlers mapping
         self._message_handlers = self._init_message_handlers()
@@ -85,6 +97,8 @@ class WebSocketHandler:
             "request-group-info": self._handle_group_info,
             "fetch-history-list": self._handle_history_list_request,
             "fetch-and-set-history": self._handle_fetch_history,
+            "fetch-history-page": self._handle_fetch_history_page,
+            "search-history": self._handle_search_history,
             "create-new-history": self._handle_create_history,
             "delete-history": self._handle_delete_history,
             "interrupt-signal": self._handle_interrupt,
@@ -197,6 +211,7 @@ class WebSocketHandler:
     async def _init_service_context(self) -> ServiceContext:
         """Initialize service context for a new session by cloning the default context"""
         session_service_context = ServiceContext()
+        default_agent = self.default_context_cache.agent_engine
         session_service_context.load_cache(
             config=self.default_context_cache.config.model_copy(deep=True),
             system_config=self.default_context_cache.system_config.model_copy(
@@ -209,9 +224,21 @@ class WebSocketHandler:
             asr_engine=self.default_context_cache.asr_engine,
             tts_engine=self.default_context_cache.tts_engine,
             vad_engine=self.default_context_cache.vad_engine,
-            agent_engine=self.default_context_cache.agent_engine,
+            # LLM and pipeline are shared, memory and conversation ids are per client
+            agent_engine=default_agent.create_session()
+            if default_agent.has_sessions()
+            else None,
             translate_engine=self.default_context_cache.translate_engine,
         )
+        session_service_context.share_engines(self.default_context_cache)
+        if session_service_context.agent_engine is None:
+            # The agent keeps its memory itself; this client gets its own
+            character_config = session_service_context.character_config
+            await asyncio.to_thread(
+                session_service_context.init_agent,
+                character_config.agent_config,
+                character_config.persona_prompt,
+            )
         return session_service_context
 
     async def handle_websocket_communication(
@@ -312,8 +339,13 @@ class WebSocketHandler:
 
         # Clean up other client data
         self.client_connections.pop(client_uid, None)
-        self.client_contexts.pop(client_uid, None)
+        context = self.client_contexts.pop(client_uid, None)
+        if context:
+            context.release_engines()
         self.received_data_buffers.pop(client_uid, None)
+        swap_task = self.tts_swap_tasks.pop(client_uid, None)
+        if swap_task and not swap_task.done():
+            swap_task.cancel()
         if client_uid in self.current_conversation_tasks:
             task = self.current_conversation_tasks[client_uid]
             if task and not task.done():
@@ -324,10 +356,13 @@ class WebSocketHandler:
         message_handler.cleanup_client(client_uid)
 
     async def broadcast_to_group(
-        self, group_members: list[str], message: dict, exclude_uid: str = None
-    ) -> None:
-        """Broadcasts a message to group members"""
-        await broadcast_to_group(
+        self,
+        group_members: list[str],
+        message: Union[dict, str],
+        exclude_uid: str = None,
+    ) -> Dict[str, Optional[float]]:
+        """Broadcasts a message to group members, returns the send latency per member"""
+        return await broadcast_to_group(
             group_members=group_members,
             message=message,
             client_connections=self.client_connections,
@@ -397,7 +432,12 @@ class WebSocketHandler:
     async def _handle_fetch_history(
         self, websocket: WebSocket, client_uid: str, data: dict
     ):
-        """Handle fetching and setting specific chat history"""
+        """Handle fetching and setting specific chat history
+
+        Only the latest page (`limit` messages, DEFAULT_HISTORY_PAGE_SIZE by
+        default) is sent, together with the `cursor` for fetching older pages
+        with `fetch-history-page`.
+        """
         history_uid = data.get("history_uid")
         if not history_uid:
             return
@@ -406,23 +446,83 @@ class WebSocketHandler:
         # Update history_uid in service context
         context.history_uid = history_uid
         user_id = self.client_user_ids[client_uid]
-        context.agent_engine.set_memory_from_history(
-            # conf_uid=context.character_config.conf_uid,
+        # 历史记录在线程中读取，不阻塞事件循环
+        await context.agent_engine.async_set_memory_from_history(
             user_id=user_id,
             history_uid=history_uid,
         )
 
-        messages = [
-            msg
-            for msg in get_history(
-                # context.character_config.conf_uid,
-                user_id,
-                history_uid,
+        limit = data.get("limit")
+        await self._send_history_page(
+            websocket,
+            "history-data",
+            user_id,
+            history_uid,
+            None,
+            limit if isinstance(limit, int) else DEFAULT_HISTORY_PAGE_SIZE,
+        )
+
+    async def _handle_fetch_history_page(
+        self, websocket: WebSocket, client_uid: str, data: WSMessage
+    ) -> None:
+        """Send the page of history messages before the given cursor"""
+        history_uid = data.get("history_uid")
+        if not history_uid:
+            return
+        before = data.get("before")
+        limit = data.get("limit")
+        await self._send_history_page(
+            websocket,
+            "history-page",
+            self.client_user_ids[client_uid],
+            history_uid,
+            before if isinstance(before, int) else None,
+            limit if isinstance(limit, int) else DEFAULT_HISTORY_PAGE_SIZE,
+        )
+
+    async def _send_history_page(
+        self,
+        websocket: WebSocket,
+        message_type: str,
+        user_id: str,
+        history_uid: str,
+        before: Optional[int],
+        limit: int,
+    ) -> None:
+        messages, cursor = await asyncio.to_thread(
+            get_history_page, user_id, history_uid, before, limit
+        )
+        await websocket.send_text(
+            json.dumps(
+                {
+                    "type": message_type,
+                    "history_uid": history_uid,
+                    "messages": [msg for msg in messages if msg["role"] != "system"],
+                    # Pass as `before` to fetch the older messages
+                    "cursor": cursor,
+                    "has_more": cursor is not None,
+                }
             )
-            if msg["role"] != "system"
-        ]
+        )
+
+    async def _handle_search_history(
+        self, websocket: WebSocket, client_uid: str, data: WSMessage
+    ) -> None:
+        """Search the messages of all histories of the user"""
+        query = data.get("query")
+        if not isinstance(query, str):
+            return
+        limit = data.get("limit")
+        results = await asyncio.to_thread(
+            search_history,
+            self.client_user_ids[client_uid],
+            query,
+            limit if isinstance(limit, int) else DEFAULT_SEARCH_LIMIT,
+        )
         await websocket.send_text(
-            json.dumps({"type": "history-data", "messages": messages})
+            json.dumps(
+                {"type": "history-search-results", "query": query, "results": results}
+            )
         )
 
     async def _handle_create_history(
@@ -718,50 +818,116 @@ class WebSocketHandler:
             }))
 
     async def _handle_update_tts_settings(self, websocket: WebSocket, client_uid: str, data: dict) -> None:
+        """
+        Switch the client to new TTS settings without blocking.
+
+        The engine is built and tested in the background while the current
+        one keeps serving; the client gets `tts-settings-progress` events,
+        then `tts-settings-updated` once the new engine is in use.
+        """
         try:
             context = self.client_contexts[client_uid]
             new_settings = data.get("settings", {})
-            
-            # 保存旧的TTS引擎以便出错时恢复
-            old_tts_config = context.character_config.tts_config
-            old_tts_engine = context.tts_engine
 
-            try:
-                # 更新TTS配置
-                tts_config = context.character_config.tts_config
-                tts_config.tts_model = new_settings["tts_model"]
-                logger.info(f"TTS model updated to: {tts_config.tts_model}")
-                
-                # 根据模型类型更新具体设置
-                model_config = getattr(tts_config, new_settings["tts_model"])
-                for key, value in new_settings.items():
-                    if hasattr(model_config, key):
-                        setattr(model_config, key, value)
-                
-                # 使用新的reinit_tts函数强制重新初始化TTS引擎
-                await context.reinit_tts(tts_config)
-                
-                # 测试新的TTS引擎
-                test_text = "TTS engine test"
-                await context.tts_engine.async_generate_audio(text=test_text)
-                
-                await websocket.send_text(json.dumps({
-                    "type": "tts-settings-updated",
-                    "success": True
-                }))
-                
-            except Exception as e:
-                # 如果初始化新的TTS引擎失败，恢复到旧的配置
-                context.character_config.tts_config = old_tts_config
-                context.tts_engine = old_tts_engine
-                raise e
+            # 在副本上修改，切换完成前当前配置保持不变
+            tts_config = context.character_config.tts_config.model_copy(deep=True)
+            tts_config.tts_model = new_settings["tts_model"]
 
+            # 根据模型类型更新具体设置
+            model_config = getattr(tts_config, new_settings["tts_model"])
+            if model_config is None:
+                raise ValueError(
+                    f"No configuration for TTS model {tts_config.tts_model}"
+                )
+            for key, value in new_settings.items():
+                if hasattr(model_config, key):
+                    setattr(model_config, key, value)
         except Exception as e:
             logger.error(f"Failed to update TTS settings: {e}")
             await websocket.send_text(json.dumps({
                 "type": "error",
                 "message": f"Failed to update TTS settings: {str(e)}"
             }))
+            return
+
+        # 新的请求取代尚未完成的切换
+        previous = self.tts_swap_tasks.get(client_uid)
+        if previous and not previous.done():
+            previous.cancel()
+        self.tts_swap_tasks[client_uid] = asyncio.create_task(
+            self._swap_tts_engine(websocket, client_uid, context, tts_config)
+        )
+
+    async def _swap_tts_engine(
+        self,
+        websocket: WebSocket,
+        client_uid: str,
+        context: ServiceContext,
+        tts_config: TTSConfig,
+    ) -> None:
+        """Build (or reuse) and test the engine, then switch the client's context to it"""
+        tts_model = tts_config.tts_model
+        try:
+            await self._send_tts_progress(websocket, "loading", tts_model)
+            # Engines other clients already use were tested when they were loaded
+            loaded = context.is_tts_engine_loaded(tts_config)
+            tts_engine = await context.build_tts_engine(tts_config)
+            swapped = False
+            try:
+                if not loaded:
+                    await self._send_tts_progress(websocket, "testing", tts_model)
+                    test_file = await tts_engine.async_generate_audio(
+                        text="TTS engine test"
+                    )
+                    if test_file:
+                        tts_engine.remove_file(test_file, verbose=False)
+
+                if self.client_contexts.get(client_uid) is not context:
+                    # The client disconnected or switched character meanwhile
+                    return
+                context.swap_tts_engine(tts_engine, tts_config)
+                swapped = True
+            finally:
+                if not swapped:
+                    engine_registry.release(tts_engine)
+            await websocket.send_text(
+                json.dumps({"type": "tts-settings-updated", "success": True})
+            )
+        except asyncio.CancelledError:
+            logger.info(f"TTS switch to {tts_model} for {client_uid} cancelled")
+            raise
+        except Exception as e:
+            logger.error(f"Failed to update TTS settings: {e}")
+            try:
+                await websocket.send_text(
+                    json.dumps(
+                        {
+                            "type": "error",
+                            "message": f"Failed to update TTS settings: {str(e)}",
+                        }
+                    )
+                )
+            except Exception:
+                pass
+        finally:
+            if self.tts_swap_tasks.get(client_uid) is asyncio.current_task():
+                self.tts_swap_tasks.pop(client_uid, None)
+
+    async def _send_tts_progress(
+        self, websocket: WebSocket, stage: str, tts_model: str
+    ) -> None:
+        try:
+            await websocket.send_text(
+                json.dumps(
+                    {
+                        "type": "tts-settings-progress",
+                        "stage": stage,
+                        "tts_model": tts_model,
+                    }
+                )
+            )
+        except Exception as e:
+            logger.debug(f"Failed to send TTS switch progress: {e}")
 
     async def _handle_feedback(
         self,
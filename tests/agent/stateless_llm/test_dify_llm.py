@@ -0,0 +1,92 @@
+import pytest
+
+from open_llm_vtuber.agent.stateless_llm.dify_llm import (
+    SOFT_SPLIT_THRESHOLD,
+    StreamingTextSplitter,
+)
+
+ANSWER = (
+    "说明如下：\n"
+    "```py\nx = 1。\n```\n"
+    "然后看表格。\n"
+    "| a | b |\n|---|---|\n| 1 | 2 |\n"
+    "结束了。a | b 还是正文。"
+)
+
+
+def split(text, size):
+    splitter = StreamingTextSplitter()
+    segments = []
+    for i in range(0, len(text), size):
+        segments.extend(splitter.feed(text[i : i + size]))
+    rest = splitter.flush()
+    return segments + [rest] if rest else segments
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, len(ANSWER)])
+def test_blocks_and_sentences_do_not_depend_on_chunks(size):
+    assert split(ANSWER, size) == [
+        "说明如下：\n",
+        "```py\nx = 1。\n```\n",
+        "然后看表格。",
+        "\n| a | b |\n|---|---|\n| 1 | 2 |\n",
+        "结束了。",
+        "a | b 还是正文。",
+    ]
+
+
+def test_every_complete_segment_of_a_chunk_is_returned():
+    splitter = StreamingTextSplitter()
+
+    assert splitter.feed("一。二！三？四") == ["一。", "二！", "三？"]
+    assert splitter.flush() == "四"
+
+
+def test_code_fence_at_the_start_is_one_block():
+    assert split("```\ncode。\n```\n后面。", 1) == ["```\ncode。\n```\n", "后面。"]
+
+
+def test_unclosed_code_fence_waits_for_the_end():
+    splitter = StreamingTextSplitter()
+
+    assert splitter.feed("```py\nprint('a。')\n") == []
+    assert splitter.feed("``") == []
+    assert splitter.feed("`") == []
+    assert splitter.feed("\n") == ["```py\nprint('a。')\n```\n"]
+
+
+def test_lines_without_primary_endings_end_at_newlines():
+    assert split("line one\nline two\nthree", 1) == [
+        "line one\n",
+        "line two\n",
+        "three",
+    ]
+
+
+def test_long_text_is_split_at_a_secondary_ending():
+    text = "这是一段很长的文字，" * 8
+
+    segments = split(text, 2)
+
+    assert "".join(segments) == text
+    assert len(segments) > 1
+    assert segments[0].endswith("，")
+    assert len(segments[0]) >= SOFT_SPLIT_THRESHOLD
+
+
+def test_long_english_text_is_split_at_a_space():
+    text = "word " * 30
+
+    segments = split(text, 3)
+
+    assert "".join(segments) == text
+    assert len(segments) > 1
+    assert segments[0].endswith(" ")
+
+
+def test_splitters_do_not_share_state():
+    first, second = StreamingTextSplitter(), StreamingTextSplitter()
+
+    first.feed("你好")
+    assert second.feed("再见。") == ["再见。"]
+    assert first.feed("。") == ["你好。"]
@@ -0,0 +1,222 @@
+import asyncio
+import threading
+
+import pytest
+
+from open_llm_vtuber import chat_history_manager
+from open_llm_vtuber.agent.input_types import BatchInput, TextData, TextSource
+from open_llm_vtuber.agent.agents.basic_memory_agent import BasicMemoryAgent
+from open_llm_vtuber.agent.stateless_llm.stateless_llm_interface import (
+    StatelessLLMInterface,
+)
+from open_llm_vtuber.config_manager.tts_preprocessor import (
+    TranslatorConfig,
+    TTSPreprocessorConfig,
+)
+
+
+class FakeLLM(StatelessLLMInterface):
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    async def chat_completion(self, messages, system=None, **kwargs):
+        self.requests.append((messages, system))
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        yield response
+
+
+def make_agent(llm=None, live2d_model=None, **kwargs):
+    return BasicMemoryAgent(
+        llm=llm or FakeLLM(),
+        system="You are a test.",
+        live2d_model=live2d_model,
+        tts_preprocessor_config=TTSPreprocessorConfig(
+            remove_special_char=False,
+            translator_config=TranslatorConfig(
+                translate_audio=False, translate_provider="deeplx"
+            ),
+        ),
+        **kwargs,
+    )
+
+
+def test_conversation_id_is_saved_to_the_loaded_history(history_storage):
+    history_uid = chat_history_manager.create_new_history("u1")
+    session = make_agent().create_session()
+    session.set_memory_from_history("u1", history_uid)
+
+    session.set_conversation_info(conversation_id="c1")
+
+    metadata = chat_history_manager.get_metadata("u1", history_uid)
+    assert metadata["conversation_id"] == "c1"
+
+    other = make_agent().create_session()
+    other.set_memory_from_history("u1", history_uid)
+    assert other.get_conversation_info()["conversation_id"] == "c1"
+
+
+class ErrorTextLLM(FakeLLM):
+    """Yields provider errors as text, like the OpenAI-compatible LLM"""
+
+    error_prefixes = ("Error calling the chat endpoint",)
+
+
+def summarize(agent, previous_summary="", messages=None):
+    messages = messages or [
+        {"role": "user", "content": "I like cats."},
+        {"role": "assistant", "content": "Cats are great!"},
+    ]
+    return asyncio.run(agent._summarize_context(previous_summary, messages))
+
+
+def test_summary_is_the_stripped_llm_reply():
+    llm = FakeLLM(" The user likes cats. ")
+
+    assert summarize(make_agent(llm)) == "The user likes cats."
+    assert "I like cats." in llm.requests[0][0][0]["content"]
+
+
+@pytest.mark.parametrize(
+    "reply", ["", "   ", "Error calling the chat endpoint: Connection error."]
+)
+def test_failed_summary_raises(reply):
+    with pytest.raises(RuntimeError):
+        summarize(make_agent(ErrorTextLLM(reply)), previous_summary="old")
+
+
+def test_summary_is_sent_in_the_system_prompt(live2d_model):
+    llm = FakeLLM("Hello!")
+    session = make_agent(llm, live2d_model).create_session()
+    session._context.set_summary("The user likes cats.")
+
+    async def chat():
+        return [
+            output
+            async for output in session.chat(
+                BatchInput(texts=[TextData(source=TextSource.INPUT, content="Hi")])
+            )
+        ]
+
+    asyncio.run(chat())
+
+    messages, system = llm.requests[0]
+    assert system.startswith("You are a test.")
+    assert system.endswith("Summary of the earlier conversation:\nThe user likes cats.")
+    assert all("cats" not in str(message["content"]) for message in messages)
+
+
+def chat(session, content):
+    async def collect():
+        return [
+            output
+            async for output in session.chat(
+                BatchInput(texts=[TextData(source=TextSource.INPUT, content=content)])
+            )
+        ]
+
+    return asyncio.run(collect())
+
+
+def sent_contents(llm, request):
+    messages, _ = llm.requests[request]
+    return [message["content"] for message in messages if message["role"] != "system"]
+
+
+def test_sessions_of_one_agent_keep_their_own_memory(live2d_model):
+    llm = FakeLLM("Hi Alice.", "Hi Bob.", "You are Alice.")
+    agent = make_agent(llm, live2d_model)
+    alice, bob = agent.create_session(), agent.create_session()
+
+    chat(alice, "I am Alice.")
+    chat(bob, "I am Bob.")
+    chat(alice, "Who am I?")
+
+    assert alice.agent is bob.agent is agent
+    assert sent_contents(llm, 1) == ["I am Bob."]
+    assert sent_contents(llm, 2) == ["I am Alice.", "Hi Alice.", "Who am I?"]
+
+
+def test_conversation_info_and_interrupts_are_per_session(live2d_model):
+    agent = make_agent(FakeLLM("Hello there."), live2d_model)
+    first, second = agent.create_session(), agent.create_session()
+
+    first.set_conversation_info(conversation_id="c1", user_id="u1")
+    chat(second, "Hi")
+    second.handle_interrupt("Hello")
+
+    assert second.get_conversation_info()["conversation_id"] is None
+    assert first.get_conversation_info() == {"conversation_id": "c1", "user_id": "u1"}
+    assert not first._interrupt_handled
+    assert second._context.last_message["content"] == "[Interrupted by user]"
+
+
+def test_agent_methods_go_to_the_default_session(live2d_model):
+    llm = FakeLLM("One.", "Two.")
+    agent = make_agent(llm, live2d_model)
+
+    chat(agent, "First")
+    chat(agent, "Second")
+
+    assert sent_contents(llm, 1) == ["First", "One.", "Second"]
+    assert agent.create_session()._context.to_messages() == []
+
+
+def test_rollback_removes_a_prefetched_turn(live2d_model):
+    llm = FakeLLM("Hello.", "Prefetched.", "Again.")
+    session = make_agent(llm, live2d_model).create_session()
+    chat(session, "Hi")
+
+    checkpoint = session.checkpoint_memory()
+    chat(session, "Unused")
+    session.rollback_memory(checkpoint)
+    chat(session, "Again")
+
+    assert sent_contents(llm, 2) == ["Hi", "Hello.", "Again"]
+
+
+def test_llms_keeping_the_conversation_are_not_checkpointed(live2d_model):
+    llm = FakeLLM()
+    llm.keeps_conversation = True
+
+    assert make_agent(llm, live2d_model).create_session().checkpoint_memory() is None
+
+
+def test_group_context_is_pinned_once_per_session():
+    session = make_agent().create_session()
+    tokens = session._context.total_tokens
+
+    for _ in range(50):
+        session.start_group_conversation("Human", ["Alice", "Bob"])
+
+    assert len(session._context.to_messages()) == 1
+    pinned_tokens = session._context.total_tokens - tokens
+    session.start_group_conversation("Human", ["Alice", "Bob"])
+    assert session._context.total_tokens - tokens == pinned_tokens
+
+
+def test_history_is_read_in_a_thread_and_loaded_on_the_loop(
+    history_storage, monkeypatch
+):
+    history_uid = chat_history_manager.create_new_history("u1")
+    chat_history_manager.store_message("u1", history_uid, "human", "hello")
+    chat_history_manager.store_message("u1", history_uid, "ai", "hi")
+    session = make_agent().create_session()
+    threads = []
+    read_history = session._read_history
+
+    def recording_read(*args):
+        threads.append(threading.current_thread())
+        return read_history(*args)
+
+    monkeypatch.setattr(session, "_read_history", recording_read)
+
+    asyncio.run(session.async_set_memory_from_history("u1", history_uid))
+
+    assert threads and threads[0] is not threading.main_thread()
+    assert [m["content"] for m in session._context.to_messages()[1:]] == [
+        "hello",
+        "hi",
+    ]
@@ -0,0 +1,193 @@
+import asyncio
+
+from open_llm_vtuber.agent.context_window import (
+    MESSAGE_OVERHEAD_TOKENS,
+    ContextWindow,
+    count_message_tokens,
+    estimate_tokens,
+)
+
+
+def user(content):
+    return {"role": "user", "content": content}
+
+
+def assistant(content):
+    return {"role": "assistant", "content": content}
+
+
+# 10 tokens per message
+def turn(i):
+    return [user(f"{i:02d}" + "x" * 22), assistant(f"{i:02d}" + "y" * 22)]
+
+
+def contents(window):
+    return [message["content"][:2] for message in window.to_messages()]
+
+
+class Summarizer:
+    """Joins the first two characters of each evicted message, or fails"""
+
+    def __init__(self):
+        self.calls = []
+        self.fail = False
+
+    async def __call__(self, summary, messages):
+        self.calls.append([m["content"][:2] for m in messages])
+        if self.fail:
+            raise ConnectionError("provider unavailable")
+        return " ".join(filter(None, [summary] + [m["content"][:2] for m in messages]))
+
+
+def test_token_estimates():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abcdefgh") == 2
+    assert estimate_tokens("abcde") == 2
+    assert estimate_tokens("你好世界") == 4
+    assert (
+        count_message_tokens(
+            {
+                "role": "user",
+                "content": [{"type": "text", "text": "你好"}, {"type": "image_url"}],
+            }
+        )
+        == 2 + MESSAGE_OVERHEAD_TOKENS
+    )
+
+
+def test_eviction_keeps_whole_turns_within_the_budget():
+    window = ContextWindow(token_budget=60, min_recent_messages=2)
+    window.pin({"role": "system", "content": "pinned"})
+    for i in range(5):
+        for message in turn(i):
+            window.append(message)
+
+    assert window.total_tokens <= 60
+    assert window.to_messages()[0]["content"] == "pinned"
+    # 66 tokens: evicted whole turns down to the low watermark (45)
+    assert contents(window)[1:] == ["04", "04"]
+
+
+def test_latest_messages_are_kept_even_over_budget():
+    window = ContextWindow(token_budget=5, min_recent_messages=2)
+    for message in turn(0):
+        window.append(message)
+
+    assert len(window) == 2
+
+
+def test_evicted_turns_are_summarized_into_the_system_prompt():
+    async def run():
+        summarizer = Summarizer()
+        saved = []
+        window = ContextWindow(
+            token_budget=50,
+            summarizer=summarizer,
+            min_recent_messages=2,
+            on_summary=saved.append,
+        )
+        for i in range(4):
+            for message in turn(i):
+                window.append(message)
+            await window.wait_for_summary()
+        return window, summarizer, saved
+
+    window, summarizer, saved = asyncio.run(run())
+
+    assert window.summary == saved[-1]
+    assert window.summary.split() == [c for call in summarizer.calls for c in call]
+    assert all(m["role"] != "system" for m in window.to_messages())
+    assert window.system_prompt("Be nice.") == (
+        f"Be nice.\n\nSummary of the earlier conversation:\n{window.summary}"
+    )
+    assert ContextWindow().system_prompt("Be nice.") == "Be nice."
+
+
+def test_failed_summaries_keep_the_old_summary_and_are_retried():
+    async def run():
+        summarizer = Summarizer()
+        window = ContextWindow(
+            token_budget=50, summarizer=summarizer, min_recent_messages=2
+        )
+        window.set_summary("old")
+        summarizer.fail = True
+        for i in range(4):
+            for message in turn(i):
+                window.append(message)
+            await window.wait_for_summary()
+        failed_summary = window.summary
+
+        summarizer.fail = False
+        for message in turn(4):
+            window.append(message)
+        await window.wait_for_summary()
+        return window, summarizer, failed_summary
+
+    window, summarizer, failed_summary = asyncio.run(run())
+
+    assert failed_summary == "old"
+    # Every evicted message made it into the summary once, in order
+    assert window.summary.split() == ["old", "00", "00", "01", "01", "02", "02"]
+    assert summarizer.calls[-1][:2] == ["00", "00"]
+
+
+def test_empty_summary_counts_as_a_failure():
+    async def empty(summary, messages):
+        return "  "
+
+    async def run():
+        window = ContextWindow(token_budget=30, summarizer=empty, min_recent_messages=2)
+        window.set_summary("old")
+        for i in range(3):
+            for message in turn(i):
+                window.append(message)
+        await window.wait_for_summary()
+        return window
+
+    window = asyncio.run(run())
+
+    assert window.summary == "old"
+    assert window._pending_eviction
+
+
+def test_rollback_removes_the_messages_since_the_checkpoint():
+    window = ContextWindow()
+    window.append(user("00"))
+    checkpoint = window.checkpoint()
+    window.append(assistant("01"))
+    window.append(user("02"))
+
+    window.rollback(checkpoint)
+
+    assert contents(window) == ["00"]
+    assert window.total_tokens == count_message_tokens(user("00"))
+
+
+def test_load_keeps_the_latest_messages_that_fit():
+    window = ContextWindow(token_budget=35, min_recent_messages=2)
+    window.load([m for i in range(5) for m in turn(i)])
+
+    # Three messages fit; the window doesn't start with an AI reply
+    assert contents(window) == ["04", "04"]
+
+
+def test_update_last_recounts_tokens():
+    window = ContextWindow()
+    window.append(assistant("short"))
+
+    window.update_last("a much longer reply than before")
+
+    assert window.last_message["content"] == "a much longer reply than before"
+    assert window.total_tokens == count_message_tokens(window.last_message)
+
+
+def test_pinning_a_key_again_replaces_the_message():
+    window = ContextWindow()
+    window.pin(user("persona"))
+    window.pin(user("group a"), key="group")
+    window.pin(user("group bb"), key="group")
+
+    assert [m["content"] for m in window.to_messages()] == ["persona", "group bb"]
+    assert window.total_tokens == count_message_tokens(
+        user("persona")
+    ) + count_message_tokens(user("group bb"))
@@ -0,0 +1,60 @@
+import asyncio
+import os
+import time
+
+import numpy as np
+import pytest
+
+from open_llm_vtuber.asr.asr_interface import ASRInterface
+from open_llm_vtuber.asr.forked_asr import ForkedASREngine
+from open_llm_vtuber.utils.forked_worker import fork_available
+
+pytestmark = pytest.mark.skipif(not fork_available(), reason="needs fork")
+
+
+class PidASR(ASRInterface):
+    """Transcribes to the sample count and the pid of the process that ran it"""
+
+    SAMPLE_RATE = 8000
+
+    def transcribe_np(self, audio):
+        time.sleep(0.1)
+        return f"{len(audio)}-{os.getpid()}"
+
+
+@pytest.fixture
+def asr():
+    asr = ForkedASREngine(PidASR(), worker_processes=2)
+    yield asr
+    asr.close()
+
+
+def test_transcription_runs_in_the_workers(asr):
+    pids = {str(worker.pid) for worker in asr._workers}
+
+    text = asr.transcribe_np(np.zeros(160, dtype=np.float32))
+
+    assert asr.SAMPLE_RATE == 8000
+    assert text.split("-")[0] == "160"
+    assert text.split("-")[1] in pids
+    assert str(os.getpid()) not in pids
+
+
+def test_concurrent_calls_go_to_the_least_busy_worker(asr):
+    async def transcribe():
+        return await asyncio.gather(
+            *(asr.async_transcribe_np(np.zeros(i, dtype=np.float32)) for i in range(4))
+        )
+
+    texts = asyncio.run(transcribe())
+
+    assert [text.split("-")[0] for text in texts] == ["0", "1", "2", "3"]
+    assert {text.split("-")[1] for text in texts} == {
+        str(worker.pid) for worker in asr._workers
+    }
+    assert asr._in_flight == [0, 0]
+
+
+def test_at_least_one_worker_is_needed():
+    with pytest.raises(ValueError):
+        ForkedASREngine(PidASR(), worker_processes=0)
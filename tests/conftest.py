@@ -0,0 +1,62 @@
+import json
+
+import pytest
+
+from open_llm_vtuber import chat_history_manager, service_context, websocket_handler
+from open_llm_vtuber.config_manager.system import (
+    ChatHistoryConfig,
+    EngineRegistryConfig,
+)
+from open_llm_vtuber.engine_registry import EngineRegistry
+from open_llm_vtuber.live2d_model import Live2dModel
+
+
+@pytest.fixture
+def history_storage(request, tmp_path):
+    """
+    The chat history storage, in a temporary directory. Parametrize indirectly
+    with "sqlite" for the SQLite backend.
+    """
+    chat_history_manager.configure_history_storage(
+        ChatHistoryConfig(
+            storage=getattr(request, "param", "jsonl"),
+            jsonl_dir=str(tmp_path / "users"),
+            sqlite_path=str(tmp_path / "chat_history.db"),
+            archive_dir=str(tmp_path / "archive"),
+            transcripts_dir=str(tmp_path / "transcripts"),
+            search_index_path=str(tmp_path / "search_index.db"),
+            durability="none",
+        )
+    )
+    yield chat_history_manager.get_history_storage()
+    chat_history_manager.close_history_storage()
+
+
+@pytest.fixture
+def make_live2d_model(tmp_path):
+    """Builds a Live2D model from an emotion map"""
+
+    def make(emotion_map):
+        model_dict_path = tmp_path / "model_dict.json"
+        model_dict_path.write_text(
+            json.dumps([{"name": "test", "emotionMap": emotion_map}])
+        )
+        return Live2dModel("test", model_dict_path=str(model_dict_path))
+
+    return make
+
+
+@pytest.fixture
+def live2d_model(make_live2d_model):
+    """A Live2D model with the expressions joy (3) and sadness (1)"""
+    return make_live2d_model({"joy": 3, "Sadness": 1})
+
+
+@pytest.fixture
+def engine_registry(monkeypatch):
+    """A fresh engine registry in place of the process-wide one; unused engines are unloaded at once"""
+    registry = EngineRegistry(EngineRegistryConfig(idle_ttl=0))
+    monkeypatch.setattr(service_context, "engine_registry", registry)
+    monkeypatch.setattr(websocket_handler, "engine_registry", registry)
+    yield registry
+    registry.close()
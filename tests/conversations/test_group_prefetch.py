@@ -0,0 +1,157 @@
+import asyncio
+from types import SimpleNamespace
+
+from open_llm_vtuber.conversations import group_conversation
+from open_llm_vtuber.conversations.types import GroupConversationState
+
+
+class FakeAgent:
+    """Yields its outputs one by one and records checkpoints and rollbacks"""
+
+    def __init__(self, *outputs, checkpoint=0):
+        self.outputs = list(outputs)
+        self.checkpoint = checkpoint
+        self.inputs = []
+        self.rollbacks = []
+        self.release = asyncio.Event()
+        self.release.set()
+
+    def checkpoint_memory(self):
+        return self.checkpoint
+
+    def rollback_memory(self, checkpoint):
+        self.rollbacks.append(checkpoint)
+
+    async def chat(self, batch_input):
+        self.inputs.append(batch_input.texts[0].content)
+        await self.release.wait()
+        for output in self.outputs:
+            if isinstance(output, Exception):
+                raise output
+            yield output
+
+
+def make_state(agent, history=("Human: hi", "alice: hello")):
+    state = GroupConversationState(
+        group_id="test-group",
+        conversation_history=list(history),
+        memory_index={"bob": 1},
+        group_queue=["bob"],
+    )
+    contexts = {"bob": SimpleNamespace(agent_engine=agent)}
+    return state, contexts
+
+
+def run(coro):
+    try:
+        return asyncio.run(coro)
+    finally:
+        GroupConversationState.remove_state("test-group")
+
+
+async def collect(outputs):
+    return [output async for output in outputs]
+
+
+def test_matching_prefetch_is_replayed_without_a_new_request():
+    async def scenario():
+        agent = FakeAgent("one", "two", checkpoint=7)
+        state, contexts = make_state(agent)
+        group_conversation.start_prefetched_response(
+            state, contexts, None, "alice: hello again"
+        )
+
+        prefetch = group_conversation.take_prefetched_response(
+            state, contexts, "bob", "alice: hello\nalice: hello again"
+        )
+        outputs = await collect(
+            group_conversation._replay_prefetched_response(prefetch, agent, None)
+        )
+        return agent, state, outputs
+
+    agent, state, outputs = run(scenario())
+
+    assert outputs == ["one", "two"]
+    assert agent.inputs == ["alice: hello\nalice: hello again"]
+    assert agent.rollbacks == []
+    assert state.prefetch is None
+
+
+def test_prefetch_for_another_context_is_cancelled_and_rolled_back():
+    async def scenario():
+        agent = FakeAgent("stale", checkpoint=7)
+        agent.release.clear()
+        state, contexts = make_state(agent)
+        group_conversation.start_prefetched_response(state, contexts, None, "")
+        task = state.prefetch.task
+        await asyncio.sleep(0)
+
+        taken = group_conversation.take_prefetched_response(
+            state, contexts, "bob", "alice: something else"
+        )
+        await asyncio.gather(task, return_exceptions=True)
+        return agent, state, taken, task
+
+    agent, state, taken, task = run(scenario())
+
+    assert taken is None
+    assert task.cancelled()
+    assert agent.rollbacks == [7]
+    assert state.prefetch is None
+
+
+def test_interrupt_discards_the_prefetch():
+    async def scenario():
+        agent = FakeAgent("one", checkpoint=3)
+        agent.release.clear()
+        state, contexts = make_state(agent)
+        group_conversation.start_prefetched_response(state, contexts, None, "")
+        task = state.prefetch.task
+
+        group_conversation.discard_prefetched_response(state, contexts)
+        group_conversation.discard_prefetched_response(state, contexts)
+        await asyncio.gather(task, return_exceptions=True)
+        return agent, task
+
+    agent, task = run(scenario())
+
+    assert task.cancelled()
+    assert agent.rollbacks == [3]
+
+
+def test_agents_that_cannot_roll_back_are_not_prefetched():
+    async def scenario():
+        agent = FakeAgent("one", checkpoint=None)
+        state, contexts = make_state(agent)
+        group_conversation.start_prefetched_response(state, contexts, None, "")
+        return agent, state
+
+    agent, state = run(scenario())
+
+    assert state.prefetch is None
+    assert agent.inputs == []
+
+
+def test_prefetch_failing_before_its_first_output_is_generated_again():
+    async def scenario():
+        agent = FakeAgent(ConnectionError("provider unavailable"), checkpoint=5)
+        state, contexts = make_state(agent)
+        group_conversation.start_prefetched_response(state, contexts, None, "")
+        prefetch = group_conversation.take_prefetched_response(
+            state, contexts, "bob", "alice: hello"
+        )
+        await prefetch.task
+        agent.outputs = ["retried"]
+        batch_input = group_conversation.create_batch_input(
+            input_text="alice: hello", images=None, from_name="Human"
+        )
+        outputs = await collect(
+            group_conversation._replay_prefetched_response(prefetch, agent, batch_input)
+        )
+        return agent, outputs
+
+    agent, outputs = run(scenario())
+
+    assert outputs == ["retried"]
+    assert agent.rollbacks == [5]
+    assert agent.inputs == ["alice: hello", "alice: hello"]
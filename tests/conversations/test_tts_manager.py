@@ -0,0 +1,169 @@
+import asyncio
+import base64
+import io
+import json
+import math
+import struct
+import wave
+
+import pytest
+
+from open_llm_vtuber.agent.output_types import DisplayText
+from open_llm_vtuber.conversations.tts_manager import TTSTaskManager
+from open_llm_vtuber.tts.tts_interface import TTSInterface
+
+RATE = 16000
+MS_PER_CHAR = 20
+PAUSE_MS = 100
+
+
+class ToneEngine(TTSInterface):
+    """Writes a tone per sentence followed by a pause; `gate` holds the first request"""
+
+    def __init__(self, cache_dir, fail=False):
+        self.cache_dir = cache_dir
+        self.fail = fail
+        self.requests = []
+        self.gate = asyncio.Event()
+        self.gate.set()
+
+    def generate_audio(self, text, file_name_no_ext=None):
+        raise NotImplementedError
+
+    async def async_generate_audio(self, text, file_name_no_ext=None):
+        self.requests.append(text)
+        if len(self.requests) == 1:
+            await self.gate.wait()
+        if self.fail:
+            raise ConnectionError("engine unavailable")
+        frames = bytearray()
+        for sentence in text.split("|"):
+            tone = RATE * MS_PER_CHAR * len(sentence) // 1000
+            frames += b"".join(
+                struct.pack("<h", int(8000 * math.sin(2 * math.pi * 220 * i / RATE)))
+                for i in range(tone)
+            )
+            frames += b"\0\0" * (RATE * PAUSE_MS // 1000)
+        path = str(self.cache_dir / f"{file_name_no_ext}.wav")
+        with wave.open(path, "wb") as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(RATE)
+            f.writeframes(bytes(frames))
+        return path
+
+
+def audio_ms(payload):
+    with wave.open(io.BytesIO(base64.b64decode(payload["audio"]))) as f:
+        return f.getnframes() * 1000 / f.getframerate()
+
+
+async def speak_all(manager, engine, sentences):
+    sent = []
+
+    async def websocket_send(text):
+        sent.append(json.loads(text))
+
+    for sentence in sentences:
+        await manager.speak(
+            tts_text=sentence,
+            display_text=DisplayText(text=sentence),
+            actions=None,
+            live2d_model=None,
+            tts_engine=engine,
+            websocket_send=websocket_send,
+        )
+    manager.flush()
+    engine.gate.set()
+    await asyncio.gather(*manager.task_list)
+    while len(sent) < len(sentences):
+        await asyncio.sleep(0.01)
+    manager.clear()
+    return sent
+
+
+# Sentences end with "|" so the engine gives each its own tone and pause
+SENTENCES = ["Hi!|", "Sure.|", "Okay then.|", "Yes.|"]
+
+
+def test_sentences_are_not_merged_by_default(tmp_path):
+    engine = ToneEngine(tmp_path)
+
+    sent = asyncio.run(speak_all(TTSTaskManager(), engine, SENTENCES))
+
+    assert engine.requests == SENTENCES
+    assert [payload["display_text"]["text"] for payload in sent] == SENTENCES
+
+
+def test_sentences_behind_unsent_audio_are_merged(tmp_path):
+    engine = ToneEngine(tmp_path)
+    engine.gate.clear()
+    manager = TTSTaskManager(coalesce_max_chars=40, coalesce_max_wait=5)
+
+    sent = asyncio.run(speak_all(manager, engine, SENTENCES))
+
+    # The first sentence is never held back
+    assert engine.requests == ["Hi!|", "Sure.| Okay then.| Yes.|"]
+    assert [payload["display_text"]["text"] for payload in sent] == SENTENCES
+    # The merged audio is cut into one slice per sentence, with nothing lost.
+    # Cuts are placed by text length, so they can land a sentence off.
+    merged_ms = MS_PER_CHAR * len("Sure.| Okay then.| Yes.|".replace("|", "")) + (
+        4 * PAUSE_MS
+    )
+    assert all(audio_ms(payload) > 0 for payload in sent)
+    assert sum(audio_ms(payload) for payload in sent[1:]) == pytest.approx(
+        merged_ms, abs=20
+    )
+
+
+def test_long_and_silent_sentences_are_not_merged(tmp_path):
+    engine = ToneEngine(tmp_path)
+    engine.gate.clear()
+    manager = TTSTaskManager(coalesce_max_chars=12, coalesce_max_wait=5)
+    sentences = ["Hi!|", "A rather long one.|", "Yes.|", "...", "No.|", "Ok.|"]
+
+    sent = asyncio.run(speak_all(manager, engine, sentences))
+
+    assert engine.requests == [
+        "Hi!|",
+        "A rather long one.|",
+        "Yes.|",
+        "No.| Ok.|",
+    ]
+    assert [payload["display_text"]["text"] for payload in sent] == sentences
+    assert sent[3]["audio"] is None
+
+
+def test_merged_call_waits_at_most_coalesce_max_wait(tmp_path):
+    async def scenario():
+        engine = ToneEngine(tmp_path)
+        engine.gate.clear()
+        manager = TTSTaskManager(coalesce_max_chars=40, coalesce_max_wait=0.05)
+        for sentence in SENTENCES[:2]:
+            await manager.speak(
+                sentence, DisplayText(text=sentence), None, None, engine, _ignore
+            )
+        await asyncio.sleep(0.2)
+        requests = list(engine.requests)
+        engine.gate.set()
+        await asyncio.gather(*manager.task_list)
+        manager.clear()
+        return requests
+
+    assert asyncio.run(scenario()) == SENTENCES[:2]
+
+
+async def _ignore(text):
+    pass
+
+
+def test_failed_merged_call_sends_every_sentence_without_audio(tmp_path):
+    engine = ToneEngine(tmp_path, fail=True)
+    engine.gate.clear()
+    manager = TTSTaskManager(coalesce_max_chars=40, coalesce_max_wait=5)
+
+    sent = asyncio.run(speak_all(manager, engine, SENTENCES))
+
+    assert len(engine.requests) == 2
+    assert [payload["display_text"]["text"] for payload in sent] == SENTENCES
+    assert all(payload["audio"] is None for payload in sent)
@@ -0,0 +1,6 @@
+"""Helpers shared by the test modules"""
+
+
+def contents(messages):
+    """The content of each message, to compare histories in one assert"""
+    return [message["content"] for message in messages]
@@ -0,0 +1,200 @@
+import os
+
+import pytest
+
+from open_llm_vtuber.history_storage import history_archive
+from open_llm_vtuber.history_storage.archiving_history_storage import (
+    ArchivingHistoryStorage,
+)
+from open_llm_vtuber.history_storage.history_archive import HistoryArchive
+from open_llm_vtuber.history_storage.jsonl_history_storage import JsonlHistoryStorage
+from tests.helpers import contents
+
+USER = "user"
+OLD = "2020-01-01T00:00:00"
+RECENT = "2999-01-01T00:00:00"
+
+
+def _message(content, role="human", timestamp=OLD):
+    return {"role": role, "content": content, "timestamp": timestamp}
+
+
+@pytest.fixture
+def archive(tmp_path):
+    return HistoryArchive(str(tmp_path / "archive"))
+
+
+@pytest.fixture
+def backend(tmp_path):
+    return JsonlHistoryStorage(str(tmp_path / "users"))
+
+
+@pytest.fixture
+def storage(backend, archive):
+    # Archived by the tests, not by the background thread
+    storage = ArchivingHistoryStorage(backend, archive, archive_after_days=0)
+    yield storage
+    storage.close()
+
+
+def _store(backend, history_uid, *messages, metadata=None):
+    backend.create_history(USER, history_uid, metadata or {"role": "metadata"})
+    backend.append_messages(USER, history_uid, list(messages))
+
+
+def test_archive_round_trip_and_segment_cleanup(archive, tmp_path):
+    archive.add(USER, "h1", {"title": "one"}, [_message("a"), _message("b")])
+    archive.add(USER, "h2", {"title": "two"}, [_message("c")])
+
+    assert archive.read(USER, "h1") == {
+        "metadata": {"title": "one"},
+        "messages": [_message("a"), _message("b")],
+    }
+    entry = archive.get_entry(USER, "h2")
+    assert entry["message_count"] == 1
+    assert entry["latest_message"]["content"] == "c"
+
+    # The index is reloaded from disk by a new instance
+    reopened = HistoryArchive(str(tmp_path / "archive"))
+    assert contents(reopened.read(USER, "h2")["messages"]) == ["c"]
+
+    assert archive.remove(USER, "h1")
+    assert archive.remove(USER, "h2")
+    assert not archive.remove(USER, "h2")
+    assert os.listdir(tmp_path / "archive" / USER) == ["index.json"]
+
+
+def test_full_segments_start_a_new_one(archive, tmp_path, monkeypatch):
+    monkeypatch.setattr(history_archive, "SEGMENT_MAX_BYTES", 64)
+    for i in range(3):
+        archive.add(USER, f"h{i}", {}, [_message(os.urandom(32).hex())])
+
+    segments = {archive.get_entry(USER, f"h{i}")["segment"] for i in range(3)}
+    assert len(segments) == 3
+    for i in range(3):
+        assert len(archive.read(USER, f"h{i}")["messages"]) == 1
+
+
+def test_idle_histories_are_archived_and_stay_readable(storage, backend, archive):
+    _store(backend, "old", _message("a"), _message("b", "ai"), metadata={"t": 1})
+    _store(backend, "recent", _message("c", timestamp=RECENT))
+    storage.archive_after_days = 30
+
+    assert storage.archive_idle_histories() == 1
+    assert backend.get_messages(USER, "old") is None
+    assert archive.get_entry(USER, "recent") is None
+
+    assert contents(storage.get_messages(USER, "old")) == ["a", "b"]
+    assert storage.count_messages(USER, "old") == 2
+    assert contents(storage.get_message_range(USER, "old", 1, 2)) == ["b"]
+    assert storage.get_metadata(USER, "old")["t"] == 1
+    assert [h["uid"] for h in storage.list_histories(USER)] == ["recent", "old"]
+    assert storage.list_history_ids() == [(USER, "old"), (USER, "recent")]
+
+
+def test_history_with_a_newer_message_than_the_cutoff_is_kept(storage, backend):
+    _store(backend, "h1", _message("a", timestamp=RECENT))
+
+    assert not storage.archive_history(USER, "h1", cutoff=OLD)
+    assert contents(backend.get_messages(USER, "h1")) == ["a"]
+
+
+@pytest.mark.parametrize(
+    "write",
+    [
+        lambda s: s.append_message(USER, "h1", _message("c")),
+        lambda s: s.modify_latest_message(USER, "h1", "ai", "b!"),
+        lambda s: s.update_metadata(USER, "h1", {"title": "new"}),
+    ],
+)
+def test_writes_move_the_history_back_into_the_backend(
+    storage, backend, archive, write
+):
+    _store(backend, "h1", _message("a"), _message("b", "ai"), metadata={"t": 1})
+    assert storage.archive_history(USER, "h1")
+
+    write(storage)
+
+    assert archive.get_entry(USER, "h1") is None
+    assert contents(backend.get_messages(USER, "h1"))[:1] == ["a"]
+    assert backend.get_metadata(USER, "h1")["t"] == 1
+
+
+def test_rename_and_delete_of_archived_histories(storage, backend, archive):
+    _store(backend, "h1", _message("a"))
+    storage.archive_history(USER, "h1")
+
+    assert storage.rename_history(USER, "h1", "renamed")
+    assert contents(storage.get_messages(USER, "renamed")) == ["a"]
+    assert storage.get_messages(USER, "h1") is None
+
+    assert storage.delete_history(USER, "renamed")
+    assert storage.list_histories(USER) == []
+
+
+def test_sweep_writes_the_index_once_per_batch(storage, backend, archive, monkeypatch):
+    for i in range(5):
+        _store(backend, f"h{i}", _message(str(i)))
+    saves = []
+    save_index = archive._save_index
+    monkeypatch.setattr(
+        archive, "_save_index", lambda user_id: saves.append(save_index(user_id))
+    )
+    storage.archive_after_days = 30
+
+    assert storage.archive_idle_histories() == 5
+    assert len(saves) == 1
+    reopened = HistoryArchive(archive.root)
+    assert sorted(reopened.list_entries(USER)) == [f"h{i}" for i in range(5)]
+
+
+def test_index_is_on_disk_before_the_originals_are_deleted(
+    storage, backend, archive, monkeypatch
+):
+    _store(backend, "h1", _message("a"))
+    events = []
+    fsync = os.fsync
+
+    def recording_fsync(fd):
+        events.append(("fsync", os.fstat(fd).st_ino))
+        fsync(fd)
+
+    delete_history = backend.delete_history
+
+    def recording_delete(*args):
+        events.append(("delete", args[1]))
+        return delete_history(*args)
+
+    monkeypatch.setattr(history_archive.os, "fsync", recording_fsync)
+    monkeypatch.setattr(backend, "delete_history", recording_delete)
+
+    assert storage.archive_history(USER, "h1")
+
+    user_dir = os.path.join(archive.root, USER)
+    synced = events[: events.index(("delete", "h1"))]
+    assert ("fsync", os.stat(os.path.join(user_dir, "index.json")).st_ino) in synced
+    assert ("fsync", os.stat(user_dir).st_ino) in synced
+
+
+def test_mostly_dead_segments_are_compacted(archive, tmp_path, monkeypatch):
+    monkeypatch.setattr(history_archive, "COMPACT_MIN_DEAD_BYTES", 0)
+    # The two histories removed below are the larger ones
+    for i, size in enumerate([256, 256, 32, 32]):
+        archive.add(USER, f"h{i}", {}, [_message(os.urandom(size).hex())])
+    user_dir = tmp_path / "archive" / USER
+    (old_segment,) = [name for name in os.listdir(user_dir) if name != "index.json"]
+
+    # Less than half dead: kept as it is
+    archive.remove(USER, "h0")
+    assert archive.get_entry(USER, "h3")["segment"] == old_segment
+
+    archive.remove(USER, "h1")
+    segment = archive.get_entry(USER, "h3")["segment"]
+    assert segment != old_segment
+    assert sorted(os.listdir(user_dir)) == ["index.json", segment]
+    live = [archive.get_entry(USER, f"h{i}")["length"] for i in (2, 3)]
+    assert os.path.getsize(user_dir / segment) == sum(live)
+
+    reopened = HistoryArchive(str(tmp_path / "archive"))
+    for i in (2, 3):
+        assert len(reopened.read(USER, f"h{i}")["messages"]) == 1
@@ -0,0 +1,131 @@
+import pytest
+
+from open_llm_vtuber.history_storage import write_behind_history_storage
+from open_llm_vtuber.history_storage.jsonl_history_storage import JsonlHistoryStorage
+from open_llm_vtuber.history_storage.write_behind_history_storage import (
+    WriteBehindHistoryStorage,
+)
+
+USER = "user"
+HISTORY = "history"
+
+
+class CountingStorage(JsonlHistoryStorage):
+    """Counts the metadata reads and writes reaching the backend"""
+
+    def __init__(self, root):
+        super().__init__(root)
+        self.reads = 0
+        self.writes = []
+
+    def get_metadata(self, user_id, history_uid):
+        self.reads += 1
+        return super().get_metadata(user_id, history_uid)
+
+    def update_metadata(self, user_id, history_uid, metadata):
+        self.writes.append((history_uid, dict(metadata)))
+        return super().update_metadata(user_id, history_uid, metadata)
+
+
+@pytest.fixture
+def backend(tmp_path):
+    backend = CountingStorage(str(tmp_path))
+    backend.create_history(USER, HISTORY, {"role": "metadata", "title": "t"})
+    return backend
+
+
+@pytest.fixture
+def storage(backend):
+    # Flushed by the tests, not on a timer
+    storage = WriteBehindHistoryStorage(backend, flush_interval=3600)
+    yield storage
+    storage.close()
+
+
+def test_metadata_is_read_from_the_backend_once(storage, backend):
+    for _ in range(3):
+        assert storage.get_metadata(USER, HISTORY)["title"] == "t"
+
+    assert backend.reads == 1
+
+
+def test_returned_metadata_is_a_copy(storage):
+    storage.get_metadata(USER, HISTORY)["title"] = "changed"
+
+    assert storage.get_metadata(USER, HISTORY)["title"] == "t"
+
+
+def test_updates_are_written_lazily_and_only_when_changed(storage, backend):
+    assert storage.update_metadata(USER, HISTORY, {"title": "t"})
+    storage.flush()
+    assert backend.writes == []
+
+    assert storage.update_metadata(USER, HISTORY, {"conversation_id": "c1"})
+    assert storage.update_metadata(USER, HISTORY, {"conversation_id": "c2"})
+    assert storage.get_metadata(USER, HISTORY)["conversation_id"] == "c2"
+    assert backend.writes == []
+
+    storage.flush()
+    assert len(backend.writes) == 1
+    assert backend.get_metadata(USER, HISTORY)["conversation_id"] == "c2"
+    storage.flush()
+    assert len(backend.writes) == 1
+
+
+def test_close_writes_changed_metadata(storage, backend):
+    storage.update_metadata(USER, HISTORY, {"summary": "s"})
+    storage.close()
+
+    assert backend.get_metadata(USER, HISTORY)["summary"] == "s"
+
+
+def test_missing_history_is_not_created(storage, backend):
+    assert not storage.update_metadata(USER, "missing", {"title": "x"})
+    storage.flush()
+    assert backend.writes == []
+
+
+def test_history_without_metadata_gets_it_on_write(storage, backend):
+    backend.append_message(USER, "bare", {"role": "human", "content": "a"})
+
+    assert storage.update_metadata(USER, "bare", {"title": "x"})
+    storage.flush()
+
+    assert backend.get_metadata(USER, "bare")["title"] == "x"
+
+
+def test_only_written_entries_are_evicted(storage, backend, monkeypatch):
+    monkeypatch.setattr(write_behind_history_storage, "METADATA_CACHE_SIZE", 2)
+    for uid in ("h1", "h2", "h3"):
+        backend.create_history(USER, uid, {"role": "metadata"})
+    storage.update_metadata(USER, "h1", {"title": "dirty"})
+    storage.get_metadata(USER, "h2")
+    storage.get_metadata(USER, "h3")
+    reads = backend.reads
+
+    # h2 was evicted, the unwritten h1 was kept
+    assert storage.get_metadata(USER, "h1")["title"] == "dirty"
+    assert backend.reads == reads
+    storage.get_metadata(USER, "h2")
+    assert backend.reads == reads + 1
+
+    storage.flush()
+    assert backend.get_metadata(USER, "h1")["title"] == "dirty"
+
+
+def test_rename_writes_metadata_before_moving_the_history(storage, backend):
+    storage.update_metadata(USER, HISTORY, {"title": "new"})
+
+    assert storage.rename_history(USER, HISTORY, "renamed")
+    assert storage.get_metadata(USER, "renamed")["title"] == "new"
+    assert storage.get_metadata(USER, HISTORY) == {}
+
+
+def test_delete_drops_unwritten_metadata(storage, backend):
+    storage.update_metadata(USER, HISTORY, {"title": "new"})
+
+    assert storage.delete_history(USER, HISTORY)
+    storage.flush()
+
+    assert backend.writes == []
+    assert storage.get_metadata(USER, HISTORY) == {}
@@ -0,0 +1,83 @@
+import pytest
+
+from open_llm_vtuber import chat_history_manager
+from tests.helpers import contents
+
+USER = "user"
+
+pytestmark = pytest.mark.parametrize(
+    "history_storage", ["jsonl", "sqlite"], indirect=True
+)
+
+
+@pytest.fixture
+def history_uid(history_storage):
+    history_uid = chat_history_manager.create_new_history(USER)
+    for i in range(25):
+        chat_history_manager.store_message(USER, history_uid, "human", str(i))
+    return history_uid
+
+
+def _all_pages(history_uid, limit):
+    pages = []
+    before = None
+    while True:
+        page, before = chat_history_manager.get_history_page(
+            USER, history_uid, before, limit
+        )
+        pages.append(contents(page))
+        if before is None:
+            return pages
+
+
+def test_pages_walk_backwards_to_the_first_message(history_uid):
+    pages = _all_pages(history_uid, 10)
+
+    assert pages == [
+        [str(i) for i in range(15, 25)],
+        [str(i) for i in range(5, 15)],
+        [str(i) for i in range(5)],
+    ]
+
+
+def test_cursor_stays_valid_while_messages_are_appended(history_uid):
+    page, cursor = chat_history_manager.get_history_page(USER, history_uid, None, 10)
+    assert cursor == 15
+
+    chat_history_manager.store_message(USER, history_uid, "ai", "new")
+    page, cursor = chat_history_manager.get_history_page(USER, history_uid, cursor, 10)
+
+    assert contents(page) == [str(i) for i in range(5, 15)]
+    assert cursor == 5
+
+
+def test_edits_of_the_latest_message_show_in_the_page(history_uid):
+    chat_history_manager.store_message(USER, history_uid, "ai", "draft")
+    chat_history_manager.modify_latest_message(USER, history_uid, "ai", "final")
+
+    page, _ = chat_history_manager.get_history_page(USER, history_uid, None, 2)
+
+    assert contents(page) == ["24", "final"]
+
+
+@pytest.mark.parametrize(
+    "before, limit, expected, cursor",
+    [
+        (100, 3, ["22", "23", "24"], 22),
+        (-5, 3, [], None),
+        (3, 0, ["2"], 2),
+    ],
+)
+def test_out_of_range_cursors_and_limits_are_clamped(
+    history_uid, before, limit, expected, cursor
+):
+    page, next_cursor = chat_history_manager.get_history_page(
+        USER, history_uid, before, limit
+    )
+
+    assert contents(page) == expected
+    assert next_cursor == cursor
+
+
+def test_missing_history_has_no_pages(history_storage):
+    assert chat_history_manager.get_history_page(USER, "missing") == ([], None)
@@ -0,0 +1,98 @@
+import pytest
+
+from open_llm_vtuber import chat_history_manager
+from open_llm_vtuber.history_storage.history_search_index import (
+    HistorySearchIndex,
+    tokenize,
+)
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = HistorySearchIndex(str(tmp_path / "search_index.db"))
+    yield index
+    index.close()
+
+
+def _add(index, user_id, history_uid, *contents):
+    index.add_history(user_id, history_uid)
+    index.add_messages(
+        user_id,
+        history_uid,
+        [{"role": "human", "content": content} for content in contents],
+    )
+
+
+def test_tokenize_splits_cjk_runs_into_bigrams():
+    assert tokenize("Hello 你好世界!") == [["hello"], ["你好", "好世", "世界"]]
+    assert tokenize("猫") == [["猫"]]
+
+
+def test_search_matches_cjk_substrings_and_words(index):
+    _add(index, "u1", "h1", "今天天气很好", "let's go hiking")
+
+    assert [r["message_index"] for r in index.search("u1", "天气")] == [0]
+    assert [r["message_index"] for r in index.search("u1", "hik")] == [1]
+    assert index.search("u1", "气天") == []
+
+
+@pytest.mark.parametrize("query", ["今", "天", "好"])
+def test_single_cjk_character_matches_anywhere_in_a_run(index, query):
+    _add(index, "u1", "h1", "今天天气很好")
+
+    assert len(index.search("u1", query)) == 1
+
+
+def test_search_only_returns_messages_of_the_user(index):
+    _add(index, "u1", "h1", "秘密")
+    _add(index, "u2", "h2", "秘密")
+
+    assert [r["history_uid"] for r in index.search("u1", "秘密")] == ["h1"]
+
+
+def test_updated_and_deleted_messages_are_reindexed(index):
+    _add(index, "u1", "h1", "first", "draft")
+    index.update_latest_message("u1", "h1", "final")
+
+    assert index.search("u1", "draft") == []
+    assert [r["message_index"] for r in index.search("u1", "final")] == [1]
+
+    index.delete_history("u1", "h1")
+    assert index.search("u1", "final") == []
+
+
+def test_old_index_version_is_rebuilt(tmp_path):
+    path = str(tmp_path / "search_index.db")
+    index = HistorySearchIndex(path)
+    _add(index, "u1", "h1", "hello")
+    index._conn.execute("PRAGMA user_version = 1")
+    index.close()
+
+    index = HistorySearchIndex(path)
+    try:
+        assert index.indexed_history_uids("u1") == []
+    finally:
+        index.close()
+
+
+def test_cursor_fetches_the_page_ending_with_the_match(history_storage):
+    user_id = "u1"
+    history_uid = chat_history_manager.create_new_history(user_id)
+    for i in range(30):
+        chat_history_manager.store_message(
+            user_id, history_uid, "human", f"message {i} 第{i}条"
+        )
+    chat_history_manager.store_message(user_id, history_uid, "ai", "needle 针")
+    for i in range(30, 40):
+        chat_history_manager.store_message(user_id, history_uid, "human", f"m{i}")
+
+    (result,) = chat_history_manager.search_history(user_id, "needle")
+    page, cursor = chat_history_manager.get_history_page(
+        user_id, history_uid, before=result["cursor"], limit=5
+    )
+
+    assert page[-1]["content"] == "needle 针"
+    assert [msg["content"] for msg in page[:-1]] == [
+        f"message {i} 第{i}条" for i in range(26, 30)
+    ]
+    assert cursor == result["message_index"] - 4
@@ -0,0 +1,167 @@
+import json
+import os
+
+import pytest
+
+from open_llm_vtuber.history_storage import jsonl_history_storage
+from open_llm_vtuber.history_storage.jsonl_history_storage import (
+    COMPACT_EDIT_THRESHOLD,
+    JsonlHistoryStorage,
+)
+from tests.helpers import contents
+
+USER = "user"
+HISTORY = "history"
+
+
+def _message(content, role="human", timestamp="2024-01-01T00:00:00"):
+    return {"role": role, "content": content, "timestamp": timestamp}
+
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = JsonlHistoryStorage(str(tmp_path))
+    storage.create_history(USER, HISTORY, {"role": "metadata", "title": "t"})
+    yield storage
+    storage.close()
+
+
+def _log_path(tmp_path, history_uid=HISTORY):
+    return tmp_path / USER / f"{history_uid}.jsonl"
+
+
+def test_appended_messages_are_read_back_in_order(storage):
+    storage.append_message(USER, HISTORY, _message("a"))
+    storage.append_messages(USER, HISTORY, [_message("b"), _message("c", "ai")])
+
+    assert contents(storage.get_messages(USER, HISTORY)) == ["a", "b", "c"]
+    assert storage.count_messages(USER, HISTORY) == 3
+    assert contents(storage.get_message_range(USER, HISTORY, 1, 3)) == ["b", "c"]
+    assert storage.get_messages(USER, "missing") is None
+
+
+def test_partial_last_line_is_skipped_and_next_append_starts_a_new_line(
+    storage, tmp_path
+):
+    storage.append_message(USER, HISTORY, _message("a"))
+    with open(_log_path(tmp_path), "ab") as f:
+        f.write(b'{"role": "human", "cont')
+
+    assert contents(storage.get_messages(USER, HISTORY)) == ["a"]
+
+    storage.append_message(USER, HISTORY, _message("b"))
+    assert contents(storage.get_messages(USER, HISTORY)) == ["a", "b"]
+    assert storage.count_messages(USER, HISTORY) == 2
+
+
+def test_edits_apply_to_the_latest_message(storage):
+    storage.append_messages(USER, HISTORY, [_message("a"), _message("b", "ai")])
+
+    assert not storage.modify_latest_message(USER, HISTORY, "human", "x")
+    assert storage.modify_latest_message(USER, HISTORY, "ai", "b1")
+    assert storage.modify_latest_message(USER, HISTORY, "ai", "b2")
+    storage.append_message(USER, HISTORY, _message("c"))
+
+    assert contents(storage.get_messages(USER, HISTORY)) == ["a", "b2", "c"]
+    assert contents(storage.get_message_range(USER, HISTORY, 0, 3)) == [
+        "a",
+        "b2",
+        "c",
+    ]
+    assert storage.count_messages(USER, HISTORY) == 3
+    assert storage.list_histories(USER)[0]["latest_message"]["content"] == "c"
+
+
+def test_logs_with_many_edits_are_compacted(storage, tmp_path):
+    storage.append_messages(USER, HISTORY, [_message("a"), _message("b", "ai")])
+    for i in range(COMPACT_EDIT_THRESHOLD):
+        assert storage.modify_latest_message(USER, HISTORY, "ai", f"b{i}")
+    # Waits for the scheduled compaction
+    storage.close()
+
+    lines = _log_path(tmp_path).read_bytes().splitlines()
+    assert [json.loads(line)["content"] for line in lines] == [
+        "a",
+        f"b{COMPACT_EDIT_THRESHOLD - 1}",
+    ]
+    assert not os.path.exists(f"{_log_path(tmp_path)}.tmp")
+
+
+def test_compaction_keeps_records_appended_meanwhile(storage, tmp_path, monkeypatch):
+    storage.append_messages(USER, HISTORY, [_message("a"), _message("b", "ai")])
+    storage.modify_latest_message(USER, HISTORY, "ai", "b!")
+    log_path = str(_log_path(tmp_path))
+    parse_records = jsonl_history_storage._parse_records
+    appended = []
+
+    def parse_and_append(data, path):
+        if not appended:
+            # Appended after the log was read, before the swap
+            appended.append(True)
+            with open(log_path, "ab") as f:
+                f.write(json.dumps(_message("c")).encode() + b"\n")
+        return parse_records(data, path)
+
+    monkeypatch.setattr(jsonl_history_storage, "_parse_records", parse_and_append)
+    storage._compact_log(log_path)
+    monkeypatch.undo()
+
+    assert contents(storage.get_messages(USER, HISTORY)) == ["a", "b!", "c"]
+    assert storage.count_messages(USER, HISTORY) == 3
+    assert b"edit_last" not in _log_path(tmp_path).read_bytes()
+
+
+def test_metadata_updates_keep_other_fields(storage, tmp_path):
+    assert storage.update_metadata(USER, HISTORY, {"agent_state": {"k": 1}})
+
+    metadata = storage.get_metadata(USER, HISTORY)
+    assert metadata["title"] == "t"
+    assert metadata["agent_state"] == {"k": 1}
+    assert not os.path.exists(tmp_path / USER / f"{HISTORY}.meta.json.tmp")
+    assert not storage.update_metadata(USER, "missing", {"title": "x"})
+
+
+def test_legacy_history_is_migrated_on_first_access(tmp_path):
+    user_dir = tmp_path / USER
+    user_dir.mkdir()
+    legacy = [
+        {"role": "metadata", "timestamp": "2024-01-01T00:00:00", "title": "old"},
+        _message("a"),
+        _message("b", "ai"),
+    ]
+    (user_dir / "old.json").write_text(json.dumps(legacy), encoding="utf-8")
+    storage = JsonlHistoryStorage(str(tmp_path))
+
+    assert storage.find_legacy_files() == [str(user_dir / "old.json")]
+    assert contents(storage.get_messages(USER, "old")) == ["a", "b"]
+    assert storage.get_metadata(USER, "old")["title"] == "old"
+    assert not (user_dir / "old.json").exists()
+    assert storage.find_legacy_files() == []
+    storage.close()
+
+
+def test_list_histories_reads_the_latest_message(storage):
+    storage.append_message(USER, HISTORY, _message("a", timestamp="2024-01-01"))
+    storage.create_history(USER, "newer", {"role": "metadata"})
+    storage.append_message(USER, "newer", _message("b", timestamp="2024-02-01"))
+    storage.create_history(USER, "empty", {"role": "metadata"})
+
+    histories = storage.list_histories(USER)
+    assert [h["uid"] for h in histories] == ["newer", HISTORY]
+    assert histories[0]["latest_message"]["content"] == "b"
+
+    assert storage.delete_empty_histories(USER) == ["empty"]
+    assert storage.list_history_ids() == [(USER, HISTORY), (USER, "newer")]
+
+
+def test_rename_and_delete_move_log_and_metadata(storage, tmp_path):
+    storage.append_message(USER, HISTORY, _message("a"))
+
+    assert storage.rename_history(USER, HISTORY, "renamed")
+    assert storage.get_messages(USER, HISTORY) is None
+    assert contents(storage.get_messages(USER, "renamed")) == ["a"]
+    assert storage.get_metadata(USER, "renamed")["title"] == "t"
+
+    assert storage.delete_history(USER, "renamed")
+    assert not storage.delete_history(USER, "renamed")
+    assert os.listdir(tmp_path / USER) == []
@@ -0,0 +1,135 @@
+import threading
+
+import pytest
+
+from migrate_chat_history import copy_histories
+from open_llm_vtuber.history_storage.history_storage_factory import (
+    HistoryStorageFactory,
+)
+from open_llm_vtuber.history_storage.jsonl_history_storage import JsonlHistoryStorage
+from open_llm_vtuber.history_storage.sqlite_history_storage import (
+    SqliteHistoryStorage,
+)
+from tests.helpers import contents
+
+USER = "user"
+HISTORY = "history"
+
+
+def _message(content, role="human", timestamp="2024-01-01T00:00:00"):
+    return {"role": role, "content": content, "timestamp": timestamp}
+
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = SqliteHistoryStorage(str(tmp_path / "db" / "chat_history.db"))
+    storage.create_history(USER, HISTORY, {"role": "metadata", "title": "t"})
+    yield storage
+    storage.close()
+
+
+def test_factory_builds_the_configured_backend(tmp_path):
+    sqlite = HistoryStorageFactory.get_storage(
+        "SQLite", sqlite_path=str(tmp_path / "h.db")
+    )
+    jsonl = HistoryStorageFactory.get_storage("jsonl", jsonl_dir=str(tmp_path))
+    try:
+        assert isinstance(sqlite, SqliteHistoryStorage)
+        assert isinstance(jsonl, JsonlHistoryStorage)
+        with pytest.raises(ValueError):
+            HistoryStorageFactory.get_storage("mongodb")
+    finally:
+        sqlite.close()
+        jsonl.close()
+
+
+def test_messages_and_counts(storage):
+    storage.append_message(USER, HISTORY, _message("a"))
+    storage.append_messages(USER, HISTORY, [_message("b"), _message("c", "ai")])
+
+    assert contents(storage.get_messages(USER, HISTORY)) == ["a", "b", "c"]
+    assert storage.count_messages(USER, HISTORY) == 3
+    assert storage.get_messages(USER, "missing") is None
+    assert storage.count_messages(USER, "missing") is None
+
+
+@pytest.mark.parametrize(
+    "start, end, expected",
+    [(0, 2, ["0", "1"]), (8, 10, ["8", "9"]), (3, 6, ["3", "4", "5"]), (9, 20, ["9"])],
+)
+def test_message_range_from_either_end(storage, start, end, expected):
+    storage.append_messages(USER, HISTORY, [_message(str(i)) for i in range(10)])
+
+    assert contents(storage.get_message_range(USER, HISTORY, start, end)) == expected
+
+
+def test_modify_latest_message(storage):
+    storage.append_messages(USER, HISTORY, [_message("a"), _message("b", "ai")])
+
+    assert not storage.modify_latest_message(USER, HISTORY, "human", "x")
+    assert storage.modify_latest_message(USER, HISTORY, "ai", "b!")
+    assert contents(storage.get_messages(USER, HISTORY)) == ["a", "b!"]
+    assert storage.list_histories(USER)[0]["latest_message"]["content"] == "b!"
+    assert not storage.modify_latest_message(USER, "missing", "ai", "x")
+
+
+def test_metadata_updates_keep_other_fields(storage):
+    assert storage.update_metadata(USER, HISTORY, {"agent_state": {"k": 1}})
+
+    assert storage.get_metadata(USER, HISTORY) == {
+        "role": "metadata",
+        "title": "t",
+        "agent_state": {"k": 1},
+    }
+    assert not storage.update_metadata(USER, "missing", {"title": "x"})
+    assert storage.get_metadata(USER, "missing") == {}
+
+
+def test_listing_renaming_and_deleting(storage):
+    storage.append_message(USER, HISTORY, _message("a", timestamp="2024-01-01"))
+    storage.create_history(USER, "newer", {"role": "metadata"})
+    storage.append_message(USER, "newer", _message("b", timestamp="2024-02-01"))
+    storage.create_history(USER, "empty", {"role": "metadata"})
+
+    assert [h["uid"] for h in storage.list_histories(USER)] == ["newer", HISTORY]
+    assert storage.delete_empty_histories(USER) == ["empty"]
+
+    assert storage.rename_history(USER, HISTORY, "renamed")
+    assert not storage.rename_history(USER, HISTORY, "again")
+    assert contents(storage.get_messages(USER, "renamed")) == ["a"]
+    assert storage.get_metadata(USER, "renamed")["title"] == "t"
+
+    assert storage.delete_history(USER, "renamed")
+    assert not storage.delete_history(USER, "renamed")
+    assert storage.list_history_ids() == [(USER, "newer")]
+
+
+def test_each_thread_gets_its_own_connection(storage):
+    def append(i):
+        storage.append_message(USER, HISTORY, _message(str(i)))
+
+    threads = [threading.Thread(target=append, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(contents(storage.get_messages(USER, HISTORY))) == [
+        str(i) for i in range(8)
+    ]
+    assert storage.count_messages(USER, HISTORY) == 8
+
+
+def test_copy_histories_from_jsonl_skips_existing(storage, tmp_path):
+    source = JsonlHistoryStorage(str(tmp_path / "users"))
+    source.create_history(USER, "h1", {"role": "metadata", "title": "one"})
+    source.append_messages(USER, "h1", [_message("a"), _message("b", "ai")])
+    source.create_history(USER, HISTORY, {"role": "metadata"})
+    source.append_message(USER, HISTORY, _message("not copied"))
+
+    assert copy_histories(source, storage) == 1
+    assert copy_histories(source, storage) == 0
+    assert contents(storage.get_messages(USER, "h1")) == ["a", "b"]
+    assert storage.get_metadata(USER, "h1")["title"] == "one"
+    assert storage.get_messages(USER, HISTORY) == []
+    source.close()
@@ -0,0 +1,128 @@
+import pytest
+
+from open_llm_vtuber import chat_history_manager
+from open_llm_vtuber.history_storage.transcript_history_storage import (
+    TRANSCRIPT_OWNER,
+)
+from tests.helpers import contents
+
+
+@pytest.fixture
+def group(history_storage):
+    """A group conversation of two users, each with a message of their own"""
+    histories = {}
+    for user_id in ("alice", "bob"):
+        history_uid = chat_history_manager.create_new_history(user_id)
+        chat_history_manager.store_message(
+            user_id, history_uid, "human", f"{user_id} alone"
+        )
+        histories[user_id] = history_uid
+    transcript_id = chat_history_manager.create_group_transcript(
+        list(histories.items())
+    )
+    chat_history_manager.store_group_message(transcript_id, "human", "hello group")
+    chat_history_manager.store_group_message(transcript_id, "ai", "hi all")
+    return transcript_id, histories
+
+
+def test_members_see_the_transcript_after_their_own_messages(group):
+    _, histories = group
+
+    for user_id, history_uid in histories.items():
+        assert contents(chat_history_manager.get_history(user_id, history_uid)) == [
+            f"{user_id} alone",
+            "hello group",
+            "hi all",
+        ]
+
+
+@pytest.mark.parametrize("user_id", [TRANSCRIPT_OWNER, "group_transcripts"])
+def test_transcripts_are_not_histories_of_any_user(group, user_id):
+    transcript_id, _ = group
+
+    assert chat_history_manager.get_history_list(user_id) == []
+    assert chat_history_manager.get_history(user_id, transcript_id) == []
+    assert chat_history_manager.search_history(user_id, "group") == []
+
+
+def test_user_named_like_the_owner_keeps_their_own_histories(group):
+    transcript_id, histories = group
+    history_uid = chat_history_manager.create_new_history(TRANSCRIPT_OWNER)
+    chat_history_manager.store_message(TRANSCRIPT_OWNER, history_uid, "human", "mine")
+    chat_history_manager.store_group_message(transcript_id, "ai", "still shared")
+
+    assert [h["uid"] for h in chat_history_manager.get_history_list("group")] == [
+        history_uid
+    ]
+    assert (
+        contents(chat_history_manager.get_history("alice", histories["alice"]))[-1]
+        == "still shared"
+    )
+
+
+@pytest.mark.parametrize(
+    "query, content", [("alone", "alice alone"), ("hello", "hello group")]
+)
+def test_search_cursor_points_past_the_match_in_the_member_view(group, query, content):
+    _, histories = group
+    chat_history_manager.store_message("alice", histories["alice"], "human", "later")
+
+    (result,) = chat_history_manager.search_history("alice", query)
+    page, _ = chat_history_manager.get_history_page(
+        "alice", histories["alice"], before=result["cursor"], limit=1
+    )
+
+    assert contents(page) == [content]
+
+
+def test_new_member_history_sees_the_messages_from_when_it_joined(group):
+    transcript_id, histories = group
+    new_uid = chat_history_manager.create_new_history("alice")
+
+    members = [("alice", new_uid), ("bob", histories["bob"])]
+    assert chat_history_manager.add_group_transcript_members(transcript_id, members)
+    chat_history_manager.store_group_message(transcript_id, "human", "next input")
+
+    assert contents(chat_history_manager.get_history("alice", new_uid)) == [
+        "next input"
+    ]
+    assert contents(chat_history_manager.get_history("bob", histories["bob"])) == [
+        "bob alone",
+        "hello group",
+        "hi all",
+        "next input",
+    ]
+    # Histories already sharing it get no second reference
+    metadata = chat_history_manager.get_metadata("bob", histories["bob"])
+    assert metadata["group_transcripts"] == [transcript_id]
+
+
+def test_missing_transcript_can_not_be_joined(group):
+    _, histories = group
+
+    assert not chat_history_manager.add_group_transcript_members(
+        "missing", [("alice", histories["alice"])]
+    )
+    assert not chat_history_manager.add_group_transcript_members("", [])
+
+
+def test_reads_do_not_count_the_transcript_again(group, monkeypatch):
+    transcript_id, histories = group
+    storage = chat_history_manager.get_history_storage()
+    counted = []
+    count_messages = storage.transcripts.count_messages
+
+    def counting(*args):
+        counted.append(args)
+        return count_messages(*args)
+
+    monkeypatch.setattr(storage.transcripts, "count_messages", counting)
+    for _ in range(3):
+        chat_history_manager.store_group_message(transcript_id, "ai", "more")
+        page, _ = chat_history_manager.get_history_page(
+            "alice", histories["alice"], limit=2
+        )
+        assert contents(page)[-1] == "more"
+
+    assert counted == []
+    assert storage.count_messages("alice", histories["alice"]) == 6
@@ -0,0 +1,221 @@
+import threading
+
+import pytest
+
+from open_llm_vtuber.history_storage.history_search_index import HistorySearchIndex
+from open_llm_vtuber.history_storage.indexed_history_storage import (
+    IndexedHistoryStorage,
+)
+from open_llm_vtuber.history_storage.jsonl_history_storage import JsonlHistoryStorage
+from open_llm_vtuber.history_storage.write_behind_history_storage import (
+    WriteBehindHistoryStorage,
+)
+from tests.helpers import contents
+
+USER = "user"
+HISTORY = "history"
+
+
+def _message(content, role="human"):
+    return {"role": role, "content": content}
+
+
+class SlowDiskStorage(JsonlHistoryStorage):
+    """Appends become readable at once, then block like a slow fsync"""
+
+    def __init__(self, root):
+        super().__init__(root)
+        self.writing = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def append_messages(self, user_id, history_uid, messages, sync=False):
+        super().append_messages(user_id, history_uid, messages, sync=False)
+        self.writing.set()
+        assert self.release.wait(10)
+
+
+@pytest.fixture
+def backend(tmp_path):
+    backend = SlowDiskStorage(str(tmp_path))
+    backend.create_history(USER, HISTORY, {"role": "metadata"})
+    return backend
+
+
+@pytest.fixture
+def storage(backend):
+    # Flushed by the tests, not on a timer
+    storage = WriteBehindHistoryStorage(backend, flush_interval=3600)
+    yield storage
+    backend.release.set()
+    storage.close()
+
+
+def _flush_in_background(storage):
+    thread = threading.Thread(target=storage.flush)
+    thread.start()
+    return thread
+
+
+def test_reads_include_queued_messages(storage, backend):
+    storage.append_messages(USER, HISTORY, [_message("a"), _message("b")])
+
+    assert backend.get_messages(USER, HISTORY) == []
+    assert contents(storage.get_messages(USER, HISTORY)) == ["a", "b"]
+    assert storage.count_messages(USER, HISTORY) == 2
+    assert contents(storage.get_message_range(USER, HISTORY, 1, 2)) == ["b"]
+
+
+def test_close_writes_queued_messages(storage, tmp_path):
+    storage.append_messages(USER, HISTORY, [_message("a")])
+    storage.update_metadata(USER, HISTORY, {"title": "t"})
+    storage.close()
+
+    reopened = JsonlHistoryStorage(str(tmp_path))
+    assert contents(reopened.get_messages(USER, HISTORY)) == ["a"]
+    assert reopened.get_metadata(USER, HISTORY)["title"] == "t"
+
+
+@pytest.mark.parametrize("durability", ["none", "batched", "fsync"])
+def test_durability_modes_write_every_message(backend, durability):
+    storage = WriteBehindHistoryStorage(
+        backend, durability=durability, flush_interval=0.01
+    )
+    for i in range(5):
+        storage.append_message(USER, HISTORY, _message(str(i)))
+    storage.close()
+
+    assert contents(backend.get_messages(USER, HISTORY)) == list("01234")
+
+
+def test_reads_during_a_slow_write_see_every_message_once(storage, backend):
+    storage.append_messages(USER, HISTORY, [_message("a"), _message("b")])
+    backend.release.clear()
+    flush = _flush_in_background(storage)
+    assert backend.writing.wait(10)
+    storage.append_message(USER, HISTORY, _message("c"))
+
+    # The batch is readable in the backend but its write hasn't finished
+    assert contents(storage.get_messages(USER, HISTORY)) == ["a", "b", "c"]
+    assert storage.count_messages(USER, HISTORY) == 3
+    assert contents(storage.get_message_range(USER, HISTORY, 1, 3)) == ["b", "c"]
+    assert storage.list_histories(USER)[0]["latest_message"]["content"] == "c"
+
+    backend.release.set()
+    flush.join()
+    assert contents(storage.get_messages(USER, HISTORY)) == ["a", "b", "c"]
+
+
+def test_edits_and_metadata_during_a_slow_write_do_not_wait(storage, backend):
+    storage.append_messages(USER, HISTORY, [_message("a"), _message("b", "ai")])
+    backend.release.clear()
+    flush = _flush_in_background(storage)
+    assert backend.writing.wait(10)
+
+    assert storage.modify_latest_message(USER, HISTORY, "ai", "b!")
+    assert storage.update_metadata(USER, HISTORY, {"title": "t"})
+    assert contents(storage.get_messages(USER, HISTORY)) == ["a", "b!"]
+
+    backend.release.set()
+    flush.join()
+    storage.flush()
+    assert contents(backend.get_messages(USER, HISTORY)) == ["a", "b!"]
+    assert backend.get_metadata(USER, HISTORY)["title"] == "t"
+
+
+def test_edit_of_a_written_message_is_written_before_later_messages(storage, backend):
+    storage.append_message(USER, HISTORY, _message("a", "ai"))
+    storage.flush()
+
+    assert storage.modify_latest_message(USER, HISTORY, "ai", "a!")
+    assert not storage.modify_latest_message(USER, HISTORY, "human", "x")
+    storage.append_message(USER, HISTORY, _message("b"))
+    assert contents(storage.get_messages(USER, HISTORY)) == ["a!", "b"]
+
+    storage.flush()
+    assert contents(backend.get_messages(USER, HISTORY)) == ["a!", "b"]
+
+
+def test_failed_writes_are_retried(storage, backend, monkeypatch):
+    append = backend.append_messages
+    calls = []
+
+    def failing_append(*args, **kwargs):
+        calls.append(args)
+        if len(calls) == 1:
+            raise OSError("disk full")
+        append(*args, **kwargs)
+
+    monkeypatch.setattr(backend, "append_messages", failing_append)
+    storage.append_message(USER, HISTORY, _message("a"))
+    storage.flush()
+    assert contents(storage.get_messages(USER, HISTORY)) == ["a"]
+
+    storage.flush()
+    assert contents(backend.get_messages(USER, HISTORY)) == ["a"]
+
+
+def _block_writes_to_other_history(storage, backend):
+    """Start a write of another history that doesn't finish until released"""
+    storage.append_message(USER, "other", _message("x"))
+    backend.release.clear()
+    flush = _flush_in_background(storage)
+    assert backend.writing.wait(10)
+    return flush
+
+
+def test_search_finds_queued_messages_without_waiting(backend, tmp_path):
+    index = HistorySearchIndex(str(tmp_path / "search_index.db"))
+    storage = WriteBehindHistoryStorage(
+        IndexedHistoryStorage(backend, index), flush_interval=3600
+    )
+    storage.append_message(USER, HISTORY, _message("stored weather"))
+    storage.flush()
+    # The first search indexes the stored histories
+    assert len(storage.search_messages(USER, "weather", 10)) == 1
+    flush = _block_writes_to_other_history(storage, backend)
+    storage.append_message(USER, HISTORY, _message("queued weather"))
+
+    results = storage.search_messages(USER, "weather", 10)
+    assert sorted((r["message_index"], r["snippet"]) for r in results) == [
+        (0, "stored weather"),
+        (1, "queued weather"),
+    ]
+    assert storage.search_messages(USER, "queued", 10)[0]["cursor"] == 2
+
+    backend.release.set()
+    flush.join()
+    storage.close()
+    index.close()
+
+
+def test_delete_drops_queued_messages_without_waiting(storage, backend):
+    flush = _block_writes_to_other_history(storage, backend)
+    storage.append_message(USER, HISTORY, _message("a"))
+
+    assert storage.delete_history(USER, HISTORY)
+    assert storage.get_messages(USER, HISTORY) is None
+
+    backend.release.set()
+    flush.join()
+    storage.flush()
+    assert backend.get_messages(USER, HISTORY) is None
+
+
+def test_rename_moves_queued_messages_and_metadata(storage, backend):
+    storage.append_message(USER, HISTORY, _message("a"))
+    storage.flush()
+    flush = _block_writes_to_other_history(storage, backend)
+    storage.append_message(USER, HISTORY, _message("b"))
+    storage.update_metadata(USER, HISTORY, {"title": "t"})
+
+    assert storage.rename_history(USER, HISTORY, "renamed")
+    assert contents(storage.get_messages(USER, "renamed")) == ["a", "b"]
+    assert storage.get_metadata(USER, "renamed")["title"] == "t"
+
+    backend.release.set()
+    flush.join()
+    storage.flush()
+    assert contents(backend.get_messages(USER, "renamed")) == ["a", "b"]
+    assert backend.get_metadata(USER, "renamed")["title"] == "t"
+    assert backend.get_messages(USER, HISTORY) is None
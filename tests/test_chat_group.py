@@ -0,0 +1,140 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from open_llm_vtuber import chat_group
+from open_llm_vtuber.chat_group import ChatGroupManager, broadcast_to_group
+
+
+class FakeWebSocket:
+    """Records the texts sent, each send taking `delay` seconds"""
+
+    def __init__(self, delay=0.0, error=None):
+        self.delay = delay
+        self.error = error
+        self.sent = []
+
+    async def send_text(self, text):
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        self.sent.append(text)
+
+
+@pytest.fixture(autouse=True)
+def clear_backlogs():
+    yield
+    chat_group._backlogs.clear()
+
+
+def test_message_is_encoded_once_and_not_sent_back_to_the_sender():
+    connections = {uid: FakeWebSocket() for uid in ("a", "b", "c")}
+    message = {"type": "full-text", "text": "你好"}
+
+    latencies = asyncio.run(
+        broadcast_to_group(
+            ["a", "b", "c", "gone"], message, connections, exclude_uid="a"
+        )
+    )
+
+    assert set(latencies) == {"b", "c"}
+    assert connections["a"].sent == []
+    assert connections["b"].sent == connections["c"].sent == [json.dumps(message)]
+
+
+def test_members_are_sent_to_concurrently():
+    connections = {str(i): FakeWebSocket(delay=0.1) for i in range(10)}
+
+    start = time.perf_counter()
+    latencies = asyncio.run(broadcast_to_group(list(connections), "{}", connections))
+
+    assert time.perf_counter() - start < 0.5
+    assert all(latency >= 0.1 for latency in latencies.values())
+
+
+def test_failed_send_reports_no_latency():
+    connections = {"a": FakeWebSocket(error=ConnectionError("closed"))}
+
+    assert asyncio.run(broadcast_to_group(["a"], "{}", connections)) == {"a": None}
+
+
+def test_slow_member_is_left_behind_and_receives_everything_in_order():
+    async def scenario():
+        slow, fast = FakeWebSocket(delay=0.2), FakeWebSocket()
+        connections = {"slow": slow, "fast": fast}
+        results = []
+        for i in range(3):
+            start = time.perf_counter()
+            results.append(
+                await broadcast_to_group(
+                    ["slow", "fast"], str(i), connections, timeout=0.05
+                )
+            )
+            # Later broadcasts don't wait for the slow member
+            assert time.perf_counter() - start < 0.1 or i == 0
+        await chat_group._backlogs["slow"].task
+        # Caught up: back to normal sends
+        results.append(
+            await broadcast_to_group(["slow", "fast"], "3", connections, timeout=1)
+        )
+        return slow, fast, results
+
+    slow, fast, results = asyncio.run(scenario())
+
+    assert [result["slow"] for result in results[:3]] == [None, None, None]
+    assert all(result["fast"] is not None for result in results)
+    assert results[3]["slow"] is not None
+    assert slow.sent == fast.sent == ["0", "1", "2", "3"]
+    assert "slow" not in chat_group._backlogs
+
+
+def test_backlog_beyond_the_limit_is_dropped(monkeypatch):
+    monkeypatch.setattr(chat_group, "MAX_BROADCAST_BACKLOG", 2)
+
+    async def scenario():
+        slow = FakeWebSocket(delay=0.1)
+        connections = {"slow": slow}
+        for i in range(4):
+            await broadcast_to_group(["slow"], str(i), connections, timeout=0.01)
+        await chat_group._backlogs["slow"].task
+        return slow
+
+    assert asyncio.run(scenario()).sent == ["0", "1"]
+
+
+def test_disconnect_drops_the_backlog():
+    async def scenario():
+        manager = ChatGroupManager()
+        connections = {"slow": FakeWebSocket(delay=0.1)}
+        await broadcast_to_group(["slow"], "0", connections, timeout=0.01)
+        assert "slow" in chat_group._backlogs
+
+        async def send_group_update(websocket, client_uid):
+            pass
+
+        await chat_group.handle_client_disconnect(
+            "slow", manager, connections, send_group_update
+        )
+
+    asyncio.run(scenario())
+
+    assert chat_group._backlogs == {}
+
+
+def test_group_transcript_restarts_when_the_members_change():
+    manager = ChatGroupManager()
+    for uid in ("a", "b", "c"):
+        manager.create_group_for_client(uid)
+        manager.client_group_map[uid] = ""
+    manager.add_client_to_group("a", "b")
+    group = manager.get_client_group("a")
+    group.transcript_id = "t1"
+
+    manager.add_client_to_group("a", "c")
+    assert group.transcript_id == ""
+
+    group.transcript_id = "t2"
+    manager.remove_client("c")
+    assert group.transcript_id == ""
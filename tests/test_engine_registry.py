@@ -0,0 +1,166 @@
+import threading
+import time
+
+import pytest
+
+from open_llm_vtuber import engine_registry as engine_registry_module
+from open_llm_vtuber.agent.agent_factory import AgentFactory
+from open_llm_vtuber.agent.agents.agent_interface import AgentInterface
+from open_llm_vtuber.config_manager.system import EngineRegistryConfig
+from open_llm_vtuber.config_manager.tts import EdgeTTSConfig
+from open_llm_vtuber.engine_registry import EngineRegistry, config_key
+
+MB = 1024 * 1024
+
+
+class Engine:
+    def __init__(self, name="engine"):
+        self.name = name
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def make_registry():
+    registries = []
+
+    def make(**config):
+        registries.append(EngineRegistry(EngineRegistryConfig(**config)))
+        return registries[-1]
+
+    yield make
+    for registry in registries:
+        registry.close()
+
+
+def test_config_key_ignores_key_order_and_model_types():
+    assert config_key("tts", {"a": 1, "b": 2}) == config_key("tts", {"b": 2, "a": 1})
+    assert config_key("tts", EdgeTTSConfig(voice="v")) == config_key(
+        "tts", {"voice": "v"}
+    )
+    assert config_key("tts", {"a": 1}) != config_key("asr", {"a": 1})
+
+
+def test_same_config_is_built_once_and_shared(make_registry):
+    registry = make_registry(idle_ttl=0)
+    builds = []
+
+    def factory():
+        time.sleep(0.05)
+        builds.append(1)
+        return Engine()
+
+    engines = []
+    threads = [
+        threading.Thread(
+            target=lambda: engines.append(registry.acquire("tts", {"v": 1}, factory))
+        )
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(builds) == 1
+    assert all(engine is engines[0] for engine in engines)
+    assert registry.stats()[0]["refcount"] == 5
+
+
+def test_engine_is_unloaded_after_the_last_release(make_registry):
+    registry = make_registry(idle_ttl=0)
+    engine = registry.acquire("tts", {"v": 1}, Engine)
+    assert registry.retain(engine)
+
+    registry.release(engine)
+    assert not engine.closed
+    registry.release(engine)
+
+    assert engine.closed
+    assert not registry.contains("tts", {"v": 1})
+    assert not registry.retain(engine)
+    # Releasing an unknown engine does nothing
+    registry.release(engine)
+    registry.release(None)
+
+
+def test_idle_engines_stay_loaded_for_the_ttl(make_registry):
+    registry = make_registry(idle_ttl=0.1)
+    engine = registry.acquire("tts", {"v": 1}, Engine)
+    registry.release(engine)
+
+    assert registry.evict() == 0
+    # Taken again while idle: no new build
+    assert registry.acquire("tts", {"v": 1}, pytest.fail) is engine
+    registry.release(engine)
+
+    time.sleep(0.15)
+    assert registry.evict() == 1
+    assert engine.closed
+
+
+def test_failed_build_reaches_every_waiter_and_is_retried(make_registry):
+    registry = make_registry(idle_ttl=0)
+    started = threading.Event()
+    errors = []
+
+    def failing():
+        started.set()
+        time.sleep(0.05)
+        raise RuntimeError("model not found")
+
+    def acquire(factory):
+        try:
+            registry.acquire("tts", {"v": 1}, factory)
+        except RuntimeError as e:
+            errors.append(e)
+
+    builder = threading.Thread(target=acquire, args=(failing,))
+    builder.start()
+    started.wait()
+    waiter = threading.Thread(target=acquire, args=(pytest.fail,))
+    waiter.start()
+    builder.join()
+    waiter.join()
+
+    assert len(errors) == 2
+    assert registry.stats() == []
+    assert isinstance(registry.acquire("tts", {"v": 1}, Engine), Engine)
+
+
+def test_memory_budget_unloads_least_recently_released_first(
+    make_registry, monkeypatch
+):
+    # Every build grows the process by 50 MB
+    rss = iter(range(0, 100 * MB * 100, 50 * MB))
+    monkeypatch.setattr(engine_registry_module, "_rss_bytes", lambda: next(rss))
+    registry = make_registry(idle_ttl=3600, memory_budget_mb=250)
+    a = registry.acquire("tts", {"v": "a"}, lambda: Engine("a"))
+    b = registry.acquire("tts", {"v": "b"}, lambda: Engine("b"))
+    c = registry.acquire("tts", {"v": "c"}, lambda: Engine("c"))
+    assert [e["size_mb"] for e in registry.stats()] == [50, 50, 50]
+
+    registry.release(a)
+    registry.release(b)
+    # Within the budget: idle engines stay loaded
+    assert not a.closed and not b.closed
+
+    registry.configure(EngineRegistryConfig(idle_ttl=3600, memory_budget_mb=110))
+    assert a.closed and not b.closed
+    # Engines in use are never unloaded, even over the budget
+    registry.configure(EngineRegistryConfig(idle_ttl=3600, memory_budget_mb=1))
+    assert b.closed and not c.closed
+    assert [e["refcount"] for e in registry.stats()] == [1]
+
+
+def test_only_agents_with_sessions_are_shared():
+    class Stateful(AgentInterface):
+        pass
+
+    assert not Stateful.has_sessions()
+    assert AgentFactory.get_agent_class("basic_memory_agent").has_sessions()
+    assert not AgentFactory.get_agent_class("hume_ai_agent").has_sessions()
+    with pytest.raises(ValueError):
+        AgentFactory.get_agent_class("unknown_agent")
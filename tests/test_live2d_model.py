@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+from open_llm_vtuber.agent.transformers import actions_extractor
+from open_llm_vtuber.utils.sentence_divider import (
+    SentenceWithTags,
+    TagInfo,
+    TagState,
+)
+
+
+@pytest.mark.parametrize(
+    "text, expressions, stripped",
+    [
+        ("[joy] Hello!", [3], " Hello!"),
+        ("I am [SADNESS] sad [Joy].", [1, 3], "I am  sad ."),
+        ("[joy][joy]", [3, 3], ""),
+        ("[anger] is not an expression", [], "[anger] is not an expression"),
+        ("No tags here.", [], "No tags here."),
+        ("[joy", [], "[joy"),
+    ],
+)
+def test_emotions_are_found_in_order_and_removed(
+    live2d_model, text, expressions, stripped
+):
+    assert live2d_model.extract_and_remove_emotions(text) == (expressions, stripped)
+    assert live2d_model.extract_emotion(text) == expressions
+    assert live2d_model.remove_emotion_keywords(text) == stripped
+
+
+def test_keys_are_matched_literally(make_live2d_model):
+    model = make_live2d_model({"a.b": 1, "c+": 2})
+
+    assert model.extract_and_remove_emotions("[a.b] [axb] [c+]") == ([1, 2], " [axb] ")
+
+
+def test_model_without_expressions_keeps_the_text(make_live2d_model):
+    model = make_live2d_model({})
+
+    assert model.emo_pattern is None
+    assert model.extract_and_remove_emotions("[joy] hi") == ([], "[joy] hi")
+
+
+def test_actions_extractor_strips_the_tags_from_the_sentence(live2d_model):
+    sentences = [
+        SentenceWithTags(text="[joy] Hi!", tags=[]),
+        SentenceWithTags(text="[sadness]", tags=[]),
+        SentenceWithTags(
+            text="[joy]", tags=[TagInfo(name="think", state=TagState.START)]
+        ),
+    ]
+
+    @actions_extractor(live2d_model)
+    async def stream():
+        for sentence in sentences:
+            yield sentence
+
+    async def collect():
+        return [
+            (sentence.text, actions.expressions) async for sentence, actions in stream()
+        ]
+
+    assert asyncio.run(collect()) == [
+        (" Hi!", [3]),
+        ("", [1]),
+        # Tag markers are passed on as they are
+        ("[joy]", None),
+    ]
@@ -0,0 +1,279 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from open_llm_vtuber.config_manager.tts import EdgeTTSConfig, TTSConfig
+from open_llm_vtuber.service_context import ServiceContext
+from open_llm_vtuber.tts.tts_interface import TTSInterface
+
+
+class FakeTTS(TTSInterface):
+    def __init__(self, voice):
+        self.voice = voice
+        self.closed = False
+
+    def generate_audio(self, text, file_name_no_ext=None):
+        return None
+
+    def close(self):
+        self.closed = True
+
+
+def tts_config(voice):
+    return TTSConfig(tts_model="edge_tts", edge_tts=EdgeTTSConfig(voice=voice))
+
+
+@pytest.fixture
+def builds(monkeypatch):
+    """Voices of the TTS engines built, each build blocking for 0.2 s"""
+    builds = []
+
+    def build(config):
+        time.sleep(0.2)
+        if config.edge_tts.voice == "broken":
+            raise RuntimeError("model not found")
+        builds.append(config.edge_tts.voice)
+        return FakeTTS(config.edge_tts.voice)
+
+    monkeypatch.setattr(ServiceContext, "_build_tts_engine", staticmethod(build))
+    return builds
+
+
+def make_context(voice="a"):
+    context = ServiceContext()
+    context.character_config = SimpleNamespace(tts_config=None)
+    context.init_tts(tts_config(voice))
+    return context
+
+
+async def max_tick_lag(coro):
+    """Run `coro` and return it with the longest event loop stall meanwhile"""
+    lags = []
+    stop = False
+
+    async def ticker():
+        while not stop:
+            start = time.perf_counter()
+            await asyncio.sleep(0.005)
+            lags.append(time.perf_counter() - start - 0.005)
+
+    tick = asyncio.create_task(ticker())
+    result = await coro
+    stop = True
+    await tick
+    return result, max(lags)
+
+
+def test_build_does_not_block_the_event_loop(engine_registry, builds):
+    context = make_context()
+
+    async def scenario():
+        return await max_tick_lag(context.build_tts_engine(tts_config("b")))
+
+    engine, lag = asyncio.run(scenario())
+
+    assert engine.voice == "b"
+    assert lag < 0.1
+    # Not switched until swap_tts_engine
+    assert context.tts_engine.voice == "a"
+
+
+def test_swap_switches_engine_and_config_and_releases_the_old_engine(
+    engine_registry, builds
+):
+    context = make_context()
+    old = context.tts_engine
+
+    asyncio.run(context.reinit_tts(tts_config("b")))
+
+    assert context.tts_engine.voice == "b"
+    assert context.character_config.tts_config.edge_tts.voice == "b"
+    assert old.closed
+    assert [e["refcount"] for e in engine_registry.stats()] == [1]
+
+
+def test_failed_build_keeps_the_current_engine(engine_registry, builds):
+    context = make_context()
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(context.reinit_tts(tts_config("broken")))
+
+    assert context.tts_engine.voice == "a"
+    assert context.character_config.tts_config.edge_tts.voice == "a"
+
+
+def test_contexts_share_one_build_of_a_config(engine_registry, builds):
+    first, second = make_context(), make_context()
+
+    async def scenario():
+        return await asyncio.gather(
+            first.build_tts_engine(tts_config("b")),
+            second.build_tts_engine(tts_config("b")),
+        )
+
+    engines = asyncio.run(scenario())
+
+    assert builds == ["a", "b"]
+    assert engines[0] is engines[1]
+    assert first.tts_engine is second.tts_engine
+
+
+def test_cancelled_build_gives_the_engine_back(engine_registry, builds):
+    context = make_context()
+
+    async def released():
+        while len(builds) < 2 or len(engine_registry.stats()) > 1:
+            await asyncio.sleep(0.01)
+
+    async def scenario():
+        build = asyncio.create_task(context.build_tts_engine(tts_config("b")))
+        await asyncio.sleep(0.05)
+        build.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await build
+        # The thread finishes the build, then the engine is released
+        await asyncio.wait_for(released(), 5)
+
+    asyncio.run(scenario())
+
+    assert [e["engine"] for e in engine_registry.stats()] == ["FakeTTS"]
+    assert context.tts_engine.voice == "a"
+
+
+def sleeping_step(events, name, seconds=0.2, error=None):
+    def init():
+        events.append(("start", name))
+        time.sleep(seconds)
+        events.append(("end", name))
+        if error is not None:
+            raise error
+
+    return init
+
+
+def test_init_steps_run_concurrently():
+    events = []
+    start = time.perf_counter()
+
+    timings = ServiceContext()._run_init_steps(
+        {name: (sleeping_step(events, name), ()) for name in ("asr", "tts", "vad")}
+    )
+
+    assert time.perf_counter() - start < 0.5
+    assert sorted(timings) == ["asr", "tts", "vad"]
+    assert all(0.15 < seconds < 0.5 for seconds in timings.values())
+
+
+def test_init_step_starts_after_its_dependencies():
+    events = []
+
+    ServiceContext()._run_init_steps(
+        {
+            "live2d": (sleeping_step(events, "live2d", 0.1), ()),
+            "translate": (sleeping_step(events, "translate", 0.2), ()),
+            "asr": (sleeping_step(events, "asr", 0.05), ()),
+            "agent": (sleeping_step(events, "agent", 0), ("live2d", "translate")),
+        }
+    )
+
+    agent_start = events.index(("start", "agent"))
+    assert events.index(("end", "live2d")) < agent_start
+    assert events.index(("end", "translate")) < agent_start
+    # Independent steps don't wait for each other
+    assert events.index(("end", "asr")) < events.index(("end", "live2d"))
+
+
+def test_failed_init_step_is_raised_once_every_step_finished():
+    events = []
+
+    with pytest.raises(RuntimeError, match="no model"):
+        ServiceContext()._run_init_steps(
+            {
+                "live2d": (
+                    sleeping_step(events, "live2d", 0, RuntimeError("no model")),
+                    (),
+                ),
+                "tts": (sleeping_step(events, "tts", 0.2), ()),
+                "agent": (sleeping_step(events, "agent", 0), ("live2d",)),
+            }
+        )
+
+    assert ("end", "tts") in events
+    # A step doesn't start after a dependency failed
+    assert ("start", "agent") not in events
+
+
+def load_with_recorded_steps(monkeypatch, **engine_configs):
+    """Run load_from_config with init steps that only record when they ran"""
+    events = []
+    for name in ("live2d", "asr", "tts", "vad", "translate", "agent"):
+        monkeypatch.setattr(
+            ServiceContext,
+            f"init_{name}",
+            lambda self, *args, name=name: sleeping_step(events, name, 0.05)(),
+        )
+    character_config = SimpleNamespace(
+        live2d_model_name="shizuku",
+        asr_config=None,
+        tts_config=None,
+        vad_config=None,
+        tts_preprocessor_config=SimpleNamespace(translator_config=None),
+        agent_config=None,
+        persona_prompt="",
+    )
+    vars(character_config).update(engine_configs)
+    config = SimpleNamespace(system_config=None, character_config=character_config)
+
+    context = ServiceContext()
+    context.load_from_config(config)
+    assert context.character_config is character_config
+    return events
+
+
+def test_load_from_config_builds_the_agent_after_live2d_and_translator(
+    monkeypatch,
+):
+    events = load_with_recorded_steps(monkeypatch)
+
+    assert {name for kind, name in events if kind == "end"} == {
+        "live2d",
+        "asr",
+        "tts",
+        "vad",
+        "translate",
+        "agent",
+    }
+    agent_start = events.index(("start", "agent"))
+    assert events.index(("end", "live2d")) < agent_start
+    assert events.index(("end", "translate")) < agent_start
+
+
+def test_engines_with_worker_processes_are_built_after_the_others(monkeypatch):
+    events = load_with_recorded_steps(
+        monkeypatch, tts_config=SimpleNamespace(worker_processes=2)
+    )
+
+    assert events[-2:] == [("start", "tts"), ("end", "tts")]
+
+
+def test_exclusive_init_steps_run_alone_after_the_others():
+    events = []
+
+    ServiceContext()._run_init_steps(
+        {
+            "asr": (sleeping_step(events, "asr", 0.05), ()),
+            "tts": (sleeping_step(events, "tts", 0.05), ()),
+            "vad": (sleeping_step(events, "vad", 0.1), ()),
+        },
+        exclusive=["asr", "tts"],
+    )
+
+    assert events[:2] == [("start", "vad"), ("end", "vad")]
+    assert events[2:] == [
+        ("start", "asr"),
+        ("end", "asr"),
+        ("start", "tts"),
+        ("end", "tts"),
+    ]
@@ -0,0 +1,171 @@
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from open_llm_vtuber import chat_history_manager, websocket_handler
+from open_llm_vtuber.config_manager.tts import EdgeTTSConfig, TTSConfig
+from open_llm_vtuber.service_context import ServiceContext
+from open_llm_vtuber.tts.tts_interface import TTSInterface
+from open_llm_vtuber.websocket_handler import WebSocketHandler
+
+
+class FakeTTS(TTSInterface):
+    def __init__(self, voice):
+        self.voice = voice
+        self.tested = []
+
+    def generate_audio(self, text, file_name_no_ext=None):
+        self.tested.append(text)
+        return None
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send_text(self, text):
+        self.sent.append(json.loads(text))
+
+    def types(self):
+        return [(m["type"], m.get("stage")) for m in self.sent]
+
+
+@pytest.fixture
+def builds(monkeypatch):
+    builds = []
+
+    def build(config):
+        time.sleep(0.1)
+        if config.edge_tts.voice == "broken":
+            raise RuntimeError("model not found")
+        builds.append(config.edge_tts.voice)
+        return FakeTTS(config.edge_tts.voice)
+
+    monkeypatch.setattr(ServiceContext, "_build_tts_engine", staticmethod(build))
+    return builds
+
+
+@pytest.fixture
+def client(engine_registry, builds):
+    handler = WebSocketHandler(ServiceContext())
+    context = ServiceContext()
+    context.character_config = SimpleNamespace(tts_config=None)
+    context.init_tts(TTSConfig(tts_model="edge_tts", edge_tts=EdgeTTSConfig(voice="a")))
+    handler.client_contexts["c1"] = context
+    return handler, context, FakeWebSocket()
+
+
+async def update_voice(handler, websocket, voice):
+    await handler._handle_update_tts_settings(
+        websocket, "c1", {"settings": {"tts_model": "edge_tts", "voice": voice}}
+    )
+    return handler.tts_swap_tasks["c1"]
+
+
+def test_tts_settings_are_switched_after_a_test_synthesis(client):
+    handler, context, websocket = client
+    old_config = context.character_config.tts_config
+
+    async def scenario():
+        await (await update_voice(handler, websocket, "b"))
+
+    asyncio.run(scenario())
+
+    assert websocket.types() == [
+        ("tts-settings-progress", "loading"),
+        ("tts-settings-progress", "testing"),
+        ("tts-settings-updated", None),
+    ]
+    assert context.tts_engine.voice == "b"
+    assert context.tts_engine.tested == ["TTS engine test"]
+    assert context.character_config.tts_config.edge_tts.voice == "b"
+    # The previous config was copied, not edited
+    assert old_config.edge_tts.voice == "a"
+    assert "c1" not in handler.tts_swap_tasks
+
+
+def test_failed_switch_keeps_the_current_engine(client):
+    handler, context, websocket = client
+
+    async def scenario():
+        await (await update_voice(handler, websocket, "broken"))
+
+    asyncio.run(scenario())
+
+    assert websocket.sent[-1]["type"] == "error"
+    assert context.tts_engine.voice == "a"
+
+
+def test_newer_request_cancels_the_pending_switch(client, engine_registry):
+    handler, context, websocket = client
+
+    async def released():
+        while len(engine_registry.stats()) > 1:
+            await asyncio.sleep(0.01)
+
+    async def scenario():
+        first = await update_voice(handler, websocket, "b")
+        await asyncio.sleep(0)
+        second = await update_voice(handler, websocket, "c")
+        await asyncio.gather(first, second, return_exceptions=True)
+        # The cancelled build finishes in its thread, then is released
+        await asyncio.wait_for(released(), 5)
+        return first
+
+    first = asyncio.run(scenario())
+
+    assert first.cancelled()
+    assert context.tts_engine.voice == "c"
+    assert [e["engine"] for e in engine_registry.stats()] == ["FakeTTS"]
+
+
+def test_engine_already_loaded_is_reused_without_testing(client, builds):
+    handler, context, websocket = client
+    other = ServiceContext()
+    other.character_config = SimpleNamespace(tts_config=None)
+    other.init_tts(TTSConfig(tts_model="edge_tts", edge_tts=EdgeTTSConfig(voice="b")))
+
+    async def scenario():
+        await (await update_voice(handler, websocket, "b"))
+
+    asyncio.run(scenario())
+
+    assert ("tts-settings-progress", "testing") not in websocket.types()
+    assert context.tts_engine is other.tts_engine
+    assert builds == ["a", "b"]
+
+
+def test_fetch_history_loads_memory_and_sends_the_latest_page(
+    history_storage, monkeypatch
+):
+    monkeypatch.setattr(websocket_handler, "DEFAULT_HISTORY_PAGE_SIZE", 2)
+    history_uid = chat_history_manager.create_new_history("u1")
+    for i in range(5):
+        chat_history_manager.store_message("u1", history_uid, "human", str(i))
+    loaded = []
+
+    async def async_set_memory_from_history(user_id, history_uid):
+        loaded.append((user_id, history_uid))
+
+    handler = WebSocketHandler(ServiceContext())
+    context = ServiceContext()
+    context.agent_engine = SimpleNamespace(
+        async_set_memory_from_history=async_set_memory_from_history
+    )
+    handler.client_contexts["c1"] = context
+    handler.client_user_ids["c1"] = "u1"
+    websocket = FakeWebSocket()
+
+    asyncio.run(
+        handler._handle_fetch_history(websocket, "c1", {"history_uid": history_uid})
+    )
+
+    assert loaded == [("u1", history_uid)]
+    assert context.history_uid == history_uid
+    (message,) = websocket.sent
+    assert message["type"] == "history-data"
+    assert [m["content"] for m in message["messages"]] == ["3", "4"]
+    assert message["has_more"]
@@ -0,0 +1,96 @@
+import asyncio
+import os
+
+import pytest
+
+from open_llm_vtuber.tts.forked_tts import ForkedTTSEngine
+from open_llm_vtuber.tts.tts_factory import TTSFactory
+from open_llm_vtuber.tts.tts_interface import TTSInterface
+from open_llm_vtuber.utils import forked_worker
+
+pytestmark = pytest.mark.skipif(not forked_worker.fork_available(), reason="needs fork")
+
+
+class PidEngine(TTSInterface):
+    """Returns the pid of the process that synthesized the text"""
+
+    supports_batch = True
+
+    def __init__(self):
+        self.removed = []
+
+    def generate_audio(self, text, file_name_no_ext=None):
+        return f"{text}-{os.getpid()}.wav"
+
+    def generate_audio_batch(self, texts, file_names_no_ext=None):
+        return [f"{text}-{os.getpid()}.wav" for text in texts]
+
+    def remove_file(self, filepath, verbose=True):
+        self.removed.append(filepath)
+
+
+def test_synthesis_runs_in_the_worker():
+    engine = PidEngine()
+    forked = ForkedTTSEngine(engine)
+    try:
+        pid = forked._worker.pid
+        assert forked.supports_batch
+        assert forked.generate_audio("a") == f"a-{pid}.wav"
+        assert asyncio.run(forked.async_generate_audio("b")) == f"b-{pid}.wav"
+        assert forked.generate_audio_batch(["c", "d"]) == [
+            f"c-{pid}.wav",
+            f"d-{pid}.wav",
+        ]
+        assert asyncio.run(forked.async_generate_audio_batch(["e"])) == [f"e-{pid}.wav"]
+        # Files are removed by the server process
+        forked.remove_file("a.wav")
+        assert engine.removed == ["a.wav"]
+    finally:
+        forked.close()
+
+
+@pytest.fixture
+def built(monkeypatch):
+    built = []
+
+    def get_tts_engine(engine_type, **kwargs):
+        built.append(engine_type)
+        return PidEngine()
+
+    monkeypatch.setattr(TTSFactory, "get_tts_engine", staticmethod(get_tts_engine))
+    return built
+
+
+def test_pool_replicas_are_workers_forked_from_one_engine(built):
+    pool = TTSFactory.get_tts_engine_pool(
+        "sherpa_onnx_tts", replicas=1, worker_processes=2
+    )
+
+    async def synthesize():
+        return await asyncio.gather(
+            *(pool.async_generate_audio(str(i)) for i in range(8))
+        )
+
+    workers = [engine._worker for engine in pool.engines]
+    try:
+        assert built == ["sherpa_onnx_tts"]
+        assert all(isinstance(engine, ForkedTTSEngine) for engine in pool.engines)
+        pids = {str(worker.pid) for worker in workers}
+        assert len(pids) == 2
+        paths = asyncio.run(synthesize())
+        assert {path[: -len(".wav")].split("-")[1] for path in paths} <= pids
+    finally:
+        pool.close()
+    assert not any(worker._target_id in forked_worker._targets for worker in workers)
+
+
+def test_pool_runs_in_process_without_fork(built, monkeypatch):
+    monkeypatch.setattr(forked_worker, "fork_available", lambda: False)
+
+    pool = TTSFactory.get_tts_engine_pool(
+        "sherpa_onnx_tts", replicas=2, worker_processes=2
+    )
+
+    assert built == ["sherpa_onnx_tts", "sherpa_onnx_tts"]
+    assert all(isinstance(engine, PidEngine) for engine in pool.engines)
+    assert pool.generate_audio("a") == f"a-{os.getpid()}.wav"
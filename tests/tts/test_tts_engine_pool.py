@@ -0,0 +1,275 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from open_llm_vtuber.tts.tts_engine_pool import TTSEnginePool, TTSPoolFullError
+from open_llm_vtuber.tts.tts_interface import TTSInterface
+
+
+class FakeEngine(TTSInterface):
+    """Records the calls in progress; async calls wait for `release`"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.texts = []
+        self.release = None
+        self.lock = threading.Lock()
+
+    def _start(self, text):
+        with self.lock:
+            self.texts.append(text)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def _end(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def generate_audio(self, text, file_name_no_ext=None):
+        self._start(text)
+        time.sleep(self.delay)
+        self._end()
+        return f"{text}.wav"
+
+    async def async_generate_audio(self, text, file_name_no_ext=None):
+        self._start(text)
+        try:
+            await asyncio.sleep(self.delay)
+            if self.release is not None:
+                await self.release.wait()
+            if text == "fail":
+                raise ConnectionError("engine unavailable")
+            return f"{text}.wav"
+        finally:
+            self._end()
+
+    def remove_file(self, filepath, verbose=True):
+        pass
+
+
+def make_pool(replicas=1, **kwargs):
+    engines = []
+
+    def factory():
+        engines.append(FakeEngine(delay=0.01))
+        return engines[-1]
+
+    return TTSEnginePool(factory, replicas=replicas, **kwargs), engines
+
+
+async def wait_until(condition):
+    for _ in range(200):
+        if condition():
+            return
+        await asyncio.sleep(0.005)
+    raise AssertionError("condition not reached")
+
+
+def test_calls_are_spread_over_replicas_within_the_limit():
+    pool, engines = make_pool(replicas=2, max_concurrency=2)
+
+    async def scenario():
+        return await asyncio.gather(
+            *(pool.async_generate_audio(str(i)) for i in range(12))
+        )
+
+    assert asyncio.run(scenario()) == [f"{i}.wav" for i in range(12)]
+    assert [engine.max_in_flight for engine in engines] == [2, 2]
+    stats = pool.stats()
+    assert [replica["completed"] for replica in stats["replicas"]] == [6, 6]
+    assert stats["queued"] == 0
+    assert stats["waited"] == 8
+
+
+def test_waiting_calls_are_served_by_priority():
+    pool, (engine,) = make_pool()
+
+    async def scenario():
+        engine.release = asyncio.Event()
+        first = asyncio.create_task(pool.async_generate_audio("busy"))
+        await wait_until(lambda: engine.texts)
+        waiting = [
+            asyncio.create_task(pool.async_generate_audio(text, priority=priority))
+            for text, priority in [("late", 5), ("middle", 3), ("first", 0)]
+        ]
+        await wait_until(lambda: pool.stats()["queued"] == 3)
+        engine.release.set()
+        await asyncio.gather(first, *waiting)
+
+    asyncio.run(scenario())
+
+    assert engine.texts == ["busy", "first", "middle", "late"]
+    assert engine.max_in_flight == 1
+
+
+def test_calls_beyond_the_queue_size_are_rejected():
+    pool, (engine,) = make_pool(max_queue_size=1)
+
+    async def scenario():
+        engine.release = asyncio.Event()
+        tasks = [asyncio.create_task(pool.async_generate_audio("a"))]
+        await wait_until(lambda: engine.texts)
+        tasks.append(asyncio.create_task(pool.async_generate_audio("b")))
+        await wait_until(lambda: pool.stats()["queued"] == 1)
+        with pytest.raises(TTSPoolFullError):
+            await pool.async_generate_audio("c")
+        engine.release.set()
+        return await asyncio.gather(*tasks)
+
+    assert asyncio.run(scenario()) == ["a.wav", "b.wav"]
+    assert pool.stats()["rejected"] == 1
+
+
+def test_cancelled_waiters_leave_the_queue():
+    pool, (engine,) = make_pool()
+
+    async def scenario():
+        engine.release = asyncio.Event()
+        busy = asyncio.create_task(pool.async_generate_audio("busy"))
+        await wait_until(lambda: engine.texts)
+        cancelled = asyncio.create_task(pool.async_generate_audio("cancelled"))
+        kept = asyncio.create_task(pool.async_generate_audio("kept"))
+        await wait_until(lambda: pool.stats()["queued"] == 2)
+        cancelled.cancel()
+        await asyncio.gather(cancelled, return_exceptions=True)
+        assert pool.stats()["queued"] == 1
+        engine.release.set()
+        await asyncio.gather(busy, kept)
+
+    asyncio.run(scenario())
+
+    assert engine.texts == ["busy", "kept"]
+    assert pool.stats()["replicas"][0]["in_flight"] == 0
+
+
+def test_failed_calls_release_their_slot():
+    pool, _ = make_pool()
+
+    async def scenario():
+        with pytest.raises(ConnectionError):
+            await pool.async_generate_audio("fail")
+        return await pool.async_generate_audio("ok")
+
+    assert asyncio.run(scenario()) == "ok.wav"
+    (replica,) = pool.stats()["replicas"]
+    assert (replica["failed"], replica["completed"], replica["in_flight"]) == (1, 1, 0)
+
+
+def test_sync_calls_share_the_limit():
+    pool, engines = make_pool(replicas=2, max_concurrency=1)
+    results = []
+    threads = [
+        threading.Thread(target=lambda i=i: results.append(pool.generate_audio(str(i))))
+        for i in range(6)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(results) == [f"{i}.wav" for i in range(6)]
+    assert [engine.max_in_flight for engine in engines] == [1, 1]
+    assert sum(len(engine.texts) for engine in engines) == 6
+
+
+@pytest.mark.parametrize("kwargs", [{"replicas": 0}, {"max_concurrency": 0}])
+def test_invalid_pool_sizes_are_rejected(kwargs):
+    with pytest.raises(ValueError):
+        TTSEnginePool(FakeEngine, **kwargs)
+
+
+class BatchEngine(FakeEngine):
+    supports_batch = True
+
+    def __init__(self):
+        super().__init__()
+        self.batches = []
+
+    async def async_generate_audio_batch(self, texts, file_names_no_ext=None):
+        self.batches.append(list(texts))
+        await self.release.wait()
+        if "fail" in texts:
+            raise ConnectionError("engine unavailable")
+        return [f"{text}.wav" for text in texts]
+
+
+def make_batch_pool(max_batch_size=3):
+    engine = BatchEngine()
+    return TTSEnginePool(lambda: engine, max_batch_size=max_batch_size), engine
+
+
+async def queue_behind_busy_call(pool, engine, texts):
+    """Start a call that holds the slot, then queue `texts` behind it"""
+    engine.release = asyncio.Event()
+    busy = asyncio.create_task(pool.async_generate_audio("busy"))
+    await wait_until(lambda: engine.texts)
+    waiting = [
+        asyncio.create_task(pool.async_generate_audio(text, priority=i))
+        for i, text in enumerate(texts)
+    ]
+    await wait_until(lambda: pool.stats()["queued"] == len(texts))
+    return busy, waiting
+
+
+def test_waiting_calls_are_synthesized_in_batches():
+    pool, engine = make_batch_pool()
+
+    async def scenario():
+        busy, waiting = await queue_behind_busy_call(pool, engine, ["a", "b", "c", "d"])
+        engine.release.set()
+        return await asyncio.gather(busy, *waiting)
+
+    assert asyncio.run(scenario()) == ["busy.wav", "a.wav", "b.wav", "c.wav", "d.wav"]
+    # A call with nobody waiting behind it is synthesized on its own
+    assert engine.batches == [["a", "b", "c"]]
+    assert engine.texts == ["busy", "d"]
+    (replica,) = pool.stats()["replicas"]
+    assert (replica["batches"], replica["completed"]) == (1, 5)
+
+
+def test_batch_errors_reach_every_call_of_the_batch():
+    pool, engine = make_batch_pool()
+
+    async def scenario():
+        busy, waiting = await queue_behind_busy_call(pool, engine, ["fail", "b"])
+        engine.release.set()
+        await busy
+        return await asyncio.gather(*waiting, return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, ConnectionError) for result in results)
+    assert pool.stats()["replicas"][0]["failed"] == 2
+
+
+def test_cancelled_leader_leaves_the_batch_running_for_its_followers():
+    pool, engine = make_batch_pool()
+
+    async def scenario():
+        busy, (leader, follower) = await queue_behind_busy_call(
+            pool, engine, ["a", "b"]
+        )
+        engine.release.set()
+        await busy
+        await wait_until(lambda: engine.batches)
+        leader.cancel()
+        return await follower
+
+    assert asyncio.run(scenario()) == "b.wav"
+    assert engine.batches == [["a", "b"]]
+
+
+def test_batching_is_off_for_engines_without_batch_support():
+    pool, _ = make_pool(max_batch_size=4)
+
+    assert pool.max_batch_size == 1
+
+
+def test_default_batch_calls_generate_audio_per_text():
+    engine = FakeEngine()
+
+    assert engine.generate_audio_batch(["a", "b"]) == ["a.wav", "b.wav"]
+    assert engine.texts == ["a", "b"]
@@ -0,0 +1,108 @@
+import asyncio
+import os
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from open_llm_vtuber.utils import forked_worker
+from open_llm_vtuber.utils.forked_worker import ForkedWorker, fork_available
+
+pytestmark = pytest.mark.skipif(not fork_available(), reason="needs fork")
+
+
+class Target:
+    def __init__(self):
+        self.weights = "loaded"
+
+    def pid(self):
+        return os.getpid()
+
+    def describe(self, prefix):
+        return f"{prefix}:{self.weights}"
+
+    def fail(self):
+        raise ValueError("bad input")
+
+    def crash(self):
+        os._exit(1)
+
+
+@pytest.fixture
+def worker():
+    worker = ForkedWorker(Target(), name="test")
+    yield worker
+    worker.close()
+
+
+def test_calls_run_in_the_child_on_the_inherited_target(worker):
+    assert worker.call("pid") == worker.pid != os.getpid()
+    assert worker.call("describe", "a") == "a:loaded"
+    assert asyncio.run(worker.acall("describe", "b")) == "b:loaded"
+
+
+def test_target_changes_after_the_fork_are_not_seen_by_the_child():
+    target = Target()
+    worker = ForkedWorker(target)
+    try:
+        target.weights = "changed"
+        assert worker.call("describe", "a") == "a:loaded"
+    finally:
+        worker.close()
+
+
+def test_errors_reach_the_caller(worker):
+    with pytest.raises(ValueError, match="bad input"):
+        worker.call("fail")
+    with pytest.raises(ValueError, match="bad input"):
+        asyncio.run(worker.acall("fail"))
+    assert worker.call("describe", "a") == "a:loaded"
+
+
+def test_dead_child_is_forked_again(worker):
+    first_pid = worker.pid
+
+    with pytest.raises(BrokenProcessPool):
+        worker.call("crash")
+    assert worker.pid != first_pid
+    assert worker.call("pid") == worker.pid
+
+    with pytest.raises(BrokenProcessPool):
+        asyncio.run(worker.acall("crash"))
+    assert worker.call("describe", "a") == "a:loaded"
+
+
+def test_close_forgets_the_target():
+    worker = ForkedWorker(Target())
+    target_id = worker._target_id
+    worker.close()
+
+    assert target_id not in forked_worker._targets
+
+
+def test_fork_is_required(monkeypatch):
+    monkeypatch.setattr(forked_worker, "fork_available", lambda: False)
+
+    with pytest.raises(RuntimeError, match="fork"):
+        ForkedWorker(Target())
+
+
+def test_callers_seeing_the_same_dead_child_fork_it_again_once(worker, monkeypatch):
+    forks = []
+    fork = worker._fork
+
+    def counting_fork():
+        forks.append(1)
+        fork()
+
+    monkeypatch.setattr(worker, "_fork", counting_fork)
+
+    async def crash_twice():
+        return await asyncio.gather(
+            worker.acall("crash"), worker.acall("crash"), return_exceptions=True
+        )
+
+    results = asyncio.run(crash_twice())
+
+    assert all(isinstance(result, BrokenProcessPool) for result in results)
+    assert forks == [1]
+    assert worker.call("describe", "a") == "a:loaded"
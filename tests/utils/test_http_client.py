@@ -0,0 +1,115 @@
+import sys
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from open_llm_vtuber.config_manager.system import HttpClientConfig
+from open_llm_vtuber.utils.http_client import HttpClientManager
+
+
+class RecordingHandler(BaseHTTPRequestHandler):
+    # Keep-alive
+    protocol_version = "HTTP/1.1"
+
+    def _respond(self):
+        self.server.requests.append((self.command, self.client_address[1]))
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(b"ok")
+
+    do_GET = do_HEAD = _respond
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RecordingHandler)
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def manager():
+    manager = HttpClientManager()
+    yield manager
+    if manager._sync_client is not None:
+        manager._sync_client.close()
+
+
+def test_sync_requests_reuse_one_connection(manager, server):
+    assert manager.sync_client is manager.sync_client
+
+    for _ in range(3):
+        assert manager.sync_client.get(f"{server.url}/x").text == "ok"
+
+    assert len({port for _, port in server.requests}) == 1
+
+
+def test_async_client_is_shared_within_an_event_loop(manager, server):
+    async def requests():
+        client = manager.async_client
+        for _ in range(3):
+            await manager.async_client.get(f"{server.url}/x")
+        assert manager.async_client is client
+        await manager.aclose()
+        return client
+
+    first = asyncio.run(requests())
+    second = asyncio.run(requests())
+
+    assert first is not second
+    assert len(server.requests) == 6
+    assert len({port for _, port in server.requests}) == 2
+
+
+def test_configure_replaces_the_clients(manager):
+    client = manager.sync_client
+
+    manager.configure(HttpClientConfig(read_timeout=5))
+
+    assert client.is_closed
+    assert manager.sync_client is not client
+    assert manager.sync_client.timeout.read == 5
+
+
+def test_warm_up_touches_each_registered_host_once(manager, server):
+    manager.register_warm_up(f"{server.url}/v1/chat")
+    manager.register_warm_up(f"{server.url}/v1/parameters")
+    manager.register_warm_up(f"{server.url}/tts", blocking=True)
+    manager.register_warm_up("not a url")
+
+    async def warm_up():
+        await manager.warm_up()
+        await manager.aclose()
+
+    asyncio.run(warm_up())
+
+    assert sorted(command for command, _ in server.requests) == ["HEAD", "HEAD"]
+
+
+def test_warm_up_can_be_disabled(server):
+    manager = HttpClientManager(HttpClientConfig(warm_up=False))
+    manager.register_warm_up(server.url)
+
+    asyncio.run(manager.warm_up())
+
+    assert server.requests == []
+
+
+def test_http2_without_h2_falls_back_to_http1(manager, monkeypatch):
+    # Makes `import h2` fail
+    monkeypatch.setitem(sys.modules, "h2", None)
+    manager.configure(HttpClientConfig(http2=True))
+
+    assert manager._client_kwargs()["http2"] is False
@@ -0,0 +1,158 @@
+import asyncio
+
+import pytest
+
+from open_llm_vtuber.utils import sentence_divider
+from open_llm_vtuber.utils.sentence_divider import (
+    SentenceDivider,
+    segment_text_by_regex,
+)
+
+REPLY = (
+    "<think>Let me see. The user greets me</think>"
+    "Hello there, my friend. How are you today? I am fine"
+)
+EXPECTED = [
+    ("<think>", ["think:start"]),
+    ("Let me see.", ["think:inside"]),
+    ("The user greets me", ["think:inside"]),
+    ("</think>", ["think:end"]),
+    ("Hello there, my friend.", ["none"]),
+    ("How are you today?", ["none"]),
+    ("I am fine", ["none"]),
+]
+
+
+def divide(tokens, **kwargs):
+    async def stream():
+        for token in tokens:
+            yield token
+
+    async def collect():
+        divider = SentenceDivider(**kwargs)
+        return [
+            (sentence.text, [str(tag) for tag in sentence.tags])
+            async for sentence in divider.process_stream(stream())
+        ]
+
+    return asyncio.run(collect())
+
+
+def chunks(text, size):
+    return [text[i : i + size] for i in range(0, len(text), size)]
+
+
+@pytest.mark.parametrize("method", ["regex", "pysbd"])
+@pytest.mark.parametrize("size", [1, 2, 5, len(REPLY)])
+def test_sentences_do_not_depend_on_token_boundaries(method, size):
+    assert (
+        divide(chunks(REPLY, size), segment_method=method, faster_first_response=False)
+        == EXPECTED
+    )
+
+
+def test_tag_split_across_tokens_is_detected():
+    tokens = ["<th", "ink>Hmm", ". </thi", "nk>", "Done."]
+
+    assert divide(tokens, segment_method="regex") == [
+        ("<think>", ["think:start"]),
+        ("Hmm.", ["think:inside"]),
+        ("</think>", ["think:end"]),
+        ("Done.", ["none"]),
+    ]
+
+
+def test_first_sentence_is_split_at_a_comma():
+    assert divide(chunks("Well, that is a good question.", 1), segment_method="regex")[
+        0
+    ] == ("Well,", ["none"])
+
+
+def test_text_without_punctuation_is_segmented_once(monkeypatch):
+    calls = []
+    segment = SentenceDivider._segment_text
+
+    def counting_segment(self, text):
+        calls.append(text)
+        return segment(self, text)
+
+    monkeypatch.setattr(SentenceDivider, "_segment_text", counting_segment)
+    words = ["word "] * 500
+
+    assert divide(words, segment_method="regex") == [
+        (("word " * 500).strip(), ["none"])
+    ]
+    assert len(calls) == 1
+
+
+def test_regex_keeps_the_text_before_an_abbreviation():
+    assert segment_text_by_regex("I met Mr. Smith today. He") == (
+        ["I met Mr. Smith today."],
+        "He",
+    )
+
+
+def test_module_punctuation_helpers():
+    assert sentence_divider.contains_end_punctuation("Done!")
+    assert not sentence_divider.contains_end_punctuation("Not done")
+    assert sentence_divider.comma_splitter("First, second") == ("First,", "second")
+
+
+def test_pysbd_segmenters_are_cached_per_language():
+    assert sentence_divider.get_pysbd_segmenter(
+        "en"
+    ) is sentence_divider.get_pysbd_segmenter("en")
+    assert sentence_divider.get_pysbd_segmenter(
+        "en"
+    ) is not sentence_divider.get_pysbd_segmenter("de")
+
+
+def test_language_is_detected_once_per_reply(monkeypatch):
+    detected = []
+    detect = sentence_divider.detect_language
+
+    def counting_detect(text):
+        detected.append(text)
+        return detect(text)
+
+    monkeypatch.setattr(sentence_divider, "detect_language", counting_detect)
+    segmenter = sentence_divider.SentenceSegmenter()
+    segmenter.segment("The weather is nice today. We should")
+    segmenter.segment("We should go for a walk. Maybe")
+    assert len(detected) == 1
+
+    segmenter.reset()
+    segmenter.segment("Das Wetter ist heute schön. Wir sollten")
+    assert len(detected) == 2
+
+
+def test_short_text_is_detected_again():
+    segmenter = sentence_divider.SentenceSegmenter(min_detect_length=20)
+    segmenter.segment("Hi.")
+    assert not segmenter._detected
+    segmenter.segment("Hi. How are you doing today?")
+    assert segmenter._detected
+
+
+def test_script_change_is_followed_after_consecutive_calls():
+    segmenter = sentence_divider.SentenceSegmenter(switch_after=2)
+    assert segmenter.segment("今天天气很好。我们") == (["今天天气很好。"], "我们")
+
+    # A single call in another script keeps the CJK fast path
+    segmenter.segment("OK. Then")
+    assert segmenter._is_cjk
+    segmenter.segment("OK. Then we go")
+    assert not segmenter._is_cjk
+
+
+def test_cjk_text_skips_pysbd(monkeypatch):
+    def fail(language):
+        raise AssertionError("pysbd used for CJK text")
+
+    monkeypatch.setattr(sentence_divider, "get_pysbd_segmenter", fail)
+    segmenter = sentence_divider.SentenceSegmenter()
+
+    assert segmenter.segment("圆周率是3.14。他说：“你好！”然后") == (
+        ["圆周率是3.14。", "他说：“你好！”"],
+        "然后",
+    )
@@ -0,0 +1,34 @@
+import numpy as np
+
+from open_llm_vtuber.utils.stream_audio import split_samples_at_pauses
+
+RATE = 1000
+
+
+def tone(ms):
+    return np.sin(np.arange(ms * RATE // 1000) * 0.5) + 2.0
+
+
+def silence(ms):
+    return np.zeros(ms * RATE // 1000)
+
+
+def test_samples_are_cut_at_the_pauses_near_the_proportional_position():
+    # The pause is off the proportional position (400 ms) but within reach
+    samples = np.concatenate([tone(300), silence(100), tone(400)])
+
+    first, second = split_samples_at_pauses(samples, RATE, weights=[1, 1])
+
+    assert 300 <= len(first) <= 400
+    assert np.all(first[:300] != 0)
+    assert len(first) + len(second) == len(samples)
+
+
+def test_every_sentence_gets_a_slice():
+    samples = np.concatenate([tone(100), silence(50)] * 3)
+
+    parts = split_samples_at_pauses(samples, RATE, weights=[5, 5, 5])
+
+    assert len(parts) == 3
+    assert all(len(part) > 0 for part in parts)
+    assert np.array_equal(np.concatenate(parts), samples)